@@ -13,15 +13,19 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import errno
+import json
 import os
 import random
 import socket
 from logging import DEBUG
 from math import sqrt
+from tempfile import NamedTemporaryFile
 from time import time
 import itertools
 
-from eventlet import GreenPool, sleep, Timeout
+from eventlet import GreenPool, sleep, spawn, Timeout
+from eventlet.semaphore import Semaphore
 import six
 
 import swift.common.db
@@ -34,7 +38,7 @@ from swift.common.request_helpers import USE_REPLICATION_NETWORK_HEADER
 from swift.common.ring import Ring
 from swift.common.ring.utils import is_local_device
 from swift.common.utils import get_logger, whataremyips, config_true_value, \
-    Timestamp, md5
+    Timestamp, md5, ratelimit_sleep, renamer
 from swift.common.daemon import Daemon
 from swift.common.storage_policy import POLICIES, PolicyError
 
@@ -83,6 +87,13 @@ class AccountReaper(Daemon):
         self.delay_reaping = int(conf.get('delay_reaping') or 0)
         reap_warn_after = float(conf.get('reap_warn_after') or 86400 * 30)
         self.reap_not_done_after = reap_warn_after + self.delay_reaping
+        self.checkpoint_progress = config_true_value(
+            conf.get('checkpoint_progress', 'false'))
+        self.objects_per_second = float(conf.get('objects_per_second', 0))
+        self.objects_running_time = 0
+        self.objects_rate_lock = Semaphore(1)
+        self.checkpoint = None
+        self.checkpoint_file = None
         self.start_time = time()
         self.reset_stats()
 
@@ -210,6 +221,72 @@ class AccountReaper(Daemon):
         self.stats_containers_possibly_remaining = 0
         self.stats_objects_possibly_remaining = 0
 
+    def load_checkpoint(self, broker):
+        """
+        Loads the reaping progress saved for the given account by a previous,
+        interrupted pass, if ``checkpoint_progress`` is enabled.
+
+        The checkpoint is kept in a file next to the account database and
+        records the container listing marker of the account and an object
+        listing marker for each container that has not been fully reaped.
+
+        :param broker: The AccountBroker for the account being reaped.
+        """
+        self.checkpoint = None
+        self.checkpoint_file = None
+        if not self.checkpoint_progress:
+            return
+        self.checkpoint_file = broker.db_file + '.reaper'
+        self.checkpoint = {'container_marker': '', 'object_markers': {}}
+        try:
+            with open(self.checkpoint_file) as fp:
+                self.checkpoint.update(json.load(fp))
+        except IOError as err:
+            if err.errno != errno.ENOENT:
+                self.logger.exception('Unable to load reaper checkpoint %s',
+                                      self.checkpoint_file)
+        except ValueError:
+            self.logger.warning('Ignoring invalid reaper checkpoint %s',
+                                self.checkpoint_file)
+
+    def save_checkpoint(self):
+        """
+        Atomically writes the current reaping progress to the checkpoint file,
+        or removes the file once there is no progress left to resume.
+        """
+        if self.checkpoint is None:
+            return
+        try:
+            if not (self.checkpoint['container_marker'] or
+                    self.checkpoint['object_markers']):
+                try:
+                    os.unlink(self.checkpoint_file)
+                except OSError as err:
+                    if err.errno != errno.ENOENT:
+                        raise
+                return
+            with NamedTemporaryFile(
+                    mode='w', dir=os.path.dirname(self.checkpoint_file),
+                    delete=False) as tf:
+                json.dump(self.checkpoint, tf)
+            renamer(tf.name, self.checkpoint_file, fsync=False)
+        except (Exception, Timeout):
+            self.logger.exception('Unable to save reaper checkpoint %s',
+                                  self.checkpoint_file)
+
+    def set_object_marker(self, container, marker):
+        """
+        Records how far the objects of a container have been reaped; a falsey
+        marker forgets the container's progress.
+        """
+        if self.checkpoint is None:
+            return
+        if marker:
+            self.checkpoint['object_markers'][container] = marker
+        else:
+            self.checkpoint['object_markers'].pop(container, None)
+        self.save_checkpoint()
+
     def reap_account(self, broker, partition, nodes, container_shard=None):
         """
         Called once per pass for each account this server is the primary for
@@ -228,6 +305,10 @@ class AccountReaper(Daemon):
         this function is called with the same parameters). This isn't likely
         since the listing comes from the local database.
 
+        If ``checkpoint_progress`` is enabled, the container listing marker is
+        saved after each page of containers so that a pass interrupted by a
+        restart resumes where it left off rather than starting over.
+
         After the process completes (successfully or not) statistics about what
         was accomplished will be logged.
 
@@ -257,12 +338,17 @@ class AccountReaper(Daemon):
         account = info['account']
         self.logger.info('Beginning pass on account %s', account)
         self.reset_stats()
+        self.load_checkpoint(broker)
+        container_marker = ''
+        if self.checkpoint:
+            container_marker = self.checkpoint['container_marker']
         container_limit = 1000
         if container_shard is not None:
             container_limit *= len(nodes)
         try:
             containers = list(broker.list_containers_iter(
-                container_limit, '', None, None, None, allow_reserved=True))
+                container_limit, container_marker, None, None, None,
+                allow_reserved=True))
             while containers:
                 try:
                     for (container, _junk, _junk, _junk, _junk) in containers:
@@ -282,9 +368,15 @@ class AccountReaper(Daemon):
                 except (Exception, Timeout):
                     self.logger.exception(
                         'Exception with containers for account %s', account)
+                if self.checkpoint is not None:
+                    self.checkpoint['container_marker'] = containers[-1][0]
+                    self.save_checkpoint()
                 containers = list(broker.list_containers_iter(
                     container_limit, containers[-1][0], None, None, None,
                     allow_reserved=True))
+            if self.checkpoint is not None:
+                self.checkpoint['container_marker'] = ''
+                self.save_checkpoint()
             log_buf = ['Completed pass on account %s' % account]
         except (Exception, Timeout):
             self.logger.exception('Exception with account %s', account)
@@ -341,6 +433,11 @@ class AccountReaper(Daemon):
         since the listing comes from querying just the primary remote container
         server.
 
+        The next page of the object listing is fetched while the objects of the
+        current page are being deleted. If ``checkpoint_progress`` is enabled,
+        the listing marker is saved after each page so that reaping the
+        container resumes from there after a restart.
+
         Once all objects have been attempted to be deleted, the container
         itself will be attempted to be deleted by sending a delete request to
         all container nodes. The format of the delete request is such that each
@@ -364,48 +461,41 @@ class AccountReaper(Daemon):
         node = nodes[-1]
         pool = GreenPool(size=self.object_concurrency)
         marker = ''
-        while True:
-            objects = None
-            try:
-                headers, objects = direct_get_container(
-                    node, part, account, container,
-                    marker=marker,
-                    conn_timeout=self.conn_timeout,
-                    response_timeout=self.node_timeout,
-                    headers={USE_REPLICATION_NETWORK_HEADER: 'true'})
-                self.stats_return_codes[2] = \
-                    self.stats_return_codes.get(2, 0) + 1
-                self.logger.increment('return_codes.2')
-            except ClientException as err:
-                if self.logger.getEffectiveLevel() <= DEBUG:
+        if self.checkpoint:
+            marker = self.checkpoint['object_markers'].get(container, '')
+        listing = spawn(self.get_objects, node, part, account, container,
+                        marker)
+        try:
+            while True:
+                headers, objects = listing.wait()
+                if not objects:
+                    if objects is not None:
+                        # the listing is exhausted, there's nothing to resume
+                        self.set_object_marker(container, None)
+                    break
+                marker = objects[-1]['name']
+                listing = spawn(self.get_objects, node, part, account,
+                                container, marker)
+                try:
+                    policy_index = headers.get(
+                        'X-Backend-Storage-Policy-Index', 0)
+                    policy = POLICIES.get_by_index(policy_index)
+                    if not policy:
+                        self.logger.error(
+                            'ERROR: invalid storage policy index: %r'
+                            % policy_index)
+                    for obj in objects:
+                        pool.spawn(self.reap_object, account, container, part,
+                                   nodes, obj['name'], policy_index)
+                    pool.waitall()
+                except (Exception, Timeout):
                     self.logger.exception(
-                        'Exception with %(ip)s:%(port)s/%(device)s', node)
-                self.stats_return_codes[err.http_status // 100] = \
-                    self.stats_return_codes.get(err.http_status // 100, 0) + 1
-                self.logger.increment(
-                    'return_codes.%d' % (err.http_status // 100,))
-            except (Timeout, socket.error):
-                self.logger.error(
-                    'Timeout Exception with %(ip)s:%(port)s/%(device)s',
-                    node)
-            if not objects:
-                break
-            try:
-                policy_index = headers.get('X-Backend-Storage-Policy-Index', 0)
-                policy = POLICIES.get_by_index(policy_index)
-                if not policy:
-                    self.logger.error('ERROR: invalid storage policy index: %r'
-                                      % policy_index)
-                for obj in objects:
-                    pool.spawn(self.reap_object, account, container, part,
-                               nodes, obj['name'], policy_index)
-                pool.waitall()
-            except (Exception, Timeout):
-                self.logger.exception('Exception with objects for container '
-                                      '%(container)s for account %(account)s',
-                                      {'container': container,
-                                       'account': account})
-            marker = objects[-1]['name']
+                        'Exception with objects for container '
+                        '%(container)s for account %(account)s',
+                        {'container': container, 'account': account})
+                self.set_object_marker(container, marker)
+        finally:
+            listing.kill()
         successes = 0
         failures = 0
         timestamp = Timestamp.now()
@@ -452,6 +542,42 @@ class AccountReaper(Daemon):
             self.stats_containers_possibly_remaining += 1
             self.logger.increment('containers_possibly_remaining')
 
+    def get_objects(self, node, part, account, container, marker):
+        """
+        Fetches a page of the object listing of a container from the given
+        container node.
+
+        This function should raise no exception but only update various
+        self.stats_* values for what occurs.
+
+        :returns: a tuple of (headers, objects); objects is None if the
+                  listing could not be fetched.
+        """
+        try:
+            headers, objects = direct_get_container(
+                node, part, account, container,
+                marker=marker,
+                conn_timeout=self.conn_timeout,
+                response_timeout=self.node_timeout,
+                headers={USE_REPLICATION_NETWORK_HEADER: 'true'})
+            self.stats_return_codes[2] = \
+                self.stats_return_codes.get(2, 0) + 1
+            self.logger.increment('return_codes.2')
+            return headers, objects
+        except ClientException as err:
+            if self.logger.getEffectiveLevel() <= DEBUG:
+                self.logger.exception(
+                    'Exception with %(ip)s:%(port)s/%(device)s', node)
+            self.stats_return_codes[err.http_status // 100] = \
+                self.stats_return_codes.get(err.http_status // 100, 0) + 1
+            self.logger.increment(
+                'return_codes.%d' % (err.http_status // 100,))
+        except (Timeout, socket.error):
+            self.logger.error(
+                'Timeout Exception with %(ip)s:%(port)s/%(device)s',
+                node)
+        return None, None
+
     def reap_object(self, account, container, container_partition,
                     container_nodes, obj, policy_index):
         """
@@ -460,6 +586,9 @@ class AccountReaper(Daemon):
         server will update a corresponding container server, removing the
         object from the container's listing.
 
+        If ``objects_per_second`` is set, deletes are rate limited across all
+        the containers being reaped by this process.
+
         This function returns nothing and should raise no exception but only
         update various self.stats_* values for what occurs.
 
@@ -482,6 +611,10 @@ class AccountReaper(Daemon):
             self.logger.increment('objects_remaining')
             return
         part, nodes = ring.get_nodes(account, container, obj)
+        if self.objects_per_second:
+            with self.objects_rate_lock:
+                self.objects_running_time = ratelimit_sleep(
+                    self.objects_running_time, self.objects_per_second)
         successes = 0
         failures = 0
         timestamp = Timestamp.now()
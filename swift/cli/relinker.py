@@ -31,6 +31,7 @@ from swift.common.utils import replace_partition_in_path, config_true_value, \
     non_negative_float, non_negative_int, config_auto_int_value, \
     dump_recon_cache, get_partition_from_path
 from swift.obj import diskfile
+from swift.obj.object_index import ObjectIndex
 
 
 LOCK_FILE = '.relink.{datadir}.lock'
@@ -185,6 +186,12 @@ class Relinker(object):
         fcntl.flock(fd, fcntl.LOCK_EX)
         self.dev_lock = fd
 
+        # hash dirs are linked into new partitions without the object index
+        # being updated, so stop the index being used until it is rebuilt
+        index = ObjectIndex.for_device(device_path, self.datadir)
+        if os.path.exists(index.path):
+            index.mark_incomplete()
+
         state_file = os.path.join(device_path,
                                   STATE_FILE.format(datadir=self.datadir))
         self.states["state"].clear()
@@ -342,7 +349,8 @@ class Relinker(object):
                     # Same lock used by invalidate_hashes, consolidate_hashes,
                     # get_hashes
                     try:
-                        for f in ('hashes.pkl', 'hashes.invalid', '.lock'):
+                        for f in ('hashes.pkl', 'hashes.invalid',
+                                  'hashes.fingerprints', '.lock'):
                             try:
                                 os.unlink(os.path.join(partition_path, f))
                             except OSError as e:
@@ -29,7 +29,8 @@ import six.moves.cPickle as pickle
 from swift import gettext_ as _
 from tempfile import mkstemp
 
-from eventlet import sleep, Timeout
+from eventlet import sleep, spawn, Timeout
+from eventlet.event import Event
 import sqlite3
 
 from swift.common.constraints import MAX_META_COUNT, MAX_META_OVERALL_SIZE, \
@@ -310,7 +311,7 @@ class DatabaseBroker(object):
 
     def __init__(self, db_file, timeout=BROKER_TIMEOUT, logger=None,
                  account=None, container=None, pending_timeout=None,
-                 stale_reads_ok=False, skip_commits=False):
+                 stale_reads_ok=False, skip_commits=False, pending_cap=None):
         """Encapsulates working with a database.
 
         :param db_file: path to a database file.
@@ -327,6 +328,9 @@ class DatabaseBroker(object):
             commit records from the pending file to the database;
             :meth:`~swift.common.db.DatabaseBroker.put_record` should not
             called on brokers with skip_commits True.
+        :param pending_cap: size in bytes of the pending file above which
+            :meth:`~swift.common.db.DatabaseBroker.put_record` commits the
+            pending records to the database; defaults to ``PENDING_CAP``.
         """
         self.conn = None
         self._db_file = db_file
@@ -340,6 +344,7 @@ class DatabaseBroker(object):
         self.container = container
         self._db_version = -1
         self.skip_commits = skip_commits
+        self.pending_cap = pending_cap
 
     def __str__(self):
         """
@@ -766,8 +771,8 @@ class DatabaseBroker(object):
         """
         Put a record into the DB. If the DB has an associated pending file with
         space then the record is appended to that file and a commit to the DB
-        is deferred. If the DB is in-memory or its pending file is full then
-        the record will be committed immediately.
+        is deferred. If the DB is in-memory or its pending file is larger than
+        ``pending_cap`` then the record will be committed immediately.
 
         :param record: a record to be added to the DB.
         :raises DatabaseConnectionError: if the DB file does not exist or if
@@ -790,7 +795,7 @@ class DatabaseBroker(object):
             except OSError as err:
                 if err.errno != errno.ENOENT:
                     raise
-            if pending_size > PENDING_CAP:
+            if pending_size > (self.pending_cap or PENDING_CAP):
                 self._commit_puts([record])
             else:
                 with open(self.pending_file, 'a+b') as fp:
@@ -1162,3 +1167,98 @@ class DatabaseBroker(object):
             'UPDATE %s_stat SET status_changed_at = ?'
             ' WHERE status_changed_at < ?' % self.db_type,
             (timestamp, timestamp))
+
+
+class PendingCommitter(object):
+    """
+    Commits the pending files of recently updated brokers from a background
+    greenthread, so that a request which puts a record into a broker only has
+    to append the record to the pending file.
+
+    Each broker passed to :meth:`add` is committed within ``interval``
+    seconds, or sooner once its pending file is larger than ``commit_size``
+    bytes. The time between a record first being appended to a pending file
+    and the pending file being committed is emitted as the
+    ``pending_commit.lag`` timing metric.
+
+    :param logger: a logger instance, used to emit metrics
+    :param interval: seconds between commits of the pending files
+    :param commit_size: size in bytes of a pending file above which it is
+                        committed without waiting for the interval to
+                        elapse, or 0 to always wait
+    """
+
+    def __init__(self, logger, interval, commit_size=0):
+        if interval <= 0:
+            raise ValueError('interval must be greater than 0')
+        self.logger = logger
+        self.interval = interval
+        self.commit_size = commit_size
+        # db_file => (broker, time the first uncommitted record was added)
+        self._pending = {}
+        self._evt = Event()
+        self._run_gth = None
+
+    def add(self, broker):
+        """
+        Note that a record has been appended to the pending file of a broker.
+
+        :param broker: a :class:`~swift.common.db.DatabaseBroker`
+        """
+        added_at = self._pending.get(broker.db_file, (None, time.time()))[1]
+        self._pending[broker.db_file] = (broker, added_at)
+        if self._run_gth is None:
+            self._run_gth = spawn(self.run)
+        if self.commit_size and not self._evt.ready():
+            try:
+                pending_size = os.path.getsize(broker.pending_file)
+            except OSError:
+                return
+            if pending_size > self.commit_size:
+                self._evt.send()
+
+    def run(self):
+        while True:
+            self._evt.wait(self.interval)
+            if self._evt.ready():
+                self._evt.reset()
+            self.commit_pending()
+
+    def commit_pending(self):
+        """
+        Commit the pending files of all the brokers that have been added since
+        the last commit.
+        """
+        pending, self._pending = self._pending, {}
+        for db_file, (broker, added_at) in pending.items():
+            if not os.path.exists(db_file):
+                # the db has since been removed, e.g. by the replicator;
+                # locking its parent directory would recreate it
+                self.logger.increment('pending_commit.skipped')
+                continue
+            try:
+                with lock_parent_directory(broker.pending_file,
+                                           broker.pending_timeout):
+                    broker._commit_puts()
+            except LockTimeout:
+                # try again next time around
+                broker = self._pending.get(db_file, (broker,))[0]
+                self._pending[db_file] = (broker, added_at)
+                self.logger.increment('pending_commit.timeouts')
+            except Exception:
+                self.logger.exception(
+                    _('Error committing pending file %s'), broker.pending_file)
+                self.logger.increment('pending_commit.errors')
+            else:
+                self.logger.timing_since('pending_commit.lag', added_at)
+            # the commits block the hub, so let requests run between them
+            sleep()
+
+    def stop(self):
+        """
+        Stop the background greenthread; records that have not been committed
+        are left in their pending files.
+        """
+        if self._run_gth is not None:
+            self._run_gth.kill()
+            self._run_gth = None
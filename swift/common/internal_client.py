@@ -848,7 +848,7 @@ class SimpleClient(object):
     def base_request(self, method, container=None, name=None, prefix=None,
                      headers=None, proxy=None, contents=None,
                      full_listing=None, logger=None, additional_info=None,
-                     timeout=None, marker=None):
+                     timeout=None, marker=None, limit=None):
         # Common request method
         trans_start = time()
         url = self.url
@@ -886,6 +886,9 @@ class SimpleClient(object):
             if marker:
                 params.append('marker=%s' % quote(marker))
 
+            if limit:
+                params.append('limit=%d' % limit)
+
             url += '?' + '&'.join(params)
 
         req = urllib2.Request(url, headers=headers, data=contents)
@@ -972,6 +975,12 @@ def head_object(url, **kwargs):
     return client.retry_request('HEAD', **kwargs)
 
 
+def get_container(url, **kwargs):
+    """For usage with container sync """
+    client = SimpleClient(url=url)
+    return client.retry_request('GET', **kwargs)
+
+
 def put_object(url, **kwargs):
     """For usage with container sync """
     client = SimpleClient(url=url)
@@ -50,10 +50,11 @@ import json
 import logging
 import time
 from bisect import bisect
+from collections import defaultdict
 
 from eventlet.green import socket
 from eventlet.pools import Pool
-from eventlet import Timeout
+from eventlet import GreenPile, Timeout
 from six.moves import range
 from swift.common import utils
 from swift.common.utils import md5
@@ -233,19 +234,27 @@ class MemcacheRing(object):
                 self._error_limited[server] = now + self._error_limit_duration
                 self.logger.error('Error limiting server %s', server)
 
-    def _get_conns(self, key):
+    def _get_servers(self, key):
         """
-        Retrieves a server conn from the pool, or connects a new one.
-        Chooses the server based on a consistent hash of "key".
+        Chooses the servers for "key" based on a consistent hash of "key".
+
+        :returns: a tuple of the servers to try, in order
         """
         pos = bisect(self._sorted, key)
         served = []
         while len(served) < self._tries:
             pos = (pos + 1) % len(self._sorted)
             server = self._ring[self._sorted[pos]]
-            if server in served:
-                continue
-            served.append(server)
+            if server not in served:
+                served.append(server)
+        return tuple(served)
+
+    def _get_conns(self, key):
+        """
+        Retrieves a server conn from the pool, or connects a new one.
+        Chooses the server based on a consistent hash of "key".
+        """
+        for server in self._get_servers(key):
             if self._error_limited[server] > time.time():
                 continue
             sock = None
@@ -489,17 +498,17 @@ class MemcacheRing(object):
             except (Exception, Timeout) as e:
                 self._exception_occurred(server, e, sock=sock, fp=fp)
 
-    def get_multi(self, keys, server_key):
+    def _get_values(self, keys, server_key):
         """
-        Gets multiple values from memcache for the given keys.
-
-        :param keys: keys for values to be retrieved from memcache
-        :param server_key: key to use in determining which server in the ring
-                           is used
-        :returns: list of values
+        Gets the values of keys stored on the servers chosen by server_key
+        with a single multi-key get.
+
+        :param keys: hashed keys for values to be retrieved from memcache
+        :param server_key: hashed key to use in determining which server in
+                           the ring is used
+        :returns: dict mapping the hashed keys that were found to their
+                  values, or None if no server could be talked to
         """
-        server_key = md5hash(server_key)
-        keys = [md5hash(key) for key in keys]
         for (server, fp, sock) in self._get_conns(server_key):
             try:
                 with Timeout(self._io_timeout):
@@ -524,13 +533,56 @@ class MemcacheRing(object):
                             responses[line[1]] = value
                             fp.readline()
                         line = fp.readline().strip().split()
-                    values = []
-                    for key in keys:
-                        if key in responses:
-                            values.append(responses[key])
-                        else:
-                            values.append(None)
                     self._return_conn(server, fp, sock)
-                    return values
+                    return responses
             except (Exception, Timeout) as e:
                 self._exception_occurred(server, e, sock=sock, fp=fp)
+        return None
+
+    def get_multi(self, keys, server_key):
+        """
+        Gets multiple values from memcache for the given keys.
+
+        :param keys: keys for values to be retrieved from memcache
+        :param server_key: key to use in determining which server in the ring
+                           is used
+        :returns: list of values
+        """
+        server_key = md5hash(server_key)
+        keys = [md5hash(key) for key in keys]
+        responses = self._get_values(keys, server_key)
+        if responses is None:
+            return None
+        return [responses.get(key) for key in keys]
+
+    def get_many(self, keys):
+        """
+        Gets multiple values from memcache for keys that were each set on
+        their own, and so may be stored on different servers.
+
+        The keys are grouped by the servers they are stored on; each group is
+        fetched with a single multi-key get, and the groups are fetched
+        concurrently.
+
+        :param keys: keys for values to be retrieved from memcache
+        :returns: list of values, with None for keys that were not found
+        """
+        keys = [md5hash(key) for key in keys]
+        groups = defaultdict(list)
+        for key in keys:
+            group = groups[self._get_servers(key)]
+            if key not in group:
+                group.append(key)
+        if len(groups) == 1:
+            group = next(iter(groups.values()))
+            results = [self._get_values(group, group[0])]
+        else:
+            pile = GreenPile(len(groups))
+            for group in groups.values():
+                pile.spawn(self._get_values, group, group[0])
+            results = list(pile)
+        responses = {}
+        for result in results:
+            if result:
+                responses.update(result)
+        return [responses.get(key) for key in keys]
@@ -180,7 +180,8 @@ class ReconMiddleware(object):
             return self._from_recon_cache(['container_updater_sweep'],
                                           self.container_recon_cache)
         elif recon_type == 'object':
-            return self._from_recon_cache(['object_updater_sweep'],
+            return self._from_recon_cache(['object_updater_sweep',
+                                           'object_updater_journal_lag'],
                                           self.object_recon_cache)
         else:
             return None
@@ -189,7 +190,8 @@ class ReconMiddleware(object):
         """get expirer info"""
         if recon_type == 'object':
             return self._from_recon_cache(['object_expiration_pass',
-                                           'expired_last_pass'],
+                                           'expired_last_pass',
+                                           'expiration_backlog_age'],
                                           self.object_recon_cache)
 
     def get_auditor_info(self, recon_type):
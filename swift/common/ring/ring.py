@@ -15,16 +15,17 @@
 
 import array
 import contextlib
+import mmap
 
 import six.moves.cPickle as pickle
 import json
-from collections import defaultdict
+from collections import defaultdict, OrderedDict
 from gzip import GzipFile
 from os.path import getmtime
 import struct
 from time import time
 import os
-from itertools import chain, count
+from itertools import chain
 from tempfile import NamedTemporaryFile
 import sys
 import zlib
@@ -45,6 +46,13 @@ def calc_replica_count(replica2part2dev_id):
     return base + extra
 
 
+def _get_assigned_dev_ids(replica2part2dev_id):
+    dev_ids = set()
+    for part2dev_id in replica2part2dev_id:
+        dev_ids.update(part2dev_id)
+    return dev_ids
+
+
 class RingReader(object):
     chunk_size = 2 ** 16
 
@@ -121,6 +129,7 @@ class RingData(object):
         self.next_part_power = next_part_power
         self.version = version
         self.md5 = self.size = self.raw_size = None
+        self.source = None
 
         for dev in self.devs:
             if dev is not None:
@@ -167,14 +176,23 @@ class RingData(object):
         return ring_dict
 
     @classmethod
-    def load(cls, filename, metadata_only=False):
+    def load(cls, filename, metadata_only=False, use_mmap=False):
         """
         Load ring data from a file.
 
         :param filename: Path to a file serialized by the save() method.
         :param bool metadata_only: If True, only load `devs` and `part_shift`.
+        :param bool use_mmap: If True and the file was saved uncompressed,
+                              memory-map the file and return read-only
+                              views of it as `replica2part2dev_id` rather
+                              than copying the partition table into memory.
         :returns: A RingData instance containing the loaded data.
         """
+        with open(filename, 'rb') as fp:
+            if fp.read(4) == b'R1NG':
+                return cls.load_uncompressed(
+                    fp, metadata_only=metadata_only, use_mmap=use_mmap)
+
         with contextlib.closing(RingReader(filename)) as gz_file:
             # See if the file is in the new format
             magic = gz_file.read(4)
@@ -200,7 +218,66 @@ class RingData(object):
             setattr(ring_data, attr, getattr(gz_file, attr))
         return ring_data
 
-    def serialize_v1(self, file_obj):
+    @classmethod
+    def load_uncompressed(cls, fp, metadata_only=False, use_mmap=False):
+        """
+        Load ring data from an uncompressed v1 ring file.
+
+        The ``md5``, ``size`` and ``raw_size`` of the returned instance are
+        those of the compressed ring it was saved from, if known.
+
+        :param fp: An opened file object which has already consumed the 4
+                   bytes of magic.
+        :param bool metadata_only: If True, only load `devs` and `part_shift`.
+        :param bool use_mmap: If True, memory-map the partition table.
+        :returns: A RingData instance containing the loaded data.
+        """
+        format_version, = struct.unpack('!H', fp.read(2))
+        if format_version != 1:
+            raise Exception('Unknown ring format version %d' %
+                            format_version)
+        byteswap = False
+        if use_mmap and not six.PY2 and not metadata_only:
+            ring_dict = cls.deserialize_v1(fp, metadata_only=True)
+            byteswap = (ring_dict.get('byteorder', sys.byteorder) !=
+                        sys.byteorder)
+        if use_mmap and not six.PY2 and not metadata_only and not byteswap:
+            # Pages of the mapping are shared by every process that maps the
+            # same file, so the partition table is only held in memory once
+            # per host.
+            offset = fp.tell()
+            view = memoryview(mmap.mmap(
+                fp.fileno(), 0, access=mmap.ACCESS_READ))
+            row_size = 2 * (1 << (32 - ring_dict['part_shift']))
+            for x in range(ring_dict['replica_count']):
+                ring_dict['replica2part2dev_id'].append(
+                    view[offset:offset + row_size].cast('H'))
+                offset += row_size
+        else:
+            fp.seek(6)
+            ring_dict = cls.deserialize_v1(fp, metadata_only=metadata_only)
+
+        ring_data = RingData(ring_dict['replica2part2dev_id'],
+                             ring_dict['devs'], ring_dict['part_shift'],
+                             ring_dict.get('next_part_power'),
+                             ring_dict.get('version'))
+        ring_data.source = ring_dict.get('source')
+        if ring_data.source:
+            for attr in ('md5', 'size', 'raw_size'):
+                setattr(ring_data, attr, ring_data.source.get(attr))
+        else:
+            ring_data.size = ring_data.raw_size = os.fstat(
+                fp.fileno()).st_size
+        return ring_data
+
+    def serialize_v1(self, file_obj, alignment=1):
+        """
+        Write this ring data in the v1 format.
+
+        :param file_obj: file-like object to write to
+        :param alignment: pad the metadata so that the partition table starts
+                          at an offset which is a multiple of this
+        """
         # Write out new-style serialization magic and version:
         file_obj.write(struct.pack('!4sH', b'R1NG', 1))
         ring = self.to_dict()
@@ -218,8 +295,13 @@ class RingData(object):
         if next_part_power is not None:
             _text['next_part_power'] = next_part_power
 
+        if self.source is not None:
+            _text['source'] = self.source
+
         json_text = json.dumps(_text, sort_keys=True,
                                ensure_ascii=True).encode('ascii')
+        # trailing whitespace is ignored when the JSON is parsed
+        json_text += b' ' * (-(10 + len(json_text)) % alignment)
         json_len = len(json_text)
         file_obj.write(struct.pack('!I', json_len))
         file_obj.write(json_text)
@@ -228,24 +310,32 @@ class RingData(object):
                 # Can't just use tofile() because a GzipFile apparently
                 # doesn't count as an 'open file'
                 file_obj.write(part2dev_id.tostring())
+            elif isinstance(part2dev_id, memoryview):
+                file_obj.write(part2dev_id)
             else:
                 part2dev_id.tofile(file_obj)
 
-    def save(self, filename, mtime=1300507380.0):
+    def save(self, filename, mtime=1300507380.0, compress=True):
         """
         Serialize this RingData instance to disk.
 
         :param filename: File into which this instance should be serialized.
         :param mtime: time used to override mtime for gzip, default or None
                       if the caller wants to include time
+        :param compress: if False, write the ring uncompressed so that it can
+                         be loaded with ``use_mmap``
         """
-        # Override the timestamp so that the same ring data creates
-        # the same bytes on disk. This makes a checksum comparison a
-        # good way to see if two rings are identical.
         tempf = NamedTemporaryFile(dir=".", prefix=filename, delete=False)
-        gz_file = GzipFile(filename, mode='wb', fileobj=tempf, mtime=mtime)
-        self.serialize_v1(gz_file)
-        gz_file.close()
+        if compress:
+            # Override the timestamp so that the same ring data creates
+            # the same bytes on disk. This makes a checksum comparison a
+            # good way to see if two rings are identical.
+            gz_file = GzipFile(filename, mode='wb', fileobj=tempf,
+                               mtime=mtime)
+            self.serialize_v1(gz_file)
+            gz_file.close()
+        else:
+            self.serialize_v1(tempf, alignment=8)
         tempf.flush()
         os.fsync(tempf.fileno())
         tempf.close()
@@ -268,12 +358,25 @@ class Ring(object):
     :param reload_time: time interval in seconds to check for a ring change
     :param ring_name: ring name string (basically specified from policy)
     :param validation_hook: hook point to validate ring configuration ontime
+    :param handoff_cache_size: maximum number of partitions whose handoff
+                               device sequence is remembered between calls
+                               to :meth:`get_more_nodes`; 0 (the default)
+                               disables the cache
+    :param use_mmap: if True, keep an uncompressed copy of the ring next to
+                     the serialized ring and memory-map its partition table
+                     instead of loading it into memory
 
     :raises RingLoadError: if the loaded ring data violates its constraint
     """
 
+    # defaults for subclasses that set up their ring data without calling
+    # __init__
+    handoff_cache_size = 0
+    use_mmap = False
+
     def __init__(self, serialized_path, reload_time=15, ring_name=None,
-                 validation_hook=lambda ring_data: None):
+                 validation_hook=lambda ring_data: None,
+                 handoff_cache_size=0, use_mmap=False):
         # can't use the ring unless HASH_PATH_SUFFIX is set
         validate_configuration()
         if ring_name:
@@ -283,12 +386,22 @@ class Ring(object):
             self.serialized_path = os.path.join(serialized_path)
         self.reload_time = reload_time
         self._validation_hook = validation_hook
+        self.handoff_cache_size = handoff_cache_size
+        self._handoff_cache = OrderedDict()
+        self.use_mmap = use_mmap
+        if self.serialized_path.endswith('.gz'):
+            self.mmap_path = self.serialized_path[:-3]
+        else:
+            self.mmap_path = self.serialized_path + '.mmap'
         self._reload(force=True)
 
     def _reload(self, force=False):
         self._rtime = time() + self.reload_time
         if force or self.has_changed():
-            ring_data = RingData.load(self.serialized_path)
+            if self.use_mmap:
+                ring_data = self._load_mmap_ring_data()
+            else:
+                ring_data = RingData.load(self.serialized_path)
 
             try:
                 self._validation_hook(ring_data)
@@ -319,14 +432,54 @@ class Ring(object):
             self._replica2part2dev_id = ring_data._replica2part2dev_id
             self._part_shift = ring_data._part_shift
             self._rebuild_tier_data()
-            self._update_bookkeeping()
+            self._update_bookkeeping(
+                (ring_data.source or {}).get('assigned_dev_ids'))
             self._next_part_power = ring_data.next_part_power
             self._version = ring_data.version
             self._md5 = ring_data.md5
             self._size = ring_data.size
             self._raw_size = ring_data.raw_size
+            # cached handoff sequences are only valid for the ring data they
+            # were computed from
+            self._handoff_cache = OrderedDict()
+
+    def _load_mmap_ring_data(self):
+        """
+        Load the ring data from the uncompressed copy at ``mmap_path``,
+        (re)writing the copy first if it wasn't made from the current
+        serialized ring.
+
+        The copy also records the ids of the devices with partitions assigned,
+        so that loading it doesn't need to walk the partition table.
+
+        If the copy can't be written, the serialized ring is loaded into
+        memory as usual.
 
-    def _update_bookkeeping(self):
+        :returns: a RingData instance
+        """
+        st = os.stat(self.serialized_path)
+        try:
+            ring_data = RingData.load(self.mmap_path, use_mmap=True)
+        except (IOError, OSError, ValueError, struct.error):
+            ring_data = None
+        if ring_data is not None and ring_data.source and \
+                ring_data.source.get('mtime') == st.st_mtime and \
+                ring_data.source.get('size') == st.st_size:
+            return ring_data
+
+        ring_data = RingData.load(self.serialized_path)
+        ring_data.source = {'mtime': st.st_mtime, 'size': st.st_size,
+                            'md5': ring_data.md5,
+                            'raw_size': ring_data.raw_size,
+                            'assigned_dev_ids': sorted(_get_assigned_dev_ids(
+                                ring_data._replica2part2dev_id))}
+        try:
+            ring_data.save(self.mmap_path, compress=False)
+            return RingData.load(self.mmap_path, use_mmap=True)
+        except (IOError, OSError):
+            return ring_data
+
+    def _update_bookkeeping(self, dev_ids_with_parts=None):
         # Do this now, when we know the data has changed, rather than
         # doing it on every call to get_more_nodes().
         #
@@ -335,10 +488,11 @@ class Ring(object):
         # way, a region, zone, or server with no partitions assigned
         # does not count toward our totals, thereby keeping the early
         # bailouts in get_more_nodes() working.
-        dev_ids_with_parts = set()
-        for part2dev_id in self._replica2part2dev_id:
-            for dev_id in part2dev_id:
-                dev_ids_with_parts.add(dev_id)
+        if dev_ids_with_parts is None:
+            dev_ids_with_parts = _get_assigned_dev_ids(
+                self._replica2part2dev_id)
+        else:
+            dev_ids_with_parts = set(dev_ids_with_parts)
         regions = set()
         zones = set()
         ips = set()
@@ -531,13 +685,66 @@ class Ring(object):
         """
         if time() > self._rtime:
             self._reload()
-        primary_nodes = self._get_part_nodes(part)
-        used = set(d['id'] for d in primary_nodes)
-        index = count()
-        same_regions = set(d['region'] for d in primary_nodes)
-        same_zones = set((d['region'], d['zone']) for d in primary_nodes)
-        same_ips = set(
-            (d['region'], d['zone'], d['ip']) for d in primary_nodes)
+        devs = self._devs
+        if self.handoff_cache_size > 0:
+            dev_ids = self._iter_cached_handoff_dev_ids(part)
+        else:
+            dev_ids = self._iter_handoff_dev_ids(part)
+        for handoff_index, dev_id in enumerate(dev_ids):
+            yield dict(devs[dev_id], handoff_index=handoff_index)
+
+    def _iter_cached_handoff_dev_ids(self, part):
+        """
+        Yield the handoff device ids for a partition, remembering them so
+        that subsequent calls for the same partition do not need to walk the
+        partition table again.
+
+        The sequence is extended lazily: most callers only consume a few
+        handoffs, so only as much of it as has been asked for is computed.
+        The cache is bounded to ``handoff_cache_size`` partitions, evicting
+        the least recently used, and is discarded whenever the ring reloads.
+
+        :param part: partition to get handoff device ids for
+        :returns: generator of device ids
+        """
+        cache = self._handoff_cache
+        try:
+            entry = cache.pop(part)
+        except KeyError:
+            entry = ([], self._iter_handoff_dev_ids(part))
+            while len(cache) >= self.handoff_cache_size:
+                cache.popitem(last=False)
+        cache[part] = entry
+        dev_ids, dev_id_iter = entry
+        i = 0
+        while True:
+            if i == len(dev_ids):
+                try:
+                    dev_ids.append(next(dev_id_iter))
+                except StopIteration:
+                    return
+            yield dev_ids[i]
+            i += 1
+
+    def _iter_handoff_dev_ids(self, part):
+        """
+        Generator to walk the partition table for the handoff device ids of
+        a partition; see :meth:`get_more_nodes`.
+
+        :param part: partition to get handoff device ids for
+        :returns: generator of device ids
+        """
+        used = set()
+        same_regions = set()
+        same_zones = set()
+        same_ips = set()
+        for r2p2d in self._replica2part2dev_id:
+            if part < len(r2p2d):
+                d = self._devs[r2p2d[part]]
+                used.add(d['id'])
+                same_regions.add(d['region'])
+                same_zones.add((d['region'], d['zone']))
+                same_ips.add((d['region'], d['zone'], d['ip']))
 
         parts = len(self._replica2part2dev_id[0])
         part_hash = md5(str(part).encode('ascii'),
@@ -560,7 +767,7 @@ class Ring(object):
                     dev = self._devs[dev_id]
                     region = dev['region']
                     if dev_id not in used and region not in same_regions:
-                        yield dict(dev, handoff_index=next(index))
+                        yield dev_id
                         used.add(dev_id)
                         same_regions.add(region)
                         zone = dev['zone']
@@ -585,7 +792,7 @@ class Ring(object):
                     dev = self._devs[dev_id]
                     zone = (dev['region'], dev['zone'])
                     if dev_id not in used and zone not in same_zones:
-                        yield dict(dev, handoff_index=next(index))
+                        yield dev_id
                         used.add(dev_id)
                         same_zones.add(zone)
                         ip = zone + (dev['ip'],)
@@ -608,7 +815,7 @@ class Ring(object):
                     dev = self._devs[dev_id]
                     ip = (dev['region'], dev['zone'], dev['ip'])
                     if dev_id not in used and ip not in same_ips:
-                        yield dict(dev, handoff_index=next(index))
+                        yield dev_id
                         used.add(dev_id)
                         same_ips.add(ip)
                         if len(same_ips) == self._num_ips:
@@ -628,7 +835,7 @@ class Ring(object):
                     dev_id = part2dev_id[handoff_part]
                     if dev_id not in used:
                         dev = self._devs[dev_id]
-                        yield dict(dev, handoff_index=next(index))
+                        yield dev_id
                         used.add(dev_id)
                         if len(used) == self._num_assigned_devs:
                             hit_all_devs = True
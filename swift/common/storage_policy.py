@@ -366,15 +366,19 @@ class BaseStoragePolicy(object):
             self._validate_policy_name(name)
         self.alias_list.insert(0, name)
 
-    def load_ring(self, swift_dir):
+    def load_ring(self, swift_dir, handoff_cache_size=0, use_mmap=False):
         """
         Load the ring for this policy immediately.
 
         :param swift_dir: path to rings
+        :param handoff_cache_size: see :class:`~swift.common.ring.Ring`
+        :param use_mmap: see :class:`~swift.common.ring.Ring`
         """
         if self.object_ring:
             return
-        self.object_ring = Ring(swift_dir, ring_name=self.ring_name)
+        self.object_ring = Ring(swift_dir, ring_name=self.ring_name,
+                                handoff_cache_size=handoff_cache_size,
+                                use_mmap=use_mmap)
 
     @property
     def quorum(self):
@@ -643,11 +647,13 @@ class ECStoragePolicy(BaseStoragePolicy):
         """
         return self._ec_quorum_size * self.ec_duplication_factor
 
-    def load_ring(self, swift_dir):
+    def load_ring(self, swift_dir, handoff_cache_size=0, use_mmap=False):
         """
         Load the ring for this policy immediately.
 
         :param swift_dir: path to rings
+        :param handoff_cache_size: see :class:`~swift.common.ring.Ring`
+        :param use_mmap: see :class:`~swift.common.ring.Ring`
         """
         if self.object_ring:
             return
@@ -674,7 +680,8 @@ class ECStoragePolicy(BaseStoragePolicy):
 
         self.object_ring = Ring(
             swift_dir, ring_name=self.ring_name,
-            validation_hook=validate_ring_data)
+            validation_hook=validate_ring_data,
+            handoff_cache_size=handoff_cache_size, use_mmap=use_mmap)
 
     def get_backend_index(self, node_index):
         """
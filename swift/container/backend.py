@@ -172,6 +172,21 @@ CONTAINER_STAT_VIEW_SCRIPT = '''
 '''
 
 
+def _is_plain_merge_item(item):
+    """
+    Check if an object item can be merged by comparing its ``created_at``
+    with that of an existing record as a string: it has a single,
+    normalized timestamp with no offset and no separate content-type or
+    metadata timestamps.
+    """
+    created_at = item['created_at']
+    return (isinstance(created_at, six.string_types) and
+            len(created_at) == 16 and
+            created_at[10] == '.' and
+            not any(item.get(key) for key in (
+                'ctype_timestamp', 'meta_timestamp', 'data_timestamp')))
+
+
 def update_new_item_from_existing(new_item, existing):
     """
     Compare the data and meta related timestamps of a new object item with
@@ -346,7 +361,7 @@ class ContainerBroker(DatabaseBroker):
     def __init__(self, db_file, timeout=BROKER_TIMEOUT, logger=None,
                  account=None, container=None, pending_timeout=None,
                  stale_reads_ok=False, skip_commits=False,
-                 force_db_file=False):
+                 force_db_file=False, pending_cap=None):
         self._init_db_file = db_file
         if db_file == ':memory:':
             base_db_file = db_file
@@ -354,7 +369,7 @@ class ContainerBroker(DatabaseBroker):
             base_db_file = make_db_file_path(db_file, None)
         super(ContainerBroker, self).__init__(
             base_db_file, timeout, logger, account, container, pending_timeout,
-            stale_reads_ok, skip_commits=skip_commits)
+            stale_reads_ok, skip_commits=skip_commits, pending_cap=pending_cap)
         # the root account and container are populated on demand
         self._root_account = self._root_container = None
         self._force_db_file = force_db_file
@@ -1306,13 +1321,66 @@ class ContainerBroker(DatabaseBroker):
             elif not six.PY2 and isinstance(item['name'], six.binary_type):
                 item['name'] = item['name'].decode('utf-8')
 
-        def _really_really_merge_items(conn):
-            curs = conn.cursor()
-            if self.get_db_version(conn) >= 1:
-                query_mod = ' deleted IN (0, 1) AND '
-            else:
-                query_mod = ''
-            curs.execute('BEGIN IMMEDIATE')
+        def _merge_plain_items(curs, query_mod, plain_items):
+            # Stage the items in a temporary table and merge them with a few
+            # set based statements; their timestamps have the same fixed width
+            # format so can be compared as strings. Any item with an existing
+            # record that is not so simple is returned to be merged in python.
+            object_mod = query_mod.replace('deleted', 'object.deleted')
+            curs.execute('''
+                CREATE TEMP TABLE IF NOT EXISTS object_merge (
+                    name TEXT,
+                    created_at TEXT,
+                    size INTEGER,
+                    content_type TEXT,
+                    etag TEXT,
+                    deleted INTEGER,
+                    storage_policy_index INTEGER
+                )''')
+            curs.execute('DELETE FROM object_merge')
+            curs.executemany(
+                'INSERT INTO object_merge (name, created_at, size, '
+                'content_type, etag, deleted, storage_policy_index) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                ((rec['name'], rec['created_at'], rec['size'],
+                  rec['content_type'], rec['etag'], rec['deleted'],
+                  rec['storage_policy_index'])
+                 for rec in plain_items.values()))
+            existing_match = (
+                'FROM object WHERE ' + object_mod +
+                'object.name = object_merge.name AND '
+                'object.storage_policy_index = '
+                'object_merge.storage_policy_index')
+            not_plain = (
+                'EXISTS (SELECT 1 ' + existing_match +
+                ' AND (length(object.created_at) != 16 OR '
+                'substr(object.created_at, 11, 1) != \'.\'))')
+            other_idents = set(tuple(row) for row in curs.execute(
+                'SELECT name, storage_policy_index FROM object_merge '
+                'WHERE ' + not_plain))
+            if other_idents:
+                curs.execute('DELETE FROM object_merge WHERE ' + not_plain)
+            # CROSS JOIN makes sqlite look up the staged names in the object
+            # table rather than scan it
+            curs.execute(
+                'DELETE FROM object WHERE ROWID IN ('
+                'SELECT object.ROWID FROM object_merge '
+                'CROSS JOIN object ON ' +
+                object_mod + 'object.name = object_merge.name AND '
+                'object.storage_policy_index = '
+                'object_merge.storage_policy_index '
+                'WHERE object.created_at < object_merge.created_at)')
+            curs.execute(
+                'INSERT INTO object (name, created_at, size, content_type, '
+                'etag, deleted, storage_policy_index) '
+                'SELECT name, created_at, size, content_type, etag, deleted, '
+                'storage_policy_index FROM object_merge '
+                'WHERE NOT EXISTS (SELECT 1 ' + existing_match + ') '
+                'ORDER BY ROWID')
+            curs.execute('DELETE FROM object_merge')
+            return [plain_items[item_ident] for item_ident in other_idents]
+
+        def _merge_other_items(curs, query_mod, item_list):
             # Get sqlite records for objects in item_list that already exist.
             # We must chunk it up to avoid sqlite's limit of 999 args.
             records = {}
@@ -1330,7 +1398,6 @@ class ContainerBroker(DatabaseBroker):
             to_delete = set()
             to_add = {}
             for item in item_list:
-                item.setdefault('storage_policy_index', 0)  # legacy
                 item_ident = (item['name'], item['storage_policy_index'])
                 existing = self._record_to_dict(records.get(item_ident))
                 if update_new_item_from_existing(item, existing):
@@ -1353,6 +1420,41 @@ class ContainerBroker(DatabaseBroker):
                       rec['content_type'], rec['etag'], rec['deleted'],
                       rec['storage_policy_index'])
                      for rec in to_add.values()))
+
+        def _really_really_merge_items(conn):
+            curs = conn.cursor()
+            if self.get_db_version(conn) >= 1:
+                query_mod = ' deleted IN (0, 1) AND '
+            else:
+                query_mod = ''
+            curs.execute('BEGIN IMMEDIATE')
+            # Items with a single plain timestamp are merged in bulk; the
+            # newest of any duplicates in item_list wins, or the first if
+            # their timestamps are equal.
+            plain_items = {}
+            other_idents = set()
+            for item in item_list:
+                item.setdefault('storage_policy_index', 0)  # legacy
+                item_ident = (item['name'], item['storage_policy_index'])
+                if not _is_plain_merge_item(item):
+                    other_idents.add(item_ident)
+                elif (item_ident not in plain_items or
+                        item['created_at'] >
+                        plain_items[item_ident]['created_at']):
+                    plain_items[item_ident] = item
+            # any ident with an item that is not plain has all its items
+            # merged in python, in their original order
+            other_items = [
+                item for item in item_list
+                if (item['name'], item['storage_policy_index'])
+                in other_idents]
+            for item_ident in other_idents:
+                plain_items.pop(item_ident, None)
+            if plain_items:
+                other_items.extend(
+                    _merge_plain_items(curs, query_mod, plain_items))
+            if other_items:
+                _merge_other_items(curs, query_mod, other_items)
             if source:
                 # for replication we rely on the remote end sending merges in
                 # order with no gaps to increment sync_points
@@ -1375,7 +1477,8 @@ class ContainerBroker(DatabaseBroker):
             try:
                 return _really_merge_items(conn)
             except sqlite3.OperationalError as err:
-                if 'no such column: storage_policy_index' not in str(err):
+                if not str(err).startswith('no such column: ') or \
+                        not str(err).endswith('storage_policy_index'):
                     raise
                 self._migrate_add_storage_policy(conn)
                 return _really_merge_items(conn)
@@ -30,7 +30,8 @@ from swift.container.sync_store import ContainerSyncStore
 from swift.container.backend import ContainerBroker, DATADIR, \
     RECORD_TYPE_SHARD, UNSHARDED, SHARDING, SHARDED, SHARD_UPDATE_STATES
 from swift.container.replicator import ContainerReplicatorRpc
-from swift.common.db import DatabaseAlreadyExists
+from swift.common.db import DatabaseAlreadyExists, PendingCommitter, \
+    PENDING_CAP
 from swift.common.container_sync_realms import ContainerSyncRealms
 from swift.common.request_helpers import split_and_validate_path, \
     is_sys_or_user_meta, validate_internal_container, validate_internal_obj, \
@@ -40,7 +41,8 @@ from swift.common.utils import get_logger, hash_path, public, \
     config_true_value, timing_stats, replication, \
     override_bytes_from_content_type, get_log_line, \
     config_fallocate_value, fs_has_free_space, list_from_csv, \
-    ShardRange
+    ShardRange, config_positive_int_value, non_negative_float, \
+    non_negative_int
 from swift.common.constraints import valid_timestamp, check_utf8, \
     check_drive, AUTO_CREATE_ACCOUNT_PREFIX
 from swift.common.bufferedhttp import http_connect
@@ -128,6 +130,8 @@ class ContainerController(BaseStorageServer):
         self.mount_check = config_true_value(conf.get('mount_check', 'true'))
         self.node_timeout = float(conf.get('node_timeout', 3))
         self.conn_timeout = float(conf.get('conn_timeout', 0.5))
+        self.redirect_sharding_updates = config_true_value(
+            conf.get('redirect_sharding_updates', 'false'))
         #: ContainerSyncCluster instance for validating sync-to values.
         self.realms_conf = ContainerSyncRealms(
             os.path.join(
@@ -172,6 +176,17 @@ class ContainerController(BaseStorageServer):
                                              self.mount_check)
         self.fallocate_reserve, self.fallocate_is_percent = \
             config_fallocate_value(conf.get('fallocate_reserve', '1%'))
+        self.pending_cap = config_positive_int_value(
+            conf.get('pending_cap', PENDING_CAP))
+        pending_commit_interval = non_negative_float(
+            conf.get('pending_commit_interval', 0))
+        if pending_commit_interval:
+            self.pending_committer = PendingCommitter(
+                self.logger, pending_commit_interval,
+                commit_size=non_negative_int(
+                    conf.get('pending_commit_size', 65536)))
+        else:
+            self.pending_committer = None
 
     def _get_container_broker(self, drive, part, account, container, **kwargs):
         """
@@ -189,6 +204,7 @@ class ContainerController(BaseStorageServer):
         kwargs.setdefault('account', account)
         kwargs.setdefault('container', container)
         kwargs.setdefault('logger', self.logger)
+        kwargs.setdefault('pending_cap', self.pending_cap)
         return ContainerBroker(db_path, **kwargs)
 
     def get_and_validate_policy_index(self, req):
@@ -314,7 +330,10 @@ class ContainerController(BaseStorageServer):
         """
         If the request indicates that it can accept a redirection, look for a
         shard range that contains ``obj_name`` and if one exists return a
-        HTTPMovedPermanently response.
+        HTTPMovedPermanently response. A request that only accepts a
+        redirection from a container that has started sharding is only
+        redirected if ``redirect_sharding_updates`` is enabled and the
+        container has started sharding.
 
         :param req: an instance of :class:`~swift.common.swob.Request`
         :param broker: a container broker
@@ -330,6 +349,14 @@ class ContainerController(BaseStorageServer):
             # proxy learns about it. Note that this path is also used by old,
             # pre-sharding updaters during a rolling upgrade.
             return None
+        if config_true_value(req.headers.get(
+                'x-backend-accept-redirect-if-sharding', False)) and not (
+                self.redirect_sharding_updates and
+                broker.get_db_state() in (SHARDING, SHARDED)):
+            # The object-server asks to be redirected so that the proxy learns
+            # of stale shard ranges, but updates to a container that has not
+            # started sharding are not worth a shard range lookup.
+            return None
 
         shard_ranges = broker.get_shard_ranges(
             includes=obj_name, states=SHARD_UPDATE_STATES)
@@ -390,6 +417,8 @@ class ContainerController(BaseStorageServer):
 
             broker.delete_object(obj, req.headers.get('x-timestamp'),
                                  obj_policy_index)
+            if self.pending_committer:
+                self.pending_committer.add(broker)
             return HTTPNoContent(request=req)
         else:
             # delete container
@@ -534,6 +563,8 @@ class ContainerController(BaseStorageServer):
                               wsgi_to_str(req.headers.get(
                                   'x-content-type-timestamp')),
                               wsgi_to_str(req.headers.get('x-meta-timestamp')))
+            if self.pending_committer:
+                self.pending_committer.add(broker)
             return HTTPCreated(request=req)
 
         record_type = req.headers.get('x-backend-record-type', '').lower()
@@ -846,6 +877,12 @@ class ContainerController(BaseStorageServer):
         broker = self._get_container_broker(drive, part, account, container)
         self._maybe_autocreate(broker, req_timestamp, account,
                                requested_policy_index, req)
+        if config_true_value(
+                req.headers.get('x-backend-accept-redirect', False)) and \
+                broker.get_shard_ranges(states=SHARD_UPDATE_STATES):
+            # The items may belong in shard containers; a sender that accepts
+            # redirects can send them one by one to be redirected instead.
+            return HTTPConflict(request=req)
         try:
             objs = json.load(req.environ['wsgi.input'])
         except ValueError as err:
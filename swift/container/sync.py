@@ -22,7 +22,7 @@ from time import ctime, time
 from random import choice, random
 from struct import unpack_from
 
-from eventlet import sleep, Timeout
+from eventlet import GreenPool, sleep, Timeout
 from six.moves.urllib.parse import urlparse
 
 import swift.common.db
@@ -31,16 +31,17 @@ from swift.container.backend import ContainerBroker
 from swift.container.sync_store import ContainerSyncStore
 from swift.common.container_sync_realms import ContainerSyncRealms
 from swift.common.internal_client import (
-    delete_object, put_object, head_object,
+    delete_object, put_object, head_object, get_container,
     InternalClient, UnexpectedResponse)
 from swift.common.exceptions import ClientException
 from swift.common.ring import Ring
 from swift.common.ring.utils import is_local_device
 from swift.common.swob import normalize_etag
 from swift.common.utils import (
-    clean_content_type, config_true_value,
+    clean_content_type, config_true_value, config_positive_int_value,
     FileLikeIter, get_logger, hash_path, quote, validate_sync_to,
-    whataremyips, Timestamp, decode_timestamps)
+    whataremyips, Timestamp, decode_timestamps,
+    last_modified_date_to_timestamp)
 from swift.common.daemon import Daemon
 from swift.common.http import HTTP_UNAUTHORIZED, HTTP_NOT_FOUND, HTTP_CONFLICT
 from swift.common.wsgi import ConfigString
@@ -176,6 +177,14 @@ class ContainerSync(Daemon):
         #: to the next one. If a container sync hasn't finished in this time,
         #: it'll just be resumed next scan.
         self.container_time = int(conf.get('container_time', 60))
+        #: Number of rows of a container database to read and sync at a time.
+        #: The objects of a batch that need to be PUT are looked up in a
+        #: listing of the remote container rather than with a HEAD each.
+        self.batch_size = config_positive_int_value(
+            conf.get('batch_size', 1))
+        #: Number of rows of a batch to sync concurrently.
+        self.concurrency = config_positive_int_value(
+            conf.get('concurrency', 1))
         #: ContainerSyncCluster instance for validating sync-to values.
         self.realms_conf = ContainerSyncRealms(
             os.path.join(
@@ -398,12 +407,11 @@ class ContainerSync(Daemon):
                 sync_stage_time = start_at
                 try:
                     while time() < stop_at and sync_point2 < sync_point1:
-                        rows = broker.get_items_since(sync_point2, 1)
+                        rows = [row for row in broker.get_items_since(
+                                sync_point2, self.batch_size)
+                                if row['ROWID'] <= sync_point1]
                         if not rows:
                             break
-                        row = rows[0]
-                        if row['ROWID'] > sync_point1:
-                            break
                         # This node will only initially sync out one third
                         # of the objects (if 3 replicas, 1/4 if 4, etc.)
                         # and will skip problematic rows as needed in case of
@@ -411,12 +419,13 @@ class ContainerSync(Daemon):
                         # This section will attempt to sync previously skipped
                         # rows in case the previous attempts by any of the
                         # nodes didn't succeed.
-                        if not self.container_sync_row(
-                                row, sync_to, user_key, broker, info, realm,
-                                realm_key):
-                            if not next_sync_point:
+                        results = self.container_sync_rows(
+                            rows, sync_to, user_key, broker, info, realm,
+                            realm_key)
+                        for row, success in zip(rows, results):
+                            if not success and not next_sync_point:
                                 next_sync_point = sync_point2
-                        sync_point2 = row['ROWID']
+                            sync_point2 = row['ROWID']
                         broker.set_x_container_sync_points(None, sync_point2)
                     if next_sync_point:
                         broker.set_x_container_sync_points(None,
@@ -425,24 +434,28 @@ class ContainerSync(Daemon):
                         next_sync_point = sync_point2
                     sync_stage_time = time()
                     while sync_stage_time < stop_at:
-                        rows = broker.get_items_since(sync_point1, 1)
+                        rows = broker.get_items_since(sync_point1,
+                                                      self.batch_size)
                         if not rows:
                             break
-                        row = rows[0]
-                        key = hash_path(info['account'], info['container'],
-                                        row['name'], raw_digest=True)
                         # This node will only initially sync out one third of
                         # the objects (if 3 replicas, 1/4 if 4, etc.).
                         # It'll come back around to the section above
                         # and attempt to sync previously skipped rows in case
                         # the other nodes didn't succeed or in case it failed
                         # to do so the first time.
-                        if unpack_from('>I', key)[0] % \
-                                len(nodes) == ordinal:
-                            self.container_sync_row(
-                                row, sync_to, user_key, broker, info, realm,
-                                realm_key)
-                        sync_point1 = row['ROWID']
+                        my_rows = []
+                        for row in rows:
+                            key = hash_path(info['account'],
+                                            info['container'],
+                                            row['name'], raw_digest=True)
+                            if unpack_from('>I', key)[0] % \
+                                    len(nodes) == ordinal:
+                                my_rows.append(row)
+                        self.container_sync_rows(
+                            my_rows, sync_to, user_key, broker, info, realm,
+                            realm_key)
+                        sync_point1 = rows[-1]['ROWID']
                         broker.set_x_container_sync_points(sync_point1, None)
                         sync_stage_time = time()
                     self.container_syncs += 1
@@ -463,7 +476,8 @@ class ContainerSync(Daemon):
         """
         Updates container sync headers
 
-        :param name: The name of the object
+        :param name: The name of the object, or None for a request to the
+                     remote container itself.
         :param sync_to: The URL to the remote container.
         :param user_key: The X-Container-Sync-Key to use when sending requests
                          to the other container.
@@ -478,7 +492,9 @@ class ContainerSync(Daemon):
         """
         if realm and realm_key:
             nonce = uuid.uuid4().hex
-            path = urlparse(sync_to).path + '/' + quote(name)
+            path = urlparse(sync_to).path
+            if name is not None:
+                path += '/' + quote(name)
             sig = self.realms_conf.get_sig(method, path,
                                            headers.get('x-timestamp', 0),
                                            nonce, realm_key,
@@ -531,8 +547,106 @@ class ContainerSync(Daemon):
                 return False
             raise http_err
 
+    def _list_remote_container(self, names, sync_to, user_key, realm,
+                               realm_key):
+        """
+        Looks up the given object names in listings of the remote container,
+        so that a batch of rows doesn't need a HEAD per object to find out
+        which objects the remote already has.
+
+        Each listing starts just before the first name not yet looked up and
+        asks for as many entries as there are names left, so names that sort
+        close together are covered by a single request. No more requests are
+        made than there are names.
+
+        :param names: The names of the objects to look up.
+        :param sync_to: The URL to the remote container.
+        :param user_key: The X-Container-Sync-Key to use when sending requests
+                         to the other container.
+        :param realm: The realm from self.realms_conf.
+        :param realm_key: The realm key from self.realms_conf.
+        :returns: a dict mapping each name that was looked up to the remote
+                  object's last modified Timestamp, or to None if the remote
+                  container doesn't have the object. Names that could not be
+                  looked up are not in the dict.
+        """
+        remote_timestamps = {}
+        pending = sorted(set(names), reverse=True)
+        requests_left = len(pending)
+        marker = ''
+        try:
+            while pending and requests_left:
+                requests_left -= 1
+                marker = max(marker, pending[-1][:-1])
+                limit = len(pending)
+                headers = {'x-timestamp': Timestamp.now().internal}
+                self._update_sync_to_headers(None, sync_to, user_key, realm,
+                                             realm_key, 'GET', headers)
+                _junk, listing = get_container(
+                    sync_to, headers=headers, marker=marker, limit=limit,
+                    proxy=self.select_http_proxy(), logger=self.logger,
+                    timeout=self.conn_timeout, retries=0)
+                listing = listing or []
+                listed = dict(
+                    (obj['name'],
+                     last_modified_date_to_timestamp(obj['last_modified']))
+                    for obj in listing)
+                complete = len(listing) < limit
+                if listing:
+                    marker = listing[-1]['name']
+                while pending and (complete or pending[-1] <= marker):
+                    name = pending.pop()
+                    remote_timestamps[name] = listed.get(name)
+        except (Exception, Timeout) as err:
+            self.logger.debug('Unable to list remote container %s: %s',
+                              sync_to, err)
+        return remote_timestamps
+
+    def container_sync_rows(self, rows, sync_to, user_key, broker, info,
+                            realm, realm_key):
+        """
+        Sends the updates the given rows indicate to the sync_to container,
+        up to self.concurrency at a time.
+
+        If more than one of the rows is for a live object and a realm is
+        configured, the remote container is listed once for the batch instead
+        of each object being checked with a HEAD. Objects that the listing
+        could not account for are still checked with a HEAD.
+
+        :param rows: The updated rows in the local database triggering the
+                     sync updates.
+        :param sync_to: The URL to the remote container.
+        :param user_key: The X-Container-Sync-Key to use when sending requests
+                         to the other container.
+        :param broker: The local container database broker.
+        :param info: The get_info result from the local container database
+                     broker.
+        :param realm: The realm from self.realms_conf, if there is one.
+            If None, fallback to using the older allowed_sync_hosts
+            way of syncing.
+        :param realm_key: The realm key from self.realms_conf, if there
+            is one. If None, fallback to using the older
+            allowed_sync_hosts way of syncing.
+        :returns: a list with the container_sync_row result for each row
+        """
+        remote_timestamps = None
+        names = [row['name'] for row in rows if not row.get('deleted', True)]
+        # only the container sync middleware can authorize a listing of the
+        # remote container, the older sync key is good for objects only
+        if realm and realm_key and len(names) > 1:
+            remote_timestamps = self._list_remote_container(
+                names, sync_to, user_key, realm, realm_key)
+
+        def sync_row(row):
+            return self.container_sync_row(
+                row, sync_to, user_key, broker, info, realm, realm_key,
+                remote_timestamps=remote_timestamps)
+
+        pool = GreenPool(self.concurrency)
+        return list(pool.imap(sync_row, rows))
+
     def container_sync_row(self, row, sync_to, user_key, broker, info,
-                           realm, realm_key):
+                           realm, realm_key, remote_timestamps=None):
         """
         Sends the update the row indicates to the sync_to container.
         Update can be either delete or put.
@@ -551,6 +665,9 @@ class ContainerSync(Daemon):
         :param realm_key: The realm key from self.realms_conf, if there
             is one. If None, fallback to using the older
             allowed_sync_hosts way of syncing.
+        :param remote_timestamps: An optional dict, as returned by
+            :meth:`_list_remote_container`, used instead of a HEAD to find
+            out whether the remote already has the object.
         :returns: True on success
         """
         try:
@@ -581,9 +698,14 @@ class ContainerSync(Daemon):
             else:
                 # when sync'ing a live object, use ts_meta - this is the time
                 # at which the source object was last modified by a PUT or POST
-                if self._object_in_remote_container(row['name'],
-                                                    sync_to, user_key, realm,
-                                                    realm_key, ts_meta):
+                if remote_timestamps and row['name'] in remote_timestamps:
+                    remote_ts = remote_timestamps[row['name']]
+                    if remote_ts is not None and ts_meta <= remote_ts:
+                        return True
+                elif self._object_in_remote_container(row['name'],
+                                                      sync_to, user_key,
+                                                      realm, realm_key,
+                                                      ts_meta):
                     return True
                 exc = None
                 # look up for the newest one; the symlink=get query-string has
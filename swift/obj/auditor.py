@@ -26,7 +26,8 @@ from eventlet import Timeout
 
 from swift.obj import diskfile, replicator
 from swift.common.exceptions import DiskFileQuarantined, DiskFileNotExist,\
-    DiskFileDeleted, DiskFileExpired, QuarantineRequest
+    DiskFileDeleted, DiskFileExpired, QuarantineRequest, \
+    DiskFileDeviceUnavailable
 from swift.common.daemon import Daemon
 from swift.common.storage_policy import POLICIES
 from swift.common.utils import (
@@ -111,6 +112,30 @@ class AuditorWorker(object):
         else:
             return {top_level_key: item}
 
+    def rebuild_object_indexes(self, device_dirs=None):
+        """
+        Rebuild the object index of each policy on each device from the hash
+        dirs on disk, for the policies that have an object index enabled.
+        """
+        for policy in POLICIES:
+            df_mgr = self.diskfile_router[policy]
+            if not df_mgr.object_index:
+                continue
+            for device in device_dirs or listdir(self.devices):
+                try:
+                    counts = df_mgr.rebuild_object_index(device, policy)
+                except DiskFileDeviceUnavailable:
+                    continue
+                except Exception:
+                    self.logger.exception(
+                        'ERROR rebuilding object index of %s for policy %s',
+                        device, policy.idx)
+                    continue
+                self.logger.info(
+                    'Rebuilt object index of %s for policy %s: '
+                    '%d added, %d removed, %d updated', device, policy.idx,
+                    counts['added'], counts['removed'], counts['updated'])
+
     def audit_all_objects(self, mode='once', device_dirs=None):
         description = ''
         if device_dirs:
@@ -132,6 +157,9 @@ class AuditorWorker(object):
         total_errors = 0
         time_auditing = 0
 
+        if self.auditor_type == 'ALL':
+            self.rebuild_object_indexes(device_dirs)
+
         # get AuditLocations for each policy
         loc_generators = []
         for policy in POLICIES:
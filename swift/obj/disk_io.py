@@ -0,0 +1,103 @@
+# Copyright (c) 2021 OpenStack Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Executors for the blocking disk reads and writes made by the object server.
+
+Object data is read and written with plain blocking system calls; while a
+greenthread waits on a slow disk, every other greenthread in the process
+waits too. A :class:`ThreadPoolDiskIOExecutor` moves those calls into
+eventlet's thread pool, with a limit on the number of calls in flight for
+each device so that one slow disk can't tie up every thread in the pool.
+"""
+
+import time
+from collections import defaultdict
+
+from eventlet import tpool
+from eventlet.semaphore import Semaphore
+
+
+class DiskIOExecutor(object):
+    """
+    Makes disk I/O calls in the calling greenthread.
+
+    :param logger: a logger, used to emit metrics
+    """
+
+    def __init__(self, logger=None):
+        self.logger = logger
+
+    def execute(self, device, func, *args, **kwargs):
+        """
+        Call ``func(*args, **kwargs)`` and return its result.
+
+        :param device: path of the device the call does I/O on
+        :param func: the blocking callable
+        """
+        return func(*args, **kwargs)
+
+
+class ThreadPoolDiskIOExecutor(DiskIOExecutor):
+    """
+    Makes disk I/O calls in eventlet's thread pool.
+
+    At most ``threads_per_device`` calls per device are run at once; other
+    calls for the same device wait their turn in the calling greenthread, and
+    the time they spend waiting is emitted as the ``disk_io.queue_wait``
+    timing metric.
+
+    The size of eventlet's thread pool, set with the
+    ``EVENTLET_THREADPOOL_SIZE`` environment variable, bounds the number of
+    calls in flight across all devices.
+
+    :param threads_per_device: the number of calls per device to run at once
+    :param logger: a logger, used to emit metrics
+    """
+
+    def __init__(self, threads_per_device, logger=None):
+        super(ThreadPoolDiskIOExecutor, self).__init__(logger)
+        if threads_per_device < 1:
+            raise ValueError('threads_per_device must be a positive integer')
+        self.threads_per_device = threads_per_device
+        self._semaphores = defaultdict(
+            lambda: Semaphore(self.threads_per_device))
+
+    def execute(self, device, func, *args, **kwargs):
+        semaphore = self._semaphores[device]
+        if semaphore.locked():
+            queued_at = time.time()
+            semaphore.acquire()
+            if self.logger:
+                self.logger.timing_since('disk_io.queue_wait', queued_at)
+        else:
+            semaphore.acquire()
+        try:
+            return tpool.execute(func, *args, **kwargs)
+        finally:
+            semaphore.release()
+
+
+def get_disk_io_executor(threads_per_device, logger=None):
+    """
+    :param threads_per_device: the number of disk I/O calls per device to
+                               run in eventlet's thread pool at once, or 0 to
+                               make them in the calling greenthread
+    :param logger: a logger, used to emit metrics
+    :returns: a :class:`DiskIOExecutor`
+    """
+    if threads_per_device > 0:
+        return ThreadPoolDiskIOExecutor(threads_per_device, logger)
+    return DiskIOExecutor(logger)
@@ -61,7 +61,7 @@ from swift.common.constraints import check_drive
 from swift.common.request_helpers import is_sys_meta
 from swift.common.utils import mkdirs, Timestamp, \
     storage_directory, hash_path, renamer, fallocate, fsync, fdatasync, \
-    fsync_dir, drop_buffer_cache, lock_path, write_pickle, \
+    fsync_dir, drop_buffer_cache, lock_path, lock_file, write_pickle, \
     config_true_value, listdir, split_path, remove_file, \
     get_md5_socket, F_SETPIPE_SZ, decode_timestamps, encode_timestamps, \
     MD5_OF_EMPTY_STRING, link_fd_to_path, \
@@ -77,12 +77,18 @@ from swift.common.swob import multi_range_iterator
 from swift.common.storage_policy import (
     get_policy_string, split_policy_string, PolicyError, POLICIES,
     REPL_POLICY, EC_POLICY)
+from swift.obj.disk_io import get_disk_io_executor
+from swift.obj.object_index import ObjectIndex
 
 
 PICKLE_PROTOCOL = 2
 DEFAULT_RECLAIM_AGE = timedelta(weeks=1).total_seconds()
 HASH_FILE = 'hashes.pkl'
 HASH_INVALIDATIONS_FILE = 'hashes.invalid'
+HASH_FINGERPRINTS_FILE = 'hashes.fingerprints'
+# hash dirs modified less than this many seconds before they are hashed may
+# still change without their mtime changing, so are not fingerprinted
+FINGERPRINT_RACY_WINDOW = 1.0
 METADATA_KEY = b'user.swift.metadata'
 METADATA_CHECKSUM_KEY = b'user.swift.metadata_checksum'
 DROP_CACHE_WINDOW = 1024 * 1024
@@ -92,6 +98,7 @@ RESERVED_DATAFILE_META = {'content-length', 'deleted', 'etag'}
 DATAFILE_SYSTEM_META = {'x-static-large-object'}
 DATADIR_BASE = 'objects'
 ASYNCDIR_BASE = 'async_pending'
+ASYNC_JOURNAL_FILE = '.async_pending.journal'
 TMP_BASE = 'tmp'
 MIN_TIME_UPDATE_AUDITOR_STATUS = 60
 # This matches rsync tempfiles, like ".<timestamp>.data.Xy095a"
@@ -131,6 +138,21 @@ def get_tmp_dir(policy_or_index):
     return get_policy_string(TMP_BASE, policy_or_index)
 
 
+def append_async_journal(dev_path, entries, timeout=10):
+    '''
+    Append entries to the async_pending journal of a device. Each entry is
+    the path of an async_pending suffix dir relative to the device, e.g.
+    ``async_pending-1/abc``, that has had an async pending written to it.
+
+    :param dev_path: path to the device
+    :param entries: a list of entries
+    :param timeout: time to wait for the journal's lock
+    '''
+    journal_path = os.path.join(dev_path, ASYNC_JOURNAL_FILE)
+    with lock_file(journal_path, timeout, append=True, unlink=False) as fp:
+        fp.write(''.join(entry + '\n' for entry in entries).encode('ascii'))
+
+
 def _get_filename(fd):
     """
     Helper function to get to file name from a file descriptor or filename.
@@ -432,6 +454,66 @@ def consolidate_hashes(partition_dir):
         return hashes
 
 
+def read_suffix_fingerprints(partition_dir):
+    """
+    Read the fingerprints of the hash dirs of a partition's suffixes.
+
+    :returns: a dict mapping suffixes to dicts of hash dir fingerprints, empty
+              if the fingerprints file is corrupt, cannot be read or does not
+              exist
+    """
+    fingerprints_file = join(partition_dir, HASH_FINGERPRINTS_FILE)
+    try:
+        with open(fingerprints_file, 'rb') as fp:
+            fingerprints = pickle.loads(fp.read())
+    except Exception:
+        # missing, unreadable or corrupt; it's only a cache
+        return {}
+    if not isinstance(fingerprints, dict) or not all(
+            valid_suffix(key) and isinstance(value, dict)
+            for key, value in fingerprints.items()):
+        return {}
+    return fingerprints
+
+
+def write_suffix_fingerprints(partition_dir, fingerprints):
+    """
+    Write the fingerprints of the hash dirs of a partition's suffixes.
+    """
+    fingerprints_file = join(partition_dir, HASH_FINGERPRINTS_FILE)
+    write_pickle(fingerprints, fingerprints_file, partition_dir,
+                 PICKLE_PROTOCOL)
+
+
+class _HashUpdateRecorder(object):
+    """
+    Stands in for the hasher of one key in a dict of suffix hashers, recording
+    the updates made to it so that they can be replayed later.
+    """
+
+    def __init__(self, key, updates):
+        self.key = key
+        self.updates = updates
+
+    def update(self, value):
+        self.updates.append((self.key, value))
+
+
+class _RecordingHashes(dict):
+    """
+    A dict of :class:`_HashUpdateRecorder` that records, in order, the updates
+    made to the hashers of all its keys.
+    """
+
+    def __init__(self):
+        super(_RecordingHashes, self).__init__()
+        self.updates = []
+
+    def __missing__(self, key):
+        recorder = self[key] = _HashUpdateRecorder(key, self.updates)
+        return recorder
+
+
 def invalidate_hash(suffix_dir):
     """
     Invalidates the hash for a suffix_dir in the partition's hashes file.
@@ -529,7 +611,8 @@ class AuditLocation(object):
 
 def object_audit_location_generator(devices, datadir, mount_check=True,
                                     logger=None, device_dirs=None,
-                                    auditor_type="ALL"):
+                                    auditor_type="ALL",
+                                    get_object_index=None):
     """
     Given a devices path (e.g. "/srv/node"), yield an AuditLocation for all
     objects stored under that directory for the given datadir (policy),
@@ -546,6 +629,11 @@ def object_audit_location_generator(devices, datadir, mount_check=True,
     :param logger: a logger object
     :param device_dirs: a list of directories under devices to traverse
     :param auditor_type: either ALL or ZBF
+    :param get_object_index: optional callable that is given a device name
+                             and returns the complete
+                             :class:`~swift.obj.object_index.ObjectIndex` of
+                             the datadir on that device, or None; hash dirs
+                             are listed from an index rather than from disk
     """
     if not device_dirs:
         device_dirs = listdir(devices)
@@ -570,11 +658,18 @@ def object_audit_location_generator(devices, datadir, mount_check=True,
             continue
 
         partitions = get_auditor_status(datadir_path, logger, auditor_type)
+        index = get_object_index(device) if get_object_index else None
 
         for pos, partition in enumerate(partitions):
             update_auditor_status(datadir_path, logger,
                                   partitions[pos:], auditor_type)
             part_path = os.path.join(datadir_path, partition)
+            if index is not None:
+                for asuffix, hsh, _files in index.get_hash_dirs(partition):
+                    hsh_path = os.path.join(part_path, asuffix, hsh)
+                    yield AuditLocation(hsh_path, device, partition,
+                                        policy)
+                continue
             try:
                 suffixes = listdir(part_path)
             except OSError as e:
@@ -698,7 +793,6 @@ class BaseDiskFileManager(object):
 
     invalidate_hash = staticmethod(invalidate_hash)
     consolidate_hashes = staticmethod(consolidate_hashes)
-    quarantine_renamer = staticmethod(quarantine_renamer)
 
     def __init__(self, conf, logger):
         self.logger = logger
@@ -732,6 +826,23 @@ class BaseDiskFileManager(object):
                 replication_concurrency_per_device)
         self.replication_lock_timeout = int(conf.get(
             'replication_lock_timeout', 15))
+        self.suffix_fingerprints = config_true_value(
+            conf.get('suffix_fingerprints', False))
+        self.object_index = config_true_value(conf.get('object_index', False))
+        self.async_pending_journal = config_true_value(
+            conf.get('async_pending_journal', False))
+        self._object_indexes = {}
+        if 'threads_per_disk' in conf:
+            # the old option of this name worked differently and was removed
+            # long ago; don't let a stale config enable the thread pool
+            self.logger.warning(
+                'Option threads_per_disk is no longer supported and is '
+                'ignored. Use disk_io_threads_per_device to make disk I/O '
+                'calls in a thread pool.')
+        self.disk_io_threads_per_device = int(
+            conf.get('disk_io_threads_per_device', 0))
+        self.disk_io = get_disk_io_executor(self.disk_io_threads_per_device,
+                                            self.logger)
 
         self.use_splice = False
         self.pipe_size = None
@@ -1095,6 +1206,7 @@ class BaseDiskFileManager(object):
                 raise
 
         files.sort(reverse=True)
+        num_files = len(files)
         results = self.get_ondisk_files(
             files, hsh_path, verify=False, **kwargs)
         if 'ts_info' in results and is_reclaimable(
@@ -1118,6 +1230,8 @@ class BaseDiskFileManager(object):
                         'Error cleaning up empty hash directory %s: %s',
                         hsh_path, err)
                 # else, no real harm; pass
+        if len(files) != num_files:
+            self.index_hash_dir(hsh_path)
         return results
 
     def _update_suffix_hashes(self, hashes, ondisk_info):
@@ -1131,11 +1245,73 @@ class BaseDiskFileManager(object):
         """
         raise NotImplementedError
 
-    def _hash_suffix_dir(self, path, policy):
+    def _scan_suffix_dir(self, path):
+        """
+        List the hash dirs of a suffix dir along with their stats.
+
+        :param path: full path to the suffix dir
+        :returns: a tuple of (sorted list of names, dict mapping names to
+                  ``os.stat_result``); names whose stat failed are missing
+                  from the dict
+        :raises PathNotDir: if the suffix dir does not exist
+        """
+        stats = {}
+        try:
+            if getattr(os, 'scandir', None) is None:
+                names = os.listdir(path)
+                for name in names:
+                    try:
+                        stats[name] = os.stat(join(path, name))
+                    except OSError:
+                        pass
+            else:
+                names = []
+                for entry in os.scandir(path):
+                    names.append(entry.name)
+                    try:
+                        stats[entry.name] = entry.stat()
+                    except OSError:
+                        pass
+        except OSError as err:
+            if err.errno in (errno.ENOTDIR, errno.ENOENT):
+                raise PathNotDir()
+            raise
+        return sorted(names), stats
+
+    def _fingerprint_hash_dir(self, hsh_path, ondisk_info, updates):
+        """
+        Make the fingerprint of a freshly hashed hash dir.
+
+        :param hsh_path: full path to the hash dir
+        :param ondisk_info: the hash dir's ondisk_info, after cleanup
+        :param updates: the updates the hash dir made to the suffix hashes
+        :returns: a tuple of (the hash dir's inode and mtime, the timestamp of
+                  its oldest reclaimable file, the updates), or None if the
+                  hash dir may change without its fingerprint changing
+        """
+        try:
+            st = os.stat(hsh_path)
+        except OSError:
+            return None
+        if time.time() - st.st_mtime < FINGERPRINT_RACY_WINDOW:
+            return None
+        # the hash dir needs rehashing once any of its files may be reclaimed
+        reclaimable = [float(info['timestamp'])
+                       for info in ondisk_info.get('possible_reclaim', [])]
+        if 'ts_info' in ondisk_info:
+            reclaimable.append(float(ondisk_info['ts_info']['timestamp']))
+        oldest = min(reclaimable) if reclaimable else float('inf')
+        return ((st.st_ino, st.st_mtime), oldest, tuple(updates))
+
+    def _hash_suffix_dir(self, path, policy, fingerprints=None):
         """
 
         :param path: full path to directory
         :param policy: storage policy used
+        :param fingerprints: optional dict of fingerprints of the hash dirs in
+                             the suffix dir, as left by a previous call; hash
+                             dirs with unchanged fingerprints are not rehashed
+                             and the dict is updated in place
         """
         if six.PY2:
             hashes = defaultdict(lambda: md5(usedforsecurity=False))
@@ -1153,14 +1329,34 @@ class BaseDiskFileManager(object):
                 def hexdigest(self):
                     return self.md5.hexdigest()
             hashes = defaultdict(shim)
-        try:
-            path_contents = sorted(os.listdir(path))
-        except OSError as err:
-            if err.errno in (errno.ENOTDIR, errno.ENOENT):
-                raise PathNotDir()
-            raise
+        if fingerprints is None:
+            try:
+                path_contents = sorted(os.listdir(path))
+            except OSError as err:
+                if err.errno in (errno.ENOTDIR, errno.ENOENT):
+                    raise PathNotDir()
+                raise
+            stats = None
+        else:
+            path_contents, stats = self._scan_suffix_dir(path)
+            new_fingerprints = {}
+            now = time.time()
+        index_files = {}
         for hsh in path_contents:
             hsh_path = join(path, hsh)
+            if stats is None:
+                hsh_hashes = hashes
+            else:
+                cached = fingerprints.get(hsh)
+                st = stats.get(hsh)
+                if cached and st and \
+                        cached[0] == (st.st_ino, st.st_mtime) and \
+                        now - cached[1] <= self.reclaim_age:
+                    for key, value in cached[2]:
+                        hashes[key].update(value)
+                    new_fingerprints[hsh] = cached
+                    continue
+                hsh_hashes = _RecordingHashes()
             try:
                 ondisk_info = self.cleanup_ondisk_files(
                     hsh_path, policy=policy)
@@ -1181,8 +1377,10 @@ class BaseDiskFileManager(object):
                         _('Quarantined %(hsh_path)s to %(quar_path)s because '
                           'it is not a directory'), {'hsh_path': hsh_path,
                                                      'quar_path': quar_path})
+                    index_files[hsh] = []
                     continue
                 raise
+            index_files[hsh] = ondisk_info['files']
             if not ondisk_info['files']:
                 continue
 
@@ -1198,10 +1396,11 @@ class BaseDiskFileManager(object):
             for key in (k for k in ('meta_info', 'ts_info')
                         if k in ondisk_info):
                 info = ondisk_info[key]
-                hashes[None].update(info['timestamp'].internal + info['ext'])
+                hsh_hashes[None].update(
+                    info['timestamp'].internal + info['ext'])
 
             # delegate to subclass for data file related updates...
-            self._update_suffix_hashes(hashes, ondisk_info)
+            self._update_suffix_hashes(hsh_hashes, ondisk_info)
 
             if 'ctype_info' in ondisk_info:
                 # We have a distinct content-type timestamp so update the
@@ -1210,8 +1409,21 @@ class BaseDiskFileManager(object):
                 # the hash in future. There is no .ctype file so use _ctype to
                 # avoid any confusion.
                 info = ondisk_info['ctype_info']
-                hashes[None].update(info['ctype_timestamp'].internal
-                                    + '_ctype')
+                hsh_hashes[None].update(info['ctype_timestamp'].internal
+                                        + '_ctype')
+
+            if stats is not None:
+                for key, value in hsh_hashes.updates:
+                    hashes[key].update(value)
+                fingerprint = self._fingerprint_hash_dir(
+                    hsh_path, ondisk_info, hsh_hashes.updates)
+                if fingerprint:
+                    new_fingerprints[hsh] = fingerprint
+
+        if fingerprints is not None:
+            fingerprints.clear()
+            fingerprints.update(new_fingerprints)
+        self.update_object_index(path, index_files, hashes=path_contents)
 
         try:
             os.rmdir(path)
@@ -1224,12 +1436,14 @@ class BaseDiskFileManager(object):
             raise PathNotDir()
         return hashes
 
-    def _hash_suffix(self, path, policy=None):
+    def _hash_suffix(self, path, policy=None, fingerprints=None):
         """
         Performs reclamation and returns an md5 of all (remaining) files.
 
         :param path: full path to directory
         :param policy: storage policy used to store the files
+        :param fingerprints: optional dict of hash dir fingerprints used to
+                             skip rehashing unchanged hash dirs
         :raises PathNotDir: if given path is not a valid directory
         :raises OSError: for non-ENOTDIR errors
         """
@@ -1268,6 +1482,11 @@ class BaseDiskFileManager(object):
         if recalculate is None:
             recalculate = []
 
+        fingerprints = None
+        fingerprints_modified = False
+        if self.suffix_fingerprints:
+            fingerprints = read_suffix_fingerprints(partition_path)
+
         try:
             orig_hashes = self.consolidate_hashes(partition_path)
         except Exception:
@@ -1307,16 +1526,37 @@ class BaseDiskFileManager(object):
             if not hash_:
                 suffix_dir = join(partition_path, suffix)
                 try:
-                    hashes[suffix] = self._hash_suffix(
-                        suffix_dir, policy=policy)
+                    if fingerprints is None:
+                        hashes[suffix] = self._hash_suffix(
+                            suffix_dir, policy=policy)
+                    else:
+                        old_fingerprints = fingerprints.get(suffix)
+                        suffix_fingerprints = fingerprints[suffix] = dict(
+                            old_fingerprints or {})
+                        hashes[suffix] = self._hash_suffix(
+                            suffix_dir, policy=policy,
+                            fingerprints=suffix_fingerprints)
+                        if suffix_fingerprints != old_fingerprints:
+                            fingerprints_modified = True
                     hashed += 1
                 except PathNotDir:
                     del hashes[suffix]
+                    self.update_object_index(suffix_dir, {}, hashes=[])
                 except OSError:
                     logging.exception(_('Error hashing suffix'))
                 modified = True
+        if fingerprints is not None:
+            for suffix in list(fingerprints):
+                if suffix not in hashes:
+                    del fingerprints[suffix]
+                    fingerprints_modified = True
         if modified:
             with lock_path(partition_path):
+                if fingerprints_modified:
+                    # fingerprints stay valid even if we lost a race to
+                    # update hashes.pkl, so keep them for the retry
+                    self._write_suffix_fingerprints(
+                        partition_path, fingerprints)
                 if read_hashes(partition_path) == orig_hashes:
                     write_hashes(partition_path, hashes)
                     return hashed, hashes
@@ -1326,6 +1566,168 @@ class BaseDiskFileManager(object):
         else:
             return hashed, hashes
 
+    def _write_suffix_fingerprints(self, partition_path, fingerprints):
+        try:
+            write_suffix_fingerprints(partition_path, fingerprints)
+        except (IOError, OSError):
+            self.logger.warning('Unable to write %r', join(
+                partition_path, HASH_FINGERPRINTS_FILE), exc_info=True)
+
+    def quarantine_renamer(self, device_path, corrupted_file_path):
+        """
+        Quarantine the object dir of a corrupted file, see
+        :func:`quarantine_renamer`, and remove it from the object index.
+
+        :returns: path (str) of directory the file was moved to
+        """
+        to_dir = quarantine_renamer(device_path, corrupted_file_path)
+        self.index_hash_dir(dirname(corrupted_file_path))
+        return to_dir
+
+    def get_object_index(self, dev_path, datadir):
+        """
+        Get the :class:`~swift.obj.object_index.ObjectIndex` of a data dir.
+
+        :param dev_path: path to the device
+        :param datadir: name of the data dir, e.g. ``objects-1``
+        """
+        key = (dev_path, datadir)
+        if key not in self._object_indexes:
+            self._object_indexes[key] = ObjectIndex.for_device(
+                dev_path, datadir)
+        return self._object_indexes[key]
+
+    def _get_complete_object_index(self, dev_path, policy):
+        """
+        :returns: the object index of a data dir if it is enabled and may be
+                  used for listings, otherwise None
+        """
+        if not self.object_index:
+            return None
+        index = self.get_object_index(dev_path, get_data_dir(policy))
+        try:
+            if index.is_complete():
+                return index
+        except Exception:
+            self.logger.exception('Unable to read object index %s',
+                                  index.path)
+        return None
+
+    def update_object_index(self, suffix_path, hash_files, hashes=None):
+        """
+        Record the files in some hash dirs of a suffix in the object index,
+        if the object index is enabled.
+
+        Errors are logged rather than raised; if the index can not be updated
+        it is marked incomplete so that it is not used until it is rebuilt.
+
+        :param suffix_path: full path to the suffix dir
+        :param hash_files: a dict mapping hash dir names to lists of the names
+                           of the files in them
+        :param hashes: if given, the names of all the hash dirs in the suffix
+        """
+        if not self.object_index:
+            return
+        part_path, suffix = os.path.split(suffix_path)
+        datadir_path, partition = os.path.split(part_path)
+        self._call_object_index(datadir_path, 'update_suffix', partition,
+                                suffix, hash_files, hashes=hashes)
+
+    def index_hash_dir(self, hsh_path):
+        """
+        Record the files currently in a hash dir in the object index, if the
+        object index is enabled. The hash dir is listed while the index is
+        locked, so concurrent updates of the hash dir can not be recorded out
+        of order; a hash dir that no longer exists is removed from the index.
+
+        :param hsh_path: full path to the hash dir
+        """
+        if not self.object_index:
+            return
+        suffix_path, hsh = os.path.split(hsh_path)
+        part_path, suffix = os.path.split(suffix_path)
+        datadir_path, partition = os.path.split(part_path)
+        self._call_object_index(datadir_path, 'refresh_hash_dir', partition,
+                                suffix, hsh)
+
+    def unindex_partition(self, part_path):
+        """
+        Remove a partition that has been removed from disk from the object
+        index, if the object index is enabled. If the partition dir still
+        exists, e.g. because an object was written to it while it was being
+        removed, the index is marked incomplete instead.
+
+        :param part_path: full path to the partition dir
+        """
+        if not self.object_index:
+            return
+        datadir_path, partition = os.path.split(part_path)
+        if os.path.exists(part_path):
+            self._call_object_index(datadir_path, 'mark_incomplete')
+        else:
+            self._call_object_index(datadir_path, 'remove_partition',
+                                    partition)
+
+    def _call_object_index(self, datadir_path, method, *args, **kwargs):
+        """
+        Call a method of the object index of a data dir. Errors are logged
+        rather than raised; if the index can not be updated it is marked
+        incomplete so that it is not used until it is rebuilt.
+        """
+        dev_path, datadir = os.path.split(datadir_path)
+        index = self.get_object_index(dev_path, datadir)
+        try:
+            getattr(index, method)(*args, **kwargs)
+        except Exception:
+            self.logger.exception('Unable to update object index %s',
+                                  index.path)
+            try:
+                index.mark_incomplete()
+            except Exception:
+                pass
+
+    def rebuild_object_index(self, device, policy):
+        """
+        Make the object index of a device's data dir match the hash dirs on
+        disk, and mark the index complete so that it is used for listings.
+
+        :param device: name of target device
+        :param policy: the StoragePolicy instance
+        :returns: a dict with the number of hash dirs ``added`` to,
+                  ``removed`` from and ``updated`` in the index
+        """
+        dev_path = self.get_dev_path(device)
+        if not dev_path:
+            raise DiskFileDeviceUnavailable()
+        datadir = get_data_dir(policy)
+        datadir_path = join(dev_path, datadir)
+        index = self.get_object_index(dev_path, datadir)
+        counts = {'added': 0, 'removed': 0, 'updated': 0}
+        if not os.path.isdir(datadir_path) and \
+                not os.path.exists(index.path):
+            return counts
+        partitions = set(
+            part for part in listdir(datadir_path) if part.isdigit())
+        partitions.update(index.get_partitions())
+        for partition in sorted(partitions):
+            hash_dirs = {}
+            for suffix_path, suffix in self.yield_suffixes(
+                    device, partition, policy):
+                for hsh in self._listdir(suffix_path):
+                    try:
+                        files = os.listdir(join(suffix_path, hsh))
+                    except OSError as err:
+                        if err.errno not in (errno.ENOENT, errno.ENOTDIR):
+                            raise
+                        continue
+                    if files:
+                        hash_dirs[(suffix, hsh)] = files
+            for key, value in index.replace_partition(
+                    partition, hash_dirs).items():
+                counts[key] += value
+        index.mark_complete()
+        return counts
+
     def construct_dev_path(self, device):
         """
         Construct the path to a device without checking if it is mounted.
@@ -1426,6 +1828,14 @@ class BaseDiskFileManager(object):
                          Timestamp(timestamp).internal),
             tmp_dir)
         self.logger.increment('async_pendings')
+        if self.async_pending_journal:
+            try:
+                append_async_journal(device_path, [
+                    os.path.join(get_async_dir(policy), ohash[-3:])])
+            except (Exception, Timeout):
+                # the updater's next full scan will find the async pending
+                self.logger.exception(
+                    'Unable to journal async pending in %s', device_path)
 
     def get_diskfile(self, device, partition, account, container, obj,
                      policy, **kwargs):
@@ -1462,10 +1872,16 @@ class BaseDiskFileManager(object):
         :param auditor_type: either ALL or ZBF
         """
         datadir = get_data_dir(policy)
+
+        def get_object_index(device):
+            return self._get_complete_object_index(
+                self.construct_dev_path(device), policy)
+
         return object_audit_location_generator(self.devices, datadir,
                                                self.mount_check,
                                                self.logger, device_dirs,
-                                               auditor_type)
+                                               auditor_type,
+                                               get_object_index)
 
     def get_diskfile_from_audit_location(self, audit_location):
         """
@@ -1600,6 +2016,66 @@ class BaseDiskFileManager(object):
                 continue
             yield (os.path.join(partition_path, suffix), suffix)
 
+    def _get_hash_timestamps(self, diskfile_info):
+        """
+        Extract the timestamps yielded by :meth:`yield_hashes` from the
+        result of :meth:`get_ondisk_files`.
+        """
+        # define keys that we need to extract the result from the on disk info
+        # data:
+        #   (x, y, z) -> result[x] should take the value of y[z]
+        key_map = (
+            ('ts_meta', 'meta_info', 'timestamp'),
+            ('ts_data', 'data_info', 'timestamp'),
+            ('ts_data', 'ts_info', 'timestamp'),
+            ('ts_ctype', 'ctype_info', 'ctype_timestamp'),
+            ('durable', 'data_info', 'durable'),
+        )
+        result = {}
+        for result_key, diskfile_info_key, info_key in key_map:
+            if diskfile_info_key not in diskfile_info:
+                continue
+            info = diskfile_info[diskfile_info_key]
+            if info_key in info:
+                # durable key not returned from replicated Diskfile
+                result[result_key] = info[info_key]
+        return result
+
+    def _yield_indexed_hashes(self, index, partition_path, partition,
+                              suffixes, **kwargs):
+        """
+        Yield the same tuples as :meth:`yield_hashes`, but from the files
+        recorded in the object index rather than from the hash dirs.
+
+        Hash dirs holding a reclaimable tombstone are cleaned up on disk, as a
+        walk of the partition would do.
+        """
+        if not os.path.isdir(partition_path):
+            return
+        for suffix, object_hash, files in index.get_hash_dirs(
+                partition, suffixes=suffixes):
+            object_path = os.path.join(partition_path, suffix, object_hash)
+            try:
+                diskfile_info = self.get_ondisk_files(
+                    files, object_path, verify=False, **kwargs)
+                if 'ts_info' in diskfile_info and (
+                        time.time() -
+                        float(diskfile_info['ts_info']['timestamp']) >
+                        self.reclaim_age):
+                    diskfile_info = self.cleanup_ondisk_files(
+                        object_path, **kwargs)
+                result = self._get_hash_timestamps(diskfile_info)
+                if 'ts_data' not in result:
+                    continue
+                yield object_hash, result
+            except AssertionError as err:
+                self.logger.debug('Invalid file set in %s (%s)' % (
+                    object_path, err))
+            except DiskFileError as err:
+                self.logger.debug(
+                    'Invalid diskfile filename in %r (%s)' % (
+                        object_path, err))
+
     def yield_hashes(self, device, partition, policy,
                      suffixes=None, **kwargs):
         """
@@ -1631,6 +2107,13 @@ class BaseDiskFileManager(object):
             raise DiskFileDeviceUnavailable()
 
         partition_path = get_part_path(dev_path, policy, partition)
+        index = self._get_complete_object_index(dev_path, policy)
+        if index is not None:
+            for object_hash, result in self._yield_indexed_hashes(
+                    index, partition_path, partition, suffixes, **kwargs):
+                yield object_hash, result
+            return
+
         if suffixes is None:
             suffixes = self.yield_suffixes(device, partition, policy)
         else:
@@ -1638,17 +2121,6 @@ class BaseDiskFileManager(object):
                 (os.path.join(partition_path, suffix), suffix)
                 for suffix in suffixes)
 
-        # define keys that we need to extract the result from the on disk info
-        # data:
-        #   (x, y, z) -> result[x] should take the value of y[z]
-        key_map = (
-            ('ts_meta', 'meta_info', 'timestamp'),
-            ('ts_data', 'data_info', 'timestamp'),
-            ('ts_data', 'ts_info', 'timestamp'),
-            ('ts_ctype', 'ctype_info', 'ctype_timestamp'),
-            ('durable', 'data_info', 'durable'),
-        )
-
         # cleanup_ondisk_files() will remove empty hash dirs, and we'll
         # invalidate any empty suffix dirs so they'll get cleaned up on
         # the next rehash
@@ -1661,14 +2133,7 @@ class BaseDiskFileManager(object):
                         object_path, **kwargs)
                     if diskfile_info['files']:
                         found_files = True
-                    result = {}
-                    for result_key, diskfile_info_key, info_key in key_map:
-                        if diskfile_info_key not in diskfile_info:
-                            continue
-                        info = diskfile_info[diskfile_info_key]
-                        if info_key in info:
-                            # durable key not returned from replicated Diskfile
-                            result[result_key] = info[info_key]
+                    result = self._get_hash_timestamps(diskfile_info)
                     if 'ts_data' not in result:
                         # file sets that do not include a .data or .ts
                         # file cannot be opened and therefore cannot
@@ -1805,6 +2270,12 @@ class BaseDiskFileWriter(object):
                                       self._tmppath)
             self._tmppath = None
 
+    def _write_chunk(self, chunk):
+        while chunk:
+            written = os.write(self._fd, chunk)
+            self._upload_size += written
+            chunk = chunk[written:]
+
     def write(self, chunk):
         """
         Write a chunk of data to disk. All invocations of this method must
@@ -1817,10 +2288,8 @@ class BaseDiskFileWriter(object):
         if not self._fd:
             raise ValueError('Writer is not open')
         self._chunks_etag.update(chunk)
-        while chunk:
-            written = os.write(self._fd, chunk)
-            self._upload_size += written
-            chunk = chunk[written:]
+        self.manager.disk_io.execute(
+            self._diskfile._device_path, self._write_chunk, chunk)
 
         # For large files sync every 512MB (by default) written
         diff = self._upload_size - self._last_sync
@@ -1884,13 +2353,17 @@ class BaseDiskFileWriter(object):
         # unnecessary os.unlink() of tempfile later. As renamer() has
         # succeeded, the tempfile would no longer exist at its original path.
         self._put_succeeded = True
+        ondisk_info = None
         if cleanup:
             try:
-                self.manager.cleanup_ondisk_files(self._datadir)
+                ondisk_info = self.manager.cleanup_ondisk_files(self._datadir)
             except OSError:
                 logging.exception(_('Problem cleaning up %s'), self._datadir)
 
             self._part_power_cleanup(target_path, new_target_path)
+        if not (ondisk_info and ondisk_info.get('obsolete')):
+            # cleanup_ondisk_files indexes the hash dir if it removed files
+            self.manager.index_hash_dir(self._datadir)
 
     def _put(self, metadata, cleanup=True, *a, **kw):
         """
@@ -2063,7 +2536,8 @@ class BaseDiskFileReader(object):
             self._read_to_eof = False
             self._init_checks()
             while True:
-                chunk = self._fp.read(self._disk_chunk_size)
+                chunk = self.manager.disk_io.execute(
+                    self._device_path, self._fp.read, self._disk_chunk_size)
                 if chunk:
                     self._update_checks(chunk)
                     self._bytes_read += len(chunk)
@@ -3007,17 +3481,19 @@ class DiskFileManager(BaseDiskFileManager):
             hashes[None].update(
                 file_info['timestamp'].internal + file_info['ext'])
 
-    def _hash_suffix(self, path, policy=None):
+    def _hash_suffix(self, path, policy=None, fingerprints=None):
         """
         Performs reclamation and returns an md5 of all (remaining) files.
 
         :param path: full path to directory
         :param policy: storage policy used to store the files
+        :param fingerprints: optional dict of hash dir fingerprints used to
+                             skip rehashing unchanged hash dirs
         :raises PathNotDir: if given path is not a valid directory
         :raises OSError: for non-ENOTDIR errors
         :returns: md5 of files in suffix
         """
-        hashes = self._hash_suffix_dir(path, policy)
+        hashes = self._hash_suffix_dir(path, policy, fingerprints)
         return hashes[None].hexdigest()
 
 
@@ -3150,14 +3626,20 @@ class ECDiskFileWriter(BaseDiskFileWriter):
                 exc = DiskFileNoSpace(
                     'No space left on device for %(file)s (%(err)s)' % params)
             else:
+                ondisk_info = None
                 try:
-                    self.manager.cleanup_ondisk_files(self._datadir)
+                    ondisk_info = self.manager.cleanup_ondisk_files(
+                        self._datadir)
                 except OSError as os_err:
                     self.manager.logger.exception(
                         _('Problem cleaning up %(datadir)s (%(err)s)'),
                         {'datadir': self._datadir, 'err': os_err})
                 self._part_power_cleanup(
                     durable_data_file_path, new_durable_data_file_path)
+                if not (ondisk_info and ondisk_info.get('obsolete')):
+                    # cleanup_ondisk_files indexes the hash dir if it
+                    # removed files
+                    self.manager.index_hash_dir(self._datadir)
 
         except Exception as err:
             params = {'file': durable_data_file_path, 'err': err}
@@ -3339,6 +3821,7 @@ class ECDiskFile(BaseDiskFile):
                 timestamp, ext='.data', frag_index=frag_index, durable=True)
             remove_file(os.path.join(self._datadir, purge_file))
             remove_directory(self._datadir)
+        self.manager.index_hash_dir(self._datadir)
         self.manager.invalidate_hash(dirname(self._datadir))
 
 
@@ -3677,12 +4160,14 @@ class ECDiskFileManager(BaseDiskFileManager):
             file_info = ondisk_info['durable_frag_set'][0]
             hashes[None].update(file_info['timestamp'].internal + '.durable')
 
-    def _hash_suffix(self, path, policy=None):
+    def _hash_suffix(self, path, policy=None, fingerprints=None):
         """
         Performs reclamation and returns an md5 of all (remaining) files.
 
         :param path: full path to directory
         :param policy: storage policy used to store the files
+        :param fingerprints: optional dict of hash dir fingerprints used to
+                             skip rehashing unchanged hash dirs
         :raises PathNotDir: if given path is not a valid directory
         :raises OSError: for non-ENOTDIR errors
         :returns: dict of md5 hex digests
@@ -3691,5 +4176,5 @@ class ECDiskFileManager(BaseDiskFileManager):
         # here we flatten out the hashers hexdigest into a dictionary instead
         # of just returning the one hexdigest for the whole suffix
 
-        hash_per_fi = self._hash_suffix_dir(path, policy)
+        hash_per_fi = self._hash_suffix_dir(path, policy, fingerprints)
         return dict((fi, md5.hexdigest()) for fi, md5 in hash_per_fi.items())
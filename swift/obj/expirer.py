@@ -13,23 +13,26 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import io
+import json
 import six
 
 from random import random
 from time import time
 from os.path import join
 from swift import gettext_ as _
-from collections import defaultdict, deque
+from collections import defaultdict, deque, OrderedDict
 
 from eventlet import sleep, Timeout
 from eventlet.greenpool import GreenPool
+from eventlet.queue import Queue
 
 from swift.common.constraints import AUTO_CREATE_ACCOUNT_PREFIX
 from swift.common.daemon import Daemon
 from swift.common.internal_client import InternalClient, UnexpectedResponse
 from swift.common.utils import get_logger, dump_recon_cache, split_path, \
     Timestamp, config_true_value, normalize_delete_at_timestamp, \
-    RateLimitedIterator, md5
+    RateLimitedIterator, md5, config_positive_int_value, ContextPool
 from swift.common.http import HTTP_NOT_FOUND, HTTP_CONFLICT, \
     HTTP_PRECONDITION_FAILED
 from swift.common.swob import wsgi_quote, str_to_wsgi
@@ -112,6 +115,14 @@ class ObjectExpirer(Daemon):
         # marker will be retried before it is abandoned.  It is not coupled
         # with the tombstone reclaim age in the consistency engine.
         self.reclaim_age = int(conf.get('reclaim_age', 604800))
+        # The number of task containers that are listed at once.
+        self.listing_concurrency = config_positive_int_value(
+            conf.get('listing_concurrency', 1))
+        # With more than 1, tasks are grouped by target container and the
+        # queue entries of each group are popped with a single request.
+        self.delete_batch_size = config_positive_int_value(
+            conf.get('delete_batch_size', 1))
+        self.oldest_task_timestamp = None
 
     def read_conf_for_queue_access(self, swift):
         if self.conf.get('auto_create_account_prefix'):
@@ -154,8 +165,17 @@ class ObjectExpirer(Daemon):
             self.logger.info(_('Pass completed in %(time)ds; '
                                '%(objects)d objects expired') % {
                              'time': elapsed, 'objects': self.report_objects})
+            # the backlog age is how long the oldest task that was due at
+            # the start of the pass had been waiting then
+            if self.oldest_task_timestamp is None:
+                backlog_age = 0
+            else:
+                backlog_age = max(0, self.report_first_time -
+                                  float(self.oldest_task_timestamp))
+            self.logger.timing('backlog_age', backlog_age * 1000)
             dump_recon_cache({'object_expiration_pass': elapsed,
-                              'expired_last_pass': self.report_objects},
+                              'expired_last_pass': self.report_objects,
+                              'expiration_backlog_age': backlog_age},
                              self.rcache, self.logger)
         elif time() - self.report_last_time >= self.report_interval:
             elapsed = time() - self.report_first_time
@@ -262,37 +282,163 @@ class ObjectExpirer(Daemon):
         Yields task expire info dict which consists of task_account,
         task_container, task_object, timestamp_to_delete, and target_path
         """
-        for task_account, task_container in task_account_container_list:
-            for o in self.swift.iter_objects(task_account, task_container):
-                if six.PY2:
-                    task_object = o['name'].encode('utf8')
+        task_iters = [
+            self.iter_task_container_to_expire(
+                task_account, task_container, my_index, divisor)
+            for task_account, task_container in task_account_container_list]
+        if self.listing_concurrency > 1:
+            task_iter = self.iter_concurrently(task_iters)
+        else:
+            task_iter = (task for task_iter in task_iters
+                         for task in task_iter)
+        for task in task_iter:
+            if self.oldest_task_timestamp is None or \
+                    task['delete_timestamp'] < self.oldest_task_timestamp:
+                self.oldest_task_timestamp = task['delete_timestamp']
+            yield task
+
+    def iter_task_container_to_expire(self, task_account, task_container,
+                                      my_index, divisor):
+        """
+        Yields task expire info dicts for the tasks in a single task
+        container; see :meth:`iter_task_to_expire`.
+        """
+        for o in self.swift.iter_objects(task_account, task_container):
+            if six.PY2:
+                task_object = o['name'].encode('utf8')
+            else:
+                task_object = o['name']
+            try:
+                delete_timestamp, target_account, target_container, \
+                    target_object = parse_task_obj(task_object)
+            except ValueError:
+                self.logger.exception('Unexcepted error handling task %r' %
+                                      task_object)
+                continue
+            if delete_timestamp > Timestamp.now():
+                # we shouldn't yield the object that doesn't reach
+                # the expiration date yet.
+                break
+
+            # Only one expirer daemon assigned for one task
+            if self.hash_mod('%s/%s' % (task_container, task_object),
+                             divisor) != my_index:
+                continue
+
+            is_async = o.get('content_type') == ASYNC_DELETE_TYPE
+            yield {'task_account': task_account,
+                   'task_container': task_container,
+                   'task_object': task_object,
+                   'target_path': '/'.join([
+                       target_account, target_container, target_object]),
+                   'delete_timestamp': delete_timestamp,
+                   'is_async_delete': is_async}
+
+    def iter_concurrently(self, task_iters):
+        """
+        Yields the tasks of several task iterators, consuming up to
+        listing_concurrency of them at once so that the listings of their
+        task containers are requested concurrently.
+
+        An error listing one task container is logged and its remaining
+        tasks are skipped; the other task containers are still listed.
+
+        :param task_iters: a list of task iterators, e.g. as returned by
+            :meth:`iter_task_container_to_expire`
+        """
+        done = object()
+        pending = deque(task_iters)
+        # bound the number of listed tasks waiting to be expired
+        queue = Queue(MAX_OBJECTS_TO_CACHE)
+
+        def list_tasks(task_iter):
+            try:
+                for task in task_iter:
+                    queue.put(task)
+            except (Exception, Timeout):
+                self.logger.exception(_('Exception while listing tasks'))
+            finally:
+                queue.put(done)
+
+        with ContextPool(self.listing_concurrency) as pool:
+            running = 0
+            while pending and running < self.listing_concurrency:
+                pool.spawn(list_tasks, pending.popleft())
+                running += 1
+            while running:
+                task = queue.get()
+                if task is done:
+                    running -= 1
+                    if pending:
+                        pool.spawn(list_tasks, pending.popleft())
+                        running += 1
                 else:
-                    task_object = o['name']
-                try:
-                    delete_timestamp, target_account, target_container, \
-                        target_object = parse_task_obj(task_object)
-                except ValueError:
-                    self.logger.exception('Unexcepted error handling task %r' %
-                                          task_object)
-                    continue
-                if delete_timestamp > Timestamp.now():
-                    # we shouldn't yield the object that doesn't reach
-                    # the expiration date yet.
-                    break
-
-                # Only one expirer daemon assigned for one task
-                if self.hash_mod('%s/%s' % (task_container, task_object),
-                                 divisor) != my_index:
-                    continue
+                    yield task
+
+    def iter_delete_batches(self, task_iter):
+        """
+        Groups expiration tasks into batches of up to delete_batch_size
+        tasks with the same target container.
+
+        :param task_iter: An iterator of delete-task dicts, which should each
+            have a ``target_path`` key.
+        """
+        batches = OrderedDict()
+        cnt = 0
+
+        for delete_task in task_iter:
+            try:
+                target_account, target_container, _junk = \
+                    split_path('/' + delete_task['target_path'], 3, 3, True)
+                cache_key = '%s/%s' % (target_account, target_container)
+            # sanity
+            except ValueError:
+                self.logger.error('Unexcepted error handling task %r' %
+                                  delete_task)
+                continue
+
+            batch = batches.setdefault(cache_key, [])
+            batch.append(delete_task)
+            cnt += 1
+            if len(batch) >= self.delete_batch_size:
+                cnt -= len(batch)
+                yield batches.pop(cache_key)
 
-                is_async = o.get('content_type') == ASYNC_DELETE_TYPE
-                yield {'task_account': task_account,
-                       'task_container': task_container,
-                       'task_object': task_object,
-                       'target_path': '/'.join([
-                           target_account, target_container, target_object]),
-                       'delete_timestamp': delete_timestamp,
-                       'is_async_delete': is_async}
+            if cnt > MAX_OBJECTS_TO_CACHE:
+                while batches:
+                    yield batches.popitem(last=False)[1]
+                cnt = 0
+
+        while batches:
+            yield batches.popitem(last=False)[1]
+
+    def spawn_delete_batches(self, pool, batch_iter):
+        """
+        Spawns a greenthread in the given pool to delete each batch of tasks,
+        holding back a batch until any earlier batch with the same target
+        container is done, so that each target container only has one batch
+        of deletes in flight.
+
+        :param pool: a GreenPool
+        :param batch_iter: an iterator of lists of delete-task dicts, as
+            returned by :meth:`iter_delete_batches`
+        """
+        # the batch in flight for each target container, until it is done
+        in_flight = {}
+
+        def forget(gt, target):
+            if in_flight.get(target) is gt:
+                del in_flight[target]
+
+        for delete_tasks in batch_iter:
+            target = tuple(split_path(
+                '/' + delete_tasks[0]['target_path'], 3, 3, True)[:2])
+            previous = in_flight.get(target)
+            if previous is not None:
+                previous.wait()
+            gt = pool.spawn(self.delete_objects, delete_tasks)
+            in_flight[target] = gt
+            gt.link(forget, target)
 
     def run_once(self, *args, **kwargs):
         """
@@ -319,6 +465,7 @@ class ObjectExpirer(Daemon):
         pool = GreenPool(self.concurrency)
         self.report_first_time = self.report_last_time = time()
         self.report_objects = 0
+        self.oldest_task_timestamp = None
         try:
             self.logger.debug('Run begin')
             task_account_container_list_to_delete = list()
@@ -350,6 +497,15 @@ class ObjectExpirer(Daemon):
                 # task_account, task_container, task_object, delete_timestamp,
                 # target_path to handle delete actual object and pop the task
                 # from the queue.
+                if self.delete_batch_size > 1:
+                    rate_limited_iter = RateLimitedIterator(
+                        self.iter_task_to_expire(
+                            task_account_container_list, my_index, divisor),
+                        elements_per_second=self.tasks_per_second)
+                    self.spawn_delete_batches(
+                        pool, self.iter_delete_batches(rate_limited_iter))
+                    continue
+
                 delete_task_iter = \
                     self.round_robin_order(self.iter_task_to_expire(
                         task_account_container_list, my_index, divisor))
@@ -430,36 +586,97 @@ class ObjectExpirer(Daemon):
                       is_async_delete):
         start_time = time()
         try:
-            try:
-                self.delete_actual_object(target_path, delete_timestamp,
-                                          is_async_delete)
-            except UnexpectedResponse as err:
-                if err.resp.status_int not in {HTTP_NOT_FOUND,
-                                               HTTP_PRECONDITION_FAILED}:
-                    raise
-                if float(delete_timestamp) > time() - self.reclaim_age:
-                    # we'll have to retry the DELETE later
-                    raise
+            self.expire_actual_object(target_path, delete_timestamp,
+                                      is_async_delete)
             self.pop_queue(task_account, task_container, task_object)
             self.report_objects += 1
             self.logger.increment('objects')
+        except (Exception, Timeout) as err:
+            self._log_delete_error(err, task_account, task_container,
+                                   task_object)
+        self.logger.timing_since('timing', start_time)
+        self.report()
+
+    def delete_objects(self, delete_tasks):
+        """
+        Deletes the target objects of a batch of expiration tasks one after
+        another, then pops the queue entries of the tasks that are done with
+        a single request to each of their task containers.
+
+        :param delete_tasks: a list of delete-task dicts, as yielded by
+            :meth:`iter_task_to_expire`
+        """
+        done_tasks = defaultdict(list)
+        for delete_task in delete_tasks:
+            start_time = time()
+            try:
+                self.expire_actual_object(delete_task['target_path'],
+                                          delete_task['delete_timestamp'],
+                                          delete_task['is_async_delete'])
+            except (Exception, Timeout) as err:
+                self._log_delete_error(
+                    err, delete_task['task_account'],
+                    delete_task['task_container'], delete_task['task_object'])
+            else:
+                done_tasks[(delete_task['task_account'],
+                            delete_task['task_container'])].append(
+                    delete_task['task_object'])
+            self.logger.timing_since('timing', start_time)
+
+        for (task_account, task_container), task_objects in \
+                done_tasks.items():
+            try:
+                self.pop_queue_entries(task_account, task_container,
+                                       task_objects)
+            except (Exception, Timeout) as err:
+                self.logger.update_stats('errors', len(task_objects))
+                self.logger.exception(
+                    'Exception while popping %(count)d queue entries from '
+                    '%(account)s %(container)s %(err)s' % {
+                        'count': len(task_objects), 'account': task_account,
+                        'container': task_container, 'err': str(err)})
+                continue
+            self.report_objects += len(task_objects)
+            self.logger.update_stats('objects', len(task_objects))
+        self.report()
+
+    def expire_actual_object(self, target_path, delete_timestamp,
+                             is_async_delete):
+        """
+        Deletes the target object of an expiration task; see
+        :meth:`delete_actual_object`. A target object that can not be found
+        is only treated as deleted once the task is older than reclaim_age.
+
+        :raises UnexpectedResponse: if the delete was unsuccessful and
+                                    should be retried later
+        """
+        try:
+            self.delete_actual_object(target_path, delete_timestamp,
+                                      is_async_delete)
         except UnexpectedResponse as err:
-            self.logger.increment('errors')
+            if err.resp.status_int not in {HTTP_NOT_FOUND,
+                                           HTTP_PRECONDITION_FAILED}:
+                raise
+            if float(delete_timestamp) > time() - self.reclaim_age:
+                # we'll have to retry the DELETE later
+                raise
+
+    def _log_delete_error(self, err, task_account, task_container,
+                          task_object):
+        self.logger.increment('errors')
+        if isinstance(err, UnexpectedResponse):
             self.logger.error(
                 'Unexpected response while deleting object '
                 '%(account)s %(container)s %(obj)s: %(err)s' % {
                     'account': task_account, 'container': task_container,
                     'obj': task_object, 'err': str(err.resp.status_int)})
             self.logger.debug(err.resp.body)
-        except (Exception, Timeout) as err:
-            self.logger.increment('errors')
+        else:
             self.logger.exception(
                 'Exception while deleting object %(account)s %(container)s '
                 '%(obj)s %(err)s' % {
                     'account': task_account, 'container': task_container,
                     'obj': task_object, 'err': str(err)})
-        self.logger.timing_since('timing', start_time)
-        self.report()
 
     def pop_queue(self, task_account, task_container, task_object):
         """
@@ -469,6 +686,28 @@ class ObjectExpirer(Daemon):
         direct_delete_container_entry(self.swift.container_ring, task_account,
                                       task_container, task_object)
 
+    def pop_queue_entries(self, task_account, task_container, task_objects):
+        """
+        Issue a single UPDATE request to the task_container that marks all
+        the given expiring object queue entries deleted.
+        """
+        timestamp = Timestamp.now()
+        records = [{'name': task_object,
+                    'deleted': 1,
+                    'created_at': timestamp.internal,
+                    'etag': 'noetag',
+                    'size': 0,
+                    'storage_policy_index': 0,
+                    'content_type': 'application/deleted'}
+                   for task_object in task_objects]
+        self.swift.make_request(
+            'UPDATE', self.swift.make_path(task_account, task_container),
+            headers={'X-Backend-Allow-Private-Methods': 'True',
+                     'X-Backend-Storage-Policy-Index': '0',
+                     'X-Timestamp': timestamp.internal},
+            acceptable_statuses=(2,),
+            body_file=io.BytesIO(json.dumps(records).encode('ascii')))
+
     def delete_actual_object(self, actual_obj, timestamp, is_async_delete):
         """
         Deletes the end-user object indicated by the actual object name given
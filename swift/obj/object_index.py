@@ -0,0 +1,352 @@
+# Copyright (c) 2021 OpenStack Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+A per-device index of the object hash dirs stored under a data dir.
+
+Walking ``<datadir>/<partition>/<suffix>/<hash>`` trees costs a ``listdir``
+per suffix and per hash dir. An :class:`ObjectIndex` records the files in
+every hash dir in a SQLite database next to the data dir, so that the
+partitions, hash dirs and timestamps of the objects on a device can be
+listed without touching the directory trees.
+
+The index is kept up to date by the diskfile manager as objects are written,
+cleaned up, purged and quarantined, as suffixes are rehashed and as
+partitions are removed, and is rebuilt from disk by
+:meth:`~swift.obj.diskfile.BaseDiskFileManager.rebuild_object_index`. Until
+it has been rebuilt at least once, an index is not *complete* and is not
+used for listings.
+"""
+
+import contextlib
+import errno
+import json
+import os
+import sqlite3
+import time
+
+from eventlet import patcher
+from eventlet.semaphore import Semaphore
+
+from swift.common.db import GreenDBConnection
+
+# connections are kept per OS thread, as the index is also updated from the
+# threads of eventlet's thread pool
+_threading = patcher.original('threading')
+
+OBJECT_INDEX_FILE = '.object_index.{datadir}.db'
+
+
+class ObjectIndex(object):
+    """
+    Index of the files in the object hash dirs of one data dir of a device.
+
+    Each OS thread reuses one connection to the database, and the
+    greenthreads of a thread take turns to use it, so an instance may be
+    shared between greenthreads and the threads of a thread pool.
+
+    :param path: path of the SQLite database; it is created if necessary
+    :param timeout: seconds to wait for a lock on the database
+    :param datadir_path: path of the data dir that is indexed; if given, the
+                         files in hash dirs are listed from disk while the
+                         index is locked for writing, see
+                         :meth:`refresh_hash_dir`
+    """
+
+    def __init__(self, path, timeout=10, datadir_path=None):
+        self.path = path
+        self.timeout = timeout
+        self.datadir_path = datadir_path
+        self._local = _threading.local()
+
+    @classmethod
+    def for_device(cls, dev_path, datadir, **kwargs):
+        """
+        Return the index of a data dir of a device.
+
+        :param dev_path: path to the device
+        :param datadir: name of the data dir, e.g. ``objects-1``
+        """
+        return cls(os.path.join(dev_path, OBJECT_INDEX_FILE.format(
+            datadir=datadir)), datadir_path=os.path.join(dev_path, datadir),
+            **kwargs)
+
+    def _initialize(self, conn):
+        conn.execute('PRAGMA journal_mode = WAL')
+        conn.executescript('''
+            CREATE TABLE IF NOT EXISTS hash_dir (
+                partition TEXT NOT NULL,
+                suffix TEXT NOT NULL,
+                hash TEXT NOT NULL,
+                files TEXT NOT NULL,
+                PRIMARY KEY (partition, suffix, hash)
+            );
+            CREATE TABLE IF NOT EXISTS index_stat (
+                key TEXT PRIMARY KEY,
+                value TEXT
+            );
+        ''')
+
+    def _get_conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, check_same_thread=False,
+                                   factory=GreenDBConnection,
+                                   timeout=self.timeout,
+                                   isolation_level=None)
+            try:
+                self._initialize(conn)
+            except BaseException:
+                conn.close()
+                raise
+            self._local.conn = conn
+            self._local.semaphore = Semaphore()
+        return conn, self._local.semaphore
+
+    def close(self):
+        """
+        Close the connection of the calling thread, if it has one.
+        """
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            self._local.conn = None
+            conn.close()
+
+    @contextlib.contextmanager
+    def _connect(self, write=True):
+        conn, semaphore = self._get_conn()
+        with semaphore:
+            try:
+                conn.execute('BEGIN IMMEDIATE' if write else 'BEGIN')
+            except BaseException:
+                # the database may have been removed or become corrupt
+                self.close()
+                raise
+            try:
+                yield conn
+            except BaseException:
+                conn.execute('ROLLBACK')
+                raise
+            conn.execute('COMMIT')
+
+    def _list_hash_dir(self, partition, suffix, hsh):
+        try:
+            return os.listdir(os.path.join(
+                self.datadir_path, partition, suffix, hsh))
+        except OSError as err:
+            if err.errno not in (errno.ENOENT, errno.ENOTDIR):
+                raise
+            return []
+
+    def _set_hash_dirs(self, conn, partition, suffix, hash_files):
+        for hsh, files in hash_files.items():
+            if files:
+                conn.execute(
+                    'INSERT OR REPLACE INTO hash_dir '
+                    '(partition, suffix, hash, files) VALUES (?, ?, ?, ?)',
+                    (partition, suffix, hsh,
+                     json.dumps(sorted(files, reverse=True))))
+            else:
+                conn.execute(
+                    'DELETE FROM hash_dir '
+                    'WHERE partition = ? AND suffix = ? AND hash = ?',
+                    (partition, suffix, hsh))
+
+    def refresh_hash_dir(self, partition, suffix, hsh):
+        """
+        Record the files that are currently in a hash dir.
+
+        The hash dir is listed while the index is locked for writing, so that
+        concurrent updates of the same hash dir by other greenthreads,
+        threads or processes are recorded in the order they listed it, and the
+        last one to list it wins.
+
+        :param partition: partition name
+        :param suffix: suffix name
+        :param hsh: hash dir name
+        """
+        with self._connect() as conn:
+            self._set_hash_dirs(conn, partition, suffix, {
+                hsh: self._list_hash_dir(partition, suffix, hsh)})
+
+    def update_hash_dir(self, partition, suffix, hsh, files):
+        """
+        Record the files in a hash dir.
+
+        :param partition: partition name
+        :param suffix: suffix name
+        :param hsh: hash dir name
+        :param files: names of the files in the hash dir; if empty the hash
+                      dir is removed from the index
+        """
+        with self._connect() as conn:
+            self._set_hash_dirs(conn, partition, suffix, {hsh: files})
+
+    def update_suffix(self, partition, suffix, hash_files, hashes=None):
+        """
+        Record the files in some of the hash dirs of a suffix.
+
+        :param partition: partition name
+        :param suffix: suffix name
+        :param hash_files: a dict mapping hash dir names to lists of the
+                           names of the files in them; hash dirs with no
+                           files are removed from the index
+        :param hashes: if given, the names of all the hash dirs in the suffix;
+                       any other hash dirs are removed from the index
+
+        If the index knows its data dir, hash dirs whose files differ from
+        those recorded are listed again while the index is locked for
+        writing, in case they were changed and indexed since the caller
+        listed them.
+        """
+        hash_files = dict(hash_files)
+        with self._connect() as conn:
+            indexed = dict(conn.execute(
+                'SELECT hash, files FROM hash_dir '
+                'WHERE partition = ? AND suffix = ?',
+                (partition, suffix)).fetchall())
+            if hashes is not None:
+                hashes = set(hashes)
+                for hsh in indexed:
+                    if hsh not in hashes:
+                        hash_files.setdefault(hsh, [])
+            for hsh, files in list(hash_files.items()):
+                old_files = indexed.get(hsh)
+                if old_files is None and not files:
+                    del hash_files[hsh]
+                elif old_files == json.dumps(sorted(files, reverse=True)):
+                    del hash_files[hsh]
+                elif self.datadir_path:
+                    hash_files[hsh] = self._list_hash_dir(
+                        partition, suffix, hsh)
+            self._set_hash_dirs(conn, partition, suffix, hash_files)
+
+    def remove_partition(self, partition):
+        """
+        Remove all the hash dirs of a partition from the index.
+        """
+        with self._connect() as conn:
+            conn.execute('DELETE FROM hash_dir WHERE partition = ?',
+                         (partition,))
+
+    def replace_partition(self, partition, hash_dirs):
+        """
+        Replace everything the index has for a partition.
+
+        :param partition: partition name
+        :param hash_dirs: a dict mapping (suffix, hash) tuples to lists of the
+                          names of the files in those hash dirs
+        :returns: a dict with the number of hash dirs ``added`` to,
+                  ``removed`` from and ``updated`` in the index
+
+        As with :meth:`update_suffix`, hash dirs that differ from the index
+        are listed again while the index is locked for writing, if the index
+        knows its data dir.
+        """
+        counts = {'added': 0, 'removed': 0, 'updated': 0}
+        with self._connect() as conn:
+            indexed = dict(
+                ((suffix, hsh), files) for suffix, hsh, files in conn.execute(
+                    'SELECT suffix, hash, files FROM hash_dir '
+                    'WHERE partition = ?', (partition,)))
+            hash_dirs = dict(hash_dirs)
+            if self.datadir_path:
+                for key in set(hash_dirs).union(indexed):
+                    files = hash_dirs.get(key, [])
+                    if indexed.get(key) != json.dumps(
+                            sorted(files, reverse=True)):
+                        files = self._list_hash_dir(partition, *key)
+                    if files:
+                        hash_dirs[key] = files
+                    else:
+                        hash_dirs.pop(key, None)
+            for key, files in hash_dirs.items():
+                files = json.dumps(sorted(files, reverse=True))
+                old_files = indexed.pop(key, None)
+                if old_files == files:
+                    continue
+                counts['added' if old_files is None else 'updated'] += 1
+                conn.execute(
+                    'INSERT OR REPLACE INTO hash_dir '
+                    '(partition, suffix, hash, files) VALUES (?, ?, ?, ?)',
+                    (partition, key[0], key[1], files))
+            for suffix, hsh in indexed:
+                counts['removed'] += 1
+                conn.execute(
+                    'DELETE FROM hash_dir '
+                    'WHERE partition = ? AND suffix = ? AND hash = ?',
+                    (partition, suffix, hsh))
+        return counts
+
+    def get_partitions(self):
+        """
+        :returns: a sorted list of the names of the indexed partitions
+        """
+        with self._connect(write=False) as conn:
+            return [row[0] for row in conn.execute(
+                'SELECT DISTINCT partition FROM hash_dir ORDER BY partition')]
+
+    def get_hash_dirs(self, partition, suffixes=None):
+        """
+        List the indexed hash dirs of a partition.
+
+        :param partition: partition name
+        :param suffixes: optional list of suffixes to restrict the listing to
+        :returns: a list of (suffix, hash, files) tuples, sorted by suffix and
+                  hash; files are reverse sorted
+        """
+        with self._connect(write=False) as conn:
+            rows = conn.execute(
+                'SELECT suffix, hash, files FROM hash_dir '
+                'WHERE partition = ? ORDER BY suffix, hash',
+                (partition,)).fetchall()
+        if suffixes is not None:
+            suffixes = set(suffixes)
+            rows = [row for row in rows if row[0] in suffixes]
+        return [(suffix, hsh, json.loads(files))
+                for suffix, hsh, files in rows]
+
+    def _set_stat(self, key, value):
+        with self._connect() as conn:
+            conn.execute('INSERT OR REPLACE INTO index_stat (key, value) '
+                         'VALUES (?, ?)', (key, value))
+
+    def is_complete(self):
+        """
+        :returns: True if the index has been rebuilt from disk since it was
+                  created or last marked incomplete
+        """
+        if not os.path.exists(self.path):
+            # don't keep writing to a database that was removed
+            self.close()
+            return False
+        with self._connect(write=False) as conn:
+            row = conn.execute('SELECT value FROM index_stat '
+                               'WHERE key = ?', ('complete',)).fetchone()
+        return bool(row and row[0])
+
+    def mark_complete(self):
+        """
+        Allow the index to be used for listings; call this once the index has
+        been rebuilt from disk.
+        """
+        self._set_stat('complete', '%f' % time.time())
+
+    def mark_incomplete(self):
+        """
+        Stop the index from being used for listings until it is next rebuilt,
+        e.g. because hash dirs are being created without it being updated.
+        """
+        self._set_stat('complete', '')
@@ -0,0 +1,94 @@
+# Copyright (c) 2021 OpenStack Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Helpers for the replicator and reconstructor to order the work of a pass so
+that the partitions whose data is most at risk are processed first.
+"""
+
+import os
+
+#: Partitions with at least one primary node that is unlikely to hold a
+#: healthy copy of the data.
+DEGRADED = 'degraded'
+#: Partitions held on a handoff node.
+HANDOFF = 'handoff'
+#: Everything else.
+NORMAL = 'normal'
+#: The priority classes, most urgent first.
+PRIORITY_CLASSES = (DEGRADED, HANDOFF, NORMAL)
+
+
+def count_unhealthy(nodes, failed_devs):
+    """
+    Returns the number of the given nodes that are unlikely to hold a healthy
+    copy of a partition's data: nodes whose device has been given zero weight
+    in the ring, or that could not be synced with during the last pass.
+
+    :param nodes: a list of node dicts from the ring
+    :param failed_devs: a set of (replication_ip, device) tuples
+    """
+    return sum(1 for node in nodes
+               if node.get('weight') == 0 or
+               (node['replication_ip'], node['device']) in failed_devs)
+
+
+def partition_size(path):
+    """
+    Returns the number of suffix directories in a partition directory, or 0
+    if the directory can not be listed.
+    """
+    try:
+        return sum(1 for name in os.listdir(path) if len(name) == 3)
+    except OSError:
+        return 0
+
+
+def get_priority(nodes, is_handoff, failed_devs, size):
+    """
+    Returns the priority class of some work and a key to sort the work by.
+
+    Sorting by the key puts the work with the most unhealthy nodes first,
+    then handoff work, and the largest work first within each of those.
+
+    :param nodes: the node dicts of the remote primary nodes of the work
+    :param is_handoff: True if the work is on a handoff node
+    :param failed_devs: a set of (replication_ip, device) tuples that could
+        not be synced with during the last pass
+    :param size: the size of the work, e.g. a number of suffixes
+    :returns: a tuple of (priority class, sort key)
+    """
+    unhealthy = count_unhealthy(nodes, failed_devs)
+    if unhealthy:
+        priority_class = DEGRADED
+    elif is_handoff:
+        priority_class = HANDOFF
+    else:
+        priority_class = NORMAL
+    return priority_class, (-unhealthy, not is_handoff, -size)
+
+
+def sum_priority_queues(queues):
+    """
+    Returns the total number of items in each priority class.
+
+    :param queues: an iterable of dicts mapping priority class to a number of
+        items, e.g. one for each device
+    """
+    total = dict((priority_class, 0) for priority_class in PRIORITY_CLASSES)
+    for queue in queues:
+        for priority_class, count in queue.items():
+            total[priority_class] = total.get(priority_class, 0) + count
+    return total
@@ -34,12 +34,14 @@ from swift.common.utils import (
     GreenAsyncPile, Timestamp, remove_file,
     load_recon_cache, parse_override_options, distribute_evenly,
     PrefixLoggerAdapter, remove_directory, config_request_node_count_value,
-    non_negative_int)
+    non_negative_int, config_positive_int_value)
 from swift.common.header_key_dict import HeaderKeyDict
 from swift.common.bufferedhttp import http_connect
 from swift.common.daemon import Daemon
 from swift.common.ring.utils import is_local_device
 from swift.obj.ssync_sender import Sender as ssync_sender
+from swift.obj.priority import get_priority, partition_size, \
+    sum_priority_queues
 from swift.common.http import HTTP_OK, HTTP_NOT_FOUND, \
     HTTP_INSUFFICIENT_STORAGE
 from swift.obj.diskfile import DiskFileRouter, get_data_dir, \
@@ -209,6 +211,14 @@ class ObjectReconstructor(Daemon):
         self.conn_timeout = float(conf.get('conn_timeout', 0.5))
         self.node_timeout = float(conf.get('node_timeout', 10))
         self.network_chunk_size = int(conf.get('network_chunk_size', 65536))
+        self.rebuild_concurrency = config_positive_int_value(
+            conf.get('rebuild_concurrency', 1))
+        self.rebuild_batch_segments = config_positive_int_value(
+            conf.get('rebuild_batch_segments', 1))
+        # device => bytes rebuilt by its jobs during the current pass
+        self.rebuilt_bytes = defaultdict(int)
+        self.ssync_protocol_version = int(
+            conf.get('ssync_protocol_version', 1))
         self.disk_chunk_size = int(conf.get('disk_chunk_size', 65536))
         self.headers = {
             'Content-Length': '0',
@@ -237,6 +247,17 @@ class ObjectReconstructor(Daemon):
             conf.get('quarantine_threshold', 0))
         self.request_node_count = config_request_node_count_value(
             conf.get('request_node_count', '2 * replicas'))
+        self.job_ordering = conf.get('job_ordering', 'random')
+        if self.job_ordering not in ('random', 'priority'):
+            raise ValueError('job_ordering must be random or priority, '
+                             'not %r' % self.job_ordering)
+        # (replication_ip, device) pairs that failed during the current and
+        # the last pass
+        self.sync_failures = set()
+        self.recent_failures = set()
+        # device => priority class => number of partitions, as collected at
+        # the start of the last pass
+        self.priority_queue = {}
 
         # When upgrading from liberasurecode<=1.5.0, you may want to continue
         # writing legacy CRCs until all nodes are upgraded and capabale of
@@ -337,6 +358,13 @@ class ObjectReconstructor(Daemon):
                 'object_reconstruction_time': duration / 60.0,
                 'object_reconstruction_last': last_finish
             }
+            if self.job_ordering == 'priority':
+                recon_update['object_reconstruction_priority_queue'] = \
+                    sum_priority_queues(
+                        existing_data['object_reconstruction_per_disk'][
+                            device].get(
+                                'object_reconstruction_priority_queue', {})
+                        for device in self.all_local_devices)
         else:
             # if any current devices have not yet dropped stats, or the rcache
             # file does not yet exist, we may still clear out per device stats
@@ -665,6 +693,8 @@ class ObjectReconstructor(Daemon):
             responses = list(useful_bucket.useful_responses.values())
             rebuilt_fragment_iter = self.make_rebuilt_fragment_iter(
                 responses[:policy.ec_ndata], path, policy, fi_to_rebuild)
+            rebuilt_fragment_iter = self._count_rebuilt_bytes(
+                os.path.basename(df._device_path), rebuilt_fragment_iter)
             return RebuildingECDiskFileStream(datafile_metadata, fi_to_rebuild,
                                               rebuilt_fragment_iter)
 
@@ -697,6 +727,23 @@ class ObjectReconstructor(Daemon):
 
         raise DiskFileError('Unable to reconstruct EC archive')
 
+    def _count_rebuilt_bytes(self, device, rebuilt_fragment_iter):
+        """
+        Passes through the chunks of a rebuilt fragment archive, counting the
+        bytes rebuilt by the jobs of the given local device.
+        """
+        start = time.time()
+        bytes_rebuilt = 0
+        try:
+            for chunk in rebuilt_fragment_iter:
+                bytes_rebuilt += len(chunk)
+                yield chunk
+        finally:
+            self.rebuilt_bytes[device] += bytes_rebuilt
+            self.logger.update_stats(
+                'fragment.rebuild.bytes.%s' % device, bytes_rebuilt)
+            self.logger.timing_since('fragment.rebuild.timing', start)
+
     def _reconstruct(self, policy, fragment_payload, frag_index):
         return policy.pyeclib_driver.reconstruct(fragment_payload,
                                                  [frag_index])[0]
@@ -718,11 +765,14 @@ class ObjectReconstructor(Daemon):
                 buff.append(chunk)
             return b''.join(buff)
 
-        def fragment_payload_iter():
+        def get_fragment_payloads():
+            # read the next batch of fragments from each connection; a short
+            # batch means that the fragment archives have been read or failed
+            fragment_payloads = []
             # We need a fragment from each connections, so best to
             # use a GreenPile to keep them ordered and in sync
             pile = GreenPile(len(responses))
-            while True:
+            for _junk in range(self.rebuild_batch_segments):
                 for resp in responses:
                     pile.spawn(_get_one_fragment, resp)
                 try:
@@ -739,9 +789,29 @@ class ObjectReconstructor(Daemon):
                     break
                 if not all(fragment_payload):
                     break
-                rebuilt_fragment = self._reconstruct(
-                    policy, fragment_payload, frag_index)
-                yield rebuilt_fragment
+                fragment_payloads.append(fragment_payload)
+            return fragment_payloads
+
+        def fragment_payload_iter():
+            # read the next batch while the current batch is decoded and sent
+            next_payloads = spawn(get_fragment_payloads)
+            try:
+                while True:
+                    fragment_payloads = next_payloads.wait()
+                    if len(fragment_payloads) < self.rebuild_batch_segments:
+                        next_payloads = None
+                    else:
+                        next_payloads = spawn(get_fragment_payloads)
+                    if fragment_payloads:
+                        yield b''.join(
+                            self._reconstruct(policy, fragment_payload,
+                                              frag_index)
+                            for fragment_payload in fragment_payloads)
+                    if next_payloads is None:
+                        break
+            finally:
+                if next_payloads is not None:
+                    next_payloads.kill()
 
         return fragment_payload_iter()
 
@@ -781,6 +851,12 @@ class ObjectReconstructor(Daemon):
                      'min': self.partition_times[0],
                      'med': self.partition_times[
                          len(self.partition_times) // 2]})
+            for device, bytes_rebuilt in sorted(self.rebuilt_bytes.items()):
+                self.logger.info(
+                    _("%(bytes)d bytes rebuilt for %(device)s "
+                      "(%(rate).2f bytes/sec)"),
+                    {'bytes': bytes_rebuilt, 'device': device,
+                     'rate': bytes_rebuilt / elapsed})
         else:
             self.logger.info(
                 _("Nothing reconstructed for %s seconds."),
@@ -1024,6 +1100,8 @@ class ObjectReconstructor(Daemon):
             try:
                 suffixes, node = self._get_suffixes_to_sync(job, node)
             except SuffixSyncError:
+                self.sync_failures.add((node['replication_ip'],
+                                        node['device']))
                 continue
 
             if not suffixes:
@@ -1031,7 +1109,11 @@ class ObjectReconstructor(Daemon):
 
             # ssync any out-of-sync suffixes with the remote node
             success, _ = ssync_sender(
-                self, node, job, suffixes, include_non_durable=False)()
+                self, node, job, suffixes, include_non_durable=False,
+                prefetch=self.rebuild_concurrency - 1)()
+            if not success:
+                self.sync_failures.add((node['replication_ip'],
+                                        node['device']))
             # update stats for this attempt
             self.suffix_sync += len(suffixes)
             self.logger.update_stats('suffix.syncs', len(suffixes))
@@ -1063,6 +1145,9 @@ class ObjectReconstructor(Daemon):
                     if success:
                         syncd_with += 1
                         reverted_objs.update(in_sync_objs)
+                    else:
+                        self.sync_failures.add((node['replication_ip'],
+                                                node['device']))
                 if syncd_with >= len(job['sync_to']):
                     self.delete_reverted_objs(
                         job, reverted_objs, job['frag_index'])
@@ -1347,8 +1432,37 @@ class ObjectReconstructor(Daemon):
                     }
                     all_parts.append(part_info)
         random.shuffle(all_parts)
+        if self.job_ordering == 'priority':
+            all_parts = self.prioritize_parts(all_parts)
         return all_parts
 
+    def prioritize_parts(self, all_parts):
+        """
+        Returns the partitions sorted so that partitions with the fewest
+        healthy fragments come first, then handoff partitions, and larger
+        partitions before smaller ones; the number of partitions in each
+        priority class is noted in priority_queue.
+
+        :param all_parts: a list of part_info dicts built by collect_parts
+        """
+        keyed_parts = []
+        self.priority_queue = {}
+        for i, part_info in enumerate(all_parts):
+            local_dev = part_info['local_dev']
+            part_nodes = part_info['policy'].object_ring.get_part_nodes(
+                part_info['partition'])
+            nodes = [node for node in part_nodes
+                     if node['id'] != local_dev['id']]
+            priority_class, key = get_priority(
+                nodes, len(nodes) == len(part_nodes), self.recent_failures,
+                partition_size(part_info['part_path']))
+            dev_queue = self.priority_queue.setdefault(local_dev['device'], {})
+            dev_queue[priority_class] = dev_queue.get(priority_class, 0) + 1
+            # the index keeps the shuffled order of parts with equal keys
+            keyed_parts.append((key, i, part_info))
+        keyed_parts.sort(key=lambda keyed_part: keyed_part[:2])
+        return [part_info for _key, _i, part_info in keyed_parts]
+
     def build_reconstruction_jobs(self, part_info):
         """
         Helper function for collect_jobs to build jobs for reconstruction
@@ -1359,6 +1473,11 @@ class ObjectReconstructor(Daemon):
         """
         jobs = self._get_part_jobs(**part_info)
         random.shuffle(jobs)
+        if self.job_ordering == 'priority':
+            # revert jobs and jobs syncing with unhealthy nodes go first
+            jobs.sort(key=lambda job: get_priority(
+                job['sync_to'], job['job_type'] == REVERT,
+                self.recent_failures, len(job['suffixes']))[1])
         self.job_count += len(jobs)
         return jobs
 
@@ -1374,6 +1493,7 @@ class ObjectReconstructor(Daemon):
         self.reconstruction_part_count = 0
         self.last_reconstruction_count = -1
         self.handoffs_remaining = 0
+        self.rebuilt_bytes = defaultdict(int)
 
     def delete_partition(self, path):
         def kill_it(path):
@@ -1387,6 +1507,7 @@ class ObjectReconstructor(Daemon):
         """Run a reconstruction pass"""
         self._reset_stats()
         self.partition_times = []
+        self.sync_failures = set()
 
         stats = spawn(self.heartbeat)
         lockup_detector = spawn(self.detect_lockups)
@@ -1424,6 +1545,7 @@ class ObjectReconstructor(Daemon):
             stats.kill()
             lockup_detector.kill()
             self.stats_line()
+            self.recent_failures = self.sync_failures
         if self.handoffs_only:
             if self.handoffs_remaining > 0:
                 self.logger.info(_(
@@ -1455,11 +1577,19 @@ class ObjectReconstructor(Daemon):
         devices = override_devices or self.all_local_devices
         if self.reconstructor_workers > 0 and devices:
             recon_update['pid'] = os.getpid()
-            recon_update = {'object_reconstruction_per_disk': {
-                d: recon_update for d in devices}}
+            per_disk = {}
+            for d in devices:
+                per_disk[d] = dict(recon_update)
+                if self.job_ordering == 'priority':
+                    per_disk[d]['object_reconstruction_priority_queue'] = \
+                        self.priority_queue.get(d, {})
+            recon_update = {'object_reconstruction_per_disk': per_disk}
         else:
             # if not running in worker mode, kill any per_disk stats
             recon_update['object_reconstruction_per_disk'] = {}
+            if self.job_ordering == 'priority':
+                recon_update['object_reconstruction_priority_queue'] = \
+                    sum_priority_queues(self.priority_queue.values())
         dump_recon_cache(recon_update, self.rcache, self.logger)
 
     def post_multiprocess_run(self):
@@ -28,6 +28,7 @@ from swift import gettext_ as _
 import eventlet
 from eventlet import GreenPool, queue, tpool, Timeout, sleep
 from eventlet.green import subprocess
+from eventlet.semaphore import Semaphore
 
 from swift.common.constraints import check_drive
 from swift.common.ring.utils import is_local_device
@@ -36,12 +37,15 @@ from swift.common.utils import whataremyips, unlink_older_than, \
     rsync_module_interpolation, mkdirs, config_true_value, \
     config_auto_int_value, storage_directory, \
     load_recon_cache, PrefixLoggerAdapter, parse_override_options, \
-    distribute_evenly
+    distribute_evenly, ratelimit_sleep
 from swift.common.bufferedhttp import http_connect
 from swift.common.daemon import Daemon
 from swift.common.http import HTTP_OK, HTTP_INSUFFICIENT_STORAGE
 from swift.obj import ssync_sender
-from swift.obj.diskfile import get_data_dir, get_tmp_dir, DiskFileRouter
+from swift.obj.priority import get_priority, partition_size, \
+    sum_priority_queues
+from swift.obj.diskfile import get_data_dir, get_tmp_dir, DiskFileRouter, \
+    extract_policy
 from swift.common.storage_policy import POLICIES, REPL_POLICY
 from swift.common.exceptions import PartitionLockTimeout
 
@@ -179,6 +183,16 @@ class ObjectReplicator(Daemon):
         self.node_timeout = float(conf.get('node_timeout', 10))
         self.sync_method = getattr(self, conf.get('sync_method') or 'rsync')
         self.network_chunk_size = int(conf.get('network_chunk_size', 65536))
+        self.ssync_protocol_version = int(
+            conf.get('ssync_protocol_version', 1))
+        self.ssync_target_concurrency = int(
+            conf.get('ssync_target_concurrency', 1))
+        self.ssync_bytes_per_second = int(
+            conf.get('ssync_bytes_per_second', 0))
+        self._ssync_target_semaphores = defaultdict(
+            lambda: Semaphore(self.ssync_target_concurrency))
+        self._ssync_bytes_running_time = 0
+        self._ssync_ratelimit_lock = Semaphore()
         self.default_headers = {
             'Content-Length': '0',
             'user-agent': 'object-replicator %s' % os.getpid()}
@@ -188,6 +202,15 @@ class ObjectReplicator(Daemon):
                                                          False))
         self.handoff_delete = config_auto_int_value(
             conf.get('handoff_delete', 'auto'), 0)
+        self.job_ordering = conf.get('job_ordering', 'random')
+        if self.job_ordering not in ('random', 'priority'):
+            raise ValueError('job_ordering must be random or priority, '
+                             'not %r' % self.job_ordering)
+        # (replication_ip, device) pairs that failed during the last pass
+        self.recent_failures = set()
+        # device => priority class => number of jobs, as collected at the
+        # start of the last pass
+        self.priority_queue = {}
         if any((self.handoff_delete, self.handoffs_first)):
             self.logger.warning('Handoff only mode is not intended for normal '
                                 'operation, please disable handoffs_first and '
@@ -483,8 +506,35 @@ class ObjectReplicator(Daemon):
         return success, {}
 
     def ssync(self, node, job, suffixes, remote_check_objs=None):
+        """
+        Uses ssync to implement the sync method.
+
+        At most ssync_target_concurrency partitions are synced to the same
+        remote device at once; any other syncs to that device wait their turn
+        rather than contend for the receiver's replication lock.
+        """
+        if self.ssync_target_concurrency <= 0:
+            return self._ssync(node, job, suffixes, remote_check_objs)
+        target = (node['replication_ip'], node['replication_port'],
+                  node['device'])
+        with self._ssync_target_semaphores[target]:
+            return self._ssync(node, job, suffixes, remote_check_objs)
+
+    def _ssync(self, node, job, suffixes, remote_check_objs):
+        ratelimit = None
+        if self.ssync_bytes_per_second > 0:
+            ratelimit = self._ssync_ratelimit
         return ssync_sender.Sender(
-            self, node, job, suffixes, remote_check_objs)()
+            self, node, job, suffixes, remote_check_objs,
+            ratelimit=ratelimit)()
+
+    def _ssync_ratelimit(self, nbytes):
+        # the limit is shared by all the concurrent syncs of this process, so
+        # only one of them at a time may update the running time
+        with self._ssync_ratelimit_lock:
+            self._ssync_bytes_running_time = ratelimit_sleep(
+                self._ssync_bytes_running_time, self.ssync_bytes_per_second,
+                incr_by=nbytes)
 
     def check_ring(self, object_ring):
         """
@@ -616,6 +666,10 @@ class ObjectReplicator(Daemon):
             if e.errno not in (errno.ENOENT, errno.ENOTEMPTY):
                 # If there was a race to create or delete, don't worry
                 raise
+        finally:
+            policy = extract_policy(path)
+            if policy is not None:
+                self._df_router[policy].unindex_partition(path)
 
     def delete_handoff_objs(self, job, delete_objs):
         success_paths = []
@@ -624,6 +678,7 @@ class ObjectReplicator(Daemon):
             object_path = storage_directory(job['obj_path'], job['partition'],
                                             object_hash)
             tpool.execute(shutil.rmtree, object_path, ignore_errors=True)
+            self._df_router[job['policy']].index_hash_dir(object_path)
             suffix_dir = dirname(object_path)
             try:
                 os.rmdir(suffix_dir)
@@ -930,12 +985,36 @@ class ObjectReplicator(Daemon):
                 policy, ips, override_devices=override_devices,
                 override_partitions=override_partitions)
         random.shuffle(jobs)
+        if self.job_ordering == 'priority':
+            jobs = self.prioritize_jobs(jobs)
         if self.handoffs_first:
             # Move the handoff parts to the front of the list
             jobs.sort(key=lambda job: not job['delete'])
         self.job_count = len(jobs)
         return jobs
 
+    def prioritize_jobs(self, jobs):
+        """
+        Returns the jobs sorted so that partitions with the fewest healthy
+        replicas come first, then handoff partitions, and larger partitions
+        before smaller ones; the number of jobs in each priority class is
+        noted in priority_queue.
+
+        :param jobs: a list of jobs built by build_replication_jobs
+        """
+        keyed_jobs = []
+        self.priority_queue = {}
+        for i, job in enumerate(jobs):
+            priority_class, key = get_priority(
+                job['nodes'], job['delete'], self.recent_failures,
+                partition_size(job['path']))
+            dev_queue = self.priority_queue.setdefault(job['device'], {})
+            dev_queue[priority_class] = dev_queue.get(priority_class, 0) + 1
+            # the index keeps the shuffled order of jobs with equal keys
+            keyed_jobs.append((key, i, job))
+        keyed_jobs.sort(key=lambda keyed_job: keyed_job[:2])
+        return [job for _key, _i, job in keyed_jobs]
+
     def replicate(self, override_devices=None, override_partitions=None,
                   override_policies=None, start_time=None):
         """Run a replication pass"""
@@ -1018,6 +1097,10 @@ class ObjectReplicator(Daemon):
         finally:
             stats.kill()
             self.stats_line()
+            self.recent_failures = set(
+                (ip, device)
+                for ip, devices in self.total_stats.failure_nodes.items()
+                for device in devices)
 
     def update_recon(self, total, end_time, override_devices):
         # Called at the end of a replication pass to update recon stats.
@@ -1035,12 +1118,20 @@ class ObjectReplicator(Daemon):
                          'object_replication_time': total,
                          'object_replication_last': end_time}
                     for od in override_devices}}
+            if self.job_ordering == 'priority':
+                for od in override_devices:
+                    update['object_replication_per_disk'][od][
+                        'replication_priority_queue'] = \
+                        self.priority_queue.get(od, {})
         else:
             update = {'replication_stats': self.total_stats.to_recon(),
                       'replication_time': total,
                       'replication_last': end_time,
                       'object_replication_time': total,
                       'object_replication_last': end_time}
+            if self.job_ordering == 'priority':
+                update['replication_priority_queue'] = \
+                    sum_priority_queues(self.priority_queue.values())
         dump_recon_cache(update, self.rcache, self.logger)
 
     def aggregate_recon_update(self):
@@ -1064,6 +1155,11 @@ class ObjectReplicator(Daemon):
             recon_update['replication_time'] = min_repl_time
             recon_update['object_replication_last'] = min_repl_last
             recon_update['object_replication_time'] = min_repl_time
+            if self.job_ordering == 'priority':
+                recon_update['replication_priority_queue'] = \
+                    sum_priority_queues(
+                        data.get('replication_priority_queue', {})
+                        for data in per_disk_stats.values())
 
         # Clear out entries for old local devices that we no longer have
         devices_to_remove = set(per_disk_stats) - set(self.all_local_devices)
@@ -143,6 +143,8 @@ class ObjectController(BaseStorageServer):
         self.node_timeout = float(conf.get('node_timeout', 3))
         self.container_update_timeout = float(
             conf.get('container_update_timeout', 1))
+        self.container_update_redirects = config_true_value(
+            conf.get('container_update_redirects', 'false'))
         self.conn_timeout = float(conf.get('conn_timeout', 0.5))
         self.client_timeout = float(conf.get('client_timeout', 60))
         self.disk_chunk_size = int(conf.get('disk_chunk_size', 65536))
@@ -233,6 +235,8 @@ class ObjectController(BaseStorageServer):
             conf.get('replication_failure_threshold') or 100)
         self.replication_failure_ratio = float(
             conf.get('replication_failure_ratio') or 1.0)
+        self.replication_pipeline_depth = int(
+            conf.get('replication_pipeline_depth', 4))
 
         servers_per_port = int(conf.get('servers_per_port', '0') or 0)
         if servers_per_port:
@@ -277,7 +281,8 @@ class ObjectController(BaseStorageServer):
 
     def async_update(self, op, account, container, obj, host, partition,
                      contdevice, headers_out, objdevice, policy,
-                     logger_thread_locals=None, container_path=None):
+                     logger_thread_locals=None, container_path=None,
+                     accept_redirect=False):
         """
         Sends or saves an async update.
 
@@ -299,6 +304,12 @@ class ObjectController(BaseStorageServer):
             to which the update should be sent. If given this path will be used
             instead of constructing a path from the ``account`` and
             ``container`` params.
+        :param accept_redirect: if True, ask to be redirected if the update
+            arrives at a container that has started sharding; a redirected
+            update is saved as an async pending.
+        :returns: the path and timestamp that the update was redirected to as
+            returned by :func:`~swift.common.utils.get_redirect_data`, or None
+            if it was not redirected
         """
         if logger_thread_locals:
             self.logger.thread_locals = logger_thread_locals
@@ -309,13 +320,22 @@ class ObjectController(BaseStorageServer):
         else:
             full_path = '/%s/%s/%s' % (account, container, obj)
 
+        request_headers = headers_out
+        if accept_redirect:
+            # these are not saved with an async pending; the updater always
+            # accepts redirects
+            request_headers = dict(headers_out)
+            request_headers.update({
+                'X-Backend-Accept-Redirect': 'true',
+                'X-Backend-Accept-Redirect-If-Sharding': 'true',
+                'X-Backend-Accept-Quoted-Location': 'true'})
         redirect_data = None
         if all([host, partition, contdevice]):
             try:
                 with ConnectionTimeout(self.conn_timeout):
                     ip, port = host.rsplit(':', 1)
                     conn = http_connect(ip, port, contdevice, partition, op,
-                                        full_path, headers_out)
+                                        full_path, request_headers)
                 with Timeout(self.node_timeout):
                     response = conn.getresponse()
                     response.read()
@@ -354,6 +374,7 @@ class ObjectController(BaseStorageServer):
                                     headers_out.get('x-timestamp'))
         self._diskfile_router[policy].pickle_async_update(
             objdevice, account, container, obj, data, timestamp, policy)
+        return redirect_data
 
     def container_update(self, op, account, container, obj, request,
                          headers_out, objdevice, policy):
@@ -369,6 +390,9 @@ class ObjectController(BaseStorageServer):
                             request(s)
         :param objdevice: device name that the object is in
         :param policy:  the BaseStoragePolicy instance
+        :returns: True if any container server redirected the update to a
+            shard, in which case the proxy's cached shard ranges for the
+            container are stale
         """
         headers_in = request.headers
         conthosts = [h.strip() for h in
@@ -386,7 +410,7 @@ class ObjectController(BaseStorageServer):
                 '"%(hosts)s" vs "%(devices)s"') % {
                     'hosts': headers_in.get('X-Container-Host', ''),
                     'devices': headers_in.get('X-Container-Device', '')})
-            return
+            return False
 
         contpath = headers_in.get('X-Backend-Quoted-Container-Path')
         if contpath:
@@ -420,13 +444,17 @@ class ObjectController(BaseStorageServer):
         headers_out['x-trans-id'] = headers_in.get('x-trans-id', '-')
         headers_out['referer'] = request.as_referer()
         headers_out['X-Backend-Storage-Policy-Index'] = int(policy)
+        # If enabled, updates are redirected by containers that have started
+        # sharding, so that the proxy learns that its cached shard ranges are
+        # stale.
         update_greenthreads = []
         for conthost, contdevice in updates:
             gt = spawn(self.async_update, op, account, container, obj,
                        conthost, contpartition, contdevice, headers_out,
                        objdevice, policy,
                        logger_thread_locals=self.logger.thread_locals,
-                       container_path=contpath)
+                       container_path=contpath,
+                       accept_redirect=self.container_update_redirects)
             update_greenthreads.append(gt)
         # Wait a little bit to see if the container updates are successful.
         # If we immediately return after firing off the greenthread above, then
@@ -434,15 +462,18 @@ class ObjectController(BaseStorageServer):
         # after getting a successful response to the object create. The
         # `container_update_timeout` bounds the length of time we wait so that
         # one slow container server doesn't make the entire request lag.
+        redirected = False
         try:
             with Timeout(self.container_update_timeout):
                 for gt in update_greenthreads:
-                    gt.wait()
+                    if gt.wait():
+                        redirected = True
         except Timeout:
             # updates didn't go through, log it and return
             self.logger.debug(
                 'Container update timeout (%.4fs) waiting for %s',
                 self.container_update_timeout, updates)
+        return redirected
 
     def delete_at_update(self, op, delete_at, account, container, obj,
                          request, objdevice, policy):
@@ -759,13 +790,15 @@ class ObjectController(BaseStorageServer):
         self._check_container_override(update_headers, orig_metadata)
 
         # object POST updates are PUT to the container server
-        self.container_update(
+        redirected = self.container_update(
             'PUT', account, container, obj, request, update_headers,
             device, policy)
 
         # Add current content-type and sysmeta to response
         resp_headers = {
             'X-Backend-Content-Type': content_type_headers['Content-Type']}
+        if redirected:
+            resp_headers['X-Backend-Container-Update-Redirected'] = 'true'
         for key, value in orig_metadata.items():
             if is_sys_meta('object', key):
                 resp_headers[key] = value
@@ -1018,7 +1051,7 @@ class ObjectController(BaseStorageServer):
         # apply any container update header overrides sent with request
         self._check_container_override(update_headers, request.headers,
                                        footers_metadata)
-        self.container_update(
+        return self.container_update(
             'PUT', account, container, obj, request,
             update_headers, device, policy)
 
@@ -1061,10 +1094,13 @@ class ObjectController(BaseStorageServer):
             return HTTPRequestTimeout(request=request)
         finally:
             writer.close()
-        self._post_commit_updates(request, device,
-                                  account, container, obj, policy,
-                                  orig_metadata, footers_metadata, metadata)
-        return HTTPCreated(request=request, etag=etag)
+        redirected = self._post_commit_updates(
+            request, device, account, container, obj, policy,
+            orig_metadata, footers_metadata, metadata)
+        resp = HTTPCreated(request=request, etag=etag)
+        if redirected:
+            resp.headers['X-Backend-Container-Update-Redirected'] = 'true'
+        return resp
 
     @public
     @timing_stats()
@@ -1267,20 +1303,20 @@ class ObjectController(BaseStorageServer):
             self.delete_at_update('DELETE', orig_delete_at, account,
                                   container, obj, request, device,
                                   policy)
+        resp_headers = {
+            'X-Backend-Timestamp': response_timestamp.internal,
+            'X-Backend-Content-Type': orig_metadata.get('Content-Type', '')}
         if orig_timestamp < req_timestamp:
             try:
                 disk_file.delete(req_timestamp)
             except DiskFileNoSpace:
                 return HTTPInsufficientStorage(drive=device, request=request)
-            self.container_update(
-                'DELETE', account, container, obj, request,
-                HeaderKeyDict({'x-timestamp': req_timestamp.internal}),
-                device, policy)
-        return response_class(
-            request=request,
-            headers={'X-Backend-Timestamp': response_timestamp.internal,
-                     'X-Backend-Content-Type': orig_metadata.get(
-                         'Content-Type', '')})
+            if self.container_update(
+                    'DELETE', account, container, obj, request,
+                    HeaderKeyDict({'x-timestamp': req_timestamp.internal}),
+                    device, policy):
+                resp_headers['X-Backend-Container-Update-Redirected'] = 'true'
+        return response_class(request=request, headers=resp_headers)
 
     @public
     @replication
@@ -1317,9 +1353,11 @@ class ObjectController(BaseStorageServer):
         # commit all PUTs (subject to EC footer metadata), so we need to
         # indicate to the sender that this object server has been upgraded to
         # understand the X-Backend-No-Commit header.
-        headers = {'X-Backend-Accept-No-Commit': True}
-        return Response(app_iter=ssync_receiver.Receiver(self, request)(),
-                        headers=headers)
+        receiver = ssync_receiver.Receiver(self, request)
+        headers = {'X-Backend-Accept-No-Commit': True,
+                   'X-Backend-Ssync-Protocol-Version':
+                   receiver.protocol_version}
+        return Response(app_iter=receiver(), headers=headers)
 
     def __call__(self, env, start_response):
         """WSGI Application entry point for the Swift Object Server."""
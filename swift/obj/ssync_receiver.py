@@ -14,9 +14,13 @@
 # limitations under the License.
 
 
+import zlib
+
 import eventlet.greenio
+import eventlet.greenpool
 import eventlet.wsgi
 from eventlet import sleep
+import six
 from six.moves import urllib
 
 from swift.common import exceptions
@@ -24,13 +28,57 @@ from swift.common import http
 from swift.common import swob
 from swift.common import utils
 from swift.common import request_helpers
+from swift.common.storage_policy import EC_POLICY
 from swift.common.utils import Timestamp
 
+#: The latest version of the SSYNC protocol understood by the receiver.
+#: Version 2 exchanges the MISSING_CHECK lists as zlib compressed batches.
+SSYNC_PROTOCOL_VERSION = 2
+
 
 class SsyncClientDisconnected(Exception):
     pass
 
 
+def encode_batch(lines):
+    """
+    Returns a MISSING_CHECK batch message, for version 2 of the protocol,
+    carrying the given lines; the message is a ``:MISSING_CHECK: BATCH
+    <length>`` line followed by ``<length>`` bytes of zlib compressed lines.
+
+    The decoder for the compressed lines is :py:func:`decode_batch`.
+    """
+    data = zlib.compress(b''.join(line + b'\r\n' for line in lines), 1)
+    return b':MISSING_CHECK: BATCH %d\r\n%s' % (len(data), data)
+
+
+def decode_batch(data):
+    """
+    Returns the lines in the compressed data of a MISSING_CHECK batch message
+    generated by :py:func:`encode_batch`.
+    """
+    try:
+        data = zlib.decompress(data)
+    except zlib.error as err:
+        raise exceptions.ReplicationException(
+            'Invalid MISSING_CHECK batch: %s' % err)
+    return data.splitlines()
+
+
+def parse_batch_length(line):
+    """
+    Returns the length of the compressed data that follows a MISSING_CHECK
+    batch line, or None if the line does not start a batch.
+    """
+    if not line.startswith(b':MISSING_CHECK: BATCH '):
+        return None
+    try:
+        return int(line.split()[2])
+    except (IndexError, ValueError):
+        raise exceptions.ReplicationException(
+            'Invalid MISSING_CHECK batch line: %r' % line[:1024])
+
+
 def decode_missing(line):
     """
     Parse a string of the form generated by
@@ -248,6 +296,18 @@ class Receiver(object):
                 raise swob.HTTPBadRequest(
                     'Invalid X-Backend-Ssync-Frag-Index %r' %
                     self.request.headers['X-Backend-Ssync-Frag-Index'])
+        # the sender asks for the latest version of the protocol it
+        # understands; anything before version 2 did not ask
+        try:
+            self.protocol_version = min(int(self.request.headers.get(
+                'X-Backend-Ssync-Protocol-Version', 1)),
+                SSYNC_PROTOCOL_VERSION)
+        except ValueError:
+            self.protocol_version = 0
+        if self.protocol_version < 1:
+            raise swob.HTTPBadRequest(
+                'Invalid X-Backend-Ssync-Protocol-Version %r' %
+                self.request.headers['X-Backend-Ssync-Protocol-Version'])
         utils.validate_device_partition(self.device, self.partition)
         self.diskfile_mgr = self.app._diskfile_router[self.policy]
         if not self.diskfile_mgr.get_dev_path(self.device):
@@ -265,6 +325,24 @@ class Receiver(object):
                 raise exceptions.ChunkReadError('%s: %s' % (context, err))
             return line
 
+    def _read(self, size, context):
+        # read exactly size bytes from the wsgi input; annotate any timeout or
+        # read errors with a description of the calling context
+        data = b''
+        while len(data) < size:
+            with exceptions.MessageTimeout(
+                    self.app.client_timeout, context):
+                try:
+                    chunk = self.fp.read(size - len(data))
+                except (eventlet.wsgi.ChunkReadError, IOError) as err:
+                    raise exceptions.ChunkReadError(
+                        '%s: %s' % (context, err))
+            if not chunk:
+                raise exceptions.ChunkReadError(
+                    '%s: Early termination' % context)
+            data += chunk
+        return data
+
     def _check_local(self, remote, make_durable=True):
         """
         Parse local diskfile and return results of current
@@ -334,6 +412,51 @@ class Receiver(object):
         local = self._check_local(remote)
         return encode_wanted(remote, local)
 
+    def _check_missing_batch(self, lines):
+        """
+        Parse a batch of offered objects from the sender, and compare them to
+        the local diskfiles, returning a list of the protocol lines that
+        represent needed data.
+
+        The hashes and timestamps of the local diskfiles in the suffixes of
+        the offered objects are listed with one call to ``yield_hashes``;
+        only objects whose local timestamps differ from those offered are
+        then checked with :meth:`_check_local`. On a replication policy an
+        object with no local files is wanted without further checks.
+        """
+        remotes = [decode_missing(line) for line in lines]
+        suffixes = set(remote['object_hash'][-3:] for remote in remotes)
+        suffixes -= self.listed_suffixes
+        if suffixes:
+            self.listed_suffixes.update(suffixes)
+            self.local_hashes.update(self.diskfile_mgr.yield_hashes(
+                self.device, self.partition, self.policy, suffixes,
+                frag_index=self.frag_index))
+        wanted = []
+        for i, remote in enumerate(remotes):
+            local = self.local_hashes.get(remote['object_hash'])
+            if local is not None:
+                ts_data = local['ts_data']
+                if (remote['ts_data'], remote['ts_meta'], remote['ts_ctype'],
+                        remote['durable']) == (
+                        ts_data, local.get('ts_meta', ts_data),
+                        local.get('ts_ctype', ts_data),
+                        local.get('durable', True)):
+                    # in sync
+                    continue
+                local = self._check_local(remote)
+            elif self.policy.policy_type == EC_POLICY:
+                # non-durable frags are not listed
+                local = self._check_local(remote)
+            else:
+                local = {}
+            want = encode_wanted(remote, local)
+            if want:
+                wanted.append(want)
+            if i % 5 == 0:
+                sleep()  # Gives a chance for other greenthreads to run
+        return wanted
+
     def missing_check(self):
         """
         Handles the receiver-side of the MISSING_CHECK step of a
@@ -373,6 +496,12 @@ class Receiver(object):
         The collection and then response is so the sender doesn't
         have to read while it writes to ensure network buffers don't
         fill up and block everything.
+
+        In version 2 of the protocol the `hash timestamp` lines, and the
+        <wanted_hash> specifiers, are instead sent as batches. Each batch
+        is a `:MISSING_CHECK: BATCH <length>` line followed by <length>
+        bytes of zlib compressed lines, and the receiver checks the
+        objects offered in a batch together.
         """
         line = self._readline('missing_check start')
         if not line:
@@ -383,22 +512,64 @@ class Receiver(object):
                 'Looking for :MISSING_CHECK: START got %r' % line[:1024])
         object_hashes = []
         nlines = 0
+        self.listed_suffixes = set()
+        self.local_hashes = {}
         while True:
             line = self._readline('missing_check line')
             if not line or line.strip() == b':MISSING_CHECK: END':
                 break
+            if self.protocol_version > 1:
+                length = parse_batch_length(line.strip())
+                if length is None:
+                    raise Exception(
+                        'Looking for :MISSING_CHECK: BATCH got %r'
+                        % line[:1024])
+                object_hashes.extend(self._check_missing_batch(
+                    decode_batch(self._read(length, 'missing_check batch'))))
+                continue
             want = self._check_missing(line)
             if want:
                 object_hashes.append(want)
             if nlines % 5 == 0:
                 sleep()  # Gives a chance for other greenthreads to run
             nlines += 1
+        # don't hold on to the local listing through the updates
+        self.listed_suffixes = self.local_hashes = None
         yield b':MISSING_CHECK: START\r\n'
-        if object_hashes:
-            yield b'\r\n'.join(hsh.encode('ascii') for hsh in object_hashes)
-        yield b'\r\n'
+        if self.protocol_version > 1:
+            if object_hashes:
+                yield encode_batch(
+                    [hsh.encode('ascii') for hsh in object_hashes])
+        else:
+            if object_hashes:
+                yield b'\r\n'.join(
+                    hsh.encode('ascii') for hsh in object_hashes)
+            yield b'\r\n'
         yield b':MISSING_CHECK: END\r\n'
 
+    def _update(self, subreq, results):
+        # route an UPDATES subrequest and tally its response
+        resp = subreq.get_response(self.app)
+        if http.is_success(resp.status_int) or \
+                resp.status_int == http.HTTP_NOT_FOUND:
+            results['successes'] += 1
+        else:
+            self.app.logger.warning(
+                'ssync subrequest failed with %s: %s %s (%s)' %
+                (resp.status_int, subreq.method, subreq.path, resp.body))
+            results['failures'] += 1
+
+    def _check_failures(self, results):
+        failures = results['failures']
+        successes = results['successes']
+        if failures >= self.app.replication_failure_threshold and (
+                not successes or
+                float(failures) / successes >
+                self.app.replication_failure_ratio):
+            raise Exception(
+                'Too many %d failures to %d successes' %
+                (failures, successes))
+
     def updates(self):
         """
         Handles the UPDATES step of an SSYNC request.
@@ -436,6 +607,13 @@ class Receiver(object):
         thresholds) so the sender knows the whole was not entirely a
         success. This is so the sender knows if it can remove an out
         of place partition, for example.
+
+        In version 2 of the protocol the receiver may route up to
+        replication_pipeline_depth subrequests concurrently, while it reads
+        the next ones from the sender. Only DELETE and POST subrequests, and
+        PUT subrequests with a body no bigger than network_chunk_size, are
+        pipelined; subrequests for the same object are always applied in the
+        order they were sent.
         """
         line = self._readline('updates start')
         if not line:
@@ -443,8 +621,43 @@ class Receiver(object):
             raise SsyncClientDisconnected
         if line.strip() != b':UPDATES: START':
             raise Exception('Looking for :UPDATES: START got %r' % line[:1024])
-        successes = 0
-        failures = 0
+        results = {'successes': 0, 'failures': 0}
+        pool = None
+        if self.protocol_version > 1 and \
+                self.app.replication_pipeline_depth > 1:
+            pool = eventlet.greenpool.GreenPool(
+                self.app.replication_pipeline_depth)
+        try:
+            self._receive_updates(results, pool)
+        finally:
+            if pool is not None:
+                # don't leave subrequests running after this request is done
+                pool.waitall()
+        self._check_failures(results)
+        if results['failures']:
+            raise swob.HTTPInternalServerError(
+                'ERROR: With :UPDATES: %d failures to %d successes' %
+                (results['failures'], results['successes']))
+        yield b':UPDATES: START\r\n'
+        yield b':UPDATES: END\r\n'
+
+    def _receive_updates(self, results, pool=None):
+        """
+        Reads the UPDATES subrequests from the sender and routes them to the
+        object server, up until ``:UPDATES: END``.
+
+        :param results: a dict in which successes and failures are counted
+        :param pool: if given, a GreenPool in which small subrequests are
+            routed concurrently
+        """
+        pipelined = pool is not None
+        # the last update spawned for each object, until it is done
+        in_flight = {}
+
+        def forget(gt, path):
+            if in_flight.get(path) is gt:
+                del in_flight[path]
+
         while True:
             line = self._readline('updates line')
             if not line or line.strip() == b':UPDATES: END':
@@ -517,31 +730,27 @@ class Receiver(object):
             if replication_headers:
                 subreq.headers['X-Backend-Replication-Headers'] = \
                     ' '.join(replication_headers)
-            # Route subrequest and translate response.
-            resp = subreq.get_response(self.app)
-            if http.is_success(resp.status_int) or \
-                    resp.status_int == http.HTTP_NOT_FOUND:
-                successes += 1
+            if pipelined and (method != 'PUT' or
+                              content_length <= self.app.network_chunk_size):
+                if method == 'PUT':
+                    subreq.environ['wsgi.input'] = six.BytesIO(self._read(
+                        content_length, 'updates content'))
+                # updates to the same object must still be applied in order
+                previous = in_flight.get(subreq.path)
+                if previous is not None:
+                    previous.wait()
+                gt = pool.spawn(self._update, subreq, results)
+                in_flight[subreq.path] = gt
+                gt.link(forget, subreq.path)
+                self._check_failures(results)
             else:
-                self.app.logger.warning(
-                    'ssync subrequest failed with %s: %s %s (%s)' %
-                    (resp.status_int, method, subreq.path, resp.body))
-                failures += 1
-            if failures >= self.app.replication_failure_threshold and (
-                    not successes or
-                    float(failures) / successes >
-                    self.app.replication_failure_ratio):
-                raise Exception(
-                    'Too many %d failures to %d successes' %
-                    (failures, successes))
-            # The subreq may have failed, but we want to read the rest of the
-            # body from the remote side so we can continue on with the next
-            # subreq.
-            for junk in subreq.environ['wsgi.input']:
-                pass
-        if failures:
-            raise swob.HTTPInternalServerError(
-                'ERROR: With :UPDATES: %d failures to %d successes' %
-                (failures, successes))
-        yield b':UPDATES: START\r\n'
-        yield b':UPDATES: END\r\n'
+                if pipelined and subreq.path in in_flight:
+                    in_flight.pop(subreq.path).wait()
+                # Route subrequest and translate response.
+                self._update(subreq, results)
+                self._check_failures(results)
+                # The subreq may have failed, but we want to read the rest of
+                # the body from the remote side so we can continue on with the
+                # next subreq.
+                for junk in subreq.environ['wsgi.input']:
+                    pass
@@ -13,6 +13,11 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+from collections import deque
+import functools
+import sys
+
+import eventlet
 import six
 from six.moves import urllib
 
@@ -20,6 +25,12 @@ from swift.common import bufferedhttp
 from swift.common import exceptions
 from swift.common import http
 from swift.common.utils import config_true_value
+from swift.obj.ssync_receiver import SSYNC_PROTOCOL_VERSION, decode_batch, \
+    encode_batch, parse_batch_length
+
+#: The number of MISSING_CHECK lines sent in each batch with version 2 of the
+#: SSYNC protocol.
+MISSING_CHECK_BATCH_SIZE = 1000
 
 
 def encode_missing(object_hash, ts_data, ts_meta=None, ts_ctype=None,
@@ -128,6 +139,23 @@ class SsyncBufferedHTTPResponse(bufferedhttp.BufferedHTTPResponse, object):
             data += b'\n'
         return data
 
+    def read_exactly(self, size):
+        """
+        Reads exactly ``size`` bytes from the SSYNC response body.
+        """
+        data = b''
+        while len(data) < size:
+            chunk = self.readline(size=size - len(data))
+            if not chunk:
+                self.close()
+                raise exceptions.ReplicationException('Early disconnect')
+            data += chunk
+        if len(data) > size:
+            # readline may return more than size bytes from its buffer
+            data, extra = data[:size], data[size:]
+            self.ssync_response_buffer = extra + self.ssync_response_buffer
+        return data
+
 
 class SsyncBufferedHTTPConnection(bufferedhttp.BufferedHTTPConnection):
     response_class = SsyncBufferedHTTPResponse
@@ -143,7 +171,7 @@ class Sender(object):
     """
 
     def __init__(self, daemon, node, job, suffixes, remote_check_objs=None,
-                 include_non_durable=False):
+                 include_non_durable=False, ratelimit=None, prefetch=0):
         self.daemon = daemon
         self.df_mgr = self.daemon._df_router[job['policy']]
         self.node = node
@@ -153,6 +181,15 @@ class Sender(object):
         # make sure those objects exist or not in remote.
         self.remote_check_objs = remote_check_objs
         self.include_non_durable = include_non_durable
+        # When ratelimit is given it is called with the size of each chunk of
+        # object data before the chunk is sent, and may sleep to limit the
+        # rate at which data is sent.
+        self.ratelimit = ratelimit
+        # The number of objects after the one being sent whose diskfiles are
+        # opened, and built by any sync_diskfile_builder, concurrently.
+        self.prefetch = prefetch
+        # until the receiver agrees to something better
+        self.protocol_version = 1
 
     def __call__(self):
         """
@@ -250,6 +287,11 @@ class Sender(object):
                 connection.putheader('X-Backend-Ssync-Frag-Index', frag_index)
                 # Node-Index header is for backwards compat 2.4.0-2.20.0
                 connection.putheader('X-Backend-Ssync-Node-Index', frag_index)
+            requested_version = min(self.daemon.ssync_protocol_version,
+                                    SSYNC_PROTOCOL_VERSION)
+            if requested_version > 1:
+                connection.putheader('X-Backend-Ssync-Protocol-Version',
+                                     requested_version)
             connection.endheaders()
         with exceptions.MessageTimeout(
                 self.daemon.node_timeout, 'connect receive'):
@@ -267,6 +309,14 @@ class Sender(object):
                     'ssync receiver %s does not accept non-durable fragments' %
                     node_addr)
                 self.include_non_durable = False
+            if requested_version > 1:
+                # receivers that predate version 2 do not send the header
+                try:
+                    self.protocol_version = max(1, min(requested_version, int(
+                        response.getheader(
+                            'x-backend-ssync-protocol-version', 1))))
+                except ValueError:
+                    self.protocol_version = 1
         return connection, response
 
     def missing_check(self, connection, response):
@@ -297,13 +347,22 @@ class Sender(object):
                 lambda objhash_timestamps:
                 objhash_timestamps[0] in
                 self.remote_check_objs, hash_gen)
+        batch = []
         for object_hash, timestamps in hash_gen:
             available_map[object_hash] = timestamps
+            if self.protocol_version > 1:
+                batch.append(encode_missing(object_hash, **timestamps))
+                if len(batch) >= MISSING_CHECK_BATCH_SIZE:
+                    self._send_missing_check_batch(connection, batch)
+                    batch = []
+                continue
             with exceptions.MessageTimeout(
                     self.daemon.node_timeout,
                     'missing_check send line'):
                 msg = b'%s\r\n' % encode_missing(object_hash, **timestamps)
                 connection.send(b'%x\r\n%s\r\n' % (len(msg), msg))
+        if batch:
+            self._send_missing_check_batch(connection, batch)
         with exceptions.MessageTimeout(
                 self.daemon.node_timeout, 'missing_check end'):
             msg = b':MISSING_CHECK: END\r\n'
@@ -335,11 +394,27 @@ class Sender(object):
             line = line.strip()
             if line == b':MISSING_CHECK: END':
                 break
-            parts = line.decode('ascii').split()
-            if parts:
-                send_map[parts[0]] = decode_wanted(parts[1:])
+            length = None
+            if self.protocol_version > 1:
+                length = parse_batch_length(line)
+            if length is None:
+                lines = [line]
+            else:
+                with exceptions.MessageTimeout(
+                        self.daemon.http_timeout, 'missing_check batch wait'):
+                    lines = decode_batch(response.read_exactly(length))
+            for line in lines:
+                parts = line.decode('ascii').split()
+                if parts:
+                    send_map[parts[0]] = decode_wanted(parts[1:])
         return available_map, send_map
 
+    def _send_missing_check_batch(self, connection, lines):
+        with exceptions.MessageTimeout(
+                self.daemon.node_timeout, 'missing_check send batch'):
+            msg = encode_batch(lines)
+            connection.send(b'%x\r\n%s\r\n' % (len(msg), msg))
+
     def updates(self, connection, response, send_map):
         """
         Handles the sender-side of the UPDATES step of an SSYNC
@@ -354,27 +429,12 @@ class Sender(object):
             msg = b':UPDATES: START\r\n'
             connection.send(b'%x\r\n%s\r\n' % (len(msg), msg))
         frag_prefs = [] if self.include_non_durable else None
-        for object_hash, want in send_map.items():
-            object_hash = urllib.parse.unquote(object_hash)
+        for want, url_path, df, open_diskfile in self._iter_diskfiles(
+                send_map, frag_prefs):
             try:
-                df = self.df_mgr.get_diskfile_from_hash(
-                    self.job['device'], self.job['partition'], object_hash,
-                    self.job['policy'], frag_index=self.job.get('frag_index'),
-                    open_expired=True, frag_prefs=frag_prefs)
-            except exceptions.DiskFileNotExist:
-                continue
-            url_path = urllib.parse.quote(
-                '/%s/%s/%s' % (df.account, df.container, df.obj))
-            try:
-                df.open()
+                df_alt = open_diskfile()
                 if want.get('data'):
                     is_durable = (df.durable_timestamp == df.data_timestamp)
-                    # EC reconstructor may have passed a callback to build an
-                    # alternative diskfile - construct it using the metadata
-                    # from the data file only.
-                    df_alt = self.job.get(
-                        'sync_diskfile_builder', lambda *args: df)(
-                            self.job, self.node, df)
                     self.send_put(connection, url_path, df_alt,
                                   durable=is_durable)
                 if want.get('meta') and df.data_timestamp != df.timestamp:
@@ -429,6 +489,81 @@ class Sender(object):
                 raise exceptions.ReplicationException(
                     'Unexpected response: %r' % line[:1024])
 
+    def _open_diskfile(self, df, want):
+        """
+        Opens a diskfile and, if its data is wanted, returns the diskfile to
+        send the data from.
+        """
+        df.open()
+        if not want.get('data'):
+            return None
+        # EC reconstructor may have passed a callback to build an
+        # alternative diskfile - construct it using the metadata
+        # from the data file only.
+        return self.job.get('sync_diskfile_builder', lambda *args: df)(
+            self.job, self.node, df)
+
+    def _iter_diskfiles(self, send_map, frag_prefs):
+        """
+        Yields a tuple of (want, url_path, df, open_diskfile) for each object
+        in the send_map that still exists. Calling open_diskfile returns the
+        result of :meth:`_open_diskfile`, or raises its error.
+
+        Up to ``prefetch`` objects after the one most recently yielded are
+        opened concurrently, so that e.g. the fragments needed to rebuild
+        them are fetched while the current object is sent.
+        """
+        pending = deque()
+
+        def prefetch(df, want):
+            # errors such as DiskFileDeleted are expected; return them to be
+            # raised by the consumer rather than reported by the hub
+            try:
+                return self._open_diskfile(df, want), None
+            except Exception:
+                return None, sys.exc_info()
+
+        def wait(greenthread):
+            result, exc_info = greenthread.wait()
+            if exc_info:
+                six.reraise(*exc_info)
+            return result
+
+        def next_pending():
+            want, url_path, df, greenthread = pending.popleft()
+            if greenthread is not None:
+                return want, url_path, df, functools.partial(
+                    wait, greenthread)
+            return want, url_path, df, functools.partial(
+                self._open_diskfile, df, want)
+
+        try:
+            for object_hash, want in send_map.items():
+                object_hash = urllib.parse.unquote(object_hash)
+                try:
+                    df = self.df_mgr.get_diskfile_from_hash(
+                        self.job['device'], self.job['partition'],
+                        object_hash, self.job['policy'],
+                        frag_index=self.job.get('frag_index'),
+                        open_expired=True, frag_prefs=frag_prefs)
+                except exceptions.DiskFileNotExist:
+                    continue
+                url_path = urllib.parse.quote(
+                    '/%s/%s/%s' % (df.account, df.container, df.obj))
+                greenthread = None
+                if self.prefetch:
+                    greenthread = eventlet.spawn(prefetch, df, want)
+                pending.append((want, url_path, df, greenthread))
+                if len(pending) > self.prefetch:
+                    yield next_pending()
+            while pending:
+                yield next_pending()
+        finally:
+            # don't leave prefetched diskfiles open if the updates failed
+            for _want, _url_path, _df, greenthread in pending:
+                if greenthread is not None:
+                    greenthread.kill()
+
     def send_subrequest(self, connection, method, url_path, headers, df):
         msg = [b'%s %s' % (method.encode('ascii'), url_path.encode('utf8'))]
         for key, value in sorted(headers.items()):
@@ -447,6 +582,8 @@ class Sender(object):
             bytes_read = 0
             for chunk in df.reader():
                 bytes_read += len(chunk)
+                if self.ratelimit:
+                    self.ratelimit(len(chunk))
                 with exceptions.MessageTimeout(self.daemon.node_timeout,
                                                'send_%s chunk' %
                                                method.lower()):
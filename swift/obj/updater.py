@@ -15,6 +15,7 @@
 
 import six.moves.cPickle as pickle
 import errno
+import json
 import os
 import signal
 import sys
@@ -30,13 +31,20 @@ from swift.common.exceptions import ConnectionTimeout
 from swift.common.ring import Ring
 from swift.common.utils import get_logger, renamer, write_pickle, \
     dump_recon_cache, config_true_value, RateLimitedIterator, split_path, \
-    eventlet_monkey_patch, get_redirect_data, ContextPool
+    eventlet_monkey_patch, get_redirect_data, ContextPool, Timestamp, \
+    config_positive_int_value, lock_file
 from swift.common.daemon import Daemon
 from swift.common.header_key_dict import HeaderKeyDict
 from swift.common.storage_policy import split_policy_string, PolicyError
-from swift.obj.diskfile import get_tmp_dir, ASYNCDIR_BASE
+from swift.obj.diskfile import get_tmp_dir, ASYNCDIR_BASE, \
+    ASYNC_JOURNAL_FILE, append_async_journal
 from swift.common.http import is_success, HTTP_INTERNAL_SERVER_ERROR, \
-    HTTP_MOVED_PERMANENTLY
+    HTTP_MOVED_PERMANENTLY, HTTP_CONFLICT
+from swift.common.swob import wsgi_to_str
+
+# The most async pendings that are held in partial batches before they are
+# all sent.
+MAX_BATCHED_UPDATES = 10000
 
 
 class SweepStats(object):
@@ -116,6 +124,17 @@ class ObjectUpdater(Daemon):
         self.recon_cache_path = conf.get('recon_cache_path',
                                          '/var/cache/swift')
         self.rcache = os.path.join(self.recon_cache_path, 'object.recon')
+        # With more than 1, the async pendings for the same container are
+        # sent to each container server with a single UPDATE request.
+        self.batch_size = config_positive_int_value(
+            conf.get('batch_size', 1))
+        # With the async_pending journal, sweeps only visit the async_pending
+        # dirs that the object server has journaled, with a full scan of
+        # every async_pending dir at least once every full_scan_interval.
+        self.async_pending_journal = config_true_value(
+            conf.get('async_pending_journal', False))
+        self.full_scan_interval = float(conf.get('full_scan_interval', 86400))
+        self.last_full_scan = 0
         self.stats = SweepStats()
 
     def _listdir(self, path):
@@ -142,6 +161,7 @@ class ObjectUpdater(Daemon):
             self.logger.info(_('Begin object update sweep'))
             begin = time.time()
             pids = []
+            full_scan = self._is_full_scan_due(begin)
             # read from container ring to ensure it's fresh
             self.get_container_ring().get_nodes('')
             for device in self._listdir(self.devices):
@@ -164,7 +184,7 @@ class ObjectUpdater(Daemon):
                     eventlet_monkey_patch()
                     self.stats.reset()
                     forkbegin = time.time()
-                    self.object_sweep(dev_path)
+                    self.object_sweep(dev_path, full_scan=full_scan)
                     elapsed = time.time() - forkbegin
                     self.logger.info(
                         ('Object update sweep of %(device)s '
@@ -174,6 +194,8 @@ class ObjectUpdater(Daemon):
                     sys.exit()
             while pids:
                 pids.remove(os.wait()[0])
+            if full_scan:
+                self.last_full_scan = begin
             elapsed = time.time() - begin
             self.logger.info(_('Object update sweep completed: %.02fs'),
                              elapsed)
@@ -187,6 +209,7 @@ class ObjectUpdater(Daemon):
         self.logger.info(_('Begin object update single threaded sweep'))
         begin = time.time()
         self.stats.reset()
+        full_scan = self._is_full_scan_due(begin)
         for device in self._listdir(self.devices):
             try:
                 dev_path = check_drive(self.devices, device, self.mount_check)
@@ -196,7 +219,9 @@ class ObjectUpdater(Daemon):
                 # warning is sufficient.
                 self.logger.warning('Skipping: %s', err)
                 continue
-            self.object_sweep(dev_path)
+            self.object_sweep(dev_path, full_scan=full_scan)
+        if full_scan:
+            self.last_full_scan = begin
         elapsed = time.time() - begin
         self.logger.info(
             ('Object update single-threaded sweep completed: '
@@ -222,14 +247,8 @@ class ObjectUpdater(Daemon):
                 continue
             if not os.path.isdir(async_pending):
                 continue
-            try:
-                base, policy = split_policy_string(asyncdir)
-            except PolicyError as e:
-                # This isn't an error, but a misconfiguration. Logging a
-                # warning should be sufficient.
-                self.logger.warning(_('Directory %(directory)r does not map '
-                                      'to a valid policy (%(error)s)') % {
-                                    'directory': asyncdir, 'error': e})
+            policy = self._get_async_dir_policy(asyncdir)
+            if policy is None:
                 continue
             prefix_dirs = self._listdir(async_pending)
             shuffle(prefix_dirs)
@@ -237,59 +256,198 @@ class ObjectUpdater(Daemon):
                 prefix_path = os.path.join(async_pending, prefix)
                 if not os.path.isdir(prefix_path):
                     continue
-                last_obj_hash = None
-                for update in sorted(self._listdir(prefix_path), reverse=True):
-                    update_path = os.path.join(prefix_path, update)
-                    if not os.path.isfile(update_path):
-                        continue
-                    try:
-                        obj_hash, timestamp = update.split('-')
-                    except ValueError:
-                        self.stats.errors += 1
-                        self.logger.increment('errors')
-                        self.logger.error(
-                            _('ERROR async pending file with unexpected '
-                              'name %s')
-                            % (update_path))
-                        continue
-                    # Async pendings are stored on disk like this:
-                    #
-                    # <device>/async_pending/<suffix>/<obj_hash>-<timestamp>
-                    #
-                    # If there are multiple updates for a given object,
-                    # they'll look like this:
-                    #
-                    # <device>/async_pending/<obj_suffix>/<obj_hash>-<timestamp1>
-                    # <device>/async_pending/<obj_suffix>/<obj_hash>-<timestamp2>
-                    # <device>/async_pending/<obj_suffix>/<obj_hash>-<timestamp3>
-                    #
-                    # Async updates also have the property that newer
-                    # updates contain all the information in older updates.
-                    # Since we sorted the directory listing in reverse
-                    # order, we'll see timestamp3 first, yield it, and then
-                    # unlink timestamp2 and timestamp1 since we know they
-                    # are obsolete.
-                    #
-                    # This way, our caller only gets useful async_pendings.
-                    if obj_hash == last_obj_hash:
-                        self.stats.unlinks += 1
-                        self.logger.increment('unlinks')
-                        try:
-                            os.unlink(update_path)
-                        except OSError as e:
-                            if e.errno != errno.ENOENT:
-                                raise
-                    else:
-                        last_obj_hash = obj_hash
-                        yield {'device': device, 'policy': policy,
-                               'path': update_path,
-                               'obj_hash': obj_hash, 'timestamp': timestamp}
-
-    def object_sweep(self, device):
+                for update in self._iter_prefix_async_pendings(
+                        device, policy, prefix_path):
+                    yield update
+
+    def _get_async_dir_policy(self, asyncdir):
+        try:
+            return split_policy_string(asyncdir)[1]
+        except PolicyError as e:
+            # This isn't an error, but a misconfiguration. Logging a
+            # warning should be sufficient.
+            self.logger.warning(_('Directory %(directory)r does not map '
+                                  'to a valid policy (%(error)s)') % {
+                                'directory': asyncdir, 'error': e})
+            return None
+
+    def _iter_prefix_async_pendings(self, device, policy, prefix_path):
+        """
+        Yield the async pendings in an async_pending suffix dir; see
+        :meth:`_iter_async_pendings`.
+        """
+        last_obj_hash = None
+        for update in sorted(self._listdir(prefix_path), reverse=True):
+            update_path = os.path.join(prefix_path, update)
+            if not os.path.isfile(update_path):
+                continue
+            try:
+                obj_hash, timestamp = update.split('-')
+            except ValueError:
+                self.stats.errors += 1
+                self.logger.increment('errors')
+                self.logger.error(
+                    _('ERROR async pending file with unexpected '
+                      'name %s')
+                    % (update_path))
+                continue
+            # Async pendings are stored on disk like this:
+            #
+            # <device>/async_pending/<suffix>/<obj_hash>-<timestamp>
+            #
+            # If there are multiple updates for a given object,
+            # they'll look like this:
+            #
+            # <device>/async_pending/<obj_suffix>/<obj_hash>-<timestamp1>
+            # <device>/async_pending/<obj_suffix>/<obj_hash>-<timestamp2>
+            # <device>/async_pending/<obj_suffix>/<obj_hash>-<timestamp3>
+            #
+            # Async updates also have the property that newer
+            # updates contain all the information in older updates.
+            # Since we sorted the directory listing in reverse
+            # order, we'll see timestamp3 first, yield it, and then
+            # unlink timestamp2 and timestamp1 since we know they
+            # are obsolete.
+            #
+            # This way, our caller only gets useful async_pendings.
+            if obj_hash == last_obj_hash:
+                self.stats.unlinks += 1
+                self.logger.increment('unlinks')
+                try:
+                    os.unlink(update_path)
+                except OSError as e:
+                    if e.errno != errno.ENOENT:
+                        raise
+            else:
+                last_obj_hash = obj_hash
+                yield {'device': device, 'policy': policy,
+                       'path': update_path,
+                       'obj_hash': obj_hash, 'timestamp': timestamp}
+
+    def _iter_journaled_async_pendings(self, device, entries):
+        """
+        Yield the async pendings in the async_pending suffix dirs named by
+        async_pending journal entries; see :meth:`_iter_async_pendings`.
+        """
+        for entry in entries:
+            asyncdir, _junk, prefix = entry.partition('/')
+            if not asyncdir.startswith(ASYNCDIR_BASE) or not prefix:
+                self.stats.errors += 1
+                self.logger.increment('errors')
+                self.logger.error('ERROR unexpected async_pending journal '
+                                  'entry %r on %s', entry, device)
+                continue
+            prefix_path = os.path.join(device, entry)
+            if not os.path.isdir(prefix_path):
+                # the async pendings have already been processed
+                continue
+            policy = self._get_async_dir_policy(asyncdir)
+            if policy is None:
+                continue
+            for update in self._iter_prefix_async_pendings(
+                    device, policy, prefix_path):
+                yield update
+
+    def _is_full_scan_due(self, now):
+        """
+        Returns True if the next sweep should scan every async_pending dir
+        rather than only the journaled ones.
+        """
+        return not self.async_pending_journal or \
+            now - self.last_full_scan >= self.full_scan_interval
+
+    def _take_async_journal(self, device):
+        """
+        Move the async_pending journal of a device aside so that it can be
+        consumed while the object server appends to a new journal, and
+        return the unique entries in it.
+
+        If a journal that was moved aside was not consumed, e.g. because
+        the updater was killed, its entries are returned instead and the
+        current journal is left to be consumed by the next sweep.
+
+        :returns: a list of entries, or None if the journal could not be
+            read
+        """
+        journal_path = os.path.join(device, ASYNC_JOURNAL_FILE)
+        consuming_path = journal_path + '.consuming'
+        try:
+            if not os.path.exists(consuming_path):
+                try:
+                    if not os.path.getsize(journal_path):
+                        return []
+                except OSError as err:
+                    if err.errno != errno.ENOENT:
+                        raise
+                    return []
+                with lock_file(journal_path, append=True, unlink=False):
+                    os.rename(journal_path, consuming_path)
+            with open(consuming_path, 'rb') as fp:
+                entries = fp.read().decode('ascii').splitlines()
+        except (Exception, Timeout) as err:
+            self.stats.errors += 1
+            self.logger.increment('errors')
+            self.logger.error('ERROR Unable to read async_pending journal '
+                              'on %s: %s', device, err)
+            return None
+        unique_entries = []
+        seen = set()
+        for entry in entries:
+            if entry and entry not in seen:
+                seen.add(entry)
+                unique_entries.append(entry)
+        return unique_entries
+
+    def _finish_async_journal(self, device, entries):
+        """
+        Re-journal the entries whose async_pending dirs still hold async
+        pendings, e.g. because their updates failed, and remove the
+        journal that was moved aside by :meth:`_take_async_journal`.
+        """
+        retry_entries = []
+        for entry in entries:
+            try:
+                if os.listdir(os.path.join(device, entry)):
+                    retry_entries.append(entry)
+            except OSError:
+                pass
+        try:
+            if retry_entries:
+                append_async_journal(device, retry_entries)
+            os.unlink(os.path.join(device, ASYNC_JOURNAL_FILE + '.consuming'))
+        except OSError as err:
+            if err.errno != errno.ENOENT:
+                self.stats.errors += 1
+                self.logger.increment('errors')
+                self.logger.error('ERROR Unable to update async_pending '
+                                  'journal on %s: %s', device, err)
+        except (Exception, Timeout) as err:
+            self.stats.errors += 1
+            self.logger.increment('errors')
+            self.logger.error('ERROR Unable to update async_pending journal '
+                              'on %s: %s', device, err)
+
+    def _get_async_journal_lag(self, device):
+        """
+        Returns the number of entries in the async_pending journal of a
+        device that have not been consumed.
+        """
+        lag = 0
+        for name in (ASYNC_JOURNAL_FILE, ASYNC_JOURNAL_FILE + '.consuming'):
+            try:
+                with open(os.path.join(device, name), 'rb') as fp:
+                    lag += sum(1 for line in fp if line.strip())
+            except (IOError, OSError):
+                pass
+        return lag
+
+    def object_sweep(self, device, full_scan=True):
         """
         If there are async pendings on the device, walk each one and update.
 
         :param device: path to device
+        :param full_scan: if False, and the async_pending journal is enabled,
+            only walk the async pendings in the journaled async_pending dirs
         """
         start_time = time.time()
         last_status_update = start_time
@@ -298,13 +456,31 @@ class ObjectUpdater(Daemon):
         self.logger.info("Object update sweep starting on %s (pid: %d)",
                          device, my_pid)
 
+        journal_entries = None
+        if self.async_pending_journal:
+            # the journal is consumed either way; a full scan finds
+            # everything journaled before it starts
+            journal_entries = self._take_async_journal(device)
+            if journal_entries is None:
+                full_scan = True
+        if full_scan:
+            ap_iter = self._iter_async_pendings(device)
+        else:
+            ap_iter = self._iter_journaled_async_pendings(
+                device, journal_entries)
+        # async pendings are rate limited before they are batched, so that
+        # objects_per_second limits updates whatever the batch size
         ap_iter = RateLimitedIterator(
-            self._iter_async_pendings(device),
-            elements_per_second=self.max_objects_per_second)
+            ap_iter, elements_per_second=self.max_objects_per_second)
+        if self.batch_size > 1:
+            ap_iter = self._iter_update_batches(ap_iter)
         with ContextPool(self.concurrency) as pool:
             for update in ap_iter:
-                pool.spawn(self.process_object_update,
-                           update['path'], update['device'], update['policy'])
+                if self.batch_size > 1:
+                    pool.spawn(self.process_object_update_batch, update)
+                else:
+                    pool.spawn(self.process_object_update, update['path'],
+                               update['device'], update['policy'])
                 now = time.time()
                 if now - last_status_update >= self.report_interval:
                     this_sweep = self.stats.since(start_stats)
@@ -318,6 +494,17 @@ class ObjectUpdater(Daemon):
                     last_status_update = now
             pool.waitall()
 
+        if journal_entries is not None:
+            if full_scan:
+                journal_entries = []
+            self._finish_async_journal(device, journal_entries)
+        if self.async_pending_journal:
+            dump_recon_cache(
+                {'object_updater_journal_lag': {
+                    os.path.basename(device):
+                        self._get_async_journal_lag(device)}},
+                self.rcache, self.logger)
+
         self.logger.timing_since('timing', start_time)
         sweep_totals = self.stats.since(start_stats)
         self.logger.info(
@@ -338,16 +525,13 @@ class ObjectUpdater(Daemon):
              'errors': sweep_totals.errors,
              'redirects': sweep_totals.redirects})
 
-    def process_object_update(self, update_path, device, policy):
+    def _load_update(self, update_path, device):
         """
-        Process the object information to be updated and update.
-
-        :param update_path: path to pickled object update file
-        :param device: path to device
-        :param policy: storage policy of object update
+        Returns the object update pickled in an async pending file, or None
+        if the file could not be loaded and has been quarantined.
         """
         try:
-            update = pickle.load(open(update_path, 'rb'))
+            return pickle.load(open(update_path, 'rb'))
         except Exception:
             self.logger.exception(
                 _('ERROR Pickle problem, quarantining %s'), update_path)
@@ -356,6 +540,192 @@ class ObjectUpdater(Daemon):
             target_path = os.path.join(device, 'quarantined', 'objects',
                                        os.path.basename(update_path))
             renamer(update_path, target_path, fsync=False)
+            return None
+
+    def _get_update_container(self, update):
+        """
+        Returns the (account, container) that an object update is sent to.
+        """
+        container_path = update.get('container_path')
+        if container_path:
+            return split_path('/' + container_path, minsegs=2)
+        return update['account'], update['container']
+
+    def _unlink_update(self, update_path):
+        self.stats.unlinks += 1
+        self.logger.increment('unlinks')
+        os.unlink(update_path)
+        try:
+            # If this was the last async_pending in the directory,
+            # then this will succeed. Otherwise, it'll fail, and
+            # that's okay.
+            os.rmdir(os.path.dirname(update_path))
+        except OSError:
+            pass
+
+    def _iter_update_batches(self, ap_iter):
+        """
+        Loads the async pendings yielded by ``ap_iter`` and groups them into
+        batches of up to batch_size async pendings for the same container
+        and policy.
+
+        Each item of a batch is an async pending dict, as yielded by
+        :meth:`_iter_async_pendings`, with the loaded object update added
+        under the ``update`` key.
+        """
+        batches = {}
+        batched = 0
+        for item in ap_iter:
+            update = self._load_update(item['path'], item['device'])
+            if update is None:
+                continue
+            item['update'] = update
+            key = (self._get_update_container(update), int(item['policy']))
+            batch = batches.setdefault(key, [])
+            batch.append(item)
+            batched += 1
+            if len(batch) >= self.batch_size:
+                batched -= len(batch)
+                yield batches.pop(key)
+            elif batched > MAX_BATCHED_UPDATES:
+                for batch in batches.values():
+                    yield batch
+                batches = {}
+                batched = 0
+        for batch in batches.values():
+            yield batch
+
+    def _make_update_record(self, update, policy):
+        """
+        Returns the container object record for an object update, as the
+        container server would make it from the update's request.
+        """
+        headers = HeaderKeyDict(update['headers'])
+        record = {
+            'name': update['obj'],
+            'created_at': Timestamp(headers['x-timestamp']).internal,
+            'storage_policy_index': int(headers.get(
+                'X-Backend-Storage-Policy-Index', int(policy))),
+        }
+        if update['op'] == 'DELETE':
+            record.update({
+                'size': 0, 'content_type': 'application/deleted',
+                'etag': 'noetag', 'deleted': 1,
+                'ctype_timestamp': None, 'meta_timestamp': None})
+        else:
+            record.update({
+                'size': int(headers['x-size']),
+                'content_type': wsgi_to_str(headers['x-content-type']),
+                'etag': wsgi_to_str(headers['x-etag']), 'deleted': 0,
+                'ctype_timestamp': wsgi_to_str(
+                    headers.get('x-content-type-timestamp')),
+                'meta_timestamp': wsgi_to_str(
+                    headers.get('x-meta-timestamp'))})
+        return record
+
+    def process_object_update_batch(self, batch):
+        """
+        Sends a batch of object updates for the same container to each of
+        the container's nodes with a single UPDATE request, and unlinks the
+        async pendings of the updates that every node has acknowledged.
+
+        A container that has shard ranges rejects the batch, in which case
+        the updates are sent one by one so that they can be redirected.
+
+        :param batch: a list of async pending dicts, as yielded by
+            :meth:`_iter_update_batches`
+        """
+        device = batch[0]['device']
+        policy = batch[0]['policy']
+        acct, cont = self._get_update_container(batch[0]['update'])
+
+        # only the newest update for each object is sent
+        newest = {}
+        obsolete = []
+        for item in batch:
+            obj = item['update']['obj']
+            if obj in newest and Timestamp(newest[obj]['timestamp']) >= \
+                    Timestamp(item['timestamp']):
+                obsolete.append(item)
+                continue
+            if obj in newest:
+                obsolete.append(newest[obj])
+            newest[obj] = item
+        items = list(newest.values())
+
+        part, nodes = self.get_container_ring().get_nodes(acct, cont)
+        path = '/%s/%s' % (acct, cont)
+        headers_out = HeaderKeyDict({
+            'X-Timestamp': Timestamp.now().internal,
+            'X-Backend-Storage-Policy-Index': str(int(policy)),
+            'X-Backend-Accept-Redirect': 'true',
+            'Content-Type': 'application/json',
+            'User-Agent': 'object-updater %s' % os.getpid()})
+        events = []
+        for node in nodes:
+            node_items = [item for item in items if node['id'] not in
+                          item['update'].get('successes', [])]
+            if not node_items:
+                continue
+            records = [self._make_update_record(item['update'], policy)
+                       for item in node_items]
+            events.append((node_items, spawn(
+                self.object_update_batch, node, part, path, records,
+                headers_out)))
+
+        new_successes = set()
+        sharded = False
+        for node_items, event in events:
+            status, node_id = event.wait()
+            if is_success(status):
+                for item in node_items:
+                    item['update'].setdefault('successes', []).append(node_id)
+                    new_successes.add(item['path'])
+            elif status == HTTP_CONFLICT:
+                sharded = True
+
+        node_ids = set(node['id'] for node in nodes)
+        sent = set()
+        for item in items:
+            update, update_path = item['update'], item['path']
+            if node_ids.issubset(update.get('successes', [])):
+                self.stats.successes += 1
+                self.logger.increment('successes')
+                self.logger.debug('Update sent for %(obj)s %(path)s',
+                                  {'obj': update['obj'], 'path': update_path})
+                self._unlink_update(update_path)
+                sent.add(update['obj'])
+                continue
+            if update_path in new_successes:
+                write_pickle(update, update_path, os.path.join(
+                    device, get_tmp_dir(policy)))
+            if sharded:
+                self.process_object_update(update_path, device, policy)
+            else:
+                self.stats.failures += 1
+                self.logger.increment('failures')
+                self.logger.debug('Update failed for %(obj)s %(path)s',
+                                  {'obj': update['obj'], 'path': update_path})
+
+        for item in obsolete:
+            if item['update']['obj'] in sent:
+                # the newer update for the object has been sent
+                try:
+                    self._unlink_update(item['path'])
+                except OSError as e:
+                    if e.errno != errno.ENOENT:
+                        raise
+
+    def process_object_update(self, update_path, device, policy):
+        """
+        Process the object information to be updated and update.
+
+        :param update_path: path to pickled object update file
+        :param device: path to device
+        :param policy: storage policy of object update
+        """
+        update = self._load_update(update_path, device)
+        if update is None:
             return
 
         def do_update():
@@ -366,11 +736,7 @@ class ObjectUpdater(Daemon):
                                    str(int(policy)))
             headers_out.setdefault('X-Backend-Accept-Redirect', 'true')
             headers_out.setdefault('X-Backend-Accept-Quoted-Location', 'true')
-            container_path = update.get('container_path')
-            if container_path:
-                acct, cont = split_path('/' + container_path, minsegs=2)
-            else:
-                acct, cont = update['account'], update['container']
+            acct, cont = self._get_update_container(update)
             part, nodes = self.get_container_ring().get_nodes(acct, cont)
             obj = '/%s/%s/%s' % (acct, cont, update['obj'])
             events = [spawn(self.object_update,
@@ -395,16 +761,7 @@ class ObjectUpdater(Daemon):
                 self.logger.increment('successes')
                 self.logger.debug('Update sent for %(obj)s %(path)s',
                                   {'obj': obj, 'path': update_path})
-                self.stats.unlinks += 1
-                self.logger.increment('unlinks')
-                os.unlink(update_path)
-                try:
-                    # If this was the last async_pending in the directory,
-                    # then this will succeed. Otherwise, it'll fail, and
-                    # that's okay.
-                    os.rmdir(os.path.dirname(update_path))
-                except OSError:
-                    pass
+                self._unlink_update(update_path)
             elif redirects:
                 # erase any previous successes
                 update.pop('successes', None)
@@ -486,3 +843,39 @@ class ObjectUpdater(Daemon):
             self.logger.exception(_('ERROR with remote server '
                                     '%(ip)s:%(port)s/%(device)s'), node)
         return HTTP_INTERNAL_SERVER_ERROR, node['id'], redirect
+
+    def object_update_batch(self, node, part, path, records, headers_out):
+        """
+        Send a batch of object records to a container with an UPDATE request
+
+        :param node: node dictionary from the container ring
+        :param part: partition that holds the container
+        :param path: path of the container
+        :param records: a list of container object record dicts
+        :param headers_out: headers to send with the update
+        :return: a tuple of (``status``, ``node_id``) where ``status`` is the
+            status of the response, or 500 if there was no response, and
+            ``node_id`` is the id of the node updated
+        """
+        body = json.dumps(records).encode('ascii')
+        headers_out = HeaderKeyDict(headers_out)
+        headers_out['Content-Length'] = str(len(body))
+        try:
+            with ConnectionTimeout(self.conn_timeout):
+                conn = http_connect(node['ip'], node['port'], node['device'],
+                                    part, 'UPDATE', path, headers_out)
+            with Timeout(self.node_timeout):
+                conn.send(body)
+                resp = conn.getresponse()
+                resp.read()
+            if not is_success(resp.status):
+                self.logger.debug(
+                    _('Error code %(status)d is returned from remote '
+                      'server %(ip)s: %(port)s / %(device)s'),
+                    {'status': resp.status, 'ip': node['ip'],
+                     'port': node['port'], 'device': node['device']})
+            return resp.status, node['id']
+        except (Exception, Timeout):
+            self.logger.exception(_('ERROR with remote server '
+                                    '%(ip)s:%(port)s/%(device)s'), node)
+        return HTTP_INTERNAL_SERVER_ERROR, node['id']
@@ -26,6 +26,7 @@
 
 from six.moves.urllib.parse import quote
 
+import errno
 import os
 import time
 import json
@@ -33,11 +34,13 @@ import functools
 import inspect
 import itertools
 import operator
+from collections import OrderedDict
 from copy import deepcopy
 from sys import exc_info
 from swift import gettext_ as _
 
-from eventlet import sleep
+from eventlet import sleep, wsgi as eventlet_wsgi
+from eventlet.hubs import trampoline
 from eventlet.timeout import Timeout
 import six
 
@@ -46,7 +49,7 @@ from swift.common.utils import Timestamp, WatchdogTimeout, config_true_value, \
     public, split_path, list_from_csv, GreenthreadSafeIterator, \
     GreenAsyncPile, quorum_size, parse_content_type, drain_and_close, \
     document_iters_to_http_response_body, ShardRange, find_shard_range, \
-    cache_from_env
+    cache_from_env, ShardRangeList
 from swift.common.bufferedhttp import http_connect
 from swift.common import constraints
 from swift.common.exceptions import ChunkReadTimeout, ChunkWriteTimeout, \
@@ -65,7 +68,8 @@ from swift.common.request_helpers import strip_sys_meta_prefix, \
     http_response_to_document_iters, is_object_transient_sysmeta, \
     strip_object_transient_sysmeta_prefix, get_ip_port, get_user_meta_prefix, \
     get_sys_meta_prefix
-from swift.common.storage_policy import POLICIES
+from swift.common.splice import splice
+from swift.common.storage_policy import POLICIES, REPL_POLICY
 
 
 DEFAULT_RECHECK_ACCOUNT_EXISTENCE = 60  # seconds
@@ -621,6 +625,117 @@ def get_cache_key(account, container=None, obj=None, shard=None):
     return cache_key
 
 
+class InfoCache(object):
+    """
+    A bounded, per-process cache of account and container info that sits in
+    front of memcache.
+
+    Entries expire after ``ttl`` seconds, or after ``negative_ttl`` seconds
+    for accounts and containers that were not found; once there are
+    ``maxsize`` entries the least recently used entry is evicted.
+
+    :param maxsize: the maximum number of entries
+    :param ttl: seconds to cache info for
+    :param negative_ttl: seconds to cache info with a 404 or 410 status for
+    :param logger: a logger, used to emit hit and miss counters
+    """
+    metric_prefix = 'info_cache'
+
+    def __init__(self, maxsize=1000, ttl=1.0, negative_ttl=1.0, logger=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.logger = logger
+        self._entries = OrderedDict()
+
+    def _increment(self, metric):
+        if self.logger:
+            self.logger.increment(metric)
+
+    def get(self, cache_key):
+        """
+        :returns: a copy of the cached info, or None on miss
+        """
+        entry = self._entries.pop(cache_key, None)
+        if entry is None or entry[0] <= time.time():
+            self._increment('%s.miss' % self.metric_prefix)
+            return None
+        # re-insert to make this the most recently used entry
+        self._entries[cache_key] = entry
+        self._increment('%s.hit' % self.metric_prefix)
+        return self._copy(entry[1])
+
+    def _copy(self, info):
+        return deepcopy(info)
+
+    def _get_ttl(self, info):
+        if info.get('status') in (HTTP_NOT_FOUND, HTTP_GONE):
+            return self.negative_ttl
+        return self.ttl
+
+    def set(self, cache_key, info):
+        self._entries.pop(cache_key, None)
+        ttl = self._get_ttl(info)
+        if ttl <= 0 or self.maxsize <= 0:
+            return
+        while len(self._entries) >= self.maxsize:
+            self._entries.popitem(last=False)
+        self._entries[cache_key] = (time.time() + ttl, self._copy(info))
+
+    def pop(self, cache_key):
+        self._entries.pop(cache_key, None)
+
+    def clear(self):
+        self._entries.clear()
+
+
+class ShardRangeCache(InfoCache):
+    """
+    A bounded, per-process cache of the sorted
+    :class:`~swift.common.utils.ShardRangeList` that object updates to a
+    sharded root container are directed with, so that they don't cost a
+    memcache round trip and a parse of every shard range on each request.
+
+    Entries expire after ``ttl`` seconds. Cached lists are not copied, so
+    callers must not modify them.
+
+    :param maxsize: the maximum number of entries
+    :param ttl: seconds to cache shard ranges for
+    :param logger: a logger, used to emit hit and miss counters
+    """
+    metric_prefix = 'shard_range_cache'
+
+    def __init__(self, maxsize=1000, ttl=60.0, logger=None):
+        super(ShardRangeCache, self).__init__(
+            maxsize, ttl=ttl, negative_ttl=ttl, logger=logger)
+
+    def _copy(self, shard_ranges):
+        return shard_ranges
+
+    def _get_ttl(self, shard_ranges):
+        return self.ttl
+
+
+def get_process_info_cache(app):
+    """
+    Get the per-process :class:`InfoCache` of the proxy server app that
+    ``app`` is, or leads to, if it has one enabled.
+
+    get_account_info() and get_container_info() are also called by
+    middlewares, with whatever app is next in the pipeline, so the pipeline
+    is followed through each middleware's ``app`` attribute.
+
+    :param app: the application object
+    :returns: an :class:`InfoCache` instance, or None
+    """
+    while app is not None:
+        info_cache = getattr(app, 'info_cache', None)
+        if isinstance(info_cache, InfoCache):
+            return info_cache
+        app = getattr(app, '__dict__', {}).get('app')
+    return None
+
+
 def set_info_cache(app, env, account, container, resp):
     """
     Cache info in both memcache and env.
@@ -662,6 +777,9 @@ def set_info_cache(app, env, account, container, resp):
         info = headers_to_account_info(resp.headers, resp.status_int)
     if memcache:
         memcache.set(cache_key, info, time=cache_time)
+    process_info_cache = get_process_info_cache(app)
+    if process_info_cache is not None:
+        process_info_cache.set(cache_key, info)
     infocache[cache_key] = info
     return info
 
@@ -710,6 +828,9 @@ def clear_info_cache(app, env, account, container=None, shard=None):
     infocache = env.setdefault('swift.infocache', {})
     memcache = cache_from_env(env, True)
     infocache.pop(cache_key, None)
+    process_info_cache = get_process_info_cache(app)
+    if process_info_cache is not None:
+        process_info_cache.pop(cache_key)
     if memcache:
         memcache.delete(cache_key)
 
@@ -731,10 +852,43 @@ def _get_info_from_infocache(env, account, container=None):
     return None
 
 
+def _native_info(info):
+    """
+    Get back to native strings in info fetched from memcache on py2.
+    """
+    if not info or not six.PY2:
+        return info
+    new_info = {}
+    for key in info:
+        new_key = key.encode("utf-8") if isinstance(
+            key, six.text_type) else key
+        if isinstance(info[key], six.text_type):
+            new_info[new_key] = info[key].encode("utf-8")
+        elif isinstance(info[key], dict):
+            new_info[new_key] = {}
+            for subkey, value in info[key].items():
+                new_subkey = subkey.encode("utf-8") if isinstance(
+                    subkey, six.text_type) else subkey
+                if isinstance(value, six.text_type):
+                    new_info[new_key][new_subkey] = \
+                        value.encode("utf-8")
+                else:
+                    new_info[new_key][new_subkey] = value
+        else:
+            new_info[new_key] = info[key]
+    return new_info
+
+
 def _get_info_from_memcache(app, env, account, container=None):
     """
     Get cached account or container information from memcache
 
+    When getting container information from a memcache client that has a
+    ``get_many`` method, such as
+    :class:`~swift.common.memcached.MemcacheRing`, the account information is
+    fetched in the same round trip if it isn't in the request-environment
+    cache yet, since callers almost always want it next.
+
     :param  app: the application object
     :param  env: the environment used by the current request
     :param  account: the account name
@@ -746,37 +900,30 @@ def _get_info_from_memcache(app, env, account, container=None):
     cache_key = get_cache_key(account, container)
     memcache = cache_from_env(env, True)
     if memcache:
-        info = memcache.get(cache_key)
-        if info and six.PY2:
-            # Get back to native strings
-            new_info = {}
-            for key in info:
-                new_key = key.encode("utf-8") if isinstance(
-                    key, six.text_type) else key
-                if isinstance(info[key], six.text_type):
-                    new_info[new_key] = info[key].encode("utf-8")
-                elif isinstance(info[key], dict):
-                    new_info[new_key] = {}
-                    for subkey, value in info[key].items():
-                        new_subkey = subkey.encode("utf-8") if isinstance(
-                            subkey, six.text_type) else subkey
-                        if isinstance(value, six.text_type):
-                            new_info[new_key][new_subkey] = \
-                                value.encode("utf-8")
-                        else:
-                            new_info[new_key][new_subkey] = value
-                else:
-                    new_info[new_key] = info[key]
-            info = new_info
-        if info:
-            env.setdefault('swift.infocache', {})[cache_key] = info
-        return info
+        cache_keys = [cache_key]
+        if container and callable(getattr(memcache, 'get_many', None)):
+            account_key = get_cache_key(account)
+            if account_key not in env.get('swift.infocache', {}):
+                cache_keys.append(account_key)
+        if len(cache_keys) > 1:
+            infos = memcache.get_many(cache_keys)
+        else:
+            infos = [memcache.get(cache_key)]
+        infos = [_native_info(info) for info in infos]
+        process_info_cache = get_process_info_cache(app)
+        for key, info in zip(cache_keys, infos):
+            if info:
+                env.setdefault('swift.infocache', {})[key] = info
+                if process_info_cache is not None:
+                    process_info_cache.set(key, info)
+        return infos[0]
     return None
 
 
 def _get_info_from_caches(app, env, account, container=None):
     """
-    Get the cached info from env or memcache (if used) in that order.
+    Get the cached info from env, the per-process info cache (if enabled) or
+    memcache (if used) in that order.
     Used for both account and container info.
 
     :param  app: the application object
@@ -785,6 +932,13 @@ def _get_info_from_caches(app, env, account, container=None):
     """
 
     info = _get_info_from_infocache(env, account, container)
+    if info is None:
+        process_info_cache = get_process_info_cache(app)
+        if process_info_cache is not None:
+            cache_key = get_cache_key(account, container)
+            info = process_info_cache.get(cache_key)
+            if info is not None:
+                env.setdefault('swift.infocache', {})[cache_key] = info
     if info is None:
         info = _get_info_from_memcache(app, env, account, container)
     return info
@@ -881,6 +1035,23 @@ def _get_object_info(app, env, account, container, obj, swift_source=None):
     return info
 
 
+class SplicedBytes(bytes):
+    """
+    An empty chunk that stands in for response body bytes that were spliced
+    straight to the client's socket. Its length is the number of bytes that
+    were spliced so that middlewares counting the bytes of a response see
+    the whole body.
+    """
+
+    def __new__(cls, length):
+        chunk = super(SplicedBytes, cls).__new__(cls)
+        chunk.length = length
+        return chunk
+
+    def __len__(self):
+        return self.length
+
+
 def close_swift_conn(src):
     """
     Force close the http connection to the backend.
@@ -976,6 +1147,12 @@ class GetOrHeadHandler(object):
         self.rebalance_missing_suppression_count = min(
             policy_options.rebalance_missing_suppression_count,
             node_iter.num_primary_nodes - 1)
+        # with hedged_gets, a request that hasn't responded within the hedge
+        # delay is raced by a request to the next node
+        self.hedged = policy_options.hedged_gets
+        if self.hedged:
+            self.concurrency = max(self.concurrency, 2)
+        self.hedge_nodes = []
 
         # stuff from request
         self.req_method = req.method
@@ -1359,6 +1536,7 @@ class GetOrHeadHandler(object):
         req_headers = dict(self.backend_headers)
         ip, port = get_ip_port(node, req_headers)
         start_node_timing = time.time()
+        self.app.node_request_started(node)
         try:
             with ConnectionTimeout(self.app.conn_timeout):
                 conn = http_connect(
@@ -1378,6 +1556,11 @@ class GetOrHeadHandler(object):
                 _('Trying to %(method)s %(path)s') %
                 {'method': self.req_method, 'path': self.req_path})
             return False
+        finally:
+            self.app.node_request_finished(
+                node, time.time() - start_node_timing)
+        self.app.record_first_byte_latency(
+            self.server_type, self.policy, time.time() - start_node_timing)
 
         src_headers = dict(
             (k.lower(), v) for k, v in
@@ -1470,15 +1653,29 @@ class GetOrHeadHandler(object):
             node_timeout = self.app.recoverable_node_timeout
 
         pile = GreenAsyncPile(self.concurrency)
+        self.hedge_nodes = []
+        hedge_delay_expired = False
 
         for node in nodes:
+            if hedge_delay_expired:
+                # the requests in flight have outlived the hedge delay
+                self.hedge_nodes.append(node)
             pile.spawn(self._make_node_request, node, node_timeout,
                        self.app.logger.thread_locals)
-            _timeout = self.app.get_policy_options(
-                self.policy).concurrency_timeout \
-                if pile.inflight < self.concurrency else None
-            if pile.waitfirst(_timeout):
+            if pile.inflight >= self.concurrency:
+                _timeout = None
+            elif self.hedged:
+                _timeout = self.app.get_hedge_delay(
+                    self.server_type, self.policy)
+            else:
+                _timeout = self.app.get_policy_options(
+                    self.policy).concurrency_timeout
+            result = pile.waitfirst(_timeout)
+            if result:
                 break
+            # a request that failed is just failed over, not hedged
+            hedge_delay_expired = (self.hedged and result is None and
+                                   pile.inflight > 0)
         else:
             # ran out of nodes, see if any stragglers will finish
             any(pile)
@@ -1506,9 +1703,19 @@ class GetOrHeadHandler(object):
             # between old and new mid-stream and giving garbage to the client.
             self.used_source_etag = normalize_etag(src_headers.get('etag', ''))
             self.node = node
+            self._log_hedge_stats(node)
             return source, node
+        self._log_hedge_stats(None)
         return None, None
 
+    def _log_hedge_stats(self, source_node):
+        for node in self.hedge_nodes:
+            self.app.logger.increment('hedge_sent')
+            if node == source_node:
+                self.app.logger.increment('hedge_won')
+            else:
+                self.app.logger.increment('hedge_wasted')
+
     def _make_app_iter(self, req, node, source):
         """
         Returns an iterator over the contents of the source (via its read
@@ -1545,6 +1752,142 @@ class GetOrHeadHandler(object):
             (add_content_type(pi) for pi in parts_iter),
             boundary, is_multipart, self.app.logger)
 
+    def _can_splice(self, req, source):
+        """
+        Returns True if the body of the given object server response can be
+        spliced straight from the object server's socket to the client's.
+
+        Only whole, unconditional GETs of replicated objects of at least
+        splice_min_object_size bytes that are not large object manifests are
+        spliced; anything else needs the proxy to look at, resume or decode
+        the body.
+        """
+        if not (self.app.splice and self.server_type == 'Object' and
+                req.method == 'GET' and source.status == HTTP_OK):
+            return False
+        if getattr(self.policy, 'policy_type', None) != REPL_POLICY:
+            return False
+        if any(header in req.headers for header in (
+                'Range', 'If-Match', 'If-None-Match', 'If-Modified-Since',
+                'If-Unmodified-Since')):
+            return False
+        try:
+            content_length = int(source.getheader('Content-Length'))
+        except (TypeError, ValueError):
+            return False
+        if content_length < max(self.app.splice_min_object_size,
+                                eventlet_wsgi.MINIMUM_CHUNK_SIZE + 1):
+            return False
+        if getattr(source, 'chunked', True):
+            return False
+        # large object middlewares read manifest bodies in the proxy, using
+        # the client's environ
+        if config_true_value(source.getheader('X-Static-Large-Object')) or \
+                source.getheader('X-Object-Manifest'):
+            return False
+        # splicing needs the client's socket and a buffered file for the
+        # object server's socket that can be drained before splicing from it
+        return isinstance(req.environ.get('wsgi.input'),
+                          eventlet_wsgi.Input) and \
+            hasattr(source.fp, 'peek') and hasattr(source.fp, 'read1')
+
+    def _make_splice_app_iter(self, req, node, source):
+        """
+        Returns an iterator over the body of the given object server
+        response that splices most of it straight from the object server's
+        socket to the client's socket, through a pipe, without copying it
+        through the proxy.
+
+        The first chunk of the body is read and yielded as normal, so that
+        eventlet sends the response headers before any bytes are spliced.
+        The iterator then yields a :class:`SplicedBytes` for the rest of the
+        body.
+        """
+        node_timeout = self.app.recoverable_node_timeout
+        content_length = int(source.getheader('Content-Length'))
+        client_sock = req.environ['wsgi.input'].get_socket()
+        rpipe = wpipe = None
+        try:
+            with WatchdogTimeout(self.app.watchdog, node_timeout,
+                                 ChunkReadTimeout):
+                chunk = source.fp.read(eventlet_wsgi.MINIMUM_CHUNK_SIZE + 1)
+                if len(chunk) < content_length:
+                    # read1() returns whatever is left in the file's buffer
+                    # so that nothing is skipped by splicing from the socket
+                    chunk += source.fp.read1(content_length - len(chunk))
+            if not chunk:
+                raise ShortReadError('Too few bytes; read 0, expecting %d' %
+                                     content_length)
+            with WatchdogTimeout(self.app.watchdog, self.app.client_timeout,
+                                 ChunkWriteTimeout):
+                yield chunk
+
+            backend_fd = source.fp.fileno()
+            client_fd = client_sock.fileno()
+            rpipe, wpipe = os.pipe()
+            to_splice = content_length - len(chunk)
+            spliced = 0
+            nchunks = 0
+            while spliced < to_splice:
+                try:
+                    nread = splice(
+                        backend_fd, None, wpipe, None,
+                        min(to_splice - spliced, self.app.object_chunk_size),
+                        splice.SPLICE_F_MOVE | splice.SPLICE_F_NONBLOCK)[0]
+                except IOError as err:
+                    if err.errno != errno.EAGAIN:
+                        raise
+                    trampoline(backend_fd, read=True, timeout=node_timeout,
+                               timeout_exc=ChunkReadTimeout)
+                    continue
+                if not nread:
+                    raise ShortReadError(
+                        'Too few bytes; read %d, expecting %d' % (
+                            content_length - to_splice + spliced,
+                            content_length))
+                while nread:
+                    try:
+                        nwritten = splice(
+                            rpipe, None, client_fd, None, nread,
+                            splice.SPLICE_F_MOVE | splice.SPLICE_F_NONBLOCK |
+                            splice.SPLICE_F_MORE)[0]
+                    except IOError as err:
+                        if err.errno != errno.EAGAIN:
+                            raise
+                        trampoline(client_fd, write=True,
+                                   timeout=self.app.client_timeout,
+                                   timeout_exc=ChunkWriteTimeout)
+                        continue
+                    nread -= nwritten
+                    spliced += nwritten
+                nchunks += 1
+                # See the fairness note in _get_response_parts_iter
+                if nchunks % 5 == 0:
+                    sleep()
+            self.app.logger.update_stats('splice.bytes', spliced)
+            yield SplicedBytes(spliced)
+        except ChunkReadTimeout:
+            self.app.exception_occurred(node, _('Object'),
+                                        _('Trying to read during GET'))
+            raise
+        except ChunkWriteTimeout:
+            self.app.logger.warning(
+                _('Client did not read from proxy within %ss') %
+                self.app.client_timeout)
+            self.app.logger.increment('client_timeouts')
+        except GeneratorExit:
+            self.app.logger.warning('Client disconnected on read of %r',
+                                    self.path)
+            raise
+        except Exception:
+            self.app.logger.exception(_('Trying to send to client'))
+            raise
+        finally:
+            for fd in (rpipe, wpipe):
+                if fd is not None:
+                    os.close(fd)
+            close_swift_conn(source)
+
     def get_working_response(self, req):
         source, node = self._get_source_and_node()
         res = None
@@ -1552,7 +1895,11 @@ class GetOrHeadHandler(object):
             res = Response(request=req)
             res.status = source.status
             update_headers(res, source.getheaders())
-            if req.method == 'GET' and \
+            if self._can_splice(req, source):
+                res.app_iter = self._make_splice_app_iter(req, node, source)
+                # See NOTE: swift_conn at top of file about this.
+                res.swift_conn = source.swift_conn
+            elif req.method == 'GET' and \
                     source.status in (HTTP_OK, HTTP_PARTIAL_CONTENT):
                 res.app_iter = self._make_app_iter(req, node, source)
                 # See NOTE: swift_conn at top of file about this.
@@ -2357,9 +2704,10 @@ class Controller(object):
         """
         Find the appropriate shard range for an object update.
 
-        Note that this fetches and caches (in both the per-request infocache
-        and memcache, if available) all shard ranges for the given root
-        container so we won't have to contact the container DB for every write.
+        Note that this fetches and caches (in the per-request infocache, the
+        per-process shard range cache and memcache, if available) all shard
+        ranges for the given root container so we won't have to contact the
+        container DB for every write.
 
         :param req: original Request instance.
         :param account: account from which shard ranges should be fetched.
@@ -2377,6 +2725,12 @@ class Controller(object):
             return shard_ranges[0]
 
         cache_key = get_cache_key(account, container, shard='updating')
+        shard_range_cache = self.app.shard_range_cache
+        if shard_range_cache is not None:
+            shard_ranges = shard_range_cache.get(cache_key)
+            if shard_ranges:
+                return find_shard_range(obj, shard_ranges)
+
         infocache = req.environ.setdefault('swift.infocache', {})
         memcache = cache_from_env(req.environ, True)
 
@@ -2385,13 +2739,14 @@ class Controller(object):
             cached_ranges = memcache.get(cache_key)
 
         if cached_ranges:
-            shard_ranges = [
+            shard_ranges = ShardRangeList(
                 ShardRange.from_dict(shard_range)
-                for shard_range in cached_ranges]
+                for shard_range in cached_ranges)
         else:
             shard_ranges = self._get_shard_ranges(
                 req, account, container, states='updating')
             if shard_ranges:
+                shard_ranges = ShardRangeList(shard_ranges)
                 cached_ranges = [dict(sr) for sr in shard_ranges]
                 # went to disk; cache it
                 if memcache:
@@ -2402,4 +2757,25 @@ class Controller(object):
             return None
 
         infocache[cache_key] = tuple(cached_ranges)
+        if shard_range_cache is not None:
+            shard_range_cache.set(cache_key, shard_ranges)
         return find_shard_range(obj, shard_ranges)
+
+    def _clear_update_shard_cache(self, req, account, container):
+        """
+        Forget the cached shard ranges used to direct object updates for the
+        given root container, e.g. because an update was redirected by a
+        container server and so the cached shard ranges are stale.
+
+        :param req: original Request instance.
+        :param account: account of the root container.
+        :param container: root container.
+        """
+        cache_key = get_cache_key(account, container, shard='updating')
+        req.environ.setdefault('swift.infocache', {}).pop(cache_key, None)
+        if self.app.shard_range_cache is not None:
+            self.app.shard_range_cache.pop(cache_key)
+        memcache = cache_from_env(req.environ, True)
+        if memcache:
+            memcache.delete(cache_key)
+        self.app.logger.increment('shard_updating.cache.invalidated')
@@ -14,6 +14,7 @@
 # limitations under the License.
 
 from swift import gettext_ as _
+import collections
 import json
 import math
 
@@ -21,7 +22,8 @@ import six
 from six.moves.urllib.parse import unquote
 
 from swift.common.utils import public, private, csv_append, Timestamp, \
-    config_true_value, ShardRange, cache_from_env, filter_shard_ranges
+    config_true_value, ShardRange, cache_from_env, filter_shard_ranges, \
+    ContextPool
 from swift.common.constraints import check_metadata, CONTAINER_LISTING_LIMIT
 from swift.common.http import HTTP_ACCEPTED, is_success
 from swift.common.request_helpers import get_sys_meta_prefix, get_param, \
@@ -338,33 +340,37 @@ class ContainerController(Controller):
         end_marker = wsgi_to_str(params.get('end_marker'))
         prefix = wsgi_to_str(params.get('prefix'))
 
-        limit = req_limit
-        for i, shard_range in enumerate(shard_ranges):
-            params['limit'] = limit
+        def listed_name(obj):
+            return obj.get('name', obj.get('subdir', u''))
+
+        def make_params(shard_range):
+            shard_params = dict(params, limit=limit)
             # Always set marker to ensure that object names less than or equal
             # to those already in the listing are not fetched; if the listing
             # is empty then the original request marker, if any, is used. This
             # allows misplaced objects below the expected shard range to be
             # included in the listing.
             if objects:
-                last_name = objects[-1].get('name',
-                                            objects[-1].get('subdir', u''))
-                params['marker'] = bytes_to_wsgi(last_name.encode('utf-8'))
+                shard_params['marker'] = bytes_to_wsgi(
+                    listed_name(objects[-1]).encode('utf-8'))
             elif marker:
-                params['marker'] = str_to_wsgi(marker)
+                shard_params['marker'] = str_to_wsgi(marker)
             else:
-                params['marker'] = ''
+                shard_params['marker'] = ''
             # Always set end_marker to ensure that misplaced objects beyond the
             # expected shard range are not fetched. This prevents a misplaced
             # object obscuring correctly placed objects in the next shard
             # range.
             if end_marker and end_marker in shard_range:
-                params['end_marker'] = str_to_wsgi(end_marker)
+                shard_params['end_marker'] = str_to_wsgi(end_marker)
             elif reverse:
-                params['end_marker'] = str_to_wsgi(shard_range.lower_str)
+                shard_params['end_marker'] = str_to_wsgi(shard_range.lower_str)
             else:
-                params['end_marker'] = str_to_wsgi(shard_range.end_marker)
+                shard_params['end_marker'] = str_to_wsgi(
+                    shard_range.end_marker)
+            return shard_params
 
+        def make_headers(shard_range):
             headers = {}
             if ((shard_range.account, shard_range.container) in
                     shard_listing_history):
@@ -372,56 +378,126 @@ class ContainerController(Controller):
                 headers['X-Backend-Record-Type'] = 'object'
             if config_true_value(req.headers.get('x-newest', False)):
                 headers['X-Newest'] = 'true'
+            return headers
 
+        def skip_for_prefix(shard_range):
             if prefix:
                 if prefix > shard_range:
-                    continue
+                    return True
                 try:
                     just_past = prefix[:-1] + chr(ord(prefix[-1]) + 1)
                 except ValueError:
                     pass
                 else:
                     if just_past < shard_range:
-                        continue
-
-            self.app.logger.debug(
-                'Getting listing part %d from shard %s %s with %s',
-                i, shard_range, shard_range.name, headers)
-            objs, shard_resp = self._get_container_listing(
+                        return True
+            return False
+
+        def get_listing(shard_range, headers, shard_params,
+                        logger_thread_locals=None):
+            if logger_thread_locals:
+                self.app.logger.thread_locals = logger_thread_locals
+            return self._get_container_listing(
                 req, shard_range.account, shard_range.container,
-                headers=headers, params=params)
+                headers=headers, params=shard_params)
+
+        # Listings are fetched from up to shard_listing_concurrency shards at
+        # once. A listing that is prefetched before the listings of the
+        # preceding shards have been received is requested with an older
+        # marker, so any names it has that are already in the listing are
+        # dropped.
+        concurrency = max(1, self.app.shard_listing_concurrency)
+        shard_iter = (
+            (i, shard_range) for i, shard_range in enumerate(shard_ranges)
+            if not skip_for_prefix(shard_range))
+        fetches = collections.deque()
+        limit = req_limit
+        with ContextPool(concurrency) as pool:
 
-            sharding_state = shard_resp.headers.get('x-backend-sharding-state',
-                                                    'unknown')
+            def dispatch():
+                while len(fetches) < concurrency:
+                    try:
+                        i, shard_range = next(shard_iter)
+                    except StopIteration:
+                        return
+                    headers = make_headers(shard_range)
+                    shard_params = make_params(shard_range)
+                    self.app.logger.debug(
+                        'Getting listing part %d from shard %s %s with %s',
+                        i, shard_range, shard_range.name, headers)
+                    if concurrency > 1:
+                        gt = pool.spawn(
+                            get_listing, shard_range, headers, shard_params,
+                            self.app.logger.thread_locals)
+                    else:
+                        gt = None
+                    fetches.append((shard_range, headers, shard_params, gt))
+
+            dispatch()
+            while fetches:
+                shard_range, headers, shard_params, gt = fetches.popleft()
+                if gt is None:
+                    objs, shard_resp = get_listing(
+                        shard_range, headers, shard_params)
+                else:
+                    objs, shard_resp = gt.wait()
+
+                if objs and shard_params['marker'] != make_params(
+                        shard_range)['marker']:
+                    # prefetched with an older marker
+                    last_name = listed_name(objects[-1])
+                    if reverse:
+                        new_objs = [o for o in objs
+                                    if listed_name(o) < last_name]
+                    else:
+                        new_objs = [o for o in objs
+                                    if listed_name(o) > last_name]
+                    if len(new_objs) < len(objs) and \
+                            len(objs) >= shard_params['limit']:
+                        # the listing was filled up with names that are
+                        # already listed; fetch it again
+                        shard_params = make_params(shard_range)
+                        objs, shard_resp = get_listing(
+                            shard_range, headers, shard_params)
+                    else:
+                        objs = new_objs
+
+                sharding_state = shard_resp.headers.get(
+                    'x-backend-sharding-state', 'unknown')
+
+                if objs is None:
+                    # tolerate errors
+                    self.app.logger.debug(
+                        'Failed to get objects from shard (state=%s), '
+                        'total = %d', sharding_state, len(objects))
+                    dispatch()
+                    continue
 
-            if objs is None:
-                # tolerate errors
                 self.app.logger.debug(
-                    'Failed to get objects from shard (state=%s), total = %d',
-                    sharding_state, len(objects))
-                continue
+                    'Found %d objects in shard (state=%s), total = %d',
+                    len(objs), sharding_state, len(objs) + len(objects))
 
-            self.app.logger.debug(
-                'Found %d objects in shard (state=%s), total = %d',
-                len(objs), sharding_state, len(objs) + len(objects))
-
-            if not objs:
-                # tolerate empty shard containers
-                continue
-
-            objects.extend(objs)
-            limit -= len(objs)
-
-            if limit <= 0:
-                break
-            last_name = objects[-1].get('name',
-                                        objects[-1].get('subdir', u''))
-            if six.PY2:
-                last_name = last_name.encode('utf8')
-            if end_marker and reverse and end_marker >= last_name:
-                break
-            if end_marker and not reverse and end_marker <= last_name:
-                break
+                if not objs:
+                    # tolerate empty shard containers
+                    dispatch()
+                    continue
+
+                if shard_params['limit'] > limit:
+                    # prefetched before some of the listing was received
+                    objs = objs[:limit]
+                objects.extend(objs)
+                limit -= len(objs)
+
+                if limit <= 0:
+                    break
+                last_name = listed_name(objects[-1])
+                if six.PY2:
+                    last_name = last_name.encode('utf8')
+                if end_marker and reverse and end_marker >= last_name:
+                    break
+                if end_marker and not reverse and end_marker <= last_name:
+                    break
+                dispatch()
 
         resp.body = json.dumps(objects).encode('ascii')
         constrained = any(req.params.get(constraint) for constraint in (
@@ -98,8 +98,12 @@ class InfoController(Controller):
             headers['Access-Control-Expose-Headers'] = ', '.join(
                 ['x-trans-id'])
 
-        info = json.dumps(get_swift_info(
-            admin=admin_request, disallowed_sections=self.disallowed_sections))
+        info = get_swift_info(
+            admin=admin_request, disallowed_sections=self.disallowed_sections)
+        if admin_request and self.app.sorts_by_latency:
+            # these are specific to the worker handling the request
+            info['admin']['node_latency'] = self.app.get_node_latency_stats()
+        info = json.dumps(info)
 
         return HTTPOk(request=req,
                       headers=headers,
@@ -55,7 +55,8 @@ from swift.common import constraints
 from swift.common.exceptions import ChunkReadTimeout, \
     ChunkWriteTimeout, ConnectionTimeout, ResponseTimeout, \
     InsufficientStorage, FooterNotSupported, MultiphasePUTNotSupported, \
-    PutterConnectError, ChunkReadError, RangeAlreadyComplete, ShortReadError
+    PutterConnectError, ChunkReadError, RangeAlreadyComplete, \
+    ShortReadError, SegmentError
 from swift.common.header_key_dict import HeaderKeyDict
 from swift.common.http import (
     is_informational, is_success, is_client_error, is_server_error,
@@ -175,6 +176,31 @@ class BaseObjectController(Controller):
         validate_internal_obj(
             self.account_name, self.container_name, self.object_name)
 
+    def _check_update_redirected(self, req, backend_headers):
+        """
+        Forget the cached shard ranges that object updates to the container
+        are directed with if any object server reports that its container
+        update was redirected to another shard, as the cached shard ranges
+        must then be stale.
+
+        :param req: the client request
+        :param backend_headers: a list of the headers of backend responses
+        """
+        for headers in backend_headers:
+            if config_true_value(HeaderKeyDict(headers).get(
+                    'X-Backend-Container-Update-Redirected')):
+                self._clear_update_shard_cache(
+                    req, self.account_name, self.container_name)
+                return
+
+    def best_response(self, req, statuses, reasons, bodies, server_type,
+                      etag=None, headers=None, **kwargs):
+        if headers and req.method in ('POST', 'DELETE'):
+            self._check_update_redirected(req, headers)
+        return super(BaseObjectController, self).best_response(
+            req, statuses, reasons, bodies, server_type, etag=etag,
+            headers=headers, **kwargs)
+
     def iter_nodes_local_first(self, ring, partition, policy=None,
                                local_handoffs_first=False):
         """
@@ -461,6 +487,7 @@ class BaseObjectController(Controller):
         reasons = []
         bodies = []
         etags = set()
+        backend_headers = []
 
         pile = GreenAsyncPile(len(putters))
         for putter in putters:
@@ -491,6 +518,8 @@ class BaseObjectController(Controller):
                      'body': body[:1024], 'path': req.path})
             elif is_success(response.status):
                 etags.add(normalize_etag(response.getheader('etag')))
+                if final_phase:
+                    backend_headers.append(response.getheaders())
 
         for (putter, response) in pile:
             if response:
@@ -507,6 +536,8 @@ class BaseObjectController(Controller):
             if response:
                 _handle_response(putter, response)
 
+        self._check_update_redirected(req, backend_headers)
+
         if final_phase:
             while len(statuses) < num_nodes:
                 statuses.append(HTTP_SERVICE_UNAVAILABLE)
@@ -1288,9 +1319,11 @@ class ECAppIter(object):
                     satisfiable = False
                     for range_spec in range_specs:
                         satisfiable |= range_spec['satisfiable']
-                        key = (range_spec['resp_fragment_start'],
-                               range_spec['resp_fragment_end'])
-                        ranges_for_resp.setdefault(key, []).append(range_spec)
+                    for fetch_specs in self._group_range_specs(range_specs):
+                        key = (fetch_specs[0]['resp_fragment_start'],
+                               fetch_specs[0]['resp_fragment_end'])
+                        ranges_for_resp.setdefault(key, []).append(
+                            fetch_specs)
 
                     # The client may have asked for an unsatisfiable set of
                     # ranges, but when converted to fragments, the object
@@ -1314,30 +1347,68 @@ class ECAppIter(object):
                     self.learned_content_type = content_type
                     seen_first_headers = True
 
-                range_spec = ranges_for_resp[(fa_start, fa_end)].pop(0)
+                fetch_specs = ranges_for_resp[(fa_start, fa_end)].pop(0)
                 seg_iter = self._decode_segments_from_fragments(frag_iters)
-                if not range_spec['satisfiable']:
+                if len(fetch_specs) > 1:
+                    byterange_iters = self._iter_coalesced_ranges(
+                        fetch_specs, seg_iter)
+                elif fetch_specs[0]['satisfiable']:
+                    byterange_iters = [(
+                        fetch_specs[0],
+                        self._iter_one_range(fetch_specs[0], seg_iter))]
+                else:
                     # This'll be small; just a single small segment. Discard
                     # it.
                     for x in seg_iter:
                         pass
                     continue
 
-                byterange_iter = self._iter_one_range(range_spec, seg_iter)
-
-                converted = {
-                    "start_byte": range_spec["resp_client_start"],
-                    "end_byte": range_spec["resp_client_end"],
-                    "content_type": content_type,
-                    "part_iter": byterange_iter}
+                for range_spec, byterange_iter in byterange_iters:
+                    converted = {
+                        "start_byte": range_spec["resp_client_start"],
+                        "end_byte": range_spec["resp_client_end"],
+                        "content_type": content_type,
+                        "part_iter": byterange_iter}
 
-                if self.obj_length is not None:
-                    converted["entity_length"] = self.obj_length
-                yield converted
+                    if self.obj_length is not None:
+                        converted["entity_length"] = self.obj_length
+                    yield converted
 
         return document_iters_to_http_response_body(
             convert_ranges_iter(), self.mime_boundary, multipart, self.logger)
 
+    def _group_range_specs(self, range_specs):
+        # Returns lists of the range specs that are served from the same
+        # byterange of the fragment archives, in the order that those
+        # byteranges were requested from the object servers.
+        fetches = collections.OrderedDict()
+        for i, range_spec in enumerate(range_specs):
+            fetches.setdefault(range_spec.get('fetch_index', (i,)),
+                               []).append(range_spec)
+        return list(fetches.values())
+
+    def _iter_coalesced_ranges(self, range_specs, segment_iter):
+        # Yields a (range_spec, byterange_iter) pair for each satisfiable
+        # range that was coalesced into the single fetch of whole segments
+        # that segment_iter decodes. The ranges are served in order of their
+        # first byte, so that each segment is decoded once and only the
+        # segments shared with later ranges need to be kept.
+        segments = DecodedSegments(
+            segment_iter,
+            min(spec['req_segment_start'] for spec in range_specs),
+            self.policy.ec_segment_size)
+        satisfiable = sorted(
+            (spec for spec in range_specs if spec['satisfiable']),
+            key=lambda spec: (spec['resp_client_start'],
+                              spec['resp_client_end']))
+        for i, range_spec in enumerate(satisfiable):
+            keep_from = (satisfiable[i + 1]['resp_client_start']
+                         if i + 1 < len(satisfiable) else None)
+            yield range_spec, segments.iter_range(
+                range_spec['resp_client_start'],
+                range_spec['resp_client_end'], keep_from)
+        segments.drain()
+
     def _iter_one_range(self, range_spec, segment_iter):
         client_start = range_spec['resp_client_start']
         client_end = range_spec['resp_client_end']
@@ -1456,6 +1527,83 @@ class ECAppIter(object):
         return self
 
 
+class DecodedSegments(object):
+    """
+    Serves byteranges of an object from the segments decoded from a fetch of
+    whole, consecutive segments, decoding each segment only once.
+
+    Byteranges must be requested in order of their first byte. Segments
+    that are needed by a later byterange are kept until that byterange is
+    served; all other segments are discarded as soon as they are served.
+
+    :param segment_iter: an iterator of the decoded segments
+    :param first_byte: the offset in the object of the first byte of the
+        first segment
+    :param segment_size: size of an EC segment, in bytes
+    """
+    def __init__(self, segment_iter, first_byte, segment_size):
+        self.segment_iter = segment_iter
+        self.first_byte = first_byte
+        self.segment_size = segment_size
+        self.kept = {}
+        self.next_index = 0
+
+    def _index(self, offset):
+        return (offset - self.first_byte) // self.segment_size
+
+    def iter_range(self, start, end, keep_from=None):
+        """
+        Yields the bytes start through end of the object, inclusive.
+
+        :param start: first byte of the range
+        :param end: last byte of the range
+        :param keep_from: first byte of the next range that will be
+            requested, or None if this is the last range
+        :raises SegmentError: if a segment of the range was discarded
+            already, i.e. the ranges were not requested in order
+        :raises ShortReadError: if the segments ran out before the end of the
+            range
+        """
+        first_index = self._index(start)
+        keep_index = (self._index(keep_from) if keep_from is not None
+                      else self._index(end) + 1)
+        for index in [i for i in self.kept if i < first_index]:
+            del self.kept[index]
+
+        for index in range(first_index, self._index(end) + 1):
+            if index in self.kept:
+                segment = self.kept[index]
+                if index < keep_index:
+                    del self.kept[index]
+            elif index < self.next_index:
+                raise SegmentError(
+                    'Segment %d was discarded before range %d-%d was served'
+                    % (index, start, end))
+            else:
+                while self.next_index <= index:
+                    try:
+                        segment = next(self.segment_iter)
+                    except StopIteration:
+                        raise ShortReadError(
+                            'Too few segments; got %d, expecting %d' % (
+                                self.next_index, self._index(end) + 1))
+                    if self.next_index >= keep_index:
+                        self.kept[self.next_index] = segment
+                    self.next_index += 1
+
+            segment_start = self.first_byte + index * self.segment_size
+            yield segment[max(start - segment_start, 0):
+                          end + 1 - segment_start]
+
+    def drain(self):
+        """
+        Discards any segments that were not needed by any range.
+        """
+        self.kept.clear()
+        for _junk in self.segment_iter:
+            pass
+
+
 def client_range_to_segment_range(client_start, client_end, segment_size):
     """
     Takes a byterange from the client and converts it into a byterange
@@ -1567,6 +1715,73 @@ def segment_range_to_fragment_range(segment_start, segment_end, segment_size,
     return (fragment_start, fragment_end)
 
 
+# The most segments that a byterange coalesced into a fetch may share with
+# the byteranges before it; shared segments are kept in memory until the
+# byterange is served.
+MAX_SHARED_SEGMENTS = 8
+
+
+def coalesce_segment_ranges(segment_ranges, segment_size,
+                            max_shared_segments=MAX_SHARED_SEGMENTS):
+    """
+    Plans the fetches of whole segments needed to serve some byteranges of
+    an object, so that byteranges which overlap or are adjacent at segment
+    boundaries are served from a single fetch.
+
+    Only byteranges bounded on both sides are coalesced; prefix and suffix
+    byteranges are each fetched on their own. A byterange is not coalesced
+    into a fetch if it shares more than max_shared_segments segments with
+    the byteranges before it, since those segments have to be kept in memory
+    until it is served.
+
+    Examples:
+        coalesce_segment_ranges([(0, 1023), (512, 1535)], 512)
+            = ([(0, 1535)], [0, 0])
+        coalesce_segment_ranges([(0, 511), (1024, None)], 512)
+            = ([(0, 511), (1024, None)], [0, 1])
+
+    :param segment_ranges: a list of (seg_start, seg_end) tuples as returned
+        by client_range_to_segment_range()
+    :param segment_size: size of an EC segment, in bytes
+    :param max_shared_segments: the most segments that a byterange may share
+        with the byteranges coalesced before it
+    :returns: a 2-tuple (fetches, fetch_indexes) where
+
+      * fetches is a list of (seg_start, seg_end) tuples to fetch, in the
+        order that the byteranges served by them first appear in
+        segment_ranges
+
+      * fetch_indexes is a list of the index in fetches of the fetch that
+        serves each byterange in segment_ranges
+    """
+    fetch_ranges = list(segment_ranges)
+    fetch_for_range = list(range(len(segment_ranges)))
+    bounded = sorted(
+        (i for i, (start, end) in enumerate(segment_ranges)
+         if start is not None and end is not None),
+        key=lambda i: segment_ranges[i])
+    current = None
+    for i in bounded:
+        start, end = segment_ranges[i]
+        if current is not None:
+            fetch_start, fetch_end = fetch_ranges[current]
+            shared = (fetch_end + 1 - start) // segment_size
+            if start <= fetch_end + 1 and shared <= max_shared_segments:
+                fetch_ranges[current] = (fetch_start, max(fetch_end, end))
+                fetch_for_range[i] = current
+                continue
+        current = i
+
+    fetches = []
+    renumbered = {}
+    for i, fetch in enumerate(fetch_for_range):
+        if fetch not in renumbered:
+            renumbered[fetch] = len(fetches)
+            fetches.append(fetch_ranges[fetch])
+        fetch_for_range[i] = renumbered[fetch]
+    return fetches, fetch_for_range
+
+
 NO_DATA_SENT = 1
 SENDING_DATA = 2
 DATA_SENT = 3
@@ -2733,6 +2948,7 @@ class ECFragGetter(object):
         ip, port = get_ip_port(node, req_headers)
         req_headers.update(self.header_provider())
         start_node_timing = time.time()
+        self.app.node_request_started(node)
         try:
             with ConnectionTimeout(self.app.conn_timeout):
                 conn = http_connect(
@@ -2752,6 +2968,9 @@ class ECFragGetter(object):
                 'Trying to %(method)s %(path)s' %
                 {'method': self.req.method, 'path': self.req.path})
             return None
+        finally:
+            self.app.node_request_finished(
+                node, time.time() - start_node_timing)
 
         src_headers = dict(
             (k.lower(), v) for k, v in
@@ -2865,35 +3084,39 @@ class ECObjectController(BaseObjectController):
         segment_size = policy.ec_segment_size
         fragment_size = policy.fragment_size
 
+        segment_ranges = [
+            client_range_to_segment_range(client_start, client_end,
+                                          segment_size)
+            for client_start, client_end in req.range.ranges]
+        # Ranges that overlap or are adjacent at segment boundaries are
+        # fetched together, so that each segment is only fetched and decoded
+        # once. For example, "bytes=0-10,20-30,40-50" with a 64 KiB segment
+        # size results in a Range header in the object request of
+        # "bytes=0-N" where N+1 is the fragment size.
+        fetches, fetch_indexes = coalesce_segment_ranges(
+            segment_ranges, segment_size)
+        fragment_ranges = [
+            segment_range_to_fragment_range(
+                fetch_start, fetch_end, segment_size, fragment_size)
+            for fetch_start, fetch_end in fetches]
+
         range_specs = []
-        new_ranges = []
-        for client_start, client_end in req.range.ranges:
-            # TODO: coalesce ranges that overlap segments. For
-            # example, "bytes=0-10,20-30,40-50" with a 64 KiB
-            # segment size will result in a Range header in the
-            # object request of "bytes=0-65535,0-65535,0-65535",
-            # which is wasteful. We should be smarter and only
-            # request that first segment once.
-            segment_start, segment_end = client_range_to_segment_range(
-                client_start, client_end, segment_size)
-
-            fragment_start, fragment_end = \
-                segment_range_to_fragment_range(
-                    segment_start, segment_end,
-                    segment_size, fragment_size)
-
-            new_ranges.append((fragment_start, fragment_end))
+        for (client_start, client_end), (segment_start, segment_end), \
+                fetch_index in zip(req.range.ranges, segment_ranges,
+                                   fetch_indexes):
+            fragment_start, fragment_end = fragment_ranges[fetch_index]
             range_specs.append({'req_client_start': client_start,
                                 'req_client_end': client_end,
                                 'req_segment_start': segment_start,
                                 'req_segment_end': segment_end,
                                 'req_fragment_start': fragment_start,
-                                'req_fragment_end': fragment_end})
+                                'req_fragment_end': fragment_end,
+                                'fetch_index': fetch_index})
 
         req.range = "bytes=" + ",".join(
             "%s-%s" % (s if s is not None else "",
                        e if e is not None else "")
-            for s, e in new_ranges)
+            for s, e in fragment_ranges)
         return range_specs
 
     def feed_remaining_primaries(self, safe_iter, pile, req, partition, policy,
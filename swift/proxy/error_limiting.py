@@ -0,0 +1,263 @@
+# Copyright (c) 2021 OpenStack Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Error limiting state shared between proxy server worker processes.
+
+By default each proxy worker keeps its own record of node errors, so every
+worker has to discover a failed node for itself. A
+:class:`SharedErrorLimitTable` keeps those records in a memory-mapped file
+instead; every process that maps the same file sees the errors recorded by
+the others as soon as they are written.
+"""
+
+import errno
+import fcntl
+import mmap
+import os
+import struct
+import tempfile
+
+from swift.common.utils import md5
+
+
+class SharedErrorStats(object):
+    """
+    A view of the error stats of one node in a :class:`SharedErrorLimitTable`.
+
+    Supports the subset of the ``dict`` interface that the proxy server uses
+    for its per-node error stats, i.e. the ``errors`` and ``last_error``
+    keys. Values are read from, and written straight through to, the shared
+    table.
+    """
+
+    __slots__ = ('table', 'fingerprint')
+
+    def __init__(self, table, fingerprint):
+        self.table = table
+        self.fingerprint = fingerprint
+
+    def __contains__(self, field):
+        return field in self.table.FIELDS and \
+            self.table._find(self.fingerprint) is not None
+
+    def __getitem__(self, field):
+        if field not in self.table.FIELDS:
+            raise KeyError(field)
+        index = self.table._find(self.fingerprint)
+        if index is None:
+            raise KeyError(field)
+        return self.table._read(index)[self.table.FIELDS[field]]
+
+    def get(self, field, default=None):
+        try:
+            return self[field]
+        except KeyError:
+            return default
+
+    def __setitem__(self, field, value):
+        if field not in self.table.FIELDS:
+            raise KeyError(field)
+        index = self.table._find(self.fingerprint)
+        if index is None:
+            # our slot was reused for another node in the meantime
+            index = self.table._allocate(self.fingerprint)
+        self.table._write_field(index, field, value)
+
+    def __repr__(self):
+        return '%s(%r)' % (self.__class__.__name__, dict(
+            (field, self.get(field)) for field in self.table.FIELDS))
+
+
+class SharedErrorLimitTable(object):
+    """
+    A fixed size table of per-node error stats in a memory-mapped file.
+
+    Nodes are identified by a 64 bit fingerprint of their error limit key and
+    stored in slots found by linear probing from the fingerprint. When every
+    slot in the probe window is taken, the one with the oldest error is
+    reused; that only loses the stats of a node which hasn't had an error for
+    the longest time.
+
+    Slots are read and written without locking. Concurrent increments of the
+    same node's error count by different processes may occasionally be lost,
+    which only delays error limiting of that node by an error or two.
+
+    The table exposes the subset of the ``dict`` interface that
+    :class:`~swift.proxy.server.Application` uses for its error stats, so it
+    can be used in place of the default per-process ``dict``.
+
+    The file starts with a header that records the number of slots, so that
+    every process that maps the file finds nodes in the same slots.
+
+    :param path: path of the file backing the table; it is created if
+                 necessary and may be shared by any number of processes
+    :param slots: number of slots in the table; if the file holds a table
+                  with a different number of slots, or no valid table, it is
+                  replaced with a new, empty table. Processes that mapped the
+                  old file keep using it until they open the table again.
+    """
+
+    HEADER = struct.Struct('<8sQ')  # magic, slots
+    MAGIC = b'SwErrLim'
+    SLOT = struct.Struct('<Qqd')  # fingerprint, errors, last_error
+    FIELDS = {'errors': 1, 'last_error': 2}
+    FIELD_FORMATS = {'errors': struct.Struct('<q'),
+                     'last_error': struct.Struct('<d')}
+    MAX_PROBES = 8
+
+    def __init__(self, path, slots=4096):
+        if slots < 1:
+            raise ValueError('slots must be a positive integer')
+        self.path = path
+        self.slots = slots
+        self._size = self.HEADER.size + slots * self.SLOT.size
+        self._mmap = self._open()
+
+    def _open(self):
+        while True:
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+                try:
+                    replaced = os.stat(self.path).st_ino != \
+                        os.fstat(fd).st_ino
+                except OSError as err:
+                    if err.errno != errno.ENOENT:
+                        raise
+                    replaced = True
+                if replaced:
+                    # another process replaced the file while we waited for
+                    # the lock
+                    continue
+                if self._read_slots(fd) != self.slots:
+                    self._replace()
+                    continue
+                return mmap.mmap(fd, self._size)
+            finally:
+                # the mmap shares the lock on the open file, so closing fd
+                # would not release it
+                fcntl.flock(fd, fcntl.LOCK_UN)
+                os.close(fd)
+
+    def _read_slots(self, fd):
+        if os.fstat(fd).st_size < self.HEADER.size:
+            return None
+        os.lseek(fd, 0, os.SEEK_SET)
+        magic, slots = self.HEADER.unpack(os.read(fd, self.HEADER.size))
+        if magic != self.MAGIC or os.fstat(fd).st_size < \
+                self.HEADER.size + slots * self.SLOT.size:
+            return None
+        return slots
+
+    def _replace(self):
+        # never truncate the file in place: other processes may have mapped
+        # all of it
+        fd, tmp_path = tempfile.mkstemp(
+            dir=os.path.dirname(self.path),
+            prefix='.%s.' % os.path.basename(self.path))
+        try:
+            os.ftruncate(fd, self._size)
+            os.write(fd, self.HEADER.pack(self.MAGIC, self.slots))
+            os.rename(tmp_path, self.path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        finally:
+            os.close(fd)
+
+    def _offset(self, index):
+        return self.HEADER.size + index * self.SLOT.size
+
+    def _fingerprint(self, key):
+        if not isinstance(key, bytes):
+            key = key.encode('utf-8')
+        fingerprint, = struct.unpack_from(
+            '<Q', md5(key, usedforsecurity=False).digest())
+        # zero marks an empty slot
+        return fingerprint or 1
+
+    def _probe(self, fingerprint):
+        start = fingerprint % self.slots
+        for i in range(min(self.MAX_PROBES, self.slots)):
+            yield (start + i) % self.slots
+
+    def _read(self, index):
+        return self.SLOT.unpack_from(self._mmap, self._offset(index))
+
+    def _write_field(self, index, field, value):
+        self.FIELD_FORMATS[field].pack_into(
+            self._mmap, self._offset(index) + 8 * self.FIELDS[field], value)
+
+    def _find(self, fingerprint):
+        for index in self._probe(fingerprint):
+            if self._read(index)[0] == fingerprint:
+                return index
+        return None
+
+    def _allocate(self, fingerprint):
+        victim = victim_last_error = None
+        for index in self._probe(fingerprint):
+            slot_fingerprint, _errors, last_error = self._read(index)
+            if not slot_fingerprint:
+                victim = index
+                break
+            if victim is None or last_error < victim_last_error:
+                victim, victim_last_error = index, last_error
+        self.SLOT.pack_into(self._mmap, self._offset(victim),
+                            fingerprint, 0, 0.0)
+        return victim
+
+    def get(self, key, default=None):
+        fingerprint = self._fingerprint(key)
+        if self._find(fingerprint) is None:
+            return default
+        return SharedErrorStats(self, fingerprint)
+
+    def __getitem__(self, key):
+        stats = self.get(key)
+        if stats is None:
+            raise KeyError(key)
+        return stats
+
+    def __contains__(self, key):
+        return self._find(self._fingerprint(key)) is not None
+
+    def setdefault(self, key, default=None):
+        """
+        Return the stats of a node, allocating a slot for it if necessary.
+
+        :param key: the node's error limit key
+        :param default: ignored; a newly allocated slot always starts with no
+                        errors
+        :returns: a :class:`SharedErrorStats`
+        """
+        fingerprint = self._fingerprint(key)
+        if self._find(fingerprint) is None:
+            self._allocate(fingerprint)
+        return SharedErrorStats(self, fingerprint)
+
+    def pop(self, key, default=None):
+        fingerprint = self._fingerprint(key)
+        index = self._find(fingerprint)
+        if index is None:
+            return default
+        _fingerprint, errors, last_error = self._read(index)
+        self.SLOT.pack_into(self._mmap, self._offset(index), 0, 0, 0.0)
+        return {'errors': errors, 'last_error': last_error}
+
+    def clear(self):
+        self._mmap[self.HEADER.size:] = \
+            b'\x00' * (len(self._mmap) - self.HEADER.size)
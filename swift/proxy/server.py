@@ -13,11 +13,12 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import math
 import mimetypes
 import os
 import socket
 
-from collections import defaultdict
+from collections import defaultdict, deque
 
 from swift import gettext_ as _
 from random import shuffle
@@ -42,12 +43,15 @@ from swift.proxy.controllers import AccountController, ContainerController, \
     ObjectControllerRouter, InfoController
 from swift.proxy.controllers.base import get_container_info, NodeIter, \
     DEFAULT_RECHECK_CONTAINER_EXISTENCE, DEFAULT_RECHECK_ACCOUNT_EXISTENCE, \
-    DEFAULT_RECHECK_UPDATING_SHARD_RANGES, DEFAULT_RECHECK_LISTING_SHARD_RANGES
+    DEFAULT_RECHECK_UPDATING_SHARD_RANGES, \
+    DEFAULT_RECHECK_LISTING_SHARD_RANGES, InfoCache, ShardRangeCache
+from swift.proxy.error_limiting import SharedErrorLimitTable
 from swift.common.swob import HTTPBadRequest, HTTPForbidden, \
     HTTPMethodNotAllowed, HTTPNotFound, HTTPPreconditionFailed, \
     HTTPServerError, HTTPException, Request, HTTPServiceUnavailable, \
     wsgi_to_str
 from swift.common.exceptions import APIVersionError
+from swift.common.splice import splice
 
 
 # List of entry points for mandatory middlewares.
@@ -84,6 +88,20 @@ required_filters = [
         'keystoneauth', 'catch_errors', 'gatekeeper', 'proxy_logging']},
 ]
 
+# Entry points of middlewares that pass the body of a plain object GET
+# response through unchanged, at most counting its bytes. Object bodies are
+# only spliced from object servers to clients if every middleware in the
+# pipeline is one of these. slo and dlo read manifest bodies in the proxy,
+# which is safe because manifests are never spliced; see _can_splice.
+splice_safe_filters = {
+    'account_quotas', 'auth_token', 'bulk', 'catch_errors', 'cname_lookup',
+    'container_quotas', 'container_sync', 'copy', 'crossdomain', 'dlo',
+    'domain_remap', 'etag_quoter', 'formpost', 'gatekeeper', 'healthcheck',
+    'keystoneauth', 'list_endpoints', 'listing_formats', 'memcache',
+    'name_check', 'proxy_logging', 'ratelimit', 'read_only', 's3token', 'slo',
+    'staticweb', 'symlink', 'tempauth', 'tempurl', 'versioned_writes',
+}
+
 
 def _label_for_policy(policy):
     if policy is not None:
@@ -91,7 +109,7 @@ def _label_for_policy(policy):
     return '(default)'
 
 
-VALID_SORTING_METHODS = ('shuffle', 'timing', 'affinity')
+VALID_SORTING_METHODS = ('shuffle', 'timing', 'affinity', 'latency')
 
 
 class ProxyOverrideOptions(object):
@@ -156,6 +174,13 @@ class ProxyOverrideOptions(object):
             'concurrency_timeout', app.conn_timeout))
         self.concurrent_ec_extra_requests = int(get(
             'concurrent_ec_extra_requests', 0))
+        self.hedged_gets = config_true_value(get('hedged_gets', False))
+        self.hedge_delay_percentile = float(get(
+            'hedge_delay_percentile', 95))
+        if not 0 < self.hedge_delay_percentile <= 100:
+            raise ValueError(
+                'Invalid hedge_delay_percentile value: %r; must be in '
+                '(0, 100]' % self.hedge_delay_percentile)
 
     def __repr__(self):
         return '%s({}, {%s}, app)' % (
@@ -170,6 +195,8 @@ class ProxyOverrideOptions(object):
                     'concurrent_gets',
                     'concurrency_timeout',
                     'concurrent_ec_extra_requests',
+                    'hedged_gets',
+                    'hedge_delay_percentile',
                 )))
 
     def __eq__(self, other):
@@ -185,9 +212,58 @@ class ProxyOverrideOptions(object):
             'concurrent_gets',
             'concurrency_timeout',
             'concurrent_ec_extra_requests',
+            'hedged_gets',
+            'hedge_delay_percentile',
         ))
 
 
+class LatencyWindow(object):
+    """
+    Keeps the most recent latency samples of some kind of request so that
+    percentiles of their distribution can be estimated.
+
+    Percentiles are recomputed lazily, at most once per ``refresh_interval``
+    new samples, so that looking them up on every request is cheap.
+
+    :param size: the number of most recent samples to keep
+    :param min_samples: the number of samples needed before any percentile
+                        is estimated
+    :param refresh_interval: the number of new samples after which cached
+                             percentiles are recomputed
+    """
+
+    def __init__(self, size=1000, min_samples=20, refresh_interval=100):
+        self.samples = deque(maxlen=size)
+        self.min_samples = min_samples
+        self.refresh_interval = refresh_interval
+        self._percentiles = {}
+        self._new_samples = 0
+
+    def add(self, latency):
+        self.samples.append(latency)
+        self._new_samples += 1
+        if self._new_samples >= self.refresh_interval:
+            self._percentiles.clear()
+            self._new_samples = 0
+
+    def percentile(self, percentile):
+        """
+        Estimate a percentile of the latencies in the window.
+
+        :param percentile: the percentile, in (0, 100]
+        :returns: the latency in seconds, or None if there are too few
+                  samples for an estimate
+        """
+        if len(self.samples) < self.min_samples:
+            return None
+        if percentile not in self._percentiles:
+            ordered = sorted(self.samples)
+            index = int(math.ceil(percentile / 100.0 * len(ordered))) - 1
+            self._percentiles[percentile] = ordered[
+                min(max(index, 0), len(ordered) - 1)]
+        return self._percentiles[percentile]
+
+
 class Application(object):
     """WSGI application for the proxy server."""
 
@@ -210,12 +286,26 @@ class Application(object):
         self.client_timeout = float(conf.get('client_timeout', 60))
         self.object_chunk_size = int(conf.get('object_chunk_size', 65536))
         self.client_chunk_size = int(conf.get('client_chunk_size', 65536))
+        self.splice = config_true_value(conf.get('splice', 'no'))
+        if self.splice and not splice.available:
+            self.logger.warning(
+                'Use of splice() requested (config says "splice = %s"), '
+                'but the system does not support it. '
+                'splice() will not be used.', conf.get('splice'))
+            self.splice = False
+        self.splice_min_object_size = int(
+            conf.get('splice_min_object_size', 1048576))
         self.trans_id_suffix = conf.get('trans_id_suffix', '')
         self.post_quorum_timeout = float(conf.get('post_quorum_timeout', 0.5))
         self.error_suppression_interval = \
             int(conf.get('error_suppression_interval', 60))
         self.error_suppression_limit = \
             int(conf.get('error_suppression_limit', 10))
+        shared_error_limit_file = conf.get('shared_error_limit_file')
+        if shared_error_limit_file:
+            self._error_limiting = SharedErrorLimitTable(
+                shared_error_limit_file,
+                int(conf.get('shared_error_limit_slots', 4096)))
         self.recheck_container_existence = \
             int(conf.get('recheck_container_existence',
                          DEFAULT_RECHECK_CONTAINER_EXISTENCE))
@@ -225,18 +315,50 @@ class Application(object):
         self.recheck_listing_shard_ranges = \
             int(conf.get('recheck_listing_shard_ranges',
                          DEFAULT_RECHECK_LISTING_SHARD_RANGES))
+        self.shard_listing_concurrency = \
+            int(conf.get('shard_listing_concurrency', 1))
         self.recheck_account_existence = \
             int(conf.get('recheck_account_existence',
                          DEFAULT_RECHECK_ACCOUNT_EXISTENCE))
+        self.info_cache_size = int(conf.get('info_cache_size', 0))
+        self.info_cache_ttl = float(conf.get('info_cache_ttl', 1.0))
+        self.info_cache_negative_ttl = float(
+            conf.get('info_cache_negative_ttl', 1.0))
+        if self.info_cache_size > 0:
+            self.info_cache = InfoCache(
+                self.info_cache_size, self.info_cache_ttl,
+                self.info_cache_negative_ttl, self.logger)
+        else:
+            self.info_cache = None
+        self.shard_range_cache_size = int(
+            conf.get('shard_range_cache_size', 0))
+        self.shard_range_cache_ttl = float(
+            conf.get('shard_range_cache_ttl', 60.0))
+        if self.shard_range_cache_size > 0:
+            self.shard_range_cache = ShardRangeCache(
+                self.shard_range_cache_size, self.shard_range_cache_ttl,
+                self.logger)
+        else:
+            self.shard_range_cache = None
         self.allow_account_management = \
             config_true_value(conf.get('allow_account_management', 'no'))
-        self.container_ring = container_ring or Ring(swift_dir,
-                                                     ring_name='container')
-        self.account_ring = account_ring or Ring(swift_dir,
-                                                 ring_name='account')
+        self.ring_handoff_cache_size = \
+            int(conf.get('ring_handoff_cache_size', 0))
+        self.ring_use_mmap = config_true_value(
+            conf.get('ring_use_mmap', 'false'))
+        self.container_ring = container_ring or Ring(
+            swift_dir, ring_name='container',
+            handoff_cache_size=self.ring_handoff_cache_size,
+            use_mmap=self.ring_use_mmap)
+        self.account_ring = account_ring or Ring(
+            swift_dir, ring_name='account',
+            handoff_cache_size=self.ring_handoff_cache_size,
+            use_mmap=self.ring_use_mmap)
         # ensure rings are loaded for all configured storage policies
         for policy in POLICIES:
-            policy.load_ring(swift_dir)
+            policy.load_ring(swift_dir,
+                             handoff_cache_size=self.ring_handoff_cache_size,
+                             use_mmap=self.ring_use_mmap)
         self.obj_controller_router = ObjectControllerRouter()
         mimetypes.init(mimetypes.knownfiles +
                        [os.path.join(swift_dir, 'mime.types')])
@@ -280,6 +402,11 @@ class Application(object):
             conf.get('strict_cors_mode', 't'))
         self.node_timings = {}
         self.timing_expiry = int(conf.get('timing_expiry', 300))
+        self.node_latencies = {}
+        self.latency_ewma_weight = float(
+            conf.get('latency_ewma_weight', 0.3))
+        if not 0 < self.latency_ewma_weight <= 1:
+            raise ValueError('latency_ewma_weight must be in (0, 1]')
         value = conf.get('request_node_count', '2 * replicas')
         self.request_node_count = config_request_node_count_value(value)
         # swift_owner_headers are stripped by the account and container
@@ -332,6 +459,11 @@ class Application(object):
         self._override_options = self._load_per_policy_config(conf)
         self.sorts_by_timing = any(pc.sorting_method == 'timing'
                                    for pc in self._override_options.values())
+        self.sorts_by_latency = any(pc.sorting_method == 'latency'
+                                    for pc in self._override_options.values())
+        self.hedges_gets = any(pc.hedged_gets
+                               for pc in self._override_options.values())
+        self.first_byte_latencies = defaultdict(LatencyWindow)
 
         register_swift_info(
             version=swift_version,
@@ -605,7 +737,10 @@ class Application(object):
         Sorts nodes in-place (and returns the sorted list) according to
         the configured strategy. The default "sorting" is to randomly
         shuffle the nodes. If the "timing" strategy is chosen, the nodes
-        are sorted according to the stored timing data.
+        are sorted according to the stored timing data. If the "latency"
+        strategy is chosen, the nodes are sorted by their expected time to
+        first byte, i.e. the moving average of their recent first byte
+        latencies scaled by the number of requests already in flight to them.
 
         :param nodes: a list of nodes
         :param policy: an instance of :class:`BaseStoragePolicy`
@@ -622,6 +757,17 @@ class Application(object):
                 timing, expires = self.node_timings.get(node['ip'], (-1.0, 0))
                 return timing if expires > now else -1.0
             nodes.sort(key=key_func)
+        elif policy_options.sorting_method == 'latency':
+            expired = time() - self.timing_expiry
+
+            def key_func(node):
+                stats = self.node_latencies.get(
+                    self._error_limit_node_key(node))
+                if not stats or stats['updated'] < expired:
+                    # no recent measurement, so try the node to get one
+                    return -1.0
+                return stats['first_byte_latency'] * (1 + stats['in_flight'])
+            nodes.sort(key=key_func)
         elif policy_options.sorting_method == 'affinity':
             nodes.sort(key=policy_options.read_affinity_sort_key)
         return nodes
@@ -633,6 +779,104 @@ class Application(object):
         timing = round(timing, 3)  # sort timings to the millisecond
         self.node_timings[node['ip']] = (timing, now + self.timing_expiry)
 
+    def node_request_started(self, node):
+        """
+        Note that a request is being made to a node, for the "latency"
+        sorting_method.
+
+        Every call must be followed by a call to
+        :meth:`node_request_finished`.
+
+        :param node: dictionary of the node the request is made to
+        """
+        if not self.sorts_by_latency:
+            return
+        stats = self.node_latencies.setdefault(
+            self._error_limit_node_key(node),
+            {'first_byte_latency': 0.0, 'in_flight': 0, 'updated': 0.0})
+        stats['in_flight'] += 1
+
+    def node_request_finished(self, node, first_byte_latency):
+        """
+        Note that the first byte of a response from a node has been received
+        (or that the request failed), for the "latency" sorting_method.
+
+        The node's first byte latency is an exponentially weighted moving
+        average of the samples given, weighted by latency_ewma_weight. Once a
+        node goes unmeasured for timing_expiry seconds the average starts
+        again from the next sample.
+
+        :param node: dictionary of the node the request was made to
+        :param first_byte_latency: the time in seconds from the start of the
+                                   request to the first byte of the response,
+                                   or until the request failed
+        """
+        if not self.sorts_by_latency:
+            return
+        stats = self.node_latencies.get(self._error_limit_node_key(node))
+        if stats is None:
+            return
+        now = time()
+        stats['in_flight'] = max(0, stats['in_flight'] - 1)
+        if stats['updated'] < now - self.timing_expiry:
+            stats['first_byte_latency'] = first_byte_latency
+        else:
+            stats['first_byte_latency'] += self.latency_ewma_weight * (
+                first_byte_latency - stats['first_byte_latency'])
+        stats['updated'] = now
+
+    def get_node_latency_stats(self):
+        """
+        Return the current latency stats of the nodes used by this worker.
+
+        :returns: a dict mapping node keys (``ip:port/device``) to dicts with
+                  ``first_byte_latency`` (seconds), ``in_flight`` and
+                  ``updated`` keys; nodes without a measurement in the last
+                  timing_expiry seconds are omitted
+        """
+        expired = time() - self.timing_expiry
+        return dict((node_key, dict(stats))
+                    for node_key, stats in self.node_latencies.items()
+                    if stats['updated'] >= expired)
+
+    def record_first_byte_latency(self, server_type, policy, latency):
+        """
+        Note the first byte latency of a successful backend GET or HEAD, for
+        the hedge delay of hedged_gets.
+
+        :param server_type: the type of server the request was made to
+        :param policy: the storage policy of the request, or None
+        :param latency: the time in seconds from the start of the request to
+                        the first byte of the response
+        """
+        if not self.hedges_gets:
+            return
+        self.first_byte_latencies[
+            (server_type, policy.idx if policy else None)].add(latency)
+
+    def get_hedge_delay(self, server_type, policy):
+        """
+        Return how long to wait for a backend GET or HEAD to respond before
+        hedging it with a request to another node.
+
+        The delay is the hedge_delay_percentile of recent first byte
+        latencies of the same server type and policy; until enough of those
+        have been seen, concurrency_timeout is used.
+
+        :param server_type: the type of server the request is made to
+        :param policy: the storage policy of the request, or None
+        :returns: the delay in seconds
+        """
+        policy_options = self.get_policy_options(policy)
+        window = self.first_byte_latencies.get(
+            (server_type, policy.idx if policy else None))
+        delay = None
+        if window is not None:
+            delay = window.percentile(policy_options.hedge_delay_percentile)
+        if delay is None:
+            return policy_options.concurrency_timeout
+        return delay
+
     def _error_limit_node_key(self, node):
         return "{ip}:{port}/{device}".format(**node)
 
@@ -758,6 +1002,16 @@ class Application(object):
         else:
             self.logger.debug(_("Pipeline is \"%s\""), pipe)
 
+        if self.splice:
+            unsafe_filters = [
+                ctx.entry_point_name for ctx in pipe.context.filter_contexts
+                if ctx.entry_point_name not in splice_safe_filters]
+            if unsafe_filters:
+                self.logger.info(
+                    'Not using splice() for object GETs because the '
+                    'pipeline includes %s', ', '.join(unsafe_filters))
+                self.splice = False
+
 
 def parse_per_policy_config(conf):
     """
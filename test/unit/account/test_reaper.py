@@ -13,6 +13,7 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import json
 import os
 import time
 import random
@@ -42,9 +43,10 @@ class FakeBroker(object):
 
 
 class FakeAccountBroker(object):
-    def __init__(self, containers, logger):
+    def __init__(self, containers, logger, db_file=None):
         self.containers = containers
         self.containers_yielded = []
+        self.db_file = db_file
 
     def get_info(self):
         info = {'account': 'a',
@@ -223,6 +225,17 @@ class TestReaper(unittest.TestCase):
         r = reaper.AccountReaper({'node_timeout': '3.5'})
         self.assertEqual(r.node_timeout, 3.5)
 
+    def test_checkpoint_and_rate_conf(self):
+        r = reaper.AccountReaper({})
+        self.assertFalse(r.checkpoint_progress)
+        self.assertEqual(r.objects_per_second, 0)
+        r = reaper.AccountReaper({'checkpoint_progress': 'yes',
+                                  'objects_per_second': '250.5'})
+        self.assertTrue(r.checkpoint_progress)
+        self.assertEqual(r.objects_per_second, 250.5)
+        self.assertRaises(ValueError, reaper.AccountReaper,
+                          {'objects_per_second': 'abc'})
+
     def test_delay_reaping_conf_default(self):
         r = reaper.AccountReaper({})
         self.assertEqual(r.delay_reaping, 0)
@@ -336,6 +349,31 @@ class TestReaper(unittest.TestCase):
             self.assertEqual(r.stats_objects_deleted,
                              policy.object_ring.replicas)
 
+    def test_reap_object_rate_limited(self):
+        r = self.init_reaper({'objects_per_second': '100'}, fakelogger=True)
+        running_times = []
+
+        def fake_ratelimit_sleep(running_time, max_rate):
+            self.assertEqual(100, max_rate)
+            running_times.append(running_time)
+            return running_time + 1
+
+        with patch('swift.account.reaper.direct_delete_object'), \
+                patch('swift.account.reaper.ratelimit_sleep',
+                      fake_ratelimit_sleep):
+            for obj in ('o1', 'o2', 'o3'):
+                r.reap_object('a', 'c', 'partition', cont_nodes, obj, 0)
+        # once per object, not once per node
+        self.assertEqual([0, 1, 2], running_times)
+        self.assertEqual(3, r.objects_running_time)
+
+        # unlimited by default
+        r = self.init_reaper({}, fakelogger=True)
+        with patch('swift.account.reaper.direct_delete_object'), \
+                patch('swift.account.reaper.ratelimit_sleep') as mock_sleep:
+            r.reap_object('a', 'c', 'partition', cont_nodes, 'o', 0)
+        self.assertFalse(mock_sleep.called)
+
     def test_reap_object_fail(self):
         r = self.init_reaper({}, fakelogger=True)
         self.amount_fail = 0
@@ -529,6 +567,103 @@ class TestReaper(unittest.TestCase):
         self.assertTrue(r.logger.get_lines_for_level(
             'error')[-1].startswith('Timeout Exception'))
 
+    def _make_checkpointing_reaper(self, checkpoint=None):
+        devices = self.prepare_data_dir()
+        db_file = os.path.join(devices, 'sda1', DATADIR, '100', 'a86',
+                               'a8c682d2472e1720f2d81ff8993aba6',
+                               'a8c682203aba6.db')
+        if checkpoint is not None:
+            with open(db_file + '.reaper', 'w') as fp:
+                json.dump(checkpoint, fp)
+        r = self.init_reaper({'checkpoint_progress': 'true'},
+                             fakelogger=True)
+        broker = FakeAccountBroker(('c1', 'c2', 'c3', 'c4'), r.logger,
+                                   db_file=db_file)
+        return r, broker
+
+    def test_reap_container_resumes_from_checkpoint(self):
+        r, broker = self._make_checkpointing_reaper(
+            {'container_marker': '', 'object_markers': {'c': 'o2'}})
+        r.load_checkpoint(broker)
+        self.get_fail = False
+        self.timeout = False
+        self.amount_delete_fail = 0
+        self.max_delete_fail = 0
+        events = []
+
+        def fake_get_container(*args, **kwargs):
+            events.append(('list', kwargs['marker']))
+            return {}, self.fake_direct_get_container(*args, **kwargs)[1]
+
+        def fake_reap_object(account, container, part, nodes, obj, pi):
+            events.append(('reap', obj))
+
+        with patch('swift.account.reaper.direct_get_container',
+                   fake_get_container), \
+                patch('swift.account.reaper.direct_delete_container',
+                      self.fake_direct_delete_container), \
+                patch('swift.account.reaper.AccountReaper.get_container_ring',
+                      self.fake_container_ring), \
+                patch('swift.account.reaper.AccountReaper.reap_object',
+                      side_effect=fake_reap_object):
+            r.reap_container('a', 'partition', acc_nodes, 'c')
+        # the next page is requested before the objects of the current page
+        # are deleted
+        self.assertEqual([('list', 'o2'), ('list', 'o4'), ('reap', 'o3'),
+                          ('reap', 'o4')], events)
+        # the container listing was exhausted so there is nothing to resume
+        self.assertEqual({}, r.checkpoint['object_markers'])
+        self.assertFalse(os.path.exists(r.checkpoint_file))
+        self.assertEqual(r.stats_containers_deleted, 1)
+
+    def test_reap_container_saves_checkpoint(self):
+        r, broker = self._make_checkpointing_reaper()
+        r.load_checkpoint(broker)
+        self.assertEqual({'container_marker': '', 'object_markers': {}},
+                         r.checkpoint)
+        self.amount_delete_fail = 0
+        self.max_delete_fail = 0
+        pages = [[{'name': 'o1'}, {'name': 'o2'}]]
+
+        def fake_get_container(*args, **kwargs):
+            if not pages:
+                raise eventlet.Timeout()
+            return {}, pages.pop(0)
+
+        with patch('swift.account.reaper.direct_get_container',
+                   fake_get_container), \
+                patch('swift.account.reaper.direct_delete_container',
+                      self.fake_direct_delete_container), \
+                patch('swift.account.reaper.AccountReaper.get_container_ring',
+                      self.fake_container_ring), \
+                patch('swift.account.reaper.AccountReaper.reap_object'):
+            r.reap_container('a', 'partition', acc_nodes, 'c')
+        # listing the second page failed, so the marker is kept
+        with open(r.checkpoint_file) as fp:
+            self.assertEqual(
+                {'container_marker': '', 'object_markers': {'c': 'o2'}},
+                json.load(fp))
+        self.assertTrue(r.logger.get_lines_for_level(
+            'error')[-1].startswith('Timeout Exception'))
+
+    def test_load_checkpoint_invalid(self):
+        r, broker = self._make_checkpointing_reaper()
+        with open(broker.db_file + '.reaper', 'w') as fp:
+            fp.write('not json')
+        r.load_checkpoint(broker)
+        self.assertEqual({'container_marker': '', 'object_markers': {}},
+                         r.checkpoint)
+        self.assertEqual(['Ignoring invalid reaper checkpoint %s.reaper' %
+                          broker.db_file],
+                         r.logger.get_lines_for_level('warning'))
+
+        # checkpointing is disabled by default
+        r = self.init_reaper({}, fakelogger=True)
+        r.load_checkpoint(broker)
+        self.assertIsNone(r.checkpoint)
+        r.set_object_marker('c', 'o')
+        self.assertIsNone(r.checkpoint)
+
     @patch('swift.account.reaper.Ring',
            lambda *args, **kwargs: unit.FakeRing())
     def test_reap_container_non_exist_policy_index(self):
@@ -602,6 +737,44 @@ class TestReaper(unittest.TestCase):
         self.assertEqual(self.r.account_ring.replica_count, 3)
         self.assertEqual(len(self.r.account_ring.devs), 3)
 
+    def test_reap_account_resumes_from_checkpoint(self):
+        self.r, broker = self._make_checkpointing_reaper(
+            {'container_marker': 'c2', 'object_markers': {'c3': 'o1'}})
+        r = self.r
+        r.start_time = time.time()
+        reaped = []
+        checkpoints = []
+
+        def fake_reap_container(account, partition, nodes, container):
+            reaped.append(container)
+            with open(r.checkpoint_file) as fp:
+                checkpoints.append(json.load(fp))
+            r.set_object_marker(container, None)
+
+        with patch('swift.account.reaper.AccountReaper.reap_container',
+                   side_effect=fake_reap_container), \
+                patch('swift.account.reaper.AccountReaper.get_account_ring',
+                      self.fake_account_ring):
+            nodes = r.get_account_ring().get_part_nodes()
+            self.assertTrue(r.reap_account(broker, 'partition', nodes))
+        self.assertEqual(['c3', 'c4'], reaped)
+        self.assertEqual(
+            {'container_marker': 'c2', 'object_markers': {'c3': 'o1'}},
+            checkpoints[0])
+        # the account listing is complete and no container has progress
+        # left to resume
+        self.assertFalse(os.path.exists(r.checkpoint_file))
+
+        # the next pass starts from the beginning
+        reaped[:] = []
+        checkpoints[:] = []
+        with patch('swift.account.reaper.AccountReaper.reap_container',
+                   side_effect=fake_reap_container), \
+                patch('swift.account.reaper.AccountReaper.get_account_ring',
+                      self.fake_account_ring):
+            self.assertTrue(r.reap_account(broker, 'partition', nodes))
+        self.assertEqual(['c1', 'c2', 'c3', 'c4'], reaped)
+
     def test_reap_account_no_container(self):
         broker = FakeAccountBroker(tuple(), debug_logger())
         self.r = r = self.init_reaper({}, fakelogger=True)
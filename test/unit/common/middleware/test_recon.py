@@ -808,14 +808,16 @@ class TestReconSuccess(TestCase):
         self.assertEqual(rv, {"container_updater_sweep": 18.476239919662476})
 
     def test_get_updater_info_object(self):
-        from_cache_response = {"object_updater_sweep": 0.79848217964172363}
+        from_cache_response = {"object_updater_sweep": 0.79848217964172363,
+                               "object_updater_journal_lag": {"sda1": 3}}
         self.fakecache.fakeout_calls = []
         self.fakecache.fakeout = from_cache_response
         rv = self.app.get_updater_info('object')
         self.assertEqual(self.fakecache.fakeout_calls,
-                         [((['object_updater_sweep'],
+                         [((['object_updater_sweep',
+                             'object_updater_journal_lag'],
                             '/var/cache/swift/object.recon'), {})])
-        self.assertEqual(rv, {"object_updater_sweep": 0.79848217964172363})
+        self.assertEqual(rv, from_cache_response)
 
     def test_get_updater_info_unrecognized(self):
         rv = self.app.get_updater_info('unrecognized_recon_type')
@@ -823,12 +825,14 @@ class TestReconSuccess(TestCase):
 
     def test_get_expirer_info_object(self):
         from_cache_response = {'object_expiration_pass': 0.79848217964172363,
-                               'expired_last_pass': 99}
+                               'expired_last_pass': 99,
+                               'expiration_backlog_age': 12.5}
         self.fakecache.fakeout_calls = []
         self.fakecache.fakeout = from_cache_response
         rv = self.app.get_expirer_info('object')
         self.assertEqual(self.fakecache.fakeout_calls,
-                         [((['object_expiration_pass', 'expired_last_pass'],
+                         [((['object_expiration_pass', 'expired_last_pass',
+                             'expiration_backlog_age'],
                             '/var/cache/swift/object.recon'), {})])
         self.assertEqual(rv, from_cache_response)
 
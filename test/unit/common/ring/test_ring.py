@@ -15,10 +15,13 @@
 
 import array
 import collections
+import errno
+import itertools
 import six.moves.cPickle as pickle
 import os
 import unittest
 import stat
+import struct
 from contextlib import closing
 from gzip import GzipFile
 from tempfile import mkdtemp
@@ -27,6 +30,7 @@ from time import sleep, time
 import sys
 import copy
 import mock
+import six
 
 from six.moves import range
 from swift.common import ring, utils
@@ -177,6 +181,71 @@ class TestRingData(unittest.TestCase):
             with open(ring_fname2, 'rb') as ring2:
                 self.assertEqual(ring1.read(), ring2.read())
 
+    def test_roundtrip_uncompressed_serialization(self):
+        ring_fname = os.path.join(self.testdir, 'foo.ring')
+        rd = ring.RingData(
+            [array.array('H', [0, 1, 0, 1]), array.array('H', [0, 1, 0, 1]),
+             array.array('H', [2, 3])],
+            [{'id': 0, 'zone': 0}, {'id': 1, 'zone': 1},
+             {'id': 2, 'zone': 2}, {'id': 3, 'zone': 3}], 30)
+        rd.save(ring_fname, compress=False)
+        with open(ring_fname, 'rb') as fp:
+            self.assertEqual(b'R1NG', fp.read(4))
+            fp.seek(6)
+            json_len, = struct.unpack('!I', fp.read(4))
+        # the partition table is aligned for mapping
+        self.assertEqual(0, (10 + json_len) % 8)
+
+        meta_only = ring.RingData.load(ring_fname, metadata_only=True)
+        self.assertEqual(4, len(meta_only.devs))
+        self.assertEqual([], meta_only._replica2part2dev_id)
+        file_size = os.path.getsize(ring_fname)
+        self.assertEqual(file_size, meta_only.size)
+        self.assertIsNone(meta_only.md5)
+
+        rd2 = ring.RingData.load(ring_fname)
+        self.assert_ring_data_equal(rd, rd2)
+        for part2dev_id in rd2._replica2part2dev_id:
+            self.assertIsInstance(part2dev_id, array.array)
+
+        rd3 = ring.RingData.load(ring_fname, use_mmap=True)
+        self.assert_ring_data_equal(rd, rd3)
+        self.assertEqual(2.5, rd3.replica_count)
+        for part2dev_id in rd3._replica2part2dev_id:
+            if six.PY2:
+                self.assertIsInstance(part2dev_id, array.array)
+            else:
+                self.assertIsInstance(part2dev_id, memoryview)
+                self.assertTrue(part2dev_id.readonly)
+
+        # mapped ring data can be written back out
+        gz_fname = os.path.join(self.testdir, 'foo.ring.gz')
+        rd3.save(gz_fname)
+        self.assert_ring_data_equal(rd, ring.RingData.load(gz_fname))
+
+    def test_byteswapped_uncompressed_serialization(self):
+        ring_fname = os.path.join(self.testdir, 'foo.ring')
+        data = [array.array('H', [0, 1, 0, 1]), array.array('H', [0, 1, 0, 1])]
+        swapped_data = copy.deepcopy(data)
+        for x in swapped_data:
+            x.byteswap()
+
+        with mock.patch.object(sys, 'byteorder',
+                               'big' if sys.byteorder == 'little'
+                               else 'little'):
+            rds = ring.RingData(swapped_data,
+                                [{'id': 0, 'zone': 0}, {'id': 1, 'zone': 1}],
+                                30)
+            rds.save(ring_fname, compress=False)
+
+        rd1 = ring.RingData(data, [{'id': 0, 'zone': 0}, {'id': 1, 'zone': 1}],
+                            30)
+        # can't map a table in the wrong byte order
+        rd2 = ring.RingData.load(ring_fname, use_mmap=True)
+        self.assert_ring_data_equal(rd1, rd2)
+        for part2dev_id in rd2._replica2part2dev_id:
+            self.assertIsInstance(part2dev_id, array.array)
+
     def test_permissions(self):
         ring_fname = os.path.join(self.testdir, 'stat.ring.gz')
         rd = ring.RingData(
@@ -997,6 +1066,144 @@ class TestRing(TestRingBase):
         self.assertEqual(sum(histogram.get(x, 0) for x in range(50, 100)), 0,
                          histogram)
 
+    def test_use_mmap(self):
+        self.assertFalse(self.ring.use_mmap)
+        self.assertEqual(os.path.join(self.testdir, 'whatever.ring'),
+                         self.ring.mmap_path)
+        self.assertFalse(os.path.exists(self.ring.mmap_path))
+
+        r = ring.Ring(self.testdir, ring_name='whatever', use_mmap=True)
+        self.assertTrue(r.use_mmap)
+        self.assertTrue(os.path.exists(r.mmap_path))
+        self.assertEqual(self.ring._replica2part2dev_id,
+                         r._replica2part2dev_id)
+        self.assertEqual(self.ring.devs, r.devs)
+        # the serialized ring's checksum is still reported
+        self.assertEqual(self.ring.md5, r.md5)
+        self.assertEqual(self.ring.size, r.size)
+        self.assertEqual(self.ring.raw_size, r.raw_size)
+        for part in range(r.partition_count):
+            self.assertEqual(self.ring.get_part_nodes(part),
+                             r.get_part_nodes(part))
+            self.assertEqual(list(self.ring.get_more_nodes(part)),
+                             list(r.get_more_nodes(part)))
+
+        # another ring reuses the existing copy, without walking its
+        # partition table
+        mmap_mtime = os.path.getmtime(r.mmap_path)
+        with mock.patch('swift.common.ring.ring.RingData.save') as mock_save, \
+                mock.patch('swift.common.ring.ring._get_assigned_dev_ids') \
+                as mock_walk:
+            r2 = ring.Ring(self.testdir, ring_name='whatever', use_mmap=True)
+        self.assertFalse(mock_save.called)
+        self.assertFalse(mock_walk.called)
+        self.assertEqual(mmap_mtime, os.path.getmtime(r2.mmap_path))
+        self.assertEqual(self.ring.devs, r2.devs)
+        self.assertEqual(self.ring.device_count, r2.device_count)
+        self.assertEqual(self.ring._num_assigned_devs,
+                         r2._num_assigned_devs)
+        self.assertEqual(self.ring._num_zones, r2._num_zones)
+
+    def test_use_mmap_reload(self):
+        os.utime(self.testgz, (time() - 300, time() - 300))
+        r = ring.Ring(self.testdir, reload_time=0.001, ring_name='whatever',
+                      use_mmap=True)
+        self.assertEqual(5, len(r.devs))
+        self.intended_devs.append(
+            {'id': 5, 'region': 0, 'zone': 3, 'weight': 1.0,
+             'ip': '10.1.1.1', 'port': 9876})
+        ring.RingData(
+            self.intended_replica2part2dev_id,
+            self.intended_devs, self.intended_part_shift).save(self.testgz)
+        sleep(0.1)
+        r.get_nodes('a')
+        self.assertEqual(6, len(r.devs))
+        # the copy was refreshed
+        self.assertEqual(6, len(ring.RingData.load(r.mmap_path).devs))
+
+    def test_use_mmap_unwritable(self):
+        with mock.patch('swift.common.ring.ring.NamedTemporaryFile',
+                        side_effect=OSError(errno.EACCES, 'nope')):
+            r = ring.Ring(self.testdir, ring_name='whatever', use_mmap=True)
+        self.assertFalse(os.path.exists(r.mmap_path))
+        # falls back to loading the serialized ring into memory
+        self.assertEqual(self.ring._replica2part2dev_id,
+                         r._replica2part2dev_id)
+        self.assertEqual(self.ring.md5, r.md5)
+
+    def test_use_mmap_bad_copy(self):
+        with open(self.ring.mmap_path, 'wb') as fp:
+            fp.write(b'R1NG\x00')
+        r = ring.Ring(self.testdir, ring_name='whatever', use_mmap=True)
+        self.assertEqual(self.ring._replica2part2dev_id,
+                         r._replica2part2dev_id)
+        self.assertEqual(5, len(ring.RingData.load(r.mmap_path).devs))
+
+    def _save_handoff_cache_ring(self):
+        rb = ring.RingBuilder(8, 3, 1)
+        for region in (1, 2):
+            for zone in (1, 2):
+                for port in range(6200, 6204):
+                    rb.add_dev({
+                        'region': region, 'zone': zone, 'weight': 1.0,
+                        'ip': '127.0.%d.%d' % (region, zone), 'port': port,
+                        'device': 'd%d' % port})
+        rb.rebalance()
+        rb.get_ring().save(self.testgz)
+
+    def test_get_more_nodes_handoff_cache(self):
+        self._save_handoff_cache_ring()
+        uncached = ring.Ring(self.testdir, ring_name='whatever')
+        cached = ring.Ring(self.testdir, ring_name='whatever',
+                           handoff_cache_size=1024)
+        self.assertEqual(0, uncached.handoff_cache_size)
+        self.assertEqual(1024, cached.handoff_cache_size)
+        for part in range(cached.partition_count):
+            expected = list(uncached.get_more_nodes(part))
+            # partially consume, then check the full sequence is the same
+            # once the rest of it has been computed and when it's all cached
+            self.assertEqual(expected[:2],
+                             list(itertools.islice(
+                                 cached.get_more_nodes(part), 2)))
+            self.assertEqual(expected, list(cached.get_more_nodes(part)))
+            self.assertEqual(expected, list(cached.get_more_nodes(part)))
+        self.assertFalse(uncached._handoff_cache)
+        self.assertEqual(cached.partition_count, len(cached._handoff_cache))
+
+        # the nodes handed out are copies, so callers may annotate them
+        node = next(cached.get_more_nodes(0))
+        node['backend_index'] = 1
+        self.assertNotIn('backend_index', next(cached.get_more_nodes(0)))
+        self.assertNotIn('backend_index', cached.devs[node['id']])
+
+        # cached sequences don't walk the partition table
+        with mock.patch.object(cached, '_iter_handoff_dev_ids') as mock_iter:
+            for part in range(cached.partition_count):
+                list(cached.get_more_nodes(part))
+        self.assertFalse(mock_iter.called)
+
+    def test_get_more_nodes_handoff_cache_bounded(self):
+        self._save_handoff_cache_ring()
+        r = ring.Ring(self.testdir, ring_name='whatever',
+                      handoff_cache_size=2)
+        next(r.get_more_nodes(1))
+        next(r.get_more_nodes(2))
+        next(r.get_more_nodes(1))
+        next(r.get_more_nodes(3))
+        # part 2 was the least recently used
+        self.assertEqual([1, 3], list(r._handoff_cache))
+
+    def test_get_more_nodes_handoff_cache_reset_on_reload(self):
+        self._save_handoff_cache_ring()
+        r = ring.Ring(self.testdir, ring_name='whatever',
+                      handoff_cache_size=10)
+        next(r.get_more_nodes(1))
+        self.assertEqual([1], list(r._handoff_cache))
+        r._reload()
+        self.assertEqual([1], list(r._handoff_cache))  # ring didn't change
+        r._reload(force=True)
+        self.assertFalse(r._handoff_cache)
+
 
 if __name__ == '__main__':
     unittest.main()
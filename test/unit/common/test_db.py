@@ -31,6 +31,7 @@ import time
 import random
 from mock import patch, MagicMock
 
+from eventlet import sleep, spawn
 from eventlet.timeout import Timeout
 from six.moves import range
 
@@ -41,11 +42,13 @@ from swift.common.constraints import \
     MAX_META_VALUE_LENGTH, MAX_META_COUNT, MAX_META_OVERALL_SIZE
 from swift.common.db import chexor, dict_factory, get_db_connection, \
     DatabaseBroker, DatabaseConnectionError, DatabaseAlreadyExists, \
-    GreenDBConnection, PICKLE_PROTOCOL, zero_like, TombstoneReclaimer
+    GreenDBConnection, PICKLE_PROTOCOL, zero_like, TombstoneReclaimer, \
+    PendingCommitter
 from swift.common.utils import normalize_timestamp, mkdirs, Timestamp
 from swift.common.exceptions import LockTimeout
 from swift.common.swob import HTTPException
 
+from test.debug_logger import debug_logger
 from test.unit import with_tempdir, make_timestamp_iter
 
 
@@ -1569,6 +1572,157 @@ class TestDatabaseBroker(unittest.TestCase):
             pending = fd.read()
         self.assertFalse(pending)
 
+    def test_put_record_pending_cap(self):
+        db_file = os.path.join(self.testdir, '1.db')
+        broker = DatabaseBroker(db_file, pending_cap=10)
+        self.assertEqual(10, broker.pending_cap)
+        broker._initialize = MagicMock()
+        broker.initialize(Timestamp.now())
+        broker.make_tuple_for_pickle = lambda x: x.upper()
+        with patch.object(broker, '_commit_puts') as mock_commit_puts:
+            broker.put_record('pinky')
+            mock_commit_puts.assert_not_called()
+            # the pending file is now bigger than the broker's cap
+            broker.put_record('perky')
+        mock_commit_puts.assert_called_once_with(['perky'])
+
+
+class TestPendingCommitter(unittest.TestCase):
+
+    def setUp(self):
+        self.testdir = mkdtemp()
+        self.ts = make_timestamp_iter()
+        self.logger = debug_logger()
+
+    def tearDown(self):
+        rmtree(self.testdir, ignore_errors=1)
+
+    def _make_broker(self, name='test.db'):
+        broker = ExampleBroker(os.path.join(self.testdir, name),
+                               account='a')
+        broker.initialize(next(self.ts).internal)
+        return broker
+
+    def _count(self, broker):
+        with broker.get() as conn:
+            return conn.execute('SELECT COUNT(*) FROM test').fetchone()[0]
+
+    def test_init(self):
+        with self.assertRaises(ValueError):
+            PendingCommitter(self.logger, 0)
+        committer = PendingCommitter(self.logger, 2.5, commit_size=10)
+        self.assertEqual(2.5, committer.interval)
+        self.assertEqual(10, committer.commit_size)
+
+    def test_commit_pending(self):
+        committer = PendingCommitter(self.logger, 30)
+        brokers = [self._make_broker(name) for name in ('1.db', '2.db')]
+        for i, broker in enumerate(brokers):
+            for j in range(i + 1):
+                broker.put_test('o%d' % j, next(self.ts).internal)
+        with patch('swift.common.db.spawn') as mock_spawn:
+            committer.add(brokers[0])
+            committer.add(brokers[1])
+            committer.add(brokers[1])
+        # the greenthread is started once
+        mock_spawn.assert_called_once_with(committer.run)
+        self.assertEqual([0, 0], [self._count(b) for b in brokers])
+        committer.commit_pending()
+        self.assertEqual([1, 2], [self._count(b) for b in brokers])
+        self.assertFalse(os.path.getsize(brokers[0].pending_file))
+        self.assertEqual(['pending_commit.lag'] * 2, [
+            call[0][0] for call in self.logger.log_dict['timing_since']])
+        # nothing more to do
+        committer.commit_pending()
+        self.assertEqual(2, len(self.logger.log_dict['timing_since']))
+
+    def test_commit_pending_errors(self):
+        committer = PendingCommitter(self.logger, 30)
+        broker = self._make_broker()
+        broker.put_test('o', next(self.ts).internal)
+        committer._run_gth = MagicMock()
+        committer.add(broker)
+        with patch('swift.common.db.lock_parent_directory',
+                   side_effect=LockTimeout(0.1)):
+            committer.commit_pending()
+        self.assertEqual(0, self._count(broker))
+        self.assertEqual({'pending_commit.timeouts': 1},
+                         self.logger.get_increment_counts())
+        # the broker is tried again
+        with patch.object(broker, '_commit_puts',
+                          side_effect=sqlite3.OperationalError('boom')):
+            committer.commit_pending()
+        self.assertEqual({'pending_commit.timeouts': 1,
+                          'pending_commit.errors': 1},
+                         self.logger.get_increment_counts())
+        self.assertEqual(1, len(self.logger.get_lines_for_level('error')))
+        # but not after an error
+        committer.commit_pending()
+        self.assertEqual(0, self._count(broker))
+        self.assertFalse(self.logger.log_dict['timing_since'])
+
+    def test_commit_pending_yields_between_brokers(self):
+        committer = PendingCommitter(self.logger, 30)
+        brokers = [self._make_broker(name) for name in ('1.db', '2.db')]
+        committer._run_gth = MagicMock()
+        events = []
+        for broker in brokers:
+            broker.put_test('o', next(self.ts).internal)
+            committer.add(broker)
+            broker._commit_puts = MagicMock(
+                side_effect=lambda: events.append('commit'))
+        spawn(events.append, 'request')
+        committer.commit_pending()
+        self.assertEqual(['commit', 'request', 'commit'], events)
+
+    def test_commit_pending_removed_db(self):
+        committer = PendingCommitter(self.logger, 30)
+        db_dir = os.path.join(self.testdir, 'db_dir')
+        os.mkdir(db_dir)
+        broker = self._make_broker(os.path.join('db_dir', 'test.db'))
+        broker.put_test('o', next(self.ts).internal)
+        committer._run_gth = MagicMock()
+        committer.add(broker)
+        rmtree(db_dir)
+        committer.commit_pending()
+        # the removed db dir is not recreated
+        self.assertFalse(os.path.exists(db_dir))
+        self.assertEqual({'pending_commit.skipped': 1},
+                         self.logger.get_increment_counts())
+        self.assertFalse(self.logger.get_lines_for_level('error'))
+        self.assertFalse(self.logger.log_dict['timing_since'])
+        # and is forgotten
+        committer.commit_pending()
+        self.assertEqual({'pending_commit.skipped': 1},
+                         self.logger.get_increment_counts())
+
+    def test_background_commits(self):
+        committer = PendingCommitter(self.logger, 0.05, commit_size=100)
+        broker = self._make_broker()
+        try:
+            broker.put_test('o1', next(self.ts).internal)
+            committer.add(broker)
+            self.assertEqual(0, self._count(broker))
+            # committed once the interval elapses
+            sleep(0.2)
+            self.assertEqual(1, self._count(broker))
+            committer.interval = 30
+            sleep(0.1)
+            # the pending file is small enough to wait for the interval
+            broker.put_test('o2', next(self.ts).internal)
+            committer.add(broker)
+            sleep(0.05)
+            self.assertEqual(1, self._count(broker))
+            # the pending file is big enough to be committed straight away
+            for i in range(3, 6):
+                broker.put_test('o%d' % i, next(self.ts).internal)
+            committer.add(broker)
+            sleep(0.05)
+            self.assertEqual(5, self._count(broker))
+        finally:
+            committer.stop()
+        self.assertIsNone(committer._run_gth)
+
 
 class TestTombstoneReclaimer(unittest.TestCase):
     def _make_object(self, broker, obj_name, ts, deleted):
@@ -1531,6 +1531,13 @@ class TestSimpleClient(unittest.TestCase):
                 headers={'X-Auth-Token': 'token'}, data=None)
             self.assertEqual([{'content-length': '345'}, {}], retval)
 
+            # same as above, now with marker and limit
+            retval = sc.retry_request(method, marker='m k', limit=10)
+            request.assert_called_with(
+                'http://127.0.0.1?format=json&marker=m%20k&limit=10',
+                headers={'X-Auth-Token': 'token'}, data=None)
+            self.assertEqual([{'content-length': '345'}, {}], retval)
+
             # same as above, now with container name
             retval = sc.retry_request(method, container='cont')
             request.assert_called_with('http://127.0.0.1/cont?format=json',
@@ -1718,7 +1725,8 @@ class TestSimpleClient(unittest.TestCase):
 
         # module level methods
         for func in (internal_client.put_object,
-                     internal_client.delete_object):
+                     internal_client.delete_object,
+                     internal_client.get_container):
             with mock.patch(mocked) as mock_urlopen:
                 mock_urlopen.return_value = FakeConn()
                 func(url, container='c', name='o1', contents='', proxy=proxy,
@@ -766,6 +766,48 @@ class TestMemcached(unittest.TestCase):
         self.assertEqual(memcache_client.get('some_key0'), [7, 8, 9])
         self.assertIn(key, mock2.cache)
 
+    def test_get_many(self):
+        memcache_client = memcached.MemcacheRing(['1.2.3.4:11211',
+                                                  '1.2.3.5:11211'],
+                                                 logger=self.logger)
+        mock1 = MockMemcached()
+        mock2 = MockMemcached()
+        memcache_client._client_cache['1.2.3.4:11211'] = MockedMemcachePool(
+            [(mock1, mock1)] * 2)
+        memcache_client._client_cache['1.2.3.5:11211'] = MockedMemcachePool(
+            [(mock2, mock2)] * 2)
+
+        # MemcacheRing will put 'some_key0' on server 1.2.3.5:11211 and
+        # 'some_key1' and 'some_key2' on '1.2.3.4:11211'
+        memcache_client.set('some_key0', [1, 2, 3])
+        memcache_client.set('some_key1', [4, 5, 6])
+        memcache_client.set('some_key2', [7, 8, 9])
+        self.assertEqual(1, len(mock2.cache))
+        self.assertEqual(2, len(mock1.cache))
+
+        with patch.object(mock1, 'handle_get',
+                          wraps=mock1.handle_get) as get1, \
+                patch.object(mock2, 'handle_get',
+                             wraps=mock2.handle_get) as get2:
+            self.assertEqual(memcache_client.get_many(
+                ['some_key1', 'some_key0', 'not_exists', 'some_key2',
+                 'some_key1']),
+                [[4, 5, 6], [1, 2, 3], None, [7, 8, 9], [4, 5, 6]])
+        # one multi-key get per server
+        self.assertEqual(1, get1.call_count)
+        self.assertEqual(1, get2.call_count)
+        self.assertEqual(1, len(get2.call_args[0]))
+        self.assertEqual([], self.logger.get_lines_for_level('error'))
+
+        # keys are fetched from the next server when a server is down
+        mock2.down = True
+        self.assertEqual(memcache_client.get_many(
+            ['some_key1', 'some_key0']), [[4, 5, 6], None])
+        error_lines = self.logger.get_lines_for_level('error')
+        self.assertEqual(1, len(error_lines))
+        self.assertIn('Error talking to memcached: 1.2.3.5:11211',
+                      error_lines[0])
+
     def test_serialization(self):
         memcache_client = memcached.MemcacheRing(['1.2.3.4:11211'],
                                                  allow_pickle=True,
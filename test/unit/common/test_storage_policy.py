@@ -1127,7 +1127,7 @@ class TestStoragePolicies(unittest.TestCase):
 
         class NamedFakeRing(FakeRing):
 
-            def __init__(self, swift_dir, ring_name=None):
+            def __init__(self, swift_dir, ring_name=None, **kwargs):
                 self.ring_name = ring_name
                 super(NamedFakeRing, self).__init__()
 
@@ -2310,6 +2310,50 @@ class TestPipelineModification(unittest.TestCase):
             'swift.common.middleware.versioned_writes',
             'swift.proxy.server'])
 
+    def _proxy_splice_app(self, pipe):
+        config = """
+        [DEFAULT]
+        swift_dir = TEMPDIR
+
+        [pipeline:main]
+        pipeline = %s
+
+        [app:proxy-server]
+        use = egg:swift#proxy
+        splice = yes
+
+        [filter:catch_errors]
+        use = egg:swift#catch_errors
+
+        [filter:proxy-logging]
+        use = egg:swift#proxy_logging
+
+        [filter:encryption]
+        use = egg:swift#encryption
+        """
+        contents = dedent(config % (pipe,))
+        with temptree(['proxy-server.conf']) as t:
+            conf_file = os.path.join(t, 'proxy-server.conf')
+            with open(conf_file, 'w') as f:
+                f.write(contents.replace('TEMPDIR', t))
+            _fake_rings(t)
+            with mock.patch('swift.proxy.server.splice',
+                            mock.Mock(available=True)):
+                app = wsgi.loadapp(conf_file, global_conf={})
+        while hasattr(app, 'app'):
+            app = app.app
+        self.assertIsInstance(app, swift.proxy.server.Application)
+        return app
+
+    def test_proxy_modify_wsgi_pipeline_splice(self):
+        app = self._proxy_splice_app(
+            'catch_errors proxy-logging proxy-server')
+        self.assertTrue(app.splice)
+
+        app = self._proxy_splice_app(
+            'catch_errors proxy-logging encryption proxy-server')
+        self.assertFalse(app.splice)
+
     @with_tempdir
     def test_loadapp_proxy(self, tempdir):
         conf_path = os.path.join(tempdir, 'proxy-server.conf')
@@ -3498,6 +3498,87 @@ class TestContainerBroker(unittest.TestCase):
                 self.assertEqual(rec['created_at'], Timestamp(5).internal)
                 self.assertEqual(rec['content_type'], 'text/plain')
 
+    def test_merge_items_bulk_and_python_merges_agree(self):
+        ts = [Timestamp(t) for t in range(1, 10)]
+        offset_ts = Timestamp(5, offset=1)
+
+        def make_item(name, t, size=0, deleted=0, policy=0, **kwargs):
+            item = {'name': name, 'created_at': t, 'size': size,
+                    'content_type': 'text/plain', 'etag': EMPTY_ETAG,
+                    'deleted': deleted, 'storage_policy_index': policy}
+            item.update(kwargs)
+            return item
+
+        def do_merges(broker):
+            broker.merge_items([
+                make_item('newer', ts[1].internal, 1),
+                make_item('older', ts[3].internal, 1),
+                make_item('equal', ts[3].internal, 1),
+                make_item('encoded', encode_timestamps(ts[2], ts[4])),
+                make_item('offset', offset_ts.internal, 1),
+                make_item('policy', ts[1].internal, 1, policy=1),
+                make_item('deleted', ts[1].internal, 1),
+            ])
+            broker.merge_items([
+                make_item('newer', ts[2].internal, 2),
+                make_item('older', ts[2].internal, 2),
+                make_item('equal', ts[3].internal, 2),
+                make_item('encoded', ts[3].internal, 2),
+                make_item('offset', ts[4].internal, 2),
+                make_item('policy', ts[2].internal, 2, policy=0),
+                make_item('deleted', ts[2].internal, deleted=1),
+                make_item('ctype', ts[2].internal, 2,
+                          ctype_timestamp=ts[3].internal),
+                make_item('ctype', ts[1].internal, 3),
+                make_item('dup', ts[3].internal, 3),
+                make_item('dup', ts[4].internal, 4),
+                make_item('dup', ts[4].internal, 5),
+                make_item('dup', ts[2].internal, 6),
+                make_item('new', ts[5].internal, 7),
+            ])
+
+        def check_merges(broker):
+            return (broker.get_info(),
+                    broker.get_policy_stats(),
+                    broker.get_items_since(-1, 1000))
+
+        broker = ContainerBroker(':memory:', account='a', container='c')
+        broker.initialize(ts[0].internal, 0)
+        do_merges(broker)
+        info, stats, items = check_merges(broker)
+        self.assertEqual(
+            {'ctype': (encode_timestamps(ts[2], ts[3], ts[3]), 2),
+             'deleted': (ts[2].internal, 0),
+             'dup': (ts[4].internal, 4),
+             'encoded': (encode_timestamps(ts[3], ts[4], ts[4]), 2),
+             'equal': (ts[3].internal, 1),
+             'new': (ts[5].internal, 7),
+             'newer': (ts[2].internal, 2),
+             'offset': (offset_ts.short, 1),
+             'older': (ts[3].internal, 1)},
+            dict((item['name'], (item['created_at'], item['size']))
+                 for item in items
+                 if item['storage_policy_index'] == 0 and
+                 item['name'] != 'policy'))
+
+        # the same merges made with every item merged in python
+        python_broker = ContainerBroker(
+            ':memory:', account='a', container='c')
+        python_broker.initialize(ts[0].internal, 0)
+        with mock.patch('swift.container.backend._is_plain_merge_item',
+                        return_value=False):
+            do_merges(python_broker)
+        python_info, python_stats, python_items = check_merges(python_broker)
+        for key in ('object_count', 'bytes_used', 'hash'):
+            self.assertEqual(python_info[key], info[key], key)
+        self.assertEqual(python_stats, stats)
+        sort_key = (lambda item: (item['name'],
+                                  item['storage_policy_index']))
+        for item in items + python_items:
+            item.pop('ROWID')
+        self.assertEqual(sorted(python_items, key=sort_key),
+                         sorted(items, key=sort_key))
+
     def test_set_storage_policy_index(self):
         ts = make_timestamp_iter()
         broker = ContainerBroker(':memory:', account='test_account',
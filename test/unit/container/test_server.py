@@ -1571,6 +1571,60 @@ class TestContainerController(unittest.TestCase):
              'content_type': 'foo/bar', 'last_modified': obj_ts.isoformat},
         ])
 
+    def test_UPDATE_with_shard_ranges(self):
+        ts_iter = make_timestamp_iter()
+        req = Request.blank(
+            '/sda1/p/a/c',
+            environ={'REQUEST_METHOD': 'PUT'},
+            headers={'X-Timestamp': next(ts_iter).internal})
+        resp = req.get_response(self.controller)
+        self.assertEqual(resp.status_int, 201)
+
+        sr = ShardRange('.shards_a/c', next(ts_iter), '', 'u', 0, 0,
+                        state=ShardRange.ACTIVE)
+        req = Request.blank(
+            '/sda1/p/a/c',
+            environ={'REQUEST_METHOD': 'PUT'},
+            headers={'X-Timestamp': next(ts_iter).internal,
+                     'X-Backend-Record-Type': 'shard'},
+            body=json.dumps([dict(sr)]))
+        resp = req.get_response(self.controller)
+        self.assertEqual(resp.status_int, 202)
+
+        obj_ts = next(ts_iter)
+        body = json.dumps([
+            {'name': 'some obj', 'deleted': 0,
+             'created_at': obj_ts.internal,
+             'etag': 'whatever', 'size': 1234,
+             'storage_policy_index': POLICIES.default.idx,
+             'content_type': 'foo/bar'}])
+
+        def do_update(headers):
+            headers['X-Timestamp'] = next(ts_iter).internal
+            req = Request.blank(
+                '/sda1/p/a/c', environ={'REQUEST_METHOD': 'UPDATE'},
+                headers=headers, body=body)
+            return req.get_response(self.controller)
+
+        def get_listing():
+            req = Request.blank(
+                '/sda1/p/a/c?format=json',
+                environ={'REQUEST_METHOD': 'GET'},
+                headers={'X-Backend-Record-Type': 'object'})
+            resp = req.get_response(self.controller)
+            self.assertEqual(resp.status_int, 200)
+            return [obj['name'] for obj in json.loads(resp.body)]
+
+        # a sender that accepts redirects is told to send the items singly
+        resp = do_update({'X-Backend-Accept-Redirect': 'true'})
+        self.assertEqual(resp.status_int, 409)
+        self.assertEqual([], get_listing())
+
+        # otherwise the items are merged, as before
+        resp = do_update({})
+        self.assertEqual(resp.status_int, 202)
+        self.assertEqual(['some obj'], get_listing())
+
     def test_UPDATE_autocreate(self):
         ts_iter = make_timestamp_iter()
         req = Request.blank(
@@ -1934,6 +1988,45 @@ class TestContainerController(unittest.TestCase):
         resp = req.get_response(self.controller)
         self.assertEqual(resp.status_int, 404)
 
+    def test_object_updates_with_pending_committer(self):
+        self.assertIsNone(self.controller.pending_committer)
+        self.assertEqual(131072, self.controller.pending_cap)
+        controller = container_server.ContainerController(
+            {'devices': self.testdir, 'mount_check': 'false',
+             'pending_cap': '1000000', 'pending_commit_interval': '2',
+             'pending_commit_size': '1000'}, logger=self.logger)
+        self.assertEqual(1000000, controller.pending_cap)
+        committer = controller.pending_committer
+        self.assertEqual(2, committer.interval)
+        self.assertEqual(1000, committer.commit_size)
+
+        req = Request.blank(
+            '/sda1/p/a/c', method='PUT', headers={
+                'X-Timestamp': next(self.ts).internal})
+        self.assertEqual(201, req.get_response(controller).status_int)
+        with mock.patch.object(committer, 'add', wraps=committer.add) \
+                as mock_add, mock.patch('swift.common.db.spawn'):
+            req = Request.blank(
+                '/sda1/p/a/c/o', method='PUT', headers={
+                    'X-Timestamp': next(self.ts).internal, 'X-Size': 1,
+                    'X-Content-Type': 'text/plain', 'X-Etag': 'x'})
+            self._update_object_put_headers(req)
+            self.assertEqual(201, req.get_response(controller).status_int)
+            req = Request.blank(
+                '/sda1/p/a/c/o', method='DELETE', headers={
+                    'X-Timestamp': next(self.ts).internal})
+            self._update_object_put_headers(req)
+            self.assertEqual(204, req.get_response(controller).status_int)
+        self.assertEqual(2, mock_add.call_count)
+        brokers = [call[0][0] for call in mock_add.call_args_list]
+        for broker in brokers:
+            self.assertEqual(1000000, broker.pending_cap)
+            self.assertTrue(os.path.getsize(broker.pending_file))
+        committer.commit_pending()
+        self.assertFalse(os.path.getsize(brokers[0].pending_file))
+        self.assertEqual(0, brokers[0].get_info()['object_count'])
+        self.assertEqual(1, len(brokers[0].get_items_since(-1, 10)))
+
     def test_object_update_with_offset(self):
         ts = (Timestamp(t).internal for t in
               itertools.count(int(time.time())))
@@ -3646,6 +3739,10 @@ class TestContainerController(unittest.TestCase):
             ShardRange.CREATED, ShardRange.CLEAVED, ShardRange.ACTIVE,
             ShardRange.SHARDING)
         headers = {'X-Backend-Accept-Redirect': 'true'}
+        # the object-server only wants redirects once sharding has started
+        if_sharding_headers = {'X-Backend-Accept-Redirect': 'true',
+                               'X-Backend-Accept-Redirect-If-Sharding': 'true'}
+        self.controller.redirect_sharding_updates = True
         for state in ShardRange.STATES:
             self.assertTrue(
                 sr_happy.update_state(state,
@@ -3667,6 +3764,11 @@ class TestContainerController(unittest.TestCase):
                 mock_get_shard_ranges.assert_not_called()
                 self.assertIn(obj_name,
                               [obj['name'] for obj in get_listing(-1)])
+                obj_name = 'grumpy%s_if_sharding' % state
+                with mock.patch(mocked_fn) as mock_get_shard_ranges:
+                    assert_not_redirected(obj_name,
+                                          headers=if_sharding_headers)
+                mock_get_shard_ranges.assert_not_called()
 
         # set broker to sharding state
         broker.enable_sharding(next(ts_iter))
@@ -3680,6 +3782,16 @@ class TestContainerController(unittest.TestCase):
                 obj_name = 'grumpier%s' % state
                 if state in redirect_states:
                     assert_redirected(obj_name, sr_happy, headers=headers)
+                    assert_redirected(obj_name + '_if_sharding', sr_happy,
+                                      headers=if_sharding_headers)
+                    # ...unless the container server doesn't honour them
+                    self.controller.redirect_sharding_updates = False
+                    with mock.patch(mocked_fn) as mock_get_shard_ranges:
+                        assert_not_redirected(
+                            obj_name + '_if_sharding_disabled',
+                            headers=if_sharding_headers)
+                    mock_get_shard_ranges.assert_not_called()
+                    self.controller.redirect_sharding_updates = True
                     self.assertNotIn(obj_name,
                                      [obj['name'] for obj in get_listing(-1)])
                 else:
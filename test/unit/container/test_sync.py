@@ -1346,6 +1346,198 @@ class TestContainerSync(unittest.TestCase):
             sync.put_object = orig_put_object
             sync.head_object = orig_head_object
 
+    def test_init_batch_options(self):
+        with mock.patch('swift.container.sync.InternalClient'):
+            cs = sync.ContainerSync({}, container_ring=FakeRing())
+        self.assertEqual(1, cs.batch_size)
+        self.assertEqual(1, cs.concurrency)
+        with mock.patch('swift.container.sync.InternalClient'):
+            cs = sync.ContainerSync({'batch_size': '100',
+                                     'concurrency': '8'},
+                                    container_ring=FakeRing())
+        self.assertEqual(100, cs.batch_size)
+        self.assertEqual(8, cs.concurrency)
+        for bad in ({'batch_size': '0'}, {'concurrency': '-1'},
+                    {'batch_size': 'many'}):
+            with mock.patch('swift.container.sync.InternalClient'):
+                self.assertRaises(ValueError, sync.ContainerSync, bad,
+                                  container_ring=FakeRing())
+
+    def test_container_sync_batches(self):
+        with mock.patch('swift.container.sync.InternalClient'):
+            cs = sync.ContainerSync({'batch_size': '3', 'concurrency': '2'},
+                                    container_ring=FakeRing(),
+                                    logger=self.logger)
+        fcb = FakeContainerBroker(
+            'path',
+            info={'account': 'a', 'container': 'c',
+                  'storage_policy_index': 0,
+                  'x_container_sync_point1': 4,
+                  'x_container_sync_point2': -1},
+            metadata={'x-container-sync-to': ('http://127.0.0.1/a/c', 1),
+                      'x-container-sync-key': ('key', 1)},
+            items_since=[{'ROWID': i, 'name': 'o%d' % i, 'deleted': True}
+                         for i in range(1, 7)])
+        sync_points = []
+        fcb.set_x_container_sync_points = \
+            lambda p1, p2: sync_points.append((p1, p2))
+        synced = []
+
+        def fake_container_sync_row(row, *args, **kwargs):
+            self.assertIsNone(kwargs['remote_timestamps'])
+            synced.append(row['name'])
+            return row['name'] != 'o2'
+
+        with mock.patch('swift.container.sync.ContainerBroker',
+                        lambda p, logger: fcb), \
+                mock.patch('swift.container.sync.hash_path',
+                           lambda *args, **kwargs: b'\x00' * 16), \
+                mock.patch.object(cs, 'container_sync_row',
+                                  fake_container_sync_row):
+            cs._myips = ['10.0.0.0']    # Match
+            cs._myport = 1000           # Match
+            cs.allowed_sync_hosts = ['127.0.0.1']
+            cs.container_sync('isa.db')
+        self.assertEqual(['o1', 'o2', 'o3', 'o4', 'o5', 'o6'], synced)
+        self.assertEqual(0, cs.container_failures)
+        self.assertEqual(1, cs.container_syncs)
+        # sync points are saved once per batch; sync point 2 falls back to
+        # the row before the failed one once the first loop is done
+        self.assertEqual([(None, 3), (None, 4), (None, 1), (6, None)],
+                         sync_points)
+
+    def test_list_remote_container(self):
+        with mock.patch('swift.container.sync.InternalClient'):
+            cs = sync.ContainerSync({}, container_ring=FakeRing(),
+                                    logger=self.logger)
+        cs.http_proxies = ['http://proxy']
+        pages = [
+            [{'name': 'a', 'last_modified': '1970-01-01T00:00:02.000000'},
+             {'name': 'aa', 'last_modified': '1970-01-01T00:00:03.000000'},
+             {'name': 'c', 'last_modified': '1970-01-01T00:00:04.000000'}],
+            [{'name': 'd', 'last_modified': '1970-01-01T00:00:05.000000'}],
+        ]
+        calls = []
+
+        def fake_get_container(url, **kwargs):
+            calls.append(kwargs)
+            return {}, pages.pop(0)
+
+        with mock.patch('swift.container.sync.get_container',
+                        fake_get_container), \
+                mock.patch('swift.container.sync.uuid.uuid4') as mock_uuid:
+            mock_uuid.return_value.hex = 'abcdef'
+            remote = cs._list_remote_container(
+                ['d', 'b', 'a'], 'http://sync/v1/a/c', 'key', 'US',
+                'realm_key')
+        self.assertEqual({'a': Timestamp(2), 'b': None, 'd': Timestamp(5)},
+                         remote)
+        self.assertEqual([('', 3), ('c', 1)],
+                         [(c['marker'], c['limit']) for c in calls])
+        for call in calls:
+            self.assertEqual('http://proxy', call['proxy'])
+            self.assertEqual(0, call['retries'])
+            # the listing is signed for the container path
+            expected_sig = cs.realms_conf.get_sig(
+                'GET', '/v1/a/c', call['headers']['x-timestamp'], 'abcdef',
+                'realm_key', 'key')
+            self.assertEqual('US abcdef %s' % expected_sig,
+                             call['headers']['x-container-sync-auth'])
+
+        # names that aren't reached within as many requests as there are
+        # names are left to be HEADed
+        pages = [[{'name': 'a%d' % i,
+                   'last_modified': '1970-01-01T00:00:02.000000'}
+                  for i in page] for page in ((0, 1), (2, 3))]
+        calls = []
+        with mock.patch('swift.container.sync.get_container',
+                        fake_get_container):
+            remote = cs._list_remote_container(
+                ['b', 'c'], 'http://sync/v1/a/c', 'key', 'US', 'realm_key')
+        self.assertEqual({}, remote)
+        self.assertEqual([('', 2), ('a1', 2)],
+                         [(c['marker'], c['limit']) for c in calls])
+        self.assertFalse(pages)
+
+        # listing errors leave every name to be HEADed
+        with mock.patch('swift.container.sync.get_container',
+                        side_effect=ClientException('boom', http_status=401)):
+            remote = cs._list_remote_container(
+                ['b', 'c'], 'http://sync/v1/a/c', 'key', 'US', 'realm_key')
+        self.assertEqual({}, remote)
+        self.assertIn('Unable to list remote container',
+                      self.logger.get_lines_for_level('debug')[-1])
+
+    def test_container_sync_rows(self):
+        with mock.patch('swift.container.sync.InternalClient'):
+            cs = sync.ContainerSync({'concurrency': '2'},
+                                    container_ring=FakeRing(),
+                                    logger=self.logger)
+        rows = [{'name': 'o1', 'deleted': False},
+                {'name': 'o2', 'deleted': True},
+                {'name': 'o3', 'deleted': False}]
+        listed = {'o1': Timestamp(1), 'o3': None}
+
+        with mock.patch.object(cs, '_list_remote_container',
+                               return_value=listed) as mock_list, \
+                mock.patch.object(cs, 'container_sync_row',
+                                  side_effect=[True, False, True]) as mock_row:
+            self.assertEqual([True, False, True], cs.container_sync_rows(
+                rows, 'http://sync/v1/a/c', 'key', 'broker', 'info', 'US',
+                'realm_key'))
+        mock_list.assert_called_once_with(
+            ['o1', 'o3'], 'http://sync/v1/a/c', 'key', 'US', 'realm_key')
+        self.assertEqual(
+            [mock.call(row, 'http://sync/v1/a/c', 'key', 'broker', 'info',
+                       'US', 'realm_key', remote_timestamps=listed)
+             for row in rows], mock_row.call_args_list)
+
+        # without a realm, or with only one live object, every object is
+        # HEADed as before
+        for realm, realm_key, batch in ((None, None, rows),
+                                        ('US', 'realm_key', rows[:2])):
+            with mock.patch.object(cs, '_list_remote_container') \
+                    as mock_list, \
+                    mock.patch.object(cs, 'container_sync_row',
+                                      return_value=True) as mock_row:
+                cs.container_sync_rows(batch, 'http://sync/v1/a/c', 'key',
+                                       'broker', 'info', realm, realm_key)
+            self.assertFalse(mock_list.called)
+            for call in mock_row.call_args_list:
+                self.assertIsNone(call[1]['remote_timestamps'])
+
+    def test_container_sync_row_put_remote_timestamps(self):
+        with mock.patch('swift.container.sync.InternalClient'):
+            cs = sync.ContainerSync({}, container_ring=FakeRing(),
+                                    logger=self.logger)
+        timestamp = Timestamp(1.2)
+        cs.swift.get_object.return_value = (
+            200, {'x-timestamp': timestamp.internal}, iter([b'contents']))
+        row = {'deleted': False, 'name': 'object',
+               'created_at': timestamp.internal, 'size': 8}
+
+        def do_sync(remote_timestamps):
+            with mock.patch('swift.container.sync.put_object') as mock_put, \
+                    mock.patch.object(cs, '_object_in_remote_container',
+                                      return_value=False) as mock_head:
+                self.assertTrue(cs.container_sync_row(
+                    row, 'http://sync/v1/a/c', 'key',
+                    FakeContainerBroker('broker'),
+                    {'account': 'a', 'container': 'c',
+                     'storage_policy_index': 0},
+                    'US', 'realm_key', remote_timestamps=remote_timestamps))
+            return mock_head.call_count, mock_put.call_count
+
+        # the remote is up to date
+        self.assertEqual((0, 0), do_sync({'object': timestamp}))
+        self.assertEqual((0, 0), do_sync({'object': Timestamp(2)}))
+        # the remote is out of date or doesn't have the object
+        self.assertEqual((0, 1), do_sync({'object': Timestamp(1)}))
+        self.assertEqual((0, 1), do_sync({'object': None}))
+        # the listing didn't cover the object
+        self.assertEqual((1, 1), do_sync({'other': None}))
+        self.assertEqual((1, 1), do_sync(None))
+
     def test_select_http_proxy_None(self):
 
         with mock.patch('swift.container.sync.InternalClient'):
@@ -0,0 +1,94 @@
+# Copyright (c) 2021 OpenStack Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import threading
+import unittest
+
+import eventlet
+import mock
+
+from swift.obj import disk_io
+from test.debug_logger import debug_logger
+
+
+class TestDiskIOExecutor(unittest.TestCase):
+
+    def test_get_disk_io_executor(self):
+        executor = disk_io.get_disk_io_executor(0)
+        self.assertIs(type(executor), disk_io.DiskIOExecutor)
+        executor = disk_io.get_disk_io_executor(2)
+        self.assertIsInstance(executor, disk_io.ThreadPoolDiskIOExecutor)
+        self.assertEqual(2, executor.threads_per_device)
+        with self.assertRaises(ValueError):
+            disk_io.ThreadPoolDiskIOExecutor(0)
+
+    def test_inline(self):
+        executor = disk_io.DiskIOExecutor()
+        with mock.patch('swift.obj.disk_io.tpool') as mock_tpool:
+            self.assertEqual(
+                (threading.current_thread(), 3),
+                executor.execute('/srv/node/sda', lambda x, y=0: (
+                    threading.current_thread(), x + y), 1, y=2))
+        self.assertFalse(mock_tpool.execute.called)
+
+    def test_thread_pool(self):
+        executor = disk_io.ThreadPoolDiskIOExecutor(1)
+        thread, result = executor.execute(
+            '/srv/node/sda', lambda x: (threading.current_thread(), x), 1)
+        self.assertEqual(1, result)
+        self.assertIsNot(threading.current_thread(), thread)
+
+        def boom():
+            raise IOError('boom')
+
+        with self.assertRaises(IOError):
+            executor.execute('/srv/node/sda', boom)
+        # the slot was released
+        self.assertFalse(executor._semaphores['/srv/node/sda'].locked())
+
+    def test_thread_pool_limits_calls_per_device(self):
+        logger = debug_logger()
+        executor = disk_io.ThreadPoolDiskIOExecutor(2, logger)
+        in_flight = {'sda': 0, 'sdb': 0}
+        max_in_flight = {'sda': 0, 'sdb': 0}
+        release = eventlet.event.Event()
+
+        def fake_execute(func, *args, **kwargs):
+            # run "in the pool" without blocking the hub
+            return func(*args, **kwargs)
+
+        def call(device):
+            in_flight[device] += 1
+            max_in_flight[device] = max(
+                max_in_flight[device], in_flight[device])
+            release.wait()
+            in_flight[device] -= 1
+
+        with mock.patch('swift.obj.disk_io.tpool.execute', fake_execute):
+            pool = eventlet.GreenPool()
+            for device in ('sda', 'sda', 'sda', 'sdb'):
+                pool.spawn(executor.execute, device, call, device)
+            eventlet.sleep(0)
+            self.assertEqual({'sda': 2, 'sdb': 1}, in_flight)
+            release.send()
+            pool.waitall()
+        self.assertEqual({'sda': 2, 'sdb': 1}, max_in_flight)
+        # only the call that had to wait for sda is timed
+        self.assertEqual(['disk_io.queue_wait'], [
+            call[0][0] for call in logger.log_dict['timing_since']])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -28,6 +28,7 @@ import threading
 import uuid
 import xattr
 import re
+import sqlite3
 import six
 from collections import defaultdict
 from random import shuffle, randint
@@ -45,7 +46,7 @@ from test.unit import (mock as unit_mock, temptree, mock_check_drive,
                        patch_policies, EMPTY_ETAG, make_timestamp_iter,
                        DEFAULT_TEST_EC_TYPE, requires_o_tmpfile_support_in_tmp,
                        encode_frag_archive_bodies, skip_if_no_xattrs)
-from swift.obj import diskfile
+from swift.obj import diskfile, disk_io
 from swift.common import utils
 from swift.common.utils import hash_path, mkdirs, Timestamp, \
     encode_timestamps, O_TMPFILE, md5 as _md5
@@ -1290,11 +1291,52 @@ class DiskFileManagerMixin(BaseDiskFileTestMixin):
                                   os.path.join(dp, 'tmp'))
         self.df_mgr.logger.increment.assert_called_with('async_pendings')
 
+    def test_pickle_async_update_journal(self):
+        dp = self.df_mgr.construct_dev_path(self.existing_device)
+        journal_path = os.path.join(dp, diskfile.ASYNC_JOURNAL_FILE)
+        ts = Timestamp(10000.0).internal
+        self.df_mgr.pickle_async_update(self.existing_device, 'a', 'c', 'o',
+                                        dict(a=1, b=2), ts, POLICIES[0])
+        self.assertFalse(os.path.exists(journal_path))
+
+        conf = dict(self.conf, async_pending_journal='true')
+        df_mgr = self.mgr_cls(conf, self.logger)
+        self.assertTrue(df_mgr.async_pending_journal)
+        for obj in ('o', 'o2'):
+            df_mgr.pickle_async_update(self.existing_device, 'a', 'c', obj,
+                                       dict(a=1, b=2), ts, POLICIES[1])
+        with open(journal_path) as fp:
+            self.assertEqual([
+                os.path.join(diskfile.get_async_dir(POLICIES[1]),
+                             diskfile.hash_path('a', 'c', obj)[-3:]) + '\n'
+                for obj in ('o', 'o2')], fp.readlines())
+
+        # a failure to journal does not fail the update
+        with mock.patch('swift.obj.diskfile.append_async_journal',
+                        side_effect=OSError('kaboom')):
+            df_mgr.pickle_async_update(self.existing_device, 'a', 'c', 'o3',
+                                       dict(a=1, b=2), ts, POLICIES[1])
+        ohash = diskfile.hash_path('a', 'c', 'o3')
+        self.assertTrue(os.path.exists(os.path.join(
+            dp, diskfile.get_async_dir(POLICIES[1]), ohash[-3:],
+            ohash + '-' + ts)))
+        self.assertEqual(['Unable to journal async pending in %s: ' % dp],
+                         self.logger.get_lines_for_level('error'))
+
     def test_object_audit_location_generator(self):
         locations = list(
             self.df_mgr.object_audit_location_generator(POLICIES[0]))
         self.assertEqual(locations, [])
 
+    def test_threads_per_disk_ignored(self):
+        conf = dict(threads_per_disk='4', **self.conf)
+        mgr = diskfile.DiskFileManager(conf, self.logger)
+        self.assertEqual(0, mgr.disk_io_threads_per_device)
+        self.assertIs(type(mgr.disk_io), disk_io.DiskIOExecutor)
+        log_lines = mgr.logger.get_lines_for_level('warning')
+        self.assertIn('threads_per_disk is no longer supported',
+                      log_lines[-1])
+
     def test_replication_one_per_device_deprecation(self):
         conf = dict(**self.conf)
         mgr = diskfile.DiskFileManager(conf, self.logger)
@@ -3937,6 +3979,27 @@ class DiskFileMixin(BaseDiskFileTestMixin):
             self.assertEqual(b''.join(reader.app_iter_range(5, None)),
                              df_data[5:])
 
+    def test_disk_io_threads_per_device(self):
+        self.conf['disk_io_threads_per_device'] = '2'
+        self.df_router = diskfile.DiskFileRouter(self.conf, self.logger)
+        df_mgr = self.df_router[POLICIES.default]
+        self.assertIsInstance(df_mgr.disk_io,
+                              disk_io.ThreadPoolDiskIOExecutor)
+        self.assertEqual(2, df_mgr.disk_io.threads_per_device)
+        dev_path = os.path.join(self.testdir, self.existing_device)
+        with mock.patch.object(df_mgr.disk_io, 'execute',
+                               wraps=df_mgr.disk_io.execute) as mock_execute:
+            df, df_data = self._create_test_file(b'1234567890')
+            self.assertEqual(1, mock_execute.call_count)
+            device, func, chunk = mock_execute.call_args[0]
+            self.assertEqual((dev_path, '_write_chunk', df_data),
+                             (device, func.__name__, chunk))
+            mock_execute.reset_mock()
+            self.assertEqual(df_data, b''.join(df.reader()))
+        # one read for the data and one to find the end of the file
+        self.assertEqual([dev_path, dev_path], [
+            call[0][0] for call in mock_execute.call_args_list])
+
     def test_disk_file_app_iter_range_w_none(self):
         df, df_data = self._create_test_file(b'1234567890')
         quarantine_msgs = []
@@ -8201,6 +8264,268 @@ class TestSuffixHashes(unittest.TestCase):
             for hsh_path in empty_hsh_paths:
                 self.assertFalse(os.path.exists(hsh_path))
 
+    def test_hash_suffix_with_fingerprints(self):
+        for policy in self.iter_policies():
+            self.conf['suffix_fingerprints'] = 'true'
+            df_mgr = diskfile.DiskFileRouter(self.conf, self.logger)[policy]
+            self.assertTrue(df_mgr.suffix_fingerprints)
+            df = df_mgr.get_diskfile('sda1', '0', 'a', 'c', 'o',
+                                     policy=policy)
+            ts = Timestamp(int(time()) - 100)
+            df.delete(ts)
+            suffix_dir = os.path.dirname(df._datadir)
+            suffix = os.path.basename(suffix_dir)
+            hsh = os.path.basename(df._datadir)
+            part_path = os.path.dirname(suffix_dir)
+            # the object dir was only just modified, so isn't fingerprinted
+            hashes = df_mgr.get_hashes('sda1', '0', [], policy)
+            self.assertEqual({suffix: {}},
+                             diskfile.read_suffix_fingerprints(part_path))
+
+            old = time() - 10
+            os.utime(df._datadir, (old, old))
+            hashes = df_mgr.get_hashes('sda1', '0', [suffix], policy)
+            fingerprints = diskfile.read_suffix_fingerprints(part_path)
+            self.assertEqual([suffix], list(fingerprints))
+            self.assertEqual([hsh], list(fingerprints[suffix]))
+            # the tombstone will need reclaiming eventually
+            self.assertEqual(float(ts), fingerprints[suffix][hsh][1])
+
+            # an unchanged object dir isn't listed again, and the unchanged
+            # fingerprints aren't written again...
+            with mock.patch.object(df_mgr, 'cleanup_ondisk_files') as mock_c, \
+                    mock.patch.object(diskfile, 'write_suffix_fingerprints') \
+                    as mock_w:
+                self.assertEqual(hashes, df_mgr.get_hashes(
+                    'sda1', '0', [suffix], policy))
+            self.assertFalse(mock_c.called)
+            self.assertFalse(mock_w.called)
+            # ...and the hash is the same as without fingerprints
+            plain_df_mgr = self.df_router[policy]
+            self.assertEqual(hashes, plain_df_mgr.get_hashes(
+                'sda1', '0', [suffix], policy))
+
+            # a changed object dir is rehashed
+            df.delete(Timestamp(int(time()) - 50))
+            os.utime(df._datadir, (old + 1, old + 1))
+            new_hashes = df_mgr.get_hashes('sda1', '0', [suffix], policy)
+            self.assertNotEqual(hashes, new_hashes)
+            self.assertEqual(new_hashes, plain_df_mgr.get_hashes(
+                'sda1', '0', [suffix], policy))
+
+            # a tombstone is still reclaimed once it's old enough
+            df_mgr.reclaim_age = 10
+            self.assertEqual({}, df_mgr.get_hashes(
+                'sda1', '0', [suffix], policy))
+            self.assertFalse(os.path.exists(df._datadir))
+            self.assertEqual({}, diskfile.read_suffix_fingerprints(part_path))
+
+    def test_hash_suffix_with_fingerprints_data(self):
+        for policy in self.iter_policies():
+            self.conf['suffix_fingerprints'] = 'true'
+            df_mgr = diskfile.DiskFileRouter(self.conf, self.logger)[policy]
+            plain_df_mgr = self.df_router[policy]
+            ts = self.ts()
+            df = df_mgr.get_diskfile('sda1', '0', 'a', 'c', 'o',
+                                     policy=policy, frag_index=2)
+            write_diskfile(df, ts)
+            suffix_dir = os.path.dirname(df._datadir)
+            suffix = os.path.basename(suffix_dir)
+            part_path = os.path.dirname(suffix_dir)
+            old = time() - 10
+            os.utime(df._datadir, (old, old))
+
+            expected = plain_df_mgr.get_hashes('sda1', '0', [suffix], policy)
+            self.assertEqual(expected, df_mgr.get_hashes(
+                'sda1', '0', [suffix], policy))
+            fingerprints = diskfile.read_suffix_fingerprints(part_path)
+            # durable data files never need reclaiming
+            self.assertEqual([float('inf')], [
+                fp[1] for fp in fingerprints[suffix].values()])
+            with mock.patch.object(df_mgr, 'cleanup_ondisk_files') as mock_c:
+                self.assertEqual(expected, df_mgr.get_hashes(
+                    'sda1', '0', [suffix], policy))
+            self.assertFalse(mock_c.called)
+
+    def test_object_index(self):
+        for policy in self.iter_policies():
+            self.conf['object_index'] = 'true'
+            df_mgr = diskfile.DiskFileRouter(self.conf, self.logger)[policy]
+            self.assertTrue(df_mgr.object_index)
+            plain_df_mgr = self.df_router[policy]
+            self.assertFalse(plain_df_mgr.object_index)
+            df = df_mgr.get_diskfile('sda1', '0', 'a', 'c', 'o',
+                                     policy=policy, frag_index=2)
+            ts = self.ts()
+            write_diskfile(df, ts)
+            suffix_dir = os.path.dirname(df._datadir)
+            suffix = os.path.basename(suffix_dir)
+            hsh = os.path.basename(df._datadir)
+            index = df_mgr.get_object_index(
+                os.path.join(self.devices, 'sda1'),
+                diskfile.get_data_dir(policy))
+            # the write was recorded...
+            self.assertEqual([(suffix, hsh, sorted(
+                os.listdir(df._datadir), reverse=True))],
+                index.get_hash_dirs('0'))
+            # ...but the index isn't used until it has been rebuilt
+            self.assertFalse(index.is_complete())
+            expected = list(plain_df_mgr.yield_hashes('sda1', '0', policy))
+            self.assertEqual(1, len(expected))
+            self.assertEqual({'added': 0, 'removed': 0, 'updated': 0},
+                             df_mgr.rebuild_object_index('sda1', policy))
+            self.assertTrue(index.is_complete())
+            with mock.patch.object(df_mgr, 'cleanup_ondisk_files') as mock_c:
+                self.assertEqual(expected, list(
+                    df_mgr.yield_hashes('sda1', '0', policy)))
+                self.assertEqual(expected, list(df_mgr.yield_hashes(
+                    'sda1', '0', policy, suffixes=[suffix])))
+                self.assertEqual([], list(df_mgr.yield_hashes(
+                    'sda1', '0', policy, suffixes=['fff'])))
+                self.assertEqual([], list(
+                    df_mgr.yield_hashes('sda1', '1', policy)))
+            self.assertFalse(mock_c.called)
+            locations = list(df_mgr.object_audit_location_generator(policy))
+            self.assertEqual([df._datadir],
+                             [loc.path for loc in locations])
+
+            # a delete is recorded
+            df = df_mgr.get_diskfile('sda1', '0', 'a', 'c', 'o',
+                                     policy=policy, frag_index=2)
+            df.delete(self.ts())
+            expected = list(plain_df_mgr.yield_hashes('sda1', '0', policy))
+            self.assertEqual(expected, list(
+                df_mgr.yield_hashes('sda1', '0', policy)))
+            self.assertEqual([(suffix, hsh, os.listdir(df._datadir))],
+                             index.get_hash_dirs('0'))
+
+            # the index catches up with changes made behind its back when
+            # the suffix is rehashed...
+            rmtree(df._datadir)
+            df_mgr.get_hashes('sda1', '0', [suffix], policy)
+            self.assertEqual([], index.get_hash_dirs('0'))
+            self.assertEqual([], list(
+                df_mgr.yield_hashes('sda1', '0', policy)))
+
+            # ...or when it is rebuilt
+            df = plain_df_mgr.get_diskfile('sda1', '0', 'a', 'c', 'o2',
+                                           policy=policy, frag_index=2)
+            write_diskfile(df, self.ts())
+            self.assertEqual([], index.get_hash_dirs('0'))
+            self.assertEqual({'added': 1, 'removed': 0, 'updated': 0},
+                             df_mgr.rebuild_object_index('sda1', policy))
+            self.assertEqual(
+                list(plain_df_mgr.yield_hashes('sda1', '0', policy)),
+                list(df_mgr.yield_hashes('sda1', '0', policy)))
+            rmtree(os.path.dirname(os.path.dirname(df._datadir)))
+            self.assertEqual([], list(
+                df_mgr.yield_hashes('sda1', '0', policy)))
+            self.assertEqual({'added': 0, 'removed': 1, 'updated': 0},
+                             df_mgr.rebuild_object_index('sda1', policy))
+            self.assertEqual([], index.get_partitions())
+
+    def test_object_index_reclaims_tombstones(self):
+        for policy in self.iter_policies():
+            self.conf['object_index'] = 'true'
+            df_mgr = diskfile.DiskFileRouter(self.conf, self.logger)[policy]
+            df = df_mgr.get_diskfile('sda1', '0', 'a', 'c', 'o',
+                                     policy=policy, frag_index=2)
+            df.delete(Timestamp(int(time()) - 100))
+            df_mgr.rebuild_object_index('sda1', policy)
+            self.assertEqual(1, len(list(
+                df_mgr.yield_hashes('sda1', '0', policy))))
+            df_mgr.reclaim_age = 10
+            self.assertEqual([], list(
+                df_mgr.yield_hashes('sda1', '0', policy)))
+            self.assertFalse(os.path.exists(df._datadir))
+            index = df_mgr.get_object_index(
+                os.path.join(self.devices, 'sda1'),
+                diskfile.get_data_dir(policy))
+            self.assertEqual([], index.get_hash_dirs('0'))
+
+    def test_object_index_removals(self):
+        for policy in self.iter_policies():
+            self.conf['object_index'] = 'true'
+            df_mgr = diskfile.DiskFileRouter(self.conf, self.logger)[policy]
+            index = df_mgr.get_object_index(
+                os.path.join(self.devices, 'sda1'),
+                diskfile.get_data_dir(policy))
+            df_mgr.rebuild_object_index('sda1', policy)
+
+            # cleanup of obsolete files
+            df = df_mgr.get_diskfile('sda1', '0', 'a', 'c', 'o',
+                                     policy=policy, frag_index=2)
+            ts = self.ts()
+            write_diskfile(df, ts)
+            with mock.patch.object(df_mgr, 'cleanup_ondisk_files'):
+                df.delete(self.ts())
+            self.assertEqual(2, len(os.listdir(df._datadir)))
+            df_mgr.cleanup_ondisk_files(df._datadir)
+            self.assertEqual(
+                [os.listdir(df._datadir)],
+                [files for _s, _h, files in index.get_hash_dirs('0')])
+
+            # quarantine
+            df_mgr.quarantine_renamer(
+                os.path.join(self.devices, 'sda1'),
+                os.path.join(df._datadir, 'made-up-filename'))
+            self.assertFalse(os.path.exists(df._datadir))
+            self.assertEqual([], index.get_hash_dirs('0'))
+            self.assertEqual([], list(
+                df_mgr.yield_hashes('sda1', '0', policy)))
+
+            if policy.policy_type != EC_POLICY:
+                continue
+            # purge
+            write_diskfile(df, ts)
+            self.assertEqual(1, len(index.get_hash_dirs('0')))
+            df.purge(ts, 2)
+            self.assertFalse(os.path.exists(df._datadir))
+            self.assertEqual([], index.get_hash_dirs('0'))
+            self.assertEqual([], list(
+                df_mgr.yield_hashes('sda1', '0', policy)))
+
+    def test_object_index_unindex_partition(self):
+        self.conf['object_index'] = 'true'
+        df_mgr = diskfile.DiskFileRouter(self.conf, self.logger)[POLICIES[0]]
+        df = df_mgr.get_diskfile('sda1', '0', 'a', 'c', 'o',
+                                 policy=POLICIES[0], frag_index=2)
+        write_diskfile(df, self.ts())
+        df_mgr.rebuild_object_index('sda1', POLICIES[0])
+        index = df_mgr.get_object_index(
+            os.path.join(self.devices, 'sda1'),
+            diskfile.get_data_dir(POLICIES[0]))
+        part_path = os.path.join(self.devices, 'sda1',
+                                 diskfile.get_data_dir(POLICIES[0]), '0')
+        # a partition that still exists can't be unindexed
+        df_mgr.unindex_partition(part_path)
+        self.assertEqual(['0'], index.get_partitions())
+        self.assertFalse(index.is_complete())
+        df_mgr.rebuild_object_index('sda1', POLICIES[0])
+        rmtree(part_path)
+        df_mgr.unindex_partition(part_path)
+        self.assertEqual([], index.get_partitions())
+        self.assertTrue(index.is_complete())
+
+    def test_object_index_update_error(self):
+        self.conf['object_index'] = 'true'
+        df_mgr = diskfile.DiskFileRouter(self.conf, self.logger)[POLICIES[0]]
+        df = df_mgr.get_diskfile('sda1', '0', 'a', 'c', 'o',
+                                 policy=POLICIES[0], frag_index=2)
+        write_diskfile(df, self.ts())
+        self.assertEqual({'added': 0, 'removed': 0, 'updated': 0},
+                         df_mgr.rebuild_object_index('sda1', POLICIES[0]))
+        index = df_mgr.get_object_index(
+            os.path.join(self.devices, 'sda1'),
+            diskfile.get_data_dir(POLICIES[0]))
+        self.assertTrue(index.is_complete())
+        with mock.patch.object(index, 'refresh_hash_dir',
+                               side_effect=sqlite3.OperationalError('boom')):
+            write_diskfile(df, self.ts())
+        self.assertFalse(index.is_complete())
+        self.assertIn('Unable to update object index',
+                      self.logger.get_lines_for_level('error')[0])
+
     # get_hashes tests - hash_suffix error handling
 
     def test_hash_suffix_listdir_enotdir(self):
@@ -8944,6 +9269,23 @@ class TestHashesHelpers(unittest.TestCase):
         # with the exactly the same value mutation from write_hashes
         self.assertEqual(hashes, result)
 
+    def test_read_write_suffix_fingerprints(self):
+        self.assertEqual({}, diskfile.read_suffix_fingerprints(self.testdir))
+        fingerprints = {'abc': {'fake': ((1, 2.0), 3.0, ((None, 'x'),))}}
+        diskfile.write_suffix_fingerprints(self.testdir, fingerprints)
+        self.assertEqual(fingerprints,
+                         diskfile.read_suffix_fingerprints(self.testdir))
+
+        fingerprints_file = os.path.join(self.testdir,
+                                         diskfile.HASH_FINGERPRINTS_FILE)
+        for corrupt in (b'garbage', pickle.dumps(['abc']),
+                        pickle.dumps({'valid': {}}),
+                        pickle.dumps({'abc': None})):
+            with open(fingerprints_file, 'wb') as f:
+                f.write(corrupt)
+            self.assertEqual(
+                {}, diskfile.read_suffix_fingerprints(self.testdir))
+
     def test_ignore_corrupted_hashes(self):
         corrupted_hashes = {u'\x00\x00\x00': False, 'valid': True}
         diskfile.write_hashes(self.testdir, corrupted_hashes)
@@ -22,6 +22,8 @@ from shutil import rmtree
 from collections import defaultdict
 from copy import deepcopy
 
+import eventlet
+import json
 import mock
 import six
 from six.moves import urllib
@@ -93,6 +95,11 @@ class FakeInternalClient(object):
     def make_request(*a, **kw):
         pass
 
+    def make_path(self, account, container=None, obj=None):
+        return '/'.join(
+            ['', 'v1'] + [urllib.parse.quote(part)
+                          for part in (account, container, obj) if part])
+
 
 class TestObjectExpirer(TestCase):
     maxDiff = None
@@ -168,6 +175,21 @@ class TestObjectExpirer(TestCase):
         ])
         self.assertEqual(x.expiring_objects_account, '-expiring_objects')
 
+    def test_init_batching_options(self):
+        x = expirer.ObjectExpirer({}, logger=self.logger)
+        self.assertEqual(1, x.listing_concurrency)
+        self.assertEqual(1, x.delete_batch_size)
+        x = expirer.ObjectExpirer({'listing_concurrency': '4',
+                                   'delete_batch_size': '100'},
+                                  logger=self.logger)
+        self.assertEqual(4, x.listing_concurrency)
+        self.assertEqual(100, x.delete_batch_size)
+        for conf in ({'listing_concurrency': '0'},
+                     {'delete_batch_size': '-1'},
+                     {'delete_batch_size': 'foo'}):
+            with self.assertRaises(ValueError):
+                expirer.ObjectExpirer(conf, logger=self.logger)
+
     def test_get_process_values_from_kwargs(self):
         x = expirer.ObjectExpirer({})
         vals = {
@@ -386,6 +408,38 @@ class TestObjectExpirer(TestCase):
         self.assertTrue(
             'so far' in str(x.logger.get_lines_for_level('info')))
 
+    def test_report_backlog_age(self):
+        x = expirer.ObjectExpirer(self.conf, logger=self.logger)
+        x.report_first_time = 1000.0
+        x.report(final=True)
+        self.assertEqual([('backlog_age', 0)],
+                         [args for args, kwargs in
+                          x.logger.log_dict['timing']])
+        self.assertEqual(0, utils.load_recon_cache(
+            self.rcache + '/object.recon')['expiration_backlog_age'])
+
+        x.logger.clear()
+        x.oldest_task_timestamp = Timestamp(900)
+        x.report(final=True)
+        self.assertEqual([('backlog_age', 100000.0)],
+                         [args for args, kwargs in
+                          x.logger.log_dict['timing']])
+        self.assertEqual(100.0, utils.load_recon_cache(
+            self.rcache + '/object.recon')['expiration_backlog_age'])
+
+    def test_run_once_tracks_backlog_age(self):
+        with mock.patch.object(self.expirer, 'delete_actual_object'), \
+                mock.patch.object(self.expirer, 'pop_queue'):
+            self.expirer.run_once()
+        self.assertEqual(Timestamp(self.past_time),
+                         self.expirer.oldest_task_timestamp)
+        backlog_age = utils.load_recon_cache(
+            self.rcache + '/object.recon')['expiration_backlog_age']
+        self.assertGreaterEqual(backlog_age, 86400)
+        self.assertIn('backlog_age', [
+            args[0] for args, kwargs in
+            self.expirer.logger.log_dict['timing']])
+
     def test_parse_task_obj(self):
         x = expirer.ObjectExpirer(self.conf, logger=self.logger)
 
@@ -684,6 +738,216 @@ class TestObjectExpirer(TestCase):
                 task_account_container_list, my_index, divisor)),
             expected)
 
+    def test_iter_task_to_expire_listing_concurrency(self):
+        other_time = str(int(self.past_time) - 3600)
+        aco_dict = deepcopy(self.fake_swift.aco_dict)
+        aco_dict['.expiring_objects'][other_time] = [
+            other_time + '-a%d/c%d/o%d' % (i, i, i) for i in range(3)]
+        aco_dict['.expiring_objects']['empty'] = []
+        fake_swift = FakeInternalClient(aco_dict)
+        task_account_container_list = [
+            ('.expiring_objects', self.past_time),
+            ('.expiring_objects', 'empty'),
+            ('.expiring_objects', other_time)]
+        expected = [
+            self.make_task(self.past_time, target_path)
+            for target_path in self.expired_target_path_list] + [
+            self.make_task(other_time, 'a%d/c%d/o%d' % (i, i, i))
+            for i in range(3)]
+
+        def sort_key(task):
+            return task['task_object']
+
+        for listing_concurrency in (1, 2, 5):
+            x = expirer.ObjectExpirer(
+                dict(self.conf, listing_concurrency=listing_concurrency),
+                logger=self.logger, swift=fake_swift)
+            tasks = list(x.iter_task_to_expire(
+                task_account_container_list, 0, 1))
+            self.assertEqual(sorted(expected, key=sort_key),
+                             sorted(tasks, key=sort_key))
+            self.assertEqual(Timestamp(other_time), x.oldest_task_timestamp)
+
+    def test_iter_task_to_expire_listing_concurrency_error(self):
+        x = expirer.ObjectExpirer(
+            dict(self.conf, listing_concurrency=2),
+            logger=self.logger, swift=self.fake_swift)
+        real_iter_objects = self.fake_swift.iter_objects
+
+        def fake_iter_objects(account, container):
+            if container == 'bad':
+                raise Exception('kaboom')
+            return real_iter_objects(account, container)
+
+        task_account_container_list = [
+            ('.expiring_objects', 'bad'),
+            ('.expiring_objects', self.past_time)]
+        with mock.patch.object(self.fake_swift, 'iter_objects',
+                               fake_iter_objects):
+            tasks = list(x.iter_task_to_expire(
+                task_account_container_list, 0, 1))
+        self.assertEqual(
+            [self.make_task(self.past_time, target_path)
+             for target_path in self.expired_target_path_list], tasks)
+        self.assertEqual(['Exception while listing tasks: '],
+                         self.logger.get_lines_for_level('error'))
+
+    def test_iter_delete_batches(self):
+        x = expirer.ObjectExpirer(dict(self.conf, delete_batch_size=2),
+                                  logger=self.logger)
+        tasks = [self.make_task(self.past_time, target)
+                 for target in ('a/c1/o1', 'a/c2/o1', 'a/c1/o2', 'a/c1/o3',
+                                'a/c2/o2', 'a/c3/o1', 'bad')]
+        self.assertEqual([
+            [tasks[0], tasks[2]],
+            [tasks[1], tasks[4]],
+            [tasks[3]],
+            [tasks[5]],
+        ], list(x.iter_delete_batches(iter(tasks))))
+        self.assertEqual(1, len(self.logger.get_lines_for_level('error')))
+
+        # partial batches are flushed when too many tasks are cached
+        with mock.patch('swift.obj.expirer.MAX_OBJECTS_TO_CACHE', 1):
+            self.assertEqual([
+                [tasks[0]],
+                [tasks[1]],
+                [tasks[2], tasks[3]],
+                [tasks[4]],
+                [tasks[5]],
+            ], list(x.iter_delete_batches(iter(tasks[:6]))))
+
+    def test_spawn_delete_batches(self):
+        x = expirer.ObjectExpirer(dict(self.conf, delete_batch_size=2),
+                                  logger=self.logger)
+        batches = [[self.make_task(self.past_time, target)]
+                   for target in ('a/c1/o1', 'a/c2/o1', 'a/c1/o/2')]
+        events = []
+
+        def fake_delete_objects(delete_tasks):
+            target = delete_tasks[0]['target_path']
+            events.append(('start', target))
+            eventlet.sleep(0.01)
+            events.append(('end', target))
+
+        pool = eventlet.GreenPool(3)
+        with mock.patch.object(x, 'delete_objects',
+                               side_effect=fake_delete_objects):
+            x.spawn_delete_batches(pool, iter(batches))
+            pool.waitall()
+        # batches for different target containers are deleted concurrently,
+        # but the second batch for a/c1 waits for the first
+        self.assertEqual([
+            ('start', 'a/c1/o1'),
+            ('start', 'a/c2/o1'),
+            ('end', 'a/c1/o1'),
+            ('end', 'a/c2/o1'),
+            ('start', 'a/c1/o/2'),
+            ('end', 'a/c1/o/2'),
+        ], events)
+
+    def test_delete_objects(self):
+        x = expirer.ObjectExpirer(dict(self.conf, delete_batch_size=10),
+                                  logger=self.logger)
+        reclaim_time = str(int(time() - x.reclaim_age - 1))
+        tasks = [self.make_task(self.past_time, 'a/c/o0'),
+                 self.make_task(self.past_time, 'a/c/o1'),
+                 self.make_task(reclaim_time, 'a/c/o2'),
+                 self.make_task(self.past_time, 'a/c/o3')]
+
+        def fake_delete_actual_object(target_path, timestamp,
+                                      is_async_delete):
+            if target_path == 'a/c/o1':
+                raise internal_client.UnexpectedResponse(
+                    '404', swob.HTTPException(status=404))
+            if target_path == 'a/c/o2':
+                raise internal_client.UnexpectedResponse(
+                    '412', swob.HTTPException(status=412))
+
+        with mock.patch.object(x, 'delete_actual_object',
+                               side_effect=fake_delete_actual_object), \
+                mock.patch.object(x, 'pop_queue_entries') as mock_pop:
+            x.delete_objects(tasks)
+        # the 404 is retried later; the old 412 is given up on
+        self.assertEqual([
+            mock.call('.expiring_objects', self.past_time,
+                      [self.past_time + '-a/c/o0',
+                       self.past_time + '-a/c/o3']),
+            mock.call('.expiring_objects', reclaim_time,
+                      [reclaim_time + '-a/c/o2']),
+        ], mock_pop.call_args_list)
+        self.assertEqual(3, x.report_objects)
+        self.assertEqual({'errors': 1}, self.logger.get_increment_counts())
+        self.assertEqual([(('objects', 2), {}), (('objects', 1), {})],
+                         self.logger.log_dict['update_stats'])
+        self.assertEqual([
+            'Unexpected response while deleting object .expiring_objects '
+            '%s %s-a/c/o1: 404' % (self.past_time, self.past_time)],
+            self.logger.get_lines_for_level('error'))
+        self.assertEqual(4, len(self.logger.log_dict['timing_since']))
+
+        # a failed pop counts an error for each entry
+        self.logger.clear()
+        with mock.patch.object(x, 'delete_actual_object'), \
+                mock.patch.object(x, 'pop_queue_entries',
+                                  side_effect=Exception('kaboom')):
+            x.delete_objects(tasks[:2])
+        self.assertEqual(3, x.report_objects)
+        self.assertEqual([(('errors', 2), {})],
+                         self.logger.log_dict['update_stats'])
+        self.assertEqual([
+            'Exception while popping 2 queue entries from .expiring_objects '
+            '%s kaboom: ' % self.past_time],
+            self.logger.get_lines_for_level('error'))
+
+    def test_pop_queue_entries(self):
+        x = expirer.ObjectExpirer({}, logger=self.logger,
+                                  swift=FakeInternalClient({}))
+        with mock.patch.object(x.swift, 'make_request') as mock_request, \
+                mock.patch('swift.obj.expirer.Timestamp.now',
+                           return_value=Timestamp(1000)):
+            x.pop_queue_entries('.expiring_objects', '1000',
+                                ['1000-a/c/o1', u'1000-a/c/o2\u2661'])
+        self.assertEqual(1, mock_request.call_count)
+        args, kwargs = mock_request.call_args
+        self.assertEqual(('UPDATE', '/v1/.expiring_objects/1000'), args)
+        self.assertEqual({'X-Backend-Allow-Private-Methods': 'True',
+                          'X-Backend-Storage-Policy-Index': '0',
+                          'X-Timestamp': Timestamp(1000).internal},
+                         kwargs['headers'])
+        self.assertEqual((2,), kwargs['acceptable_statuses'])
+        self.assertEqual([{
+            'name': name,
+            'deleted': 1,
+            'created_at': Timestamp(1000).internal,
+            'etag': 'noetag',
+            'size': 0,
+            'storage_policy_index': 0,
+            'content_type': 'application/deleted',
+        } for name in ('1000-a/c/o1', u'1000-a/c/o2\u2661')],
+            json.loads(kwargs['body_file'].read()))
+
+    def test_run_once_delete_batches(self):
+        x = expirer.ObjectExpirer(
+            dict(self.conf, delete_batch_size=5, listing_concurrency=2),
+            logger=self.logger, swift=self.fake_swift)
+        with mock.patch.object(x, 'delete_actual_object') as mock_delete, \
+                mock.patch.object(x, 'pop_queue') as mock_pop, \
+                mock.patch.object(x, 'pop_queue_entries') as mock_pop_bulk:
+            x.run_once()
+        self.assertEqual(
+            sorted(mock.call(target_path, self.past_time, False)
+                   for target_path in self.expired_target_path_list),
+            sorted(mock_delete.call_args_list))
+        self.assertFalse(mock_pop.called)
+        # every target container is different, so each batch is one task
+        self.assertEqual(10, mock_pop_bulk.call_count)
+        self.assertEqual(10, x.report_objects)
+        self.assertEqual(
+            ['Pass beginning for task account .expiring_objects; '
+             '2 possible containers; 12 possible objects',
+             'Pass completed in 0s; 10 objects expired'],
+            self.logger.get_lines_for_level('info'))
+
     def test_run_once_unicode_problem(self):
         requests = []
 
@@ -0,0 +1,175 @@
+# Copyright (c) 2021 OpenStack Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from swift.obj.object_index import ObjectIndex
+
+
+class TestObjectIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.index = ObjectIndex(
+            os.path.join(self.tempdir, '.object_index.objects-1.db'))
+
+    def tearDown(self):
+        self.index.close()
+        shutil.rmtree(self.tempdir, ignore_errors=True)
+
+    def _make_hash_dir(self, partition, suffix, hsh, files):
+        path = os.path.join(self.tempdir, 'objects-1', partition, suffix, hsh)
+        os.makedirs(path)
+        for name in files:
+            open(os.path.join(path, name), 'w').close()
+
+    def test_for_device(self):
+        index = ObjectIndex.for_device(self.tempdir, 'objects-1')
+        self.assertEqual(
+            os.path.join(self.tempdir, '.object_index.objects-1.db'),
+            index.path)
+        self.assertEqual(os.path.join(self.tempdir, 'objects-1'),
+                         index.datadir_path)
+        self.assertFalse(os.path.exists(index.path))
+        self.assertFalse(index.is_complete())
+        self.assertFalse(os.path.exists(index.path))
+
+    def test_connection_reused(self):
+        self.index.update_hash_dir('1', 'abc', 'hsh0', ['a.data'])
+        conn = self.index._local.conn
+        self.index.update_hash_dir('1', 'abc', 'hsh1', ['b.data'])
+        self.assertEqual(2, len(self.index.get_hash_dirs('1')))
+        self.assertIs(conn, self.index._local.conn)
+        self.index.close()
+        self.assertIsNone(self.index._local.conn)
+        self.assertEqual(2, len(self.index.get_hash_dirs('1')))
+        self.assertIsNot(conn, self.index._local.conn)
+        # a removed database is not written to through an old connection
+        os.unlink(self.index.path)
+        self.assertFalse(self.index.is_complete())
+        self.assertIsNone(self.index._local.conn)
+
+    def test_refresh_hash_dir(self):
+        index = ObjectIndex.for_device(self.tempdir, 'objects-1')
+        self._make_hash_dir('1', 'abc', 'hsh0', ['a.data', 'b.meta'])
+        index.refresh_hash_dir('1', 'abc', 'hsh0')
+        self.assertEqual([('abc', 'hsh0', ['b.meta', 'a.data'])],
+                         index.get_hash_dirs('1'))
+        shutil.rmtree(os.path.join(self.tempdir, 'objects-1', '1'))
+        index.refresh_hash_dir('1', 'abc', 'hsh0')
+        self.assertEqual([], index.get_partitions())
+        index.close()
+
+    def test_update_hash_dir(self):
+        self.index.update_hash_dir('1', 'abc', 'hsh1', ['a.data', 'b.meta'])
+        self.index.update_hash_dir('1', 'abc', 'hsh0', ['c.ts'])
+        self.index.update_hash_dir('2', 'def', 'hsh2', ['d.data'])
+        self.assertEqual(['1', '2'], self.index.get_partitions())
+        self.assertEqual([('abc', 'hsh0', ['c.ts']),
+                          ('abc', 'hsh1', ['b.meta', 'a.data'])],
+                         self.index.get_hash_dirs('1'))
+        self.index.update_hash_dir('1', 'abc', 'hsh1', ['e.ts'])
+        self.index.update_hash_dir('1', 'abc', 'hsh0', [])
+        self.assertEqual([('abc', 'hsh1', ['e.ts'])],
+                         self.index.get_hash_dirs('1'))
+        self.assertEqual([], self.index.get_hash_dirs('3'))
+
+    def test_update_suffix(self):
+        self.index.update_suffix('1', 'abc', {
+            'hsh0': ['a.data'], 'hsh1': ['b.data'], 'hsh2': ['c.data']})
+        self.index.update_suffix('1', 'def', {'hsh3': ['d.data']})
+        # without hashes, other hash dirs are left alone
+        self.index.update_suffix('1', 'abc', {'hsh0': ['e.ts']})
+        self.assertEqual([('abc', 'hsh0', ['e.ts']),
+                          ('abc', 'hsh1', ['b.data']),
+                          ('abc', 'hsh2', ['c.data']),
+                          ('def', 'hsh3', ['d.data'])],
+                         self.index.get_hash_dirs('1'))
+        # with hashes, hash dirs that are gone are removed
+        self.index.update_suffix('1', 'abc', {'hsh0': []},
+                                 hashes=['hsh0', 'hsh1'])
+        self.assertEqual([('abc', 'hsh1', ['b.data'])],
+                         self.index.get_hash_dirs('1', suffixes=['abc']))
+        self.index.update_suffix('1', 'abc', {}, hashes=[])
+        self.assertEqual([('def', 'hsh3', ['d.data'])],
+                         self.index.get_hash_dirs('1'))
+
+    def test_update_suffix_lists_changed_hash_dirs(self):
+        index = ObjectIndex.for_device(self.tempdir, 'objects-1')
+        self._make_hash_dir('1', 'abc', 'hsh0', ['b.data'])
+        self._make_hash_dir('1', 'abc', 'hsh1', ['c.data'])
+        index.update_hash_dir('1', 'abc', 'hsh1', ['c.data'])
+        # the caller listed the suffix before the hash dirs were written
+        index.update_suffix('1', 'abc', {'hsh0': ['a.data'], 'hsh1': []},
+                            hashes=['hsh0', 'hsh1'])
+        self.assertEqual([('abc', 'hsh0', ['b.data']),
+                          ('abc', 'hsh1', ['c.data'])],
+                         index.get_hash_dirs('1'))
+        index.close()
+
+    def test_replace_partition(self):
+        self.index.update_hash_dir('1', 'abc', 'hsh0', ['a.data'])
+        self.index.update_hash_dir('1', 'abc', 'hsh1', ['b.data'])
+        self.index.update_hash_dir('1', 'def', 'hsh2', ['c.data'])
+        self.index.update_hash_dir('2', 'def', 'hsh3', ['d.data'])
+        self.assertEqual(
+            {'added': 1, 'removed': 1, 'updated': 1},
+            self.index.replace_partition('1', {
+                ('abc', 'hsh0'): ['a.data'],
+                ('abc', 'hsh1'): ['e.ts'],
+                ('fff', 'hsh4'): ['f.data']}))
+        self.assertEqual([('abc', 'hsh0', ['a.data']),
+                          ('abc', 'hsh1', ['e.ts']),
+                          ('fff', 'hsh4', ['f.data'])],
+                         self.index.get_hash_dirs('1'))
+        self.index.remove_partition('1')
+        self.assertEqual(['2'], self.index.get_partitions())
+        self.assertEqual({'added': 0, 'removed': 1, 'updated': 0},
+                         self.index.replace_partition('2', {}))
+        self.assertEqual([], self.index.get_partitions())
+
+    def test_replace_partition_lists_changed_hash_dirs(self):
+        index = ObjectIndex.for_device(self.tempdir, 'objects-1')
+        self._make_hash_dir('1', 'abc', 'hsh0', ['b.data'])
+        self._make_hash_dir('1', 'abc', 'hsh1', ['c.data'])
+        index.update_hash_dir('1', 'abc', 'hsh1', ['c.data'])
+        # the rebuild listed the partition before hsh0 was updated, hsh1 was
+        # written and hsh2 was removed
+        self.assertEqual(
+            {'added': 1, 'removed': 0, 'updated': 0},
+            index.replace_partition('1', {('abc', 'hsh0'): ['a.data'],
+                                          ('abc', 'hsh2'): ['d.data']}))
+        self.assertEqual([('abc', 'hsh0', ['b.data']),
+                          ('abc', 'hsh1', ['c.data'])],
+                         index.get_hash_dirs('1'))
+        index.close()
+
+    def test_complete(self):
+        self.index.update_hash_dir('1', 'abc', 'hsh0', ['a.data'])
+        self.assertFalse(self.index.is_complete())
+        self.index.mark_complete()
+        self.assertTrue(self.index.is_complete())
+        # another instance sees the same state
+        other = ObjectIndex(self.index.path)
+        self.assertTrue(other.is_complete())
+        other.mark_incomplete()
+        self.assertFalse(self.index.is_complete())
+
+
+if __name__ == '__main__':
+    unittest.main()
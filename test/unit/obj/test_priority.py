@@ -0,0 +1,112 @@
+# Copyright (c) 2021 OpenStack Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from swift.obj import priority
+
+
+def _node(ip, device='sda', weight=1.0):
+    return {'replication_ip': ip, 'device': device, 'weight': weight}
+
+
+class TestPriority(unittest.TestCase):
+
+    def test_count_unhealthy(self):
+        nodes = [_node('10.0.0.1'), _node('10.0.0.2', weight=0),
+                 _node('10.0.0.3'), _node('10.0.0.3', device='sdb')]
+        self.assertEqual(1, priority.count_unhealthy(nodes, set()))
+        self.assertEqual(2, priority.count_unhealthy(
+            nodes, {('10.0.0.3', 'sda')}))
+        # a failed device that is also zero weight only counts once
+        self.assertEqual(1, priority.count_unhealthy(
+            nodes, {('10.0.0.2', 'sda')}))
+        self.assertEqual(0, priority.count_unhealthy([], {('1', 'sda')}))
+
+    def test_partition_size(self):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            part_dir = os.path.join(tmpdir, '1')
+            self.assertEqual(0, priority.partition_size(part_dir))
+            os.mkdir(part_dir)
+            self.assertEqual(0, priority.partition_size(part_dir))
+            for name in ('abc', '123', 'fff'):
+                os.mkdir(os.path.join(part_dir, name))
+            with open(os.path.join(part_dir, 'hashes.pkl'), 'w'):
+                pass
+            self.assertEqual(3, priority.partition_size(part_dir))
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def test_get_priority(self):
+        healthy = [_node('10.0.0.1'), _node('10.0.0.2')]
+        degraded = [_node('10.0.0.1'), _node('10.0.0.2', weight=0)]
+        failed = {('10.0.0.1', 'sda')}
+
+        self.assertEqual(
+            (priority.NORMAL, (0, True, -3)),
+            priority.get_priority(healthy, False, set(), 3))
+        self.assertEqual(
+            (priority.HANDOFF, (0, False, -3)),
+            priority.get_priority(healthy, True, set(), 3))
+        self.assertEqual(
+            (priority.DEGRADED, (-1, True, 0)),
+            priority.get_priority(degraded, False, set(), 0))
+        self.assertEqual(
+            (priority.DEGRADED, (-2, False, 0)),
+            priority.get_priority(degraded, True, failed, 0))
+
+    def test_get_priority_sort_order(self):
+        healthy = [_node('10.0.0.1'), _node('10.0.0.2')]
+        degraded = [_node('10.0.0.1'), _node('10.0.0.2', weight=0)]
+        work = {
+            'small primary': (healthy, False, 1),
+            'big primary': (healthy, False, 10),
+            'small handoff': (healthy, True, 1),
+            'big handoff': (healthy, True, 10),
+            'degraded': (degraded, False, 1),
+            'very degraded': (degraded, False, 1),
+        }
+        failed = {('10.0.0.1', 'sda')}
+
+        def key(name):
+            nodes, is_handoff, size = work[name]
+            failed_devs = failed if name == 'very degraded' else set()
+            return priority.get_priority(
+                nodes, is_handoff, failed_devs, size)[1]
+
+        self.assertEqual(
+            ['very degraded', 'degraded', 'big handoff', 'small handoff',
+             'big primary', 'small primary'],
+            sorted(work, key=key))
+
+    def test_sum_priority_queues(self):
+        self.assertEqual(
+            {priority.DEGRADED: 0, priority.HANDOFF: 0, priority.NORMAL: 0},
+            priority.sum_priority_queues([]))
+        self.assertEqual(
+            {priority.DEGRADED: 1, priority.HANDOFF: 2, priority.NORMAL: 7},
+            priority.sum_priority_queues([
+                {priority.DEGRADED: 1, priority.NORMAL: 4},
+                {},
+                {priority.HANDOFF: 2, priority.NORMAL: 3},
+            ]))
+
+
+if __name__ == '__main__':
+    unittest.main()
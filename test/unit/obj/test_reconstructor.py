@@ -1945,6 +1945,31 @@ class TestWorkerReconstructor(unittest.TestCase):
             'object_reconstruction_time': total,
         }, data)
 
+    def test_final_recon_dump_priority_queue(self):
+        reconstructor = object_reconstructor.ObjectReconstructor(
+            {'recon_cache_path': self.recon_cache_path,
+             'job_ordering': 'priority'},
+            logger=self.logger)
+        reconstructor.all_local_devices = ['sda', 'sdc']
+        reconstructor.priority_queue = {
+            'sda': {'degraded': 1, 'normal': 3},
+            'sdc': {'handoff': 2, 'normal': 1},
+        }
+        reconstructor.final_recon_dump(12.0)
+        with open(self.rcache) as f:
+            data = json.load(f)
+        self.assertEqual({'degraded': 1, 'handoff': 2, 'normal': 4},
+                         data['object_reconstruction_priority_queue'])
+
+        reconstructor.reconstructor_workers = 2
+        reconstructor.final_recon_dump(12.0, override_devices=['sdc'])
+        with open(self.rcache) as f:
+            data = json.load(f)
+        self.assertEqual(
+            {'handoff': 2, 'normal': 1},
+            data['object_reconstruction_per_disk']['sdc'][
+                'object_reconstruction_priority_queue'])
+
     def test_dump_recon_run_once_inline(self):
         reconstructor = object_reconstructor.ObjectReconstructor(
             {'recon_cache_path': self.recon_cache_path},
@@ -3225,6 +3250,131 @@ class TestObjectReconstructor(BaseTestObjectReconstructor):
                       % os.path.join(datadir_path, '1234'), error_lines)
         self.assertEqual(self.reconstructor.reconstruction_part_count, 6)
 
+    def test_job_ordering_conf(self):
+        self.assertEqual('random', self.reconstructor.job_ordering)
+        self._configure_reconstructor(job_ordering='priority')
+        self.assertEqual('priority', self.reconstructor.job_ordering)
+        with self.assertRaises(ValueError):
+            self._configure_reconstructor(job_ordering='size')
+
+    def test_collect_parts_priority_ordering(self):
+        self._configure_reconstructor(job_ordering='priority')
+        datadir = diskfile.get_data_dir(self.policy)
+        # part 1 has the most suffixes
+        part_suffixes = {0: 1, 1: 3, 2: 1, 3: 2, 4: 0}
+        for part, num_suffixes in part_suffixes.items():
+            part_path = os.path.join(self.devices, self.local_dev['device'],
+                                     datadir, str(part))
+            utils.mkdirs(part_path)
+            for i in range(num_suffixes):
+                os.mkdir(os.path.join(part_path, '%03x' % i))
+
+        ring = self.policy.object_ring
+        remote_devs = [dev for dev in ring.devs
+                       if dev['id'] != self.local_dev['id']]
+        failed_dev = remote_devs[0]
+        healthy_devs = remote_devs[1:3]
+        part_nodes = {
+            # primary syncing with a node that failed last pass
+            0: [self.local_dev, failed_dev] + healthy_devs[:1],
+            # healthy primaries
+            1: [self.local_dev] + healthy_devs,
+            2: [self.local_dev] + healthy_devs,
+            # handoffs
+            3: [failed_dev] + healthy_devs,
+            4: list(healthy_devs),
+        }
+        self.reconstructor.recent_failures = {
+            (failed_dev['replication_ip'], failed_dev['device'])}
+        with mock.patch.object(ring, 'get_part_nodes',
+                               lambda part: part_nodes[part]):
+            part_infos = list(self.reconstructor.collect_parts())
+        self.assertEqual([3, 0, 4, 1, 2], [
+            part_info['partition'] for part_info in part_infos])
+        self.assertEqual(
+            {self.local_dev['device']: {
+                'degraded': 2, 'handoff': 1, 'normal': 2}},
+            self.reconstructor.priority_queue)
+
+    def test_build_reconstruction_jobs_priority_ordering(self):
+        self._configure_reconstructor(job_ordering='priority')
+        ring = self.policy.object_ring
+        failed_dev, healthy_dev = ring.devs[1:3]
+        self.reconstructor.recent_failures = {
+            (failed_dev['replication_ip'], failed_dev['device'])}
+        jobs = [
+            {'job_type': SYNC, 'sync_to': [healthy_dev],
+             'suffixes': ['abc'], 'name': 'small sync'},
+            {'job_type': SYNC, 'sync_to': [healthy_dev],
+             'suffixes': ['abc', 'def'], 'name': 'big sync'},
+            {'job_type': REVERT, 'sync_to': [healthy_dev],
+             'suffixes': ['abc'], 'name': 'revert'},
+            {'job_type': SYNC, 'sync_to': [failed_dev, healthy_dev],
+             'suffixes': [], 'name': 'degraded sync'},
+        ]
+        with mock.patch.object(self.reconstructor, '_get_part_jobs',
+                               return_value=list(jobs)):
+            built_jobs = self.reconstructor.build_reconstruction_jobs({})
+        self.assertEqual(
+            ['degraded sync', 'revert', 'big sync', 'small sync'],
+            [job['name'] for job in built_jobs])
+
+    def test_sync_rebuild_concurrency(self):
+        self.assertEqual(1, self.reconstructor.rebuild_concurrency)
+        self._configure_reconstructor(rebuild_concurrency='4')
+        self.assertEqual(4, self.reconstructor.rebuild_concurrency)
+        node = self.policy.object_ring.devs[1]
+        job = {
+            'job_type': SYNC,
+            'sync_to': [node],
+            'local_dev': self.local_dev,
+        }
+        ssync_calls = []
+        with mock.patch.object(self.reconstructor, '_get_suffixes_to_sync',
+                               return_value=(['abc'], node)), \
+                mock_ssync_sender(ssync_calls):
+            self.reconstructor.process_job(job)
+        self.assertEqual(1, len(ssync_calls))
+        self.assertEqual(3, ssync_calls[0]['prefetch'])
+
+        with self.assertRaises(ValueError):
+            self._configure_reconstructor(rebuild_concurrency='0')
+
+    def test_reconstruct_notes_sync_failures(self):
+        ring = self.policy.object_ring
+        suffix_failed, ssync_failed, ok = ring.devs[1:4]
+        job = {
+            'job_type': SYNC,
+            'sync_to': [suffix_failed, ssync_failed, ok],
+            'local_dev': self.local_dev,
+        }
+
+        def fake_get_suffixes(job, node):
+            if node is suffix_failed:
+                raise object_reconstructor.SuffixSyncError()
+            return ['abc'], node
+
+        def fake_ssync(daemon, node, job, suffixes, **kwargs):
+            return lambda: (node is not ssync_failed, {})
+
+        def fake_collect_parts(**kwargs):
+            self.reconstructor.process_job(job)
+            return []
+
+        self.reconstructor.sync_failures.add(('10.0.0.1', 'sdx'))
+        with mock.patch.object(self.reconstructor, '_get_suffixes_to_sync',
+                               fake_get_suffixes), \
+                mock.patch('swift.obj.reconstructor.ssync_sender',
+                           fake_ssync), \
+                mock.patch.object(self.reconstructor, 'collect_parts',
+                                  fake_collect_parts):
+            self.reconstructor.reconstruct()
+        # failures from before this pass are forgotten
+        self.assertEqual({
+            (suffix_failed['replication_ip'], suffix_failed['device']),
+            (ssync_failed['replication_ip'], ssync_failed['device']),
+        }, self.reconstructor.recent_failures)
+
     def test_collect_parts_overrides(self):
         # setup multiple devices, with multiple parts
         device_parts = {
@@ -4613,6 +4763,81 @@ class TestReconstructFragmentArchive(BaseTestObjectReconstructor):
         self.assertFalse(self.logger.get_lines_for_level('error'))
         self.assertFalse(self.logger.get_lines_for_level('warning'))
 
+    def test_reconstruct_fa_batch_segments(self):
+        self._configure_reconstructor(rebuild_batch_segments='3')
+        self.assertEqual(3, self.reconstructor.rebuild_batch_segments)
+        job = {
+            'partition': 0,
+            'policy': self.policy,
+        }
+        part_nodes = self.policy.object_ring.get_part_nodes(0)
+        node = part_nodes[1]
+        node['backend_index'] = self.policy.get_backend_index(node['index'])
+
+        # 7 segments: two full batches and one short one
+        test_data = (b'rebuild' * self.policy.ec_segment_size)[:-777]
+        etag = md5(test_data, usedforsecurity=False).hexdigest()
+        ec_archive_bodies = encode_frag_archive_bodies(self.policy, test_data)
+        broken_body = ec_archive_bodies.pop(1)
+
+        responses = list()
+        for body in ec_archive_bodies:
+            headers = get_header_frag_index(self, body)
+            headers.update({'X-Object-Sysmeta-Ec-Etag': etag})
+            responses.append((200, body, headers))
+
+        codes, body_iter, headers = zip(*responses)
+        with mocked_http_conn(*codes, body_iter=body_iter, headers=headers):
+            df = self.reconstructor.reconstruct_fa(
+                job, node, self._create_fragment(2, body=b''))
+            chunks = list(df.reader())
+        self.assertEqual(3, len(chunks))
+        self.assertEqual([self.policy.fragment_size * 3] * 2, [
+            len(chunk) for chunk in chunks[:2]])
+        fixed_body = b''.join(chunks)
+        self.assertEqual(md5(fixed_body, usedforsecurity=False).hexdigest(),
+                         md5(broken_body, usedforsecurity=False).hexdigest())
+        self.assertFalse(self.logger.get_lines_for_level('error'))
+        # the bytes rebuilt are counted for the local device
+        self.assertEqual({'sda1': len(broken_body)},
+                         self.reconstructor.rebuilt_bytes)
+        self.assertIn((('fragment.rebuild.bytes.sda1', len(broken_body)), {}),
+                      self.logger.log_dict['update_stats'])
+        self.assertEqual(1, len(self.logger.log_dict['timing_since']))
+
+    def test_reconstruct_fa_batch_segments_short_response(self):
+        self._configure_reconstructor(rebuild_batch_segments='2')
+        job = {
+            'partition': 0,
+            'policy': self.policy,
+        }
+        part_nodes = self.policy.object_ring.get_part_nodes(0)
+        node = part_nodes[1]
+        node['backend_index'] = self.policy.get_backend_index(node['index'])
+
+        test_data = (b'rebuild' * self.policy.ec_segment_size)[:-777]
+        etag = md5(test_data, usedforsecurity=False).hexdigest()
+        ec_archive_bodies = encode_frag_archive_bodies(self.policy, test_data)
+        broken_body = ec_archive_bodies.pop(1)
+        # one body ends after the second segment
+        ec_archive_bodies[0] = ec_archive_bodies[0][
+            :self.policy.fragment_size * 2]
+
+        responses = list()
+        for body in ec_archive_bodies:
+            headers = get_header_frag_index(self, body)
+            headers.update({'X-Object-Sysmeta-Ec-Etag': etag})
+            responses.append((200, body, headers))
+
+        codes, body_iter, headers = zip(*responses)
+        with mocked_http_conn(*codes, body_iter=body_iter, headers=headers):
+            df = self.reconstructor.reconstruct_fa(
+                job, node, self._create_fragment(2, body=b''))
+            fixed_body = b''.join(df.reader())
+        # the first batch is rebuilt, but the second can't be
+        self.assertEqual(broken_body[:self.policy.fragment_size * 2],
+                         fixed_body)
+
     def test_reconstruct_fa_errors_works(self):
         job = {
             'partition': 0,
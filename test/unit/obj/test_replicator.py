@@ -25,8 +25,9 @@ import time
 import tempfile
 from contextlib import contextmanager, closing
 from collections import defaultdict
-from errno import ENOENT, ENOTEMPTY, ENOTDIR
+from errno import EACCES, ENOENT, ENOTEMPTY, ENOTDIR
 
+import eventlet
 from eventlet.green import subprocess
 from eventlet import Timeout, sleep
 
@@ -856,6 +857,93 @@ class TestObjectReplicator(unittest.TestCase):
         self.assertTrue(jobs[0]['delete'])
         self.assertEqual('1', jobs[0]['partition'])
 
+    def test_job_ordering_conf(self):
+        replicator = object_replicator.ObjectReplicator({})
+        self.assertEqual('random', replicator.job_ordering)
+        replicator = object_replicator.ObjectReplicator(
+            {'job_ordering': 'priority'})
+        self.assertEqual('priority', replicator.job_ordering)
+        with self.assertRaises(ValueError):
+            object_replicator.ObjectReplicator({'job_ordering': 'size'})
+
+    def test_collect_jobs_priority_ordering(self):
+        self.replicator.job_ordering = 'priority'
+        # node 3 failed during the last pass
+        self.replicator.recent_failures = {('127.0.0.3', 'sda')}
+        # give partition 0 more suffixes than partition 2
+        for suffix in ('abc', 'def'):
+            os.mkdir(os.path.join(self.objects, '0', suffix))
+        jobs = self.replicator.collect_jobs()
+        self.assertEqual(8, len(jobs))
+        # handoff partition 1 also has node 3 as a primary
+        self.assertEqual([('1', True)] * 2, [
+            (job['partition'], job['delete']) for job in jobs[:2]])
+        # then the other partitions replicating to node 3
+        self.assertEqual(['2', '2', '3', '3'], sorted(
+            job['partition'] for job in jobs[2:6]))
+        # then the healthy partition 0, largest first
+        self.assertEqual([('0', 0), ('0', 1)], [
+            (job['partition'], int(job['policy'])) for job in jobs[6:]])
+        self.assertEqual(
+            {'sda': {'degraded': 6, 'normal': 2}},
+            self.replicator.priority_queue)
+
+    def test_collect_jobs_priority_ordering_handoffs_first(self):
+        self.replicator.job_ordering = 'priority'
+        self.replicator.handoffs_first = True
+        self.replicator.recent_failures = {('127.0.0.2', 'sda')}
+        jobs = self.replicator.collect_jobs()
+        self.assertEqual([True, True] + [False] * 6,
+                         [job['delete'] for job in jobs])
+        self.assertEqual(['0', '0', '2', '2'], sorted(
+            job['partition'] for job in jobs[2:6]))
+        self.assertEqual(['3', '3'], [job['partition'] for job in jobs[6:]])
+
+    def test_collect_jobs_random_ordering(self):
+        self.replicator.recent_failures = {('127.0.0.3', 'sda')}
+        with mock.patch.object(self.replicator, 'prioritize_jobs') as mocked:
+            self.replicator.collect_jobs()
+        self.assertFalse(mocked.called)
+        self.assertEqual({}, self.replicator.priority_queue)
+
+    def test_replicate_notes_recent_failures(self):
+        self.replicator.job_ordering = 'priority'
+        failed_nodes = [{'replication_ip': '127.0.0.1', 'device': 'sda'},
+                        {'replication_ip': '127.0.0.1', 'device': 'sdb'}]
+
+        def fake_collect_jobs(*args, **kwargs):
+            self.replicator.stats_for_dev['sda'].add_failure_stats(
+                [(node['replication_ip'], node['device'])
+                 for node in failed_nodes])
+            return []
+
+        with mock.patch.object(self.replicator, 'collect_jobs',
+                               fake_collect_jobs):
+            self.replicator.replicate()
+        self.assertEqual({('127.0.0.1', 'sda'), ('127.0.0.1', 'sdb')},
+                         self.replicator.recent_failures)
+
+    def test_update_recon_priority_queue(self):
+        self.replicator.job_ordering = 'priority'
+        self.replicator.priority_queue = {
+            'sda': {'degraded': 1, 'normal': 3},
+            'sdb': {'handoff': 2, 'normal': 1},
+        }
+        self.replicator.update_recon(10, 12, None)
+        with open(self.replicator.rcache) as f:
+            recon = json.load(f)
+        self.assertEqual({'degraded': 1, 'handoff': 2, 'normal': 4},
+                         recon['replication_priority_queue'])
+
+        self.replicator.is_multiprocess_worker = True
+        self.replicator.update_recon(10, 12, ['sdb'])
+        with open(self.replicator.rcache) as f:
+            recon = json.load(f)
+        self.assertEqual(
+            {'handoff': 2, 'normal': 1},
+            recon['object_replication_per_disk']['sdb'][
+                'replication_priority_queue'])
+
     def test_handoffs_first_mode_will_process_all_jobs_after_handoffs(self):
         # make an object in the handoff & primary partition
         expected_suffix_paths = []
@@ -1197,6 +1285,34 @@ class TestObjectReplicator(unittest.TestCase):
                 self.replicator.replicate()
             self.assertFalse(os.access(part_path, os.F_OK))
 
+    def test_delete_partition_unindexes_partition(self):
+        df_mgr = self.replicator._df_router[POLICIES[1]]
+        df_mgr.object_index = True
+        index = df_mgr.get_object_index(
+            os.path.join(self.devices, 'sda'), 'objects-1')
+        df = df_mgr.get_diskfile('sda', '1', 'a', 'c', 'o',
+                                 policy=POLICIES[1])
+        with df.create() as writer:
+            writer.write(b'1234567890')
+            writer.put({'X-Timestamp': normalize_timestamp(time.time()),
+                        'Content-Length': '10'})
+        self.assertEqual(['1'], index.get_partitions())
+        part_path = os.path.join(self.objects_1, '1')
+        self.replicator.delete_partition(part_path)
+        self.assertFalse(os.path.exists(part_path))
+        self.assertEqual([], index.get_partitions())
+
+        # if the partition can't be removed the index is marked incomplete
+        index.mark_complete()
+        mkdirs(part_path)
+        index.update_hash_dir('1', 'abc', 'def', ['a.data'])
+        with mock.patch('swift.obj.replicator.shutil.rmtree',
+                        side_effect=OSError(EACCES, 'nope')):
+            self.assertRaises(OSError, self.replicator.delete_partition,
+                              part_path)
+        self.assertEqual(['1'], index.get_partitions())
+        self.assertFalse(index.is_complete())
+
     def test_delete_partition_ssync_single_region(self):
         devs = [
             {'id': 0, 'device': 'sda', 'zone': 0,
@@ -1830,6 +1946,81 @@ class TestObjectReplicator(unittest.TestCase):
         self.replicator.sync_method.assert_called_once_with(
             'node', 'job', 'suffixes')
 
+    def test_ssync_target_concurrency(self):
+        in_flight = collections.Counter()
+        max_in_flight = collections.Counter()
+        release = []
+
+        class FakeSender(object):
+            def __init__(self, daemon, node, job, suffixes,
+                         remote_check_objs=None, ratelimit=None):
+                self.device = node['device']
+                self.ratelimit = ratelimit
+
+            def __call__(self):
+                in_flight[self.device] += 1
+                max_in_flight[self.device] = max(
+                    max_in_flight[self.device], in_flight[self.device])
+                release[0].wait()
+                in_flight[self.device] -= 1
+                return True, {}
+
+        def do_test(conf, devices):
+            in_flight.clear()
+            max_in_flight.clear()
+            release[:] = [eventlet.event.Event()]
+            self.conf.update(conf)
+            self._create_replicator()
+            pool = eventlet.GreenPool()
+            with mock.patch('swift.obj.replicator.ssync_sender.Sender',
+                            FakeSender):
+                threads = [pool.spawn(self.replicator.ssync, dict(
+                    replication_ip='1.2.3.4', replication_port=6200,
+                    device=device), {}, ['abc']) for device in devices]
+                sleep()
+                counts = dict(in_flight)
+                release[0].send()
+                pool.waitall()
+            self.assertEqual([(True, {})] * len(devices),
+                             [thread.wait() for thread in threads])
+            return counts, dict(max_in_flight)
+
+        devices = ['sda', 'sda', 'sda', 'sdb']
+        # by default one sync per target device at a time
+        self.assertEqual(({'sda': 1, 'sdb': 1}, {'sda': 1, 'sdb': 1}),
+                         do_test({}, devices))
+        self.assertEqual(({'sda': 2, 'sdb': 1}, {'sda': 2, 'sdb': 1}),
+                         do_test({'ssync_target_concurrency': '2'}, devices))
+        self.assertEqual(({'sda': 3, 'sdb': 1}, {'sda': 3, 'sdb': 1}),
+                         do_test({'ssync_target_concurrency': '0'}, devices))
+
+    def test_ssync_bytes_per_second(self):
+        self._create_replicator()
+        self.assertEqual(0, self.replicator.ssync_bytes_per_second)
+        with mock.patch('swift.obj.replicator.ssync_sender.Sender') as \
+                mock_sender:
+            self.replicator.ssync({'replication_ip': '1.2.3.4',
+                                   'replication_port': 6200,
+                                   'device': 'sda'}, {}, ['abc'])
+        self.assertIsNone(mock_sender.call_args[1]['ratelimit'])
+
+        self.conf['ssync_bytes_per_second'] = '1024'
+        self._create_replicator()
+        with mock.patch('swift.obj.replicator.ssync_sender.Sender') as \
+                mock_sender:
+            self.replicator.ssync({'replication_ip': '1.2.3.4',
+                                   'replication_port': 6200,
+                                   'device': 'sda'}, {}, ['abc'])
+        ratelimit = mock_sender.call_args[1]['ratelimit']
+        with mock.patch('swift.obj.replicator.ratelimit_sleep',
+                        return_value=42) as mock_sleep:
+            ratelimit(100)
+            ratelimit(200)
+        self.assertEqual([
+            mock.call(0, 1024, incr_by=100),
+            mock.call(42, 1024, incr_by=200),
+        ], mock_sleep.call_args_list)
+
     @mock.patch('swift.obj.replicator.tpool.execute')
     @mock.patch('swift.obj.replicator.http_connect', autospec=True)
     @mock.patch('swift.obj.replicator._do_listdir')
@@ -1143,15 +1143,25 @@ class TestObjectController(unittest.TestCase):
         resp_headers = {'Location': '/.sharded_a/c_shard_1/o',
                         'X-Backend-Redirect-Timestamp': next(self.ts).internal}
 
+        # wait for the update to be redirected
+        self.object_controller.container_update_timeout = 1
+        self.object_controller.container_update_redirects = True
         with mocked_http_conn(301, headers=[resp_headers]) as conn, \
                 mock.patch('swift.common.utils.HASH_PATH_PREFIX', b''),\
                 fake_spawn():
             resp = req.get_response(self.object_controller)
 
         self.assertEqual(resp.status_int, 201)
+        # the proxy is told that its shard ranges are stale
+        self.assertEqual(
+            'true', resp.headers['X-Backend-Container-Update-Redirected'])
         self.assertEqual(1, len(conn.requests))
 
         self.assertEqual(expected_update_path, conn.requests[0]['path'])
+        for header in ('X-Backend-Accept-Redirect',
+                       'X-Backend-Accept-Redirect-If-Sharding',
+                       'X-Backend-Accept-Quoted-Location'):
+            self.assertEqual('true', conn.requests[0]['headers'][header])
 
         # whether or not an X-Backend-Container-Path was received from the
         # proxy, the async pending file should now have the container_path
@@ -5618,6 +5628,8 @@ class TestObjectController(unittest.TestCase):
         with self.assertRaises(StopIteration):
             next(fake_conn.code_iter)
         self.assertEqual(resp.status_int, 201)
+        self.assertNotIn('X-Backend-Container-Update-Redirected',
+                         resp.headers)
         self.assertEqual(len(container_updates), 1)
         ip, port, method, path, headers = container_updates[0]
         self.assertEqual(ip, 'chost')
@@ -5634,6 +5646,30 @@ class TestObjectController(unittest.TestCase):
             'x-trans-id': '123',
             'referer': 'PUT http://localhost/sda1/0/a/c/o'}))
 
+    def test_container_update_redirected(self):
+        def do_request(method, redirected):
+            req = Request.blank(
+                '/sda1/0/a/c/o', method=method,
+                headers={'X-Timestamp': next(self.ts).internal,
+                         'Content-Type': 'text/plain'}, body='')
+            with mock.patch.object(self.object_controller,
+                                   'container_update',
+                                   return_value=redirected):
+                resp = req.get_response(self.object_controller)
+            if redirected:
+                self.assertEqual(
+                    'true',
+                    resp.headers['X-Backend-Container-Update-Redirected'])
+            else:
+                self.assertNotIn('X-Backend-Container-Update-Redirected',
+                                 resp.headers)
+            return resp
+
+        for redirected in (False, True):
+            self.assertEqual(201, do_request('PUT', redirected).status_int)
+            self.assertEqual(202, do_request('POST', redirected).status_int)
+            self.assertEqual(204, do_request('DELETE', redirected).status_int)
+
     def test_PUT_container_update_overrides(self):
 
         def do_test(override_headers):
@@ -5983,7 +6019,8 @@ class TestObjectController(unittest.TestCase):
         expected = [('PUT', 'a', 'c', 'o', '1.2.3.4:5', '20', 'sdb1',
                      headers_out, 'sda1', POLICIES[0]),
                     {'logger_thread_locals': (None, None),
-                     'container_path': None}]
+                     'container_path': None,
+                     'accept_redirect': False}]
         self.assertEqual(called_async_update_args, [expected])
 
     def test_container_update_as_greenthread_with_timeout(self):
@@ -7355,6 +7392,17 @@ class TestObjectController(unittest.TestCase):
         self.assertEqual(resp.status_int, 200)
         self.assertEqual('True',
                          resp.headers.get('X-Backend-Accept-No-Commit'))
+        self.assertEqual(
+            '1', resp.headers.get('X-Backend-Ssync-Protocol-Version'))
+
+    def test_SSYNC_protocol_version(self):
+        req = Request.blank('/sda1/0',
+                            environ={'REQUEST_METHOD': 'SSYNC'},
+                            headers={'X-Backend-Ssync-Protocol-Version': '2'})
+        resp = req.get_response(self.object_controller)
+        self.assertEqual(resp.status_int, 200)
+        self.assertEqual(
+            '2', resp.headers.get('X-Backend-Ssync-Protocol-Version'))
 
     def test_PUT_with_full_drive(self):
 
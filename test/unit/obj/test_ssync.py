@@ -1370,6 +1370,52 @@ class TestSsyncReplication(TestBaseSsync):
         self._verify_ondisk_files(tx_objs, policy)
         self._verify_tombstones(tx_tombstones, policy)
 
+    def test_sync_protocol_version_2(self):
+        self.daemon.ssync_protocol_version = 2
+        policy = POLICIES.default
+        tx_objs = {}
+        rx_objs = {}
+        tx_tombstones = {}
+        tx_df_mgr = self.daemon._df_router[policy]
+        rx_df_mgr = self.rx_controller._diskfile_router[policy]
+        # o1 is on tx only
+        t1 = next(self.ts_iter)
+        tx_objs['o1'] = self._create_ondisk_files(tx_df_mgr, 'o1', policy, t1)
+        # o2 is on tx and older copy on rx
+        t2a = next(self.ts_iter)
+        rx_objs['o2'] = self._create_ondisk_files(rx_df_mgr, 'o2', policy, t2a)
+        t2b = next(self.ts_iter)
+        tx_objs['o2'] = self._create_ondisk_files(tx_df_mgr, 'o2', policy, t2b)
+        # o3 in sync on rx and tx
+        t3 = next(self.ts_iter)
+        tx_objs['o3'] = self._create_ondisk_files(tx_df_mgr, 'o3', policy, t3)
+        rx_objs['o3'] = self._create_ondisk_files(rx_df_mgr, 'o3', policy, t3)
+        # o4 is a tombstone on tx, older data on rx
+        t4a = next(self.ts_iter)
+        rx_objs['o4'] = self._create_ondisk_files(rx_df_mgr, 'o4', policy, t4a)
+        t4b = next(self.ts_iter)
+        tx_tombstones['o4'] = self._create_ondisk_files(
+            tx_df_mgr, 'o4', policy, t4b)
+        tx_tombstones['o4'][0].delete(t4b)
+
+        suffixes = set()
+        for diskfiles in list(tx_objs.values()) + list(tx_tombstones.values()):
+            for df in diskfiles:
+                suffixes.add(os.path.basename(os.path.dirname(df._datadir)))
+
+        job = {'device': self.device,
+               'partition': self.partition,
+               'policy': policy}
+        sender = ssync_sender.Sender(self.daemon, dict(self.rx_node), job,
+                                     suffixes)
+        success, in_sync_objs = sender()
+
+        self.assertTrue(success)
+        self.assertEqual(2, sender.protocol_version)
+        self.assertEqual(4, len(in_sync_objs))
+        self._verify_ondisk_files(tx_objs, policy)
+        self._verify_tombstones(tx_tombstones, policy)
+
     def test_nothing_to_sync(self):
         job = {'device': self.device,
                'partition': self.partition,
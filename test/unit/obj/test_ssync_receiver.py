@@ -1252,6 +1252,119 @@ class TestReceiver(unittest.TestCase):
         self.assertFalse(self.controller.logger.error.called)
         self.assertFalse(self.controller.logger.exception.called)
 
+    def test_MISSING_CHECK_protocol_version_2(self):
+        object_dir = utils.storage_directory(
+            os.path.join(self.testdir, 'sda1',
+                         diskfile.get_data_dir(POLICIES[0])),
+            '1', self.hash1)
+        utils.mkdirs(object_dir)
+        fp = open(os.path.join(object_dir, self.ts1 + '.data'), 'w+')
+        fp.write('1')
+        fp.flush()
+        self.metadata1['Content-Length'] = '1'
+        diskfile.write_metadata(fp, self.metadata1)
+        df_mgr = self.controller._diskfile_router[POLICIES[0]]
+
+        def do_test(batches, expected_wanted):
+            self.controller.logger = mock.MagicMock()
+            req = swob.Request.blank(
+                '/sda1/1',
+                environ={'REQUEST_METHOD': 'SSYNC'},
+                headers={'X-Backend-Ssync-Protocol-Version': '2'},
+                body=b':MISSING_CHECK: START\r\n' + b''.join(
+                    ssync_receiver.encode_batch(
+                        [line.encode('ascii') for line in batch])
+                    for batch in batches) +
+                b':MISSING_CHECK: END\r\n'
+                b':UPDATES: START\r\n:UPDATES: END\r\n')
+            with mock.patch.object(
+                    df_mgr, 'yield_hashes',
+                    wraps=df_mgr.yield_hashes) as mock_yield, \
+                    mock.patch.object(
+                        ssync_receiver.Receiver, '_check_local',
+                        wraps=ssync_receiver.Receiver._check_local,
+                        autospec=True) as mock_check_local:
+                resp = req.get_response(self.controller)
+                resp.body  # consume the response with the patches in place
+            wanted = b''
+            if expected_wanted:
+                wanted = ssync_receiver.encode_batch(
+                    [line.encode('ascii') for line in expected_wanted])
+            self.assertEqual(
+                b'\r\n:MISSING_CHECK: START\r\n' + wanted +
+                b':MISSING_CHECK: END\r\n'
+                b':UPDATES: START\r\n:UPDATES: END\r\n', resp.body)
+            self.assertEqual(resp.status_int, 200)
+            self.assertFalse(self.controller.logger.error.called)
+            self.assertFalse(self.controller.logger.exception.called)
+            return ([sorted(call[0][3]) for call in mock_yield.call_args_list],
+                    mock_check_local.call_count)
+
+        # hash1 is in sync and hash2 is missing, so neither is checked with
+        # the diskfile; each batch lists the suffixes it needs
+        listed, checked = do_test(
+            [[self.hash1 + ' ' + self.ts1], [self.hash2 + ' ' + self.ts2]],
+            [self.hash2 + ' dm'])
+        self.assertEqual([[self.hash1[-3:]], [self.hash2[-3:]]], listed)
+        self.assertEqual(0, checked)
+
+        # the sender has older data but newer meta for hash1
+        older_ts1 = utils.normalize_timestamp(float(self.ts1) - 1)
+        listed, checked = do_test(
+            [[self.hash1 + ' ' + older_ts1 + ' m:30d40',
+              self.hash2 + ' ' + self.ts2]],
+            [self.hash1 + ' m', self.hash2 + ' dm'])
+        self.assertEqual(
+            [sorted(set([self.hash1[-3:], self.hash2[-3:]]))], listed)
+        self.assertEqual(1, checked)
+
+        # everything is in sync
+        listed, checked = do_test([[self.hash1 + ' ' + self.ts1]], [])
+        self.assertEqual(0, checked)
+
+    def test_MISSING_CHECK_protocol_version_2_bad_batch(self):
+        self.controller.logger = mock.MagicMock()
+        req = swob.Request.blank(
+            '/sda1/1',
+            environ={'REQUEST_METHOD': 'SSYNC'},
+            headers={'X-Backend-Ssync-Protocol-Version': '2'},
+            body=':MISSING_CHECK: START\r\n' +
+                 self.hash1 + ' ' + self.ts1 + '\r\n'
+                 ':MISSING_CHECK: END\r\n')
+        resp = req.get_response(self.controller)
+        self.assertEqual(1, len(self.body_lines(resp.body)))
+        self.assertIn(b':ERROR: 0 ', resp.body)
+        self.assertIn(b'Looking for :MISSING_CHECK: BATCH got', resp.body)
+        self.assertEqual(resp.status_int, 200)
+
+    def test_protocol_version(self):
+        def do_test(value, expected):
+            req = swob.Request.blank(
+                '/sda1/1', environ={'REQUEST_METHOD': 'SSYNC'},
+                body=':MISSING_CHECK: START\r\n'
+                     ':MISSING_CHECK: END\r\n'
+                     ':UPDATES: START\r\n:UPDATES: END\r\n')
+            if value is not None:
+                req.headers['X-Backend-Ssync-Protocol-Version'] = value
+            rcvr = ssync_receiver.Receiver(self.controller, req)
+            self.assertEqual(expected, rcvr.protocol_version)
+
+        do_test(None, 1)
+        do_test('1', 1)
+        do_test('2', 2)
+        # a newer sender gets the latest version the receiver understands
+        do_test('3', ssync_receiver.SSYNC_PROTOCOL_VERSION)
+        for value in ('0', '-1', 'two'):
+            req = swob.Request.blank(
+                '/sda1/1', environ={'REQUEST_METHOD': 'SSYNC'},
+                headers={'X-Backend-Ssync-Protocol-Version': value})
+            with self.assertRaises(HTTPException) as caught:
+                ssync_receiver.Receiver(self.controller, req)
+            self.assertEqual('400 Bad Request', caught.exception.status)
+            self.assertEqual(
+                b'Invalid X-Backend-Ssync-Protocol-Version %r' % value,
+                caught.exception.body)
+
     def test_UPDATES_no_start(self):
         # verify behavior when the sender disconnects and does not send
         # ':UPDATES: START' e.g. if a sender timeout pops while waiting for
@@ -2205,6 +2318,146 @@ class TestReceiver(unittest.TestCase):
                     'x-object-meta-test-user x-timestamp')})
             self.assertEqual(_requests, [])
 
+    def test_UPDATES_pipelined(self):
+        _requests = []
+        put_o1_started = eventlet.event.Event()
+
+        @server.public
+        def _PUT(request):
+            body = request.environ['wsgi.input'].read()
+            if request.path.endswith('/o1'):
+                put_o1_started.send()
+                # let the receiver carry on with the next subrequests
+                eventlet.sleep(0.01)
+            _requests.append((request.method, request.path, body))
+            return swob.HTTPCreated()
+
+        @server.public
+        def _POST(request):
+            _requests.append((request.method, request.path, None))
+            return swob.HTTPAccepted()
+
+        @server.public
+        def _DELETE(request):
+            _requests.append((request.method, request.path, None))
+            return swob.HTTPNoContent()
+
+        self.controller.network_chunk_size = 64
+        with mock.patch.object(self.controller, 'PUT', _PUT), \
+                mock.patch.object(self.controller, 'POST', _POST), \
+                mock.patch.object(self.controller, 'DELETE', _DELETE):
+            self.controller.logger = mock.MagicMock()
+            req = swob.Request.blank(
+                '/device/partition',
+                environ={'REQUEST_METHOD': 'SSYNC'},
+                headers={'X-Backend-Ssync-Protocol-Version': '2'},
+                body=':MISSING_CHECK: START\r\n:MISSING_CHECK: END\r\n'
+                     ':UPDATES: START\r\n'
+                     'PUT /a/c/o1\r\n'
+                     'Content-Length: 3\r\n'
+                     'X-Timestamp: 1364456113.00001\r\n'
+                     '\r\n'
+                     '123'
+                     'DELETE /a/c/o2\r\n'
+                     'X-Timestamp: 1364456113.00002\r\n'
+                     '\r\n'
+                     'POST /a/c/o1\r\n'
+                     'X-Timestamp: 1364456113.00003\r\n'
+                     '\r\n'
+                     'PUT /a/c/o3\r\n'
+                     'Content-Length: 65\r\n'
+                     'X-Timestamp: 1364456113.00004\r\n'
+                     '\r\n' + 'x' * 65 +
+                     ':UPDATES: END\r\n')
+            resp = req.get_response(self.controller)
+            resp.body  # consume the response with the patches in place
+        self.assertEqual(
+            self.body_lines(resp.body),
+            [b':MISSING_CHECK: START', b':MISSING_CHECK: END',
+             b':UPDATES: START', b':UPDATES: END'])
+        self.assertEqual(resp.status_int, 200)
+        self.assertFalse(self.controller.logger.exception.called)
+        self.assertFalse(self.controller.logger.error.called)
+        self.assertTrue(put_o1_started.ready())
+        # the DELETE overtook the slow PUT, but the POST to the same object
+        # waited for it
+        self.assertEqual([
+            ('DELETE', '/device/partition/a/c/o2', None),
+            ('PUT', '/device/partition/a/c/o1', b'123'),
+        ], _requests[:2])
+        self.assertEqual(sorted([
+            ('POST', '/device/partition/a/c/o1', None),
+            ('PUT', '/device/partition/a/c/o3', b'x' * 65),
+        ]), sorted(_requests[2:]))
+
+    def test_UPDATES_pipelined_failures(self):
+        @server.public
+        def _DELETE(request):
+            if request.path.endswith('/o2'):
+                return swob.HTTPInternalServerError()
+            return swob.HTTPNoContent()
+
+        with mock.patch.object(self.controller, 'DELETE', _DELETE):
+            self.controller.logger = mock.MagicMock()
+            req = swob.Request.blank(
+                '/device/partition',
+                environ={'REQUEST_METHOD': 'SSYNC'},
+                headers={'X-Backend-Ssync-Protocol-Version': '2'},
+                body=':MISSING_CHECK: START\r\n:MISSING_CHECK: END\r\n'
+                     ':UPDATES: START\r\n'
+                     'DELETE /a/c/o1\r\n'
+                     'X-Timestamp: 1364456113.00001\r\n'
+                     '\r\n'
+                     'DELETE /a/c/o2\r\n'
+                     'X-Timestamp: 1364456113.00002\r\n'
+                     '\r\n'
+                     ':UPDATES: END\r\n')
+            resp = req.get_response(self.controller)
+            resp.body  # consume the response with the patches in place
+        if six.PY2:
+            final_line = (b":ERROR: 500 'ERROR: With :UPDATES: "
+                          b"1 failures to 1 successes'")
+        else:
+            final_line = (b":ERROR: 500 b'ERROR: With :UPDATES: "
+                          b"1 failures to 1 successes'")
+        self.assertEqual(
+            self.body_lines(resp.body),
+            [b':MISSING_CHECK: START', b':MISSING_CHECK: END', final_line])
+        self.assertEqual(resp.status_int, 200)
+        self.assertEqual(1, self.controller.logger.warning.call_count)
+
+    def test_UPDATES_pipelined_error_waits_for_updates(self):
+        _requests = []
+
+        @server.public
+        def _DELETE(request):
+            eventlet.sleep(0.01)
+            _requests.append((request.method, request.path))
+            return swob.HTTPNoContent()
+
+        with mock.patch.object(self.controller, 'DELETE', _DELETE):
+            self.controller.logger = mock.MagicMock()
+            req = swob.Request.blank(
+                '/device/partition',
+                environ={'REQUEST_METHOD': 'SSYNC'},
+                headers={'X-Backend-Ssync-Protocol-Version': '2'},
+                body=':MISSING_CHECK: START\r\n:MISSING_CHECK: END\r\n'
+                     ':UPDATES: START\r\n'
+                     'DELETE /a/c/o1\r\n'
+                     'X-Timestamp: 1364456113.00001\r\n'
+                     '\r\n'
+                     'BONK /a/c/o2\r\n'
+                     'X-Timestamp: 1364456113.00002\r\n'
+                     '\r\n'
+                     ':UPDATES: END\r\n')
+            resp = req.get_response(self.controller)
+            lines = self.body_lines(resp.body)
+        self.assertEqual(
+            [b':MISSING_CHECK: START', b':MISSING_CHECK: END',
+             b":ERROR: 0 'Invalid subrequest method BONK'"], lines)
+        # the update in flight was finished before the request ended
+        self.assertEqual([('DELETE', '/device/partition/a/c/o1')], _requests)
+
     def test_UPDATES_subreq_does_not_read_all(self):
         # This tests that if a SSYNC subrequest fails and doesn't read
         # all the subrequest body that it will read and throw away the rest of
@@ -2602,6 +2855,25 @@ class TestModuleMethods(unittest.TestCase):
         check_durable('true')
         check_durable('True')
 
+    def test_encode_decode_batch(self):
+        lines = [b'9d41d8cd98f00b204e9800998ecf0abc 1380144474.44444',
+                 b'9d41d8cd98f00b204e9800998ecf0def 1380144474.44445 m:1']
+        msg = ssync_receiver.encode_batch(lines)
+        line, data = msg.split(b'\r\n', 1)
+        self.assertEqual(len(data), ssync_receiver.parse_batch_length(line))
+        self.assertEqual(lines, ssync_receiver.decode_batch(data))
+        self.assertEqual([], ssync_receiver.decode_batch(
+            ssync_receiver.encode_batch([]).split(b'\r\n', 1)[1]))
+
+        self.assertIsNone(ssync_receiver.parse_batch_length(
+            b':MISSING_CHECK: END'))
+        self.assertIsNone(ssync_receiver.parse_batch_length(lines[0]))
+        for line in (b':MISSING_CHECK: BATCH ', b':MISSING_CHECK: BATCH x'):
+            with self.assertRaises(exceptions.ReplicationException):
+                ssync_receiver.parse_batch_length(line)
+        with self.assertRaises(exceptions.ReplicationException):
+            ssync_receiver.decode_batch(b'not compressed')
+
     def test_encode_wanted(self):
         ts_iter = make_timestamp_iter()
         old_t_data = next(ts_iter)
@@ -437,6 +437,41 @@ class TestSender(BaseTest):
         warnings = self.daemon_logger.get_lines_for_level('warning')
         self.assertEqual([], warnings)
 
+    def test_connect_protocol_version(self):
+        def do_test(requested, resp_headers):
+            self.daemon.ssync_protocol_version = requested
+            node = dict(replication_ip='1.2.3.4', replication_port=5678,
+                        device='sda1')
+            job = dict(partition='9', policy=POLICIES.legacy)
+            sender = ssync_sender.Sender(self.daemon, node, job, None)
+            self.assertEqual(1, sender.protocol_version)
+            with mock.patch(
+                    'swift.obj.ssync_sender.SsyncBufferedHTTPConnection'
+            ) as mock_conn_class:
+                mock_conn = mock_conn_class.return_value
+                mock_conn.getresponse.return_value = FakeResponse(
+                    '', resp_headers)
+                sender.connect()
+            return sender.protocol_version, [
+                call[0][1] for call in mock_conn.putheader.call_args_list
+                if call[0][0] == 'X-Backend-Ssync-Protocol-Version']
+
+        # by default the version is not asked for
+        self.assertEqual((1, []), do_test(1, {}))
+        self.assertEqual((1, []), do_test(
+            1, {'x-backend-ssync-protocol-version': '2'}))
+        # a legacy receiver does not answer
+        self.assertEqual((1, [2]), do_test(2, {}))
+        self.assertEqual((2, [2]), do_test(
+            2, {'x-backend-ssync-protocol-version': '2'}))
+        self.assertEqual((1, [2]), do_test(
+            2, {'x-backend-ssync-protocol-version': '1'}))
+        self.assertEqual((1, [2]), do_test(
+            2, {'x-backend-ssync-protocol-version': 'junk'}))
+        # never more than the sender understands
+        self.assertEqual((2, [2]), do_test(
+            3, {'x-backend-ssync-protocol-version': '3'}))
+
     def test_call(self):
         def patch_sender(sender, available_map, send_map):
             connection = FakeConnection()
@@ -788,6 +823,26 @@ class TestSender(BaseTest):
         self.assertEqual(response.readline(), b'')
         self.assertEqual(response.readline(), b'')
 
+    def test_read_exactly(self):
+        response = FakeResponse()
+        response.fp = io.BytesIO(
+            b'5\r\n\n1\n23\r\n4\r\n45\n6\r\n0\r\n\r\n')
+        self.assertEqual(response.read_exactly(0), b'')
+        self.assertEqual(response.read_exactly(6), b'\n1\n234')
+        self.assertEqual(response.read_exactly(3), b'5\n6')
+        self.assertEqual(response.readline(), b'')
+        # data already buffered by readline is used first
+        response.ssync_response_buffer = b'1234\n5'
+        self.assertEqual(response.read_exactly(2), b'12')
+        self.assertEqual(response.ssync_response_buffer, b'34\n5')
+
+    def test_read_exactly_early_disconnect(self):
+        response = FakeResponse()
+        response.fp = io.BytesIO(b'3\r\n123\r\n0\r\n\r\n')
+        self.assertRaises(exceptions.ReplicationException,
+                          response.read_exactly, 4)
+        self.assertTrue(response.close_called)
+
     def test_missing_check_timeout(self):
         connection = FakeConnection()
         connection.send = lambda d: eventlet.sleep(1)
@@ -1025,6 +1080,56 @@ class TestSender(BaseTest):
                          dict([('9d41d8cd98f00b204e9800998ecf0abc',
                                 {'ts_data': Timestamp(1380144470.00000)})]))
 
+    def test_missing_check_protocol_version_2(self):
+        def yield_hashes(device, partition, policy, suffixes=None, **kwargs):
+            yield (
+                '9d41d8cd98f00b204e9800998ecf0abc',
+                {'ts_data': Timestamp(1380144470.00000)})
+            yield (
+                '9d41d8cd98f00b204e9800998ecf0def',
+                {'ts_data': Timestamp(1380144472.22222),
+                 'ts_meta': Timestamp(1380144473.22222)})
+
+        connection = FakeConnection()
+        self.sender.job = {
+            'device': 'dev',
+            'partition': '9',
+            'policy': POLICIES.legacy,
+        }
+        self.sender.suffixes = ['abc', 'def']
+        self.sender.protocol_version = 2
+        response = FakeResponse()
+        body = (b':MISSING_CHECK: START\r\n' +
+                ssync_receiver.encode_batch([b'0123abc dm', b'0123def m']) +
+                b':MISSING_CHECK: END\r\n')
+        response.fp = io.BytesIO(b'%x\r\n%s\r\n0\r\n\r\n' % (
+            len(body), body))
+        self.sender.df_mgr.yield_hashes = yield_hashes
+        with mock.patch.object(ssync_sender, 'MISSING_CHECK_BATCH_SIZE', 1):
+            available_map, send_map = self.sender.missing_check(
+                connection, response)
+        # one chunk per batch
+        self.assertEqual(4, len(connection.sent))
+        sent = b''.join(connection.sent)
+        batches = []
+        for msg in connection.sent[1:-1]:
+            msg = msg.split(b'\r\n', 1)[1][:-2]  # strip chunk framing
+            line, data = msg.split(b'\r\n', 1)
+            self.assertEqual(len(data),
+                             ssync_receiver.parse_batch_length(line))
+            batches.append(ssync_receiver.decode_batch(data))
+        self.assertEqual([
+            [b'9d41d8cd98f00b204e9800998ecf0abc 1380144470.00000'],
+            [b'9d41d8cd98f00b204e9800998ecf0def 1380144472.22222 m:186a0'],
+        ], batches)
+        self.assertTrue(sent.startswith(b'17\r\n:MISSING_CHECK: START\r\n'))
+        self.assertTrue(sent.endswith(b'15\r\n:MISSING_CHECK: END\r\n\r\n'))
+        self.assertEqual(send_map, {'0123abc': {'data': True, 'meta': True},
+                                    '0123def': {'meta': True}})
+        self.assertEqual(sorted(available_map), [
+            '9d41d8cd98f00b204e9800998ecf0abc',
+            '9d41d8cd98f00b204e9800998ecf0def'])
+
     def test_missing_check_extra_line_parts(self):
         # check that sender tolerates extra parts in missing check
         # line responses to allow for protocol upgrades
@@ -1230,6 +1335,139 @@ class TestSender(BaseTest):
             b'11\r\n:UPDATES: START\r\n\r\n'
             b'f\r\n:UPDATES: END\r\n\r\n')
 
+    objs = ('o1', 'o2', 'o3', 'o4')
+
+    def _check_updates_put_prefetch(self, prefetch):
+        ts_iter = make_timestamp_iter()
+        device = 'dev'
+        part = '9'
+        send_map = {}
+        for obj in self.objs:
+            self._make_open_diskfile(device, part, 'a', 'c', obj,
+                                     timestamp=next(ts_iter))
+            send_map[utils.hash_path('a', 'c', obj)] = {'data': True}
+        events = []
+
+        def fake_builder(job, node, df):
+            events.append(('build', df.obj))
+            # let any other builders run
+            eventlet.sleep(0)
+            return df
+
+        def fake_send_put(connection, url_path, df, durable=True):
+            events.append(('send', df.obj))
+
+        self.sender.prefetch = prefetch
+        self.sender.job = {
+            'device': device,
+            'partition': part,
+            'policy': POLICIES.legacy,
+            'sync_diskfile_builder': fake_builder,
+        }
+        self.sender.node = {}
+        self.sender.send_put = fake_send_put
+        response = FakeResponse(
+            chunk_body=(
+                ':UPDATES: START\r\n'
+                ':UPDATES: END\r\n'))
+        self.sender.updates(FakeConnection(), response, send_map)
+        return events
+
+    def test_updates_put_no_prefetch(self):
+        events = self._check_updates_put_prefetch(0)
+        self.assertEqual(
+            [(event, obj) for obj in self.objs for event in ('build', 'send')],
+            events)
+
+    def test_updates_put_prefetch(self):
+        events = self._check_updates_put_prefetch(2)
+        self.assertEqual([('send', obj) for obj in self.objs], [
+            event for event in events if event[0] == 'send'])
+        self.assertEqual(sorted(('build', obj) for obj in self.objs), sorted(
+            event for event in events if event[0] == 'build'))
+        # no more than two objects are built ahead of the one being sent
+        for i, event in enumerate(event for event in events
+                                  if event[0] == 'send'):
+            self.assertLessEqual(
+                events.index(('build', event[1])),
+                events.index(event))
+            self.assertLessEqual(
+                len([e for e in events[:events.index(event)]
+                     if e[0] == 'build']),
+                i + 3)
+        # all three are built before the first is sent
+        self.assertEqual(['build'] * 3 + ['send'],
+                         [event for event, _obj in events[:4]])
+
+    def test_updates_prefetch_killed_on_error(self):
+        ts_iter = make_timestamp_iter()
+        device = 'dev'
+        part = '9'
+        send_map = {}
+        for obj in ('o1', 'o2', 'o3'):
+            self._make_open_diskfile(device, part, 'a', 'c', obj,
+                                     timestamp=next(ts_iter))
+            send_map[utils.hash_path('a', 'c', obj)] = {'data': True}
+        built = []
+
+        def fake_builder(job, node, df):
+            if df.obj != 'o1':
+                eventlet.sleep(0.05)
+            built.append(df.obj)
+            return df
+
+        self.sender.prefetch = 2
+        self.sender.job = {
+            'device': device,
+            'partition': part,
+            'policy': POLICIES.legacy,
+            'sync_diskfile_builder': fake_builder,
+        }
+        self.sender.node = {}
+        self.sender.send_put = mock.MagicMock(
+            side_effect=exceptions.MessageTimeout(1, 'send_put'))
+        with self.assertRaises(exceptions.MessageTimeout):
+            self.sender.updates(FakeConnection(), FakeResponse(), send_map)
+        eventlet.sleep(0.1)
+        # the objects built ahead were abandoned
+        self.assertEqual(['o1'], built)
+
+    def test_updates_prefetch_error(self):
+        ts_iter = make_timestamp_iter()
+        device = 'dev'
+        part = '9'
+        send_map = {}
+        for obj in ('o1', 'o2', 'o3'):
+            self._make_open_diskfile(device, part, 'a', 'c', obj,
+                                     timestamp=next(ts_iter))
+            send_map[utils.hash_path('a', 'c', obj)] = {'data': True}
+
+        def fake_builder(job, node, df):
+            if df.obj == 'o2':
+                raise exceptions.DiskFileError('oops')
+            return df
+
+        self.sender.prefetch = 2
+        self.sender.job = {
+            'device': device,
+            'partition': part,
+            'policy': POLICIES.legacy,
+            'sync_diskfile_builder': fake_builder,
+        }
+        self.sender.node = {}
+        self.sender.send_put = mock.MagicMock()
+        response = FakeResponse(
+            chunk_body=(
+                ':UPDATES: START\r\n'
+                ':UPDATES: END\r\n'))
+        hub = eventlet.hubs.get_hub()
+        with mock.patch.object(hub, 'squelch_timer_exception') as mock_sq:
+            self.sender.updates(FakeConnection(), response, send_map)
+        # the error is handled by the sender, not reported by the hub
+        self.assertFalse(mock_sq.called)
+        self.assertEqual(['o1', 'o3'], sorted(
+            call[0][2].obj for call in self.sender.send_put.call_args_list))
+
     def test_updates_post(self):
         ts_iter = make_timestamp_iter()
         device = 'dev'
@@ -1522,6 +1760,21 @@ class TestSender(BaseTest):
             exc = err
         self.assertEqual(str(exc), '0.01 seconds: send_put chunk')
 
+    def test_send_put_ratelimit(self):
+        df = self._make_open_diskfile(body=b'12345')
+        df._disk_chunk_size = 2
+        connection = FakeConnection()
+        calls = []
+
+        def ratelimit(nbytes):
+            # called before each chunk is sent
+            calls.append((nbytes, len(connection.sent)))
+
+        self.sender.ratelimit = ratelimit
+        self.sender.send_put(connection, '/a/c/o', df)
+        self.assertEqual([(2, 1), (2, 2), (1, 3)], calls)
+        self.assertEqual(4, len(connection.sent))
+
     def _check_send_put(self, obj_name, meta_value, durable=True):
         ts_iter = make_timestamp_iter()
         t1 = next(ts_iter)
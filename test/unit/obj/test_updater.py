@@ -14,6 +14,7 @@
 # limitations under the License.
 
 import six.moves.cPickle as pickle
+import json
 import mock
 import os
 import unittest
@@ -34,14 +35,16 @@ from eventlet import spawn, Timeout
 
 from swift.obj import updater as object_updater
 from swift.obj.diskfile import (
-    ASYNCDIR_BASE, get_async_dir, DiskFileManager, get_tmp_dir)
+    ASYNCDIR_BASE, get_async_dir, DiskFileManager, get_tmp_dir,
+    ASYNC_JOURNAL_FILE, append_async_journal)
 from swift.common.ring import RingData
 from swift.common import utils
 from swift.common.header_key_dict import HeaderKeyDict
-from swift.common.swob import bytes_to_wsgi
+from swift.common.swob import bytes_to_wsgi, str_to_wsgi
 from swift.common.utils import (
     hash_path, normalize_timestamp, mkdirs, write_pickle)
 from swift.common.storage_policy import StoragePolicy, POLICIES
+from swift.container.backend import ContainerBroker
 
 
 class MockPool(object):
@@ -125,6 +128,9 @@ class TestObjectUpdater(unittest.TestCase):
         self.assertEqual(daemon.concurrency, 8)
         self.assertEqual(daemon.updater_workers, 1)
         self.assertEqual(daemon.max_objects_per_second, 50.0)
+        self.assertEqual(daemon.batch_size, 1)
+        self.assertFalse(daemon.async_pending_journal)
+        self.assertEqual(daemon.full_scan_interval, 86400)
 
         # non-defaults
         conf = {
@@ -135,6 +141,9 @@ class TestObjectUpdater(unittest.TestCase):
             'concurrency': '2',
             'updater_workers': '3',
             'objects_per_second': '10.5',
+            'batch_size': '100',
+            'async_pending_journal': 'yes',
+            'full_scan_interval': '3600',
         }
         daemon = object_updater.ObjectUpdater(conf, logger=self.logger)
         self.assertEqual(daemon.devices, '/some/where/else')
@@ -144,6 +153,9 @@ class TestObjectUpdater(unittest.TestCase):
         self.assertEqual(daemon.concurrency, 2)
         self.assertEqual(daemon.updater_workers, 3)
         self.assertEqual(daemon.max_objects_per_second, 10.5)
+        self.assertEqual(daemon.batch_size, 100)
+        self.assertTrue(daemon.async_pending_journal)
+        self.assertEqual(daemon.full_scan_interval, 3600)
 
         # check deprecated option
         daemon = object_updater.ObjectUpdater({'slowdown': '0.04'},
@@ -160,6 +172,9 @@ class TestObjectUpdater(unittest.TestCase):
         check_bad({'concurrency': '1.0'})
         check_bad({'slowdown': 'baz'})
         check_bad({'objects_per_second': 'quux'})
+        check_bad({'batch_size': '0'})
+        check_bad({'batch_size': '1.5'})
+        check_bad({'full_scan_interval': 'soon'})
 
     @mock.patch('os.listdir')
     def test_listdir_with_exception(self, mock_listdir):
@@ -1154,6 +1169,400 @@ class TestObjectUpdater(unittest.TestCase):
             daemon.logger.get_increment_counts())
         self.assertFalse(os.listdir(async_dir))  # no async file
 
+    def _write_async_updates(self, dfmanager, policy, updates):
+        # updates is a list of (op, container, obj, timestamp) tuples
+        for op, container, obj, ts in updates:
+            headers_out = {
+                'x-timestamp': ts.internal,
+                'X-Backend-Storage-Policy-Index': int(policy),
+                'User-Agent': 'object-server %s' % os.getpid()}
+            if op == 'PUT':
+                headers_out.update({
+                    'x-size': 3,
+                    'x-content-type': 'text/plain',
+                    'x-etag': 'an etag',
+                    'x-meta-timestamp': ts.internal})
+            data = {'op': op, 'account': 'a', 'container': container,
+                    'obj': obj, 'headers': headers_out}
+            dfmanager.pickle_async_update(self.sda1, 'a', container, obj,
+                                          data, ts, policy)
+
+    def _make_batch_daemon(self, policy):
+        conf = {
+            'devices': self.devices_dir,
+            'mount_check': 'false',
+            'swift_dir': self.testdir,
+            'concurrency': '1',
+            'batch_size': '10',
+        }
+        daemon = object_updater.ObjectUpdater(conf, logger=self.logger)
+        async_dir = os.path.join(self.sda1, get_async_dir(policy))
+        os.mkdir(async_dir)
+        return daemon, async_dir, DiskFileManager(conf, daemon.logger)
+
+    def _run_batches(self, daemon, *statuses):
+        bodies = {}
+
+        def capture_body(conn, data):
+            bodies[conn.connection_id] = json.loads(data)
+
+        with mocked_http_conn(*statuses, give_send=capture_body) as conn:
+            with mock.patch('swift.obj.updater.dump_recon_cache'):
+                daemon.run_once()
+        for i, req in enumerate(conn.requests):
+            req['body'] = bodies.get(i)
+        return conn.requests
+
+    def test_obj_update_batches(self):
+        policy = random.choice(list(POLICIES))
+        daemon, async_dir, dfmanager = self._make_batch_daemon(policy)
+        ts = [next(self.ts_iter) for _ in range(3)]
+        self._write_async_updates(dfmanager, policy, [
+            ('PUT', 'c', 'o1', ts[0]),
+            ('DELETE', 'c', 'o2', ts[1]),
+            ('PUT', 'c2', 'o3', ts[2])])
+
+        requests = self._run_batches(daemon, *([202] * 6))
+        self.assertEqual(6, len(requests))
+        part = daemon.container_ring.get_part('a', 'c')
+        part2 = daemon.container_ring.get_part('a', 'c2')
+        self.assertEqual(
+            sorted(['/sda1/%s/a/c' % part] * 3 +
+                   ['/sda1/%s/a/c2' % part2] * 3),
+            sorted(req['path'] for req in requests))
+        o1_record = {
+            'name': 'o1', 'created_at': ts[0].internal, 'size': 3,
+            'content_type': 'text/plain', 'etag': 'an etag', 'deleted': 0,
+            'storage_policy_index': int(policy),
+            'ctype_timestamp': None, 'meta_timestamp': ts[0].internal}
+        o2_record = {
+            'name': 'o2', 'created_at': ts[1].internal, 'size': 0,
+            'content_type': 'application/deleted', 'etag': 'noetag',
+            'deleted': 1, 'storage_policy_index': int(policy),
+            'ctype_timestamp': None, 'meta_timestamp': None}
+        for req in requests:
+            self.assertEqual('UPDATE', req['method'])
+            self.assertEqual('true',
+                             req['headers']['X-Backend-Accept-Redirect'])
+            self.assertEqual(str(int(policy)),
+                             req['headers']['X-Backend-Storage-Policy-Index'])
+            if req['path'].endswith('/c'):
+                self.assertEqual(
+                    [o1_record, o2_record],
+                    sorted(req['body'], key=lambda r: r['name']))
+            else:
+                self.assertEqual(['o3'], [r['name'] for r in req['body']])
+        self.assertEqual(
+            {'successes': 3, 'unlinks': 3, 'async_pendings': 3},
+            daemon.logger.get_increment_counts())
+        self.assertFalse(os.listdir(async_dir))
+
+    def test_obj_update_batches_non_ascii_content_type(self):
+        policy = random.choice(list(POLICIES))
+        daemon, async_dir, dfmanager = self._make_batch_daemon(policy)
+        ts = next(self.ts_iter)
+        ctype = u'text/plain;name=\u00e9'
+        # the object server pickles the update headers as WSGI strings
+        headers_out = {
+            'x-timestamp': ts.internal,
+            'X-Backend-Storage-Policy-Index': int(policy),
+            'x-size': 3,
+            'x-content-type': str_to_wsgi(ctype),
+            'x-etag': 'an etag',
+            'x-content-type-timestamp': ts.internal,
+            'x-meta-timestamp': ts.internal}
+        data = {'op': 'PUT', 'account': 'a', 'container': 'c',
+                'obj': 'o', 'headers': headers_out}
+        dfmanager.pickle_async_update(self.sda1, 'a', 'c', 'o', data, ts,
+                                      policy)
+
+        requests = self._run_batches(daemon, *([202] * 3))
+        self.assertEqual(3, len(requests))
+        broker = ContainerBroker(os.path.join(self.testdir, 'c.db'),
+                                 account='a', container='c')
+        broker.initialize(next(self.ts_iter).internal, int(policy))
+        broker.merge_items(requests[0]['body'])
+        self.assertEqual(
+            [('o', ts.internal, 3, ctype, 'an etag')],
+            [tuple(row[:5]) for row in broker.list_objects_iter(
+                10, '', None, None, '', storage_policy_index=int(policy))])
+        self.assertEqual(
+            {'successes': 1, 'unlinks': 1, 'async_pendings': 1},
+            daemon.logger.get_increment_counts())
+
+    def test_obj_update_batches_rate_limited_per_update(self):
+        policy = random.choice(list(POLICIES))
+        daemon, async_dir, dfmanager = self._make_batch_daemon(policy)
+        ts = [next(self.ts_iter) for _ in range(3)]
+        self._write_async_updates(dfmanager, policy, [
+            ('PUT', 'c', 'o1', ts[0]),
+            ('PUT', 'c', 'o2', ts[1]),
+            ('PUT', 'c2', 'o3', ts[2])])
+        limited = []
+        orig_iter = object_updater.RateLimitedIterator
+
+        def spy_iter(iterable, *args, **kwargs):
+            def spy():
+                for item in iterable:
+                    limited.append(item)
+                    yield item
+            return orig_iter(spy(), *args, **kwargs)
+
+        with mock.patch('swift.obj.updater.RateLimitedIterator', spy_iter):
+            requests = self._run_batches(daemon, *([202] * 6))
+        self.assertEqual(6, len(requests))
+        # each async pending is rate limited, not each batch
+        self.assertEqual(3, len(limited))
+        for item in limited:
+            self.assertIsInstance(item, dict)
+            self.assertTrue(item['path'].startswith(async_dir))
+
+    def test_obj_update_batches_partial_failure(self):
+        policy = random.choice(list(POLICIES))
+        daemon, async_dir, dfmanager = self._make_batch_daemon(policy)
+        ts = [next(self.ts_iter) for _ in range(2)]
+        self._write_async_updates(dfmanager, policy, [
+            ('PUT', 'c', 'o1', ts[0]),
+            ('PUT', 'c', 'o2', ts[1])])
+        part, nodes = daemon.get_container_ring().get_nodes('a', 'c')
+
+        requests = self._run_batches(daemon, 202, 500, 202)
+        self.assertEqual(3, len(requests))
+        self.assertEqual(
+            {'failures': 2, 'async_pendings': 2},
+            daemon.logger.get_increment_counts())
+        # the successes are saved with each async pending
+        async_subdirs = os.listdir(async_dir)
+        async_files = []
+        for subdir in async_subdirs:
+            async_files.extend(
+                os.path.join(async_dir, subdir, name) for name in
+                os.listdir(os.path.join(async_dir, subdir)))
+        self.assertEqual(2, len(async_files))
+        for async_file in async_files:
+            with open(async_file, 'rb') as fd:
+                self.assertEqual([nodes[0]['id'], nodes[2]['id']],
+                                 pickle.load(fd)['successes'])
+
+        # next time the batch is only sent to the node that failed
+        daemon.logger.clear()
+        requests = self._run_batches(daemon, 202)
+        self.assertEqual(1, len(requests))
+        self.assertEqual('/%s/%s/a/c' % (nodes[1]['device'], part),
+                         requests[0]['path'])
+        self.assertEqual(['o1', 'o2'],
+                         sorted(r['name'] for r in requests[0]['body']))
+        self.assertEqual(
+            {'successes': 2, 'unlinks': 2},
+            daemon.logger.get_increment_counts())
+        for subdir in async_subdirs:
+            self.assertFalse(os.path.exists(os.path.join(async_dir, subdir)))
+
+    def test_obj_update_batches_sharded_container(self):
+        policy = random.choice(list(POLICIES))
+        daemon, async_dir, dfmanager = self._make_batch_daemon(policy)
+        ts = next(self.ts_iter)
+        self._write_async_updates(dfmanager, policy, [
+            ('PUT', 'c', 'o1', ts)])
+
+        # a container with shard ranges rejects the batch, so the update is
+        # sent on its own and can be redirected
+        requests = self._run_batches(daemon, 202, 409, 202, 201)
+        self.assertEqual(['UPDATE'] * 3 + ['PUT'],
+                         [req['method'] for req in requests])
+        part = daemon.container_ring.get_part('a', 'c')
+        self.assertEqual('/sda1/%s/a/c/o1' % part, requests[3]['path'])
+        self.assertEqual(
+            {'successes': 1, 'unlinks': 1, 'async_pendings': 1},
+            daemon.logger.get_increment_counts())
+        self.assertFalse(os.listdir(async_dir))
+
+    def test_process_object_update_batch_newest_only(self):
+        policy = random.choice(list(POLICIES))
+        daemon, async_dir, dfmanager = self._make_batch_daemon(policy)
+        ts_old, ts_new = next(self.ts_iter), next(self.ts_iter)
+        self._write_async_updates(dfmanager, policy, [
+            ('PUT', 'c', 'o1', ts_old),
+            ('DELETE', 'c', 'o1', ts_new)])
+        ohash = hash_path('a', 'c', 'o1')
+        prefix_dir = os.path.join(async_dir, ohash[-3:])
+        batch = []
+        for ts in (ts_new, ts_old):
+            path = os.path.join(prefix_dir, '%s-%s' % (ohash, ts.internal))
+            with open(path, 'rb') as fd:
+                update = pickle.load(fd)
+            batch.append({'device': self.sda1, 'policy': policy,
+                          'path': path, 'obj_hash': ohash,
+                          'timestamp': ts.internal, 'update': update})
+
+        bodies = []
+        with mocked_http_conn(
+                202, 202, 202,
+                give_send=lambda conn, data: bodies.append(
+                    json.loads(data))):
+            daemon.process_object_update_batch(batch[::-1])
+        self.assertEqual(3, len(bodies))
+        for body in bodies:
+            self.assertEqual([(ts_new.internal, 1)],
+                             [(r['created_at'], r['deleted']) for r in body])
+        # both async pendings are gone
+        self.assertFalse(os.path.exists(prefix_dir))
+        self.assertEqual({'successes': 1, 'unlinks': 2, 'async_pendings': 2},
+                         daemon.logger.get_increment_counts())
+
+    def _make_journal_daemon(self, policy):
+        conf = {
+            'devices': self.devices_dir,
+            'mount_check': 'false',
+            'swift_dir': self.testdir,
+            'recon_cache_path': self.testdir,
+            'concurrency': '1',
+            'async_pending_journal': 'true',
+        }
+        daemon = object_updater.ObjectUpdater(conf, logger=self.logger)
+        async_dir = os.path.join(self.sda1, get_async_dir(policy))
+        os.mkdir(async_dir)
+        return daemon, async_dir, DiskFileManager(conf, daemon.logger)
+
+    def _get_journal_lag(self):
+        return utils.load_recon_cache(os.path.join(
+            self.testdir, 'object.recon'))['object_updater_journal_lag']
+
+    def _list_async_pendings(self, async_dir):
+        return sorted(
+            name for subdir in os.listdir(async_dir)
+            for name in os.listdir(os.path.join(async_dir, subdir)))
+
+    def test_object_sweep_async_pending_journal(self):
+        policy = random.choice(list(POLICIES))
+        daemon, async_dir, dfmanager = self._make_journal_daemon(policy)
+        journal_path = os.path.join(self.sda1, ASYNC_JOURNAL_FILE)
+        unjournaled_dfmanager = DiskFileManager(
+            {'devices': self.devices_dir, 'mount_check': 'false'},
+            daemon.logger)
+
+        # the first sweep scans every async_pending dir
+        self._write_async_updates(dfmanager, policy, [
+            ('PUT', 'c', 'o1', next(self.ts_iter))])
+        self._write_async_updates(unjournaled_dfmanager, policy, [
+            ('PUT', 'c', 'o2', next(self.ts_iter))])
+        self.assertTrue(os.path.getsize(journal_path))
+        with mocked_http_conn(*([201] * 6)) as conn:
+            daemon.run_once()
+        self.assertEqual(6, len(conn.requests))
+        self.assertEqual([], self._list_async_pendings(async_dir))
+        self.assertFalse(os.path.exists(journal_path))
+        self.assertEqual({'sda1': 0}, self._get_journal_lag())
+
+        # an idle sweep does not list any async_pending dirs
+        with mock.patch.object(daemon, '_listdir',
+                               wraps=daemon._listdir) as mock_listdir:
+            with mocked_http_conn() as conn:
+                daemon.run_once()
+        self.assertEqual([mock.call(self.devices_dir)],
+                         mock_listdir.call_args_list)
+
+        # later sweeps only visit journaled dirs
+        ts = next(self.ts_iter)
+        self._write_async_updates(dfmanager, policy, [
+            ('PUT', 'c', 'o3', ts)])
+        self._write_async_updates(unjournaled_dfmanager, policy, [
+            ('PUT', 'c', 'o4', ts)])
+        o4_name = '%s-%s' % (hash_path('a', 'c', 'o4'), ts.internal)
+        with mocked_http_conn(201, 201, 201) as conn:
+            daemon.run_once()
+        self.assertEqual(['/sda1/%s/a/c/o3' % daemon.container_ring.get_part(
+            'a', 'c')] * 3, [req['path'] for req in conn.requests])
+        if hash_path('a', 'c', 'o3')[-3:] != hash_path('a', 'c', 'o4')[-3:]:
+            self.assertEqual([o4_name], self._list_async_pendings(async_dir))
+
+        # failed updates are journaled again
+        self._write_async_updates(dfmanager, policy, [
+            ('PUT', 'c2', 'o5', next(self.ts_iter))])
+        with mocked_http_conn(500, 500, 500):
+            daemon.run_once()
+        with open(journal_path) as fp:
+            self.assertEqual([os.path.join(
+                get_async_dir(policy), hash_path('a', 'c2', 'o5')[-3:])],
+                fp.read().splitlines())
+        self.assertEqual({'sda1': 1}, self._get_journal_lag())
+        with mocked_http_conn(201, 201, 201) as conn:
+            daemon.run_once()
+        self.assertEqual(3, len(conn.requests))
+        self.assertEqual({'sda1': 0}, self._get_journal_lag())
+
+        # and a full scan finds what was not journaled
+        daemon.last_full_scan -= daemon.full_scan_interval
+        with mocked_http_conn(201, 201, 201) as conn:
+            daemon.run_once()
+        self.assertEqual(['/sda1/%s/a/c/o4' % daemon.container_ring.get_part(
+            'a', 'c')] * 3, [req['path'] for req in conn.requests])
+        self.assertEqual([], self._list_async_pendings(async_dir))
+
+    def test_take_async_journal(self):
+        policy = random.choice(list(POLICIES))
+        daemon, async_dir, dfmanager = self._make_journal_daemon(policy)
+        journal_path = os.path.join(self.sda1, ASYNC_JOURNAL_FILE)
+        self.assertEqual([], daemon._take_async_journal(self.sda1))
+
+        append_async_journal(self.sda1, ['async_pending/abc',
+                                         'async_pending/def',
+                                         'async_pending/abc'])
+        self.assertEqual(['async_pending/abc', 'async_pending/def'],
+                         daemon._take_async_journal(self.sda1))
+        self.assertFalse(os.path.exists(journal_path))
+
+        # a journal that was taken but not finished is taken again...
+        append_async_journal(self.sda1, ['async_pending/123'])
+        self.assertEqual(['async_pending/abc', 'async_pending/def'],
+                         daemon._take_async_journal(self.sda1))
+        daemon._finish_async_journal(self.sda1, [])
+        # ...before the current journal
+        self.assertEqual(['async_pending/123'],
+                         daemon._take_async_journal(self.sda1))
+        daemon._finish_async_journal(self.sda1, [])
+        self.assertEqual([], daemon._take_async_journal(self.sda1))
+        self.assertEqual([], self.logger.get_lines_for_level('error'))
+
+        # an unreadable journal means a full scan
+        append_async_journal(self.sda1, ['async_pending/abc'])
+        with mock.patch('swift.obj.updater.lock_file',
+                        side_effect=OSError('kaboom')):
+            self.assertIsNone(daemon._take_async_journal(self.sda1))
+        self.assertEqual(['ERROR Unable to read async_pending journal on '
+                          '%s: kaboom' % self.sda1],
+                         self.logger.get_lines_for_level('error'))
+        self.logger.clear()
+        with mock.patch.object(daemon, '_take_async_journal',
+                               return_value=None), \
+                mock.patch.object(daemon, '_iter_async_pendings',
+                                  return_value=iter([])) as mock_scan:
+            daemon.object_sweep(self.sda1, full_scan=False)
+        mock_scan.assert_called_once_with(self.sda1)
+
+    def test_iter_journaled_async_pendings(self):
+        policy = random.choice(list(POLICIES))
+        daemon, async_dir, dfmanager = self._make_journal_daemon(policy)
+        ts_old, ts_new = next(self.ts_iter), next(self.ts_iter)
+        self._write_async_updates(dfmanager, policy, [
+            ('PUT', 'c', 'o1', ts_old),
+            ('PUT', 'c', 'o1', ts_new)])
+        ohash = hash_path('a', 'c', 'o1')
+        entry = os.path.join(get_async_dir(policy), ohash[-3:])
+        updates = list(daemon._iter_journaled_async_pendings(self.sda1, [
+            entry, os.path.join(get_async_dir(policy), 'fff'), 'bogus']))
+        self.assertEqual([{
+            'device': self.sda1, 'policy': policy,
+            'path': os.path.join(self.sda1, entry,
+                                 '%s-%s' % (ohash, ts_new.internal)),
+            'obj_hash': ohash, 'timestamp': ts_new.internal}], updates)
+        # the obsolete async pending was unlinked
+        self.assertEqual(['%s-%s' % (ohash, ts_new.internal)],
+                         self._list_async_pendings(async_dir))
+        self.assertEqual(["ERROR unexpected async_pending journal entry "
+                          "'bogus' on %s" % self.sda1],
+                         self.logger.get_lines_for_level('error'))
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -20,22 +20,30 @@ from collections import defaultdict
 import unittest
 import mock
 
+import eventlet
+from eventlet.green import socket
 import six
 
 from swift.proxy import server as proxy_server
+from swift.proxy.controllers import base
 from swift.proxy.controllers.base import headers_to_container_info, \
     headers_to_account_info, headers_to_object_info, get_container_info, \
     get_cache_key, get_account_info, get_info, get_object_info, \
     Controller, GetOrHeadHandler, bytes_to_skip, clear_info_cache, \
-    set_info_cache, NodeIter, headers_from_container_info
+    set_info_cache, NodeIter, headers_from_container_info, InfoCache, \
+    get_process_info_cache, ShardRangeCache
 from swift.common.swob import Request, HTTPException, RESPONSE_REASONS, \
     bytes_to_wsgi
 from swift.common import exceptions
+from swift.common.middleware import slo
 from swift.common.utils import split_path, ShardRange, Timestamp, \
-    GreenthreadSafeIterator, GreenAsyncPile
+    GreenthreadSafeIterator, GreenAsyncPile, ShardRangeList, md5
 from swift.common.header_key_dict import HeaderKeyDict
 from swift.common.http import is_success
-from swift.common.storage_policy import StoragePolicy, StoragePolicyCollection
+from swift.common.memcached import MemcacheRing
+from swift.common.splice import splice
+from swift.common.storage_policy import StoragePolicy, \
+    StoragePolicyCollection, EC_POLICY
 from test.debug_logger import debug_logger
 from test.unit import (
     fake_http_connect, FakeRing, FakeMemcache, PatchPolicies,
@@ -197,7 +205,8 @@ class BaseTest(unittest.TestCase):
 class TestFuncs(BaseTest):
 
     def test_get_info_zero_recheck(self):
-        mock_cache = mock.Mock()
+        # a memcache client without get_many
+        mock_cache = mock.Mock(spec=['get', 'set'])
         mock_cache.get.return_value = None
         app = FakeApp(ZeroCacheDynamicResponseFactory())
         env = {'swift.cache': mock_cache}
@@ -272,6 +281,238 @@ class TestFuncs(BaseTest):
             mock.call.set('container/a/c', exp_cached_info_c, time=0),
         ])
 
+    def test_info_cache(self):
+        logger = debug_logger()
+        cache = InfoCache(maxsize=2, ttl=10, negative_ttl=1, logger=logger)
+        info_a = {'status': 200, 'meta': {'x': 'y'}}
+        info_c = {'status': 404}
+        with mock.patch('swift.proxy.controllers.base.time.time',
+                        return_value=1000.0):
+            self.assertIsNone(cache.get('account/a'))
+            cache.set('account/a', info_a)
+            cache.set('container/a/c', info_c)
+            got = cache.get('account/a')
+            self.assertEqual(info_a, got)
+            # callers get their own copy
+            got['meta']['x'] = 'z'
+            self.assertEqual(info_a, cache.get('account/a'))
+            self.assertEqual(info_c, cache.get('container/a/c'))
+        self.assertEqual({'info_cache.hit': 3, 'info_cache.miss': 1},
+                         logger.get_increment_counts())
+
+        # not found info expires sooner
+        with mock.patch('swift.proxy.controllers.base.time.time',
+                        return_value=1001.0):
+            self.assertIsNone(cache.get('container/a/c'))
+            self.assertEqual(info_a, cache.get('account/a'))
+        with mock.patch('swift.proxy.controllers.base.time.time',
+                        return_value=1010.0):
+            self.assertIsNone(cache.get('account/a'))
+
+        # least recently used entries are evicted
+        cache.set('account/a', info_a)
+        cache.set('account/b', info_a)
+        cache.get('account/a')
+        cache.set('account/c', info_a)
+        self.assertEqual(['account/a', 'account/c'], list(cache._entries))
+        cache.pop('account/a')
+        cache.pop('account/x')
+        self.assertEqual(['account/c'], list(cache._entries))
+
+        # a zero ttl disables caching
+        cache = InfoCache(ttl=0, negative_ttl=1)
+        cache.set('account/a', info_a)
+        cache.set('container/a/c', info_c)
+        self.assertEqual(['container/a/c'], list(cache._entries))
+
+    def test_shard_range_cache(self):
+        logger = debug_logger()
+        cache = ShardRangeCache(maxsize=2, ttl=10, logger=logger)
+        shard_ranges = ShardRangeList([
+            ShardRange('.shards_a/c_a', Timestamp.now(), '', 'm'),
+            ShardRange('.shards_a/c_b', Timestamp.now(), 'm', '')])
+        with mock.patch('swift.proxy.controllers.base.time.time',
+                        return_value=1000.0):
+            self.assertIsNone(cache.get('shard-updating/a/c'))
+            cache.set('shard-updating/a/c', shard_ranges)
+            # the cached list is shared, not copied
+            self.assertIs(shard_ranges, cache.get('shard-updating/a/c'))
+        self.assertEqual(
+            {'shard_range_cache.hit': 1, 'shard_range_cache.miss': 1},
+            logger.get_increment_counts())
+        with mock.patch('swift.proxy.controllers.base.time.time',
+                        return_value=1010.0):
+            self.assertIsNone(cache.get('shard-updating/a/c'))
+
+    def test_get_update_shard_with_process_shard_range_cache(self):
+        app = proxy_server.Application(
+            {'shard_range_cache_size': '10', 'shard_range_cache_ttl': '30'},
+            logger=self.logger, account_ring=self.account_ring,
+            container_ring=self.container_ring)
+        shard_range_cache = app.shard_range_cache
+        self.assertIsInstance(shard_range_cache, ShardRangeCache)
+        self.assertEqual(10, shard_range_cache.maxsize)
+        self.assertEqual(30, shard_range_cache.ttl)
+
+        shard_ranges = [
+            ShardRange('.shards_a/c_a', Timestamp.now(), '', 'm'),
+            ShardRange('.shards_a/c_b', Timestamp.now(), 'm', '')]
+        controller = Controller(app)
+        memcache = FakeMemcache()
+        req = Request.blank('/v1/a/c/o', {'swift.cache': memcache})
+        with mock.patch.object(controller, '_get_shard_ranges',
+                               return_value=shard_ranges) as mock_get:
+            self.assertEqual(shard_ranges[1], controller._get_update_shard(
+                req, 'a', 'c', 'o'))
+        self.assertEqual(1, mock_get.call_count)
+        cached = shard_range_cache.get('shard-updating/a/c')
+        self.assertIsInstance(cached, ShardRangeList)
+        self.assertEqual(shard_ranges, list(cached))
+        self.assertIn('shard-updating/a/c', memcache.store)
+
+        # another request is served from the process cache
+        memcache.clear_calls()
+        req = Request.blank('/v1/a/c/o', {'swift.cache': memcache})
+        with mock.patch.object(controller, '_get_shard_ranges') as mock_get:
+            self.assertEqual(shard_ranges[0], controller._get_update_shard(
+                req, 'a', 'c', 'b'))
+        self.assertFalse(mock_get.called)
+        self.assertEqual([], memcache.calls)
+
+        # clearing the cached shard ranges clears every cache
+        controller._clear_update_shard_cache(req, 'a', 'c')
+        self.assertEqual([], list(shard_range_cache._entries))
+        self.assertNotIn('shard-updating/a/c', memcache.store)
+        self.assertEqual(
+            1, self.logger.get_increment_counts().get(
+                'shard_updating.cache.invalidated'))
+
+        # without a process cache memcache is used
+        app.shard_range_cache = None
+        memcache.set('shard-updating/a/c',
+                     [dict(sr) for sr in shard_ranges])
+        memcache.clear_calls()
+        req = Request.blank('/v1/a/c/o', {'swift.cache': memcache})
+        self.assertEqual(shard_ranges[1], controller._get_update_shard(
+            req, 'a', 'c', 'x'))
+        self.assertEqual([('get', 'shard-updating/a/c', None, None)],
+                         memcache.calls)
+
+    def test_get_info_with_process_info_cache(self):
+        app = proxy_server.Application(
+            {'info_cache_size': '10', 'info_cache_ttl': '5'},
+            logger=self.logger, account_ring=self.account_ring,
+            container_ring=self.container_ring)
+        info_cache = app.info_cache
+        self.assertIsInstance(info_cache, InfoCache)
+        self.assertEqual(10, info_cache.maxsize)
+        self.assertEqual(5, info_cache.ttl)
+        self.assertEqual(1, info_cache.negative_ttl)
+        self.assertIs(self.logger, info_cache.logger)
+        # middlewares find the cache of the proxy server app
+        self.assertIs(info_cache, get_process_info_cache(app))
+        middleware = mock.MagicMock()
+        middleware.app = mock.MagicMock()
+        middleware.app.app = app
+        self.assertIs(info_cache, get_process_info_cache(middleware))
+        self.assertIsNone(get_process_info_cache(mock.MagicMock()))
+
+        app = FakeApp()
+        app.info_cache = info_cache
+        memcache = FakeMemcache()
+        info_c = get_info(app, {'swift.cache': memcache}, 'a', 'c')
+        self.assertEqual(200, info_c['status'])
+        self.assertEqual(1, app.responses.stats['account'])
+        self.assertEqual(1, app.responses.stats['container'])
+        self.assertEqual(['account/a', 'container/a/c'],
+                         sorted(info_cache._entries))
+
+        # another request is served from the process cache
+        memcache.clear_calls()
+        env = {'swift.cache': memcache}
+        self.assertEqual(info_c, get_info(app, env, 'a', 'c'))
+        self.assertEqual([], memcache.calls)
+        self.assertIn('container/a/c', env['swift.infocache'])
+        self.assertEqual(1, app.responses.stats['container'])
+
+        # clearing the info clears it from the process cache too
+        clear_info_cache(app, {'swift.cache': memcache}, 'a', 'c')
+        self.assertEqual(['account/a'], list(info_cache._entries))
+        memcache.clear_calls()
+        get_info(app, {'swift.cache': memcache}, 'a', 'c')
+        self.assertEqual([('get', 'container/a/c', None, None)],
+                         [call for call in memcache.calls
+                          if call[0] == 'get'])
+        self.assertEqual(2, app.responses.stats['container'])
+
+        # another app without the cache enabled doesn't disable it
+        other_app = proxy_server.Application(
+            {}, logger=self.logger, account_ring=self.account_ring,
+            container_ring=self.container_ring)
+        self.assertIsNone(other_app.info_cache)
+        self.assertIsNone(get_process_info_cache(other_app))
+        get_info(app, {'swift.cache': memcache}, 'a', 'c')
+        self.assertEqual(['account/a', 'container/a/c'],
+                         sorted(info_cache._entries))
+
+    def test_get_info_prefetches_account_info(self):
+        mock_cache = mock.MagicMock(spec=MemcacheRing)
+        cached_info_c = {'status': 200, 'bytes': '10', 'object_count': '1'}
+        cached_info_a = {'status': 200, 'bytes': '10', 'container_count': '1'}
+        mock_cache.get_many.return_value = [cached_info_c, cached_info_a]
+        app = FakeApp()
+        env = {'swift.cache': mock_cache}
+        info_c = get_info(app, env, 'a', 'c')
+        self.assertEqual(info_c['status'], 200)
+        self.assertEqual(info_c['bytes'], 10)
+        # one round trip to memcache for both the container and the account
+        self.assertEqual(mock_cache.mock_calls, [
+            mock.call.get_many(['container/a/c', 'account/a'])])
+        self.assertEqual(env['swift.infocache'], {
+            'container/a/c': cached_info_c, 'account/a': cached_info_a})
+
+        mock_cache.reset_mock()
+        info_a = get_info(app, env, 'a')
+        self.assertEqual(info_a['status'], 200)
+        self.assertEqual(info_a['container_count'], 1)
+        self.assertEqual(mock_cache.mock_calls, [])
+        self.assertEqual(app.responses.stats['account'], 0)
+        self.assertEqual(app.responses.stats['container'], 0)
+
+        # the account isn't fetched again once it is in infocache
+        mock_cache.get.return_value = None
+        info_c = get_info(app, env, 'a', 'c2')
+        self.assertEqual(info_c['status'], 200)
+        self.assertEqual(mock_cache.mock_calls[0],
+                         mock.call.get('container/a/c2'))
+        self.assertEqual(app.responses.stats['account'], 0)
+        self.assertEqual(app.responses.stats['container'], 1)
+
+        # any memcache client with get_many prefetches...
+        class WrappedMemcache(object):
+            get = mock_cache.get
+            get_many = mock_cache.get_many
+            set = mock_cache.set
+
+        mock_cache.reset_mock()
+        env = {'swift.cache': WrappedMemcache()}
+        get_info(app, env, 'a', 'c')
+        self.assertEqual(mock_cache.mock_calls, [
+            mock.call.get_many(['container/a/c', 'account/a'])])
+
+        # ...and clients without it get just the container info
+        class PlainMemcache(object):
+            get = mock_cache.get
+            set = mock_cache.set
+
+        mock_cache.reset_mock()
+        env = {'swift.cache': PlainMemcache()}
+        get_info(app, env, 'a', 'c')
+        self.assertEqual(mock_cache.mock_calls[0],
+                         mock.call.get('container/a/c'))
+        self.assertNotIn(mock.call.get_many, [
+            call[0] for call in mock_cache.mock_calls])
+
     def test_get_info(self):
         app = FakeApp()
         # Do a non cached call to account
@@ -1284,6 +1525,196 @@ class TestFuncs(BaseTest):
         app_iter.close()
         self.app.logger.warning.assert_not_called()
 
+    def test_can_splice(self):
+        self.app.splice = True
+        self.app.splice_min_object_size = 8192
+        policy = StoragePolicy(0, 'zero', True)
+
+        class TestSource(object):
+            def __init__(self):
+                self.status = 200
+                self.chunked = False
+                self.headers = {'content-length': '8192'}
+                self.fp = mock.Mock(spec=['peek', 'read1'])
+
+            def getheader(self, header):
+                return self.headers.get(header.lower())
+
+        def do_test(expected, req_headers=None, environ=None, method='GET',
+                    server_type='Object', handler_policy=policy,
+                    **source_attrs):
+            env = {'wsgi.input': mock.Mock(spec=eventlet.wsgi.Input)}
+            env.update(environ or {})
+            req = Request.blank('/v1/a/c/o', headers=req_headers,
+                                environ=env)
+            req.method = method
+            source = TestSource()
+            for attr, value in source_attrs.items():
+                setattr(source, attr, value)
+            handler = GetOrHeadHandler(
+                self.app, req, server_type, Namespace(num_primary_nodes=1),
+                None, None, {}, policy=handler_policy)
+            self.assertIs(expected, handler._can_splice(req, source))
+
+        do_test(True)
+        do_test(False, method='HEAD')
+        do_test(False, server_type='Container')
+        do_test(False, handler_policy=None)
+        do_test(False, handler_policy=Namespace(
+            idx=0, policy_type=EC_POLICY))
+        for header in ('Range', 'If-Match', 'If-None-Match',
+                       'If-Modified-Since', 'If-Unmodified-Since'):
+            do_test(False, req_headers={header: 'x'})
+        do_test(False, status=206)
+        do_test(False, chunked=True)
+        do_test(False, headers={'content-length': '8191'})
+        do_test(False, headers={'content-length': None})
+        do_test(False, environ={'wsgi.input': mock.Mock()})
+        do_test(False, fp=mock.Mock(spec=['read']))
+        do_test(False, headers={'content-length': '8192',
+                                'x-static-large-object': 'true'})
+        do_test(True, headers={'content-length': '8192',
+                               'x-static-large-object': 'false'})
+        do_test(False, headers={'content-length': '8192',
+                                'x-object-manifest': 'c/seg_'})
+        self.app.splice_min_object_size = 0
+        do_test(True, headers={'content-length': '4097'})
+        # the first chunk must fill eventlet's write buffer
+        do_test(False, headers={'content-length': '4096'})
+        self.app.splice = False
+        do_test(False)
+
+    def test_slo_manifest_not_spliced(self):
+        self.app.splice = True
+        self.app.splice_min_object_size = 0
+        etag = md5(b'segment', usedforsecurity=False).hexdigest()
+        segment = {'name': '/c/seg', 'hash': etag,
+                   'bytes': 7, 'content_type': 'text/plain',
+                   'last_modified': '2021-01-01T00:00:00.000000'}
+        # big enough to be spliced if it were a plain object
+        manifest = json.dumps([segment]).encode('ascii') + b' ' * 8192
+        headers = [
+            {'Content-Length': str(len(manifest)),
+             'X-Static-Large-Object': 'true',
+             'X-Backend-Timestamp': '1609459200.00000'},
+            {'Content-Length': '7', 'Etag': etag,
+             'X-Backend-Timestamp': '1609459200.00000'},
+        ]
+
+        class SpliceableConns(list):
+            # make the object server responses look like they came straight
+            # off a socket
+            def append(self, conn):
+                conn.chunked = False
+                conn.fp = mock.Mock(spec=['peek', 'read1'])
+                super(SpliceableConns, self).append(conn)
+
+        fake_conn = fake_http_connect(
+            200, 200, body_iter=[manifest, b'segment'], headers=headers,
+            capture_connections=SpliceableConns())
+        app = slo.filter_factory({})(self.app)
+        req = Request.blank('/v1/a/c/manifest', environ={
+            'wsgi.input': mock.Mock(spec=eventlet.wsgi.Input),
+            'swift.infocache': {
+                'container/a/c': headers_to_container_info({}, 200)}})
+        with mock.patch('swift.common.bufferedhttp.http_connect_raw',
+                        new=fake_conn), \
+                mock.patch.object(GetOrHeadHandler,
+                                  '_make_splice_app_iter') as mock_splice:
+            resp = req.get_response(app)
+            body = resp.body
+        self.assertEqual(200, resp.status_int)
+        self.assertEqual(b'segment', body)
+        mock_splice.assert_not_called()
+
+    def _make_splice_source(self, body, content_length):
+        backend_sock, server_sock = socket.socketpair()
+
+        def serve():
+            server_sock.sendall(body)
+            server_sock.close()
+
+        class TestSource(object):
+            status = 200
+            chunked = False
+            headers = {'content-length': str(content_length)}
+            fp = backend_sock.makefile('rb')
+            nuke_from_orbit = mock.Mock()
+
+            def getheader(self, header):
+                return self.headers.get(header.lower())
+
+        return TestSource(), eventlet.spawn(serve)
+
+    def _read_all(self, sock):
+        def read():
+            data = b''
+            while True:
+                chunk = sock.recv(65536)
+                if not chunk:
+                    return data
+                data += chunk
+        return eventlet.spawn(read)
+
+    @unittest.skipIf(six.PY2, 'splice needs a buffered file')
+    @unittest.skipIf(not splice.available, 'splice not available')
+    def test_make_splice_app_iter(self):
+        body = b''.join(bytes([i]) * 1024 for i in range(256)) * 2
+        source, server = self._make_splice_source(body, len(body))
+        client_sock, peer_sock = socket.socketpair()
+        reader = self._read_all(peer_sock)
+        req = Request.blank('/v1/a/c/o', environ={
+            'wsgi.input': mock.Mock(get_socket=lambda: client_sock)})
+        node = {'ip': '1.2.3.4', 'port': 6200, 'device': 'sda'}
+        handler = GetOrHeadHandler(
+            self.app, req, 'Object', Namespace(num_primary_nodes=1), None,
+            'some-path', {})
+
+        app_iter = handler._make_splice_app_iter(req, node, source)
+        chunks = []
+        for chunk in app_iter:
+            if isinstance(chunk, base.SplicedBytes):
+                # a real server would have sent the first chunk already
+                self.assertEqual(b'', bytes(chunk))
+            else:
+                client_sock.sendall(chunk)
+            chunks.append(chunk)
+        client_sock.close()
+        server.wait()
+
+        self.assertEqual(2, len(chunks))
+        self.assertGreater(len(chunks[0]), eventlet.wsgi.MINIMUM_CHUNK_SIZE)
+        self.assertEqual(len(body), sum(len(chunk) for chunk in chunks))
+        self.assertEqual(body, reader.wait())
+        self.assertEqual(
+            [((('splice.bytes', len(body) - len(chunks[0])), {}))],
+            self.logger.log_dict['update_stats'])
+        source.nuke_from_orbit.assert_called_once_with()
+
+    @unittest.skipIf(six.PY2, 'splice needs a buffered file')
+    @unittest.skipIf(not splice.available, 'splice not available')
+    def test_make_splice_app_iter_short_read(self):
+        body = b'x' * 100000
+        source, server = self._make_splice_source(body, len(body) + 1)
+        client_sock, peer_sock = socket.socketpair()
+        reader = self._read_all(peer_sock)
+        req = Request.blank('/v1/a/c/o', environ={
+            'wsgi.input': mock.Mock(get_socket=lambda: client_sock)})
+        node = {'ip': '1.2.3.4', 'port': 6200, 'device': 'sda'}
+        handler = GetOrHeadHandler(
+            self.app, req, 'Object', Namespace(num_primary_nodes=1), None,
+            'some-path', {})
+
+        app_iter = handler._make_splice_app_iter(req, node, source)
+        client_sock.sendall(next(app_iter))
+        with self.assertRaises(exceptions.ShortReadError):
+            next(app_iter)
+        client_sock.close()
+        server.wait()
+        self.assertEqual(body, reader.wait())
+        self.assertEqual(1, len(self.logger.get_lines_for_level('error')))
+        source.nuke_from_orbit.assert_called_once_with()
+
     def test_bytes_to_skip(self):
         # if you start at the beginning, skip nothing
         self.assertEqual(bytes_to_skip(1024, 0), 0)
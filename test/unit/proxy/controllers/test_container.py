@@ -18,12 +18,13 @@ import mock
 import socket
 import unittest
 
-from eventlet import Timeout
+from eventlet import Timeout, sleep
 import six
 from six.moves import urllib
 
 from swift.common.constraints import CONTAINER_LISTING_LIMIT
-from swift.common.swob import Request, bytes_to_wsgi, str_to_wsgi, wsgi_quote
+from swift.common.swob import Request, Response, bytes_to_wsgi, \
+    str_to_wsgi, wsgi_quote
 from swift.common.utils import ShardRange, Timestamp
 from swift.proxy import server as proxy_server
 from swift.proxy.controllers.base import headers_to_container_info, \
@@ -907,6 +908,80 @@ class TestContainerController(TestRingBase):
             % (end_marker, marker, limit), reverse=True)
         self.check_response(resp, root_resp_hdrs)
 
+    def test_GET_sharded_container_concurrent_shard_listings(self):
+        self.app.shard_listing_concurrency = 3
+        shard_bounds = ('', 'c', 'f', 'i', '')
+        shard_ranges = [
+            ShardRange('.shards_a/c_%s' % upper, Timestamp.now(), lower, upper)
+            for lower, upper in zip(shard_bounds[:-1], shard_bounds[1:])]
+        root_resp_hdrs = {'X-Backend-Sharding-State': 'sharded',
+                          'X-Backend-Timestamp': '99',
+                          'X-Backend-Record-Type': 'shard',
+                          'X-Container-Object-Count': 100,
+                          'X-Container-Bytes-Used': 1000,
+                          'X-Backend-Storage-Policy-Index': 0}
+        # the second shard has misplaced objects belonging in the first
+        shard_names = {
+            shard_ranges[0].container: ['a', 'b'],
+            shard_ranges[1].container: ['a0', 'a1', 'a2', 'a3', 'd', 'e'],
+            shard_ranges[2].container: ['g', 'h'],
+            shard_ranges[3].container: ['j', 'k'],
+        }
+        calls = []
+        in_flight = [0, 0]  # current, max
+
+        def fake_get_container_listing(req, account, container,
+                                       headers=None, params=None):
+            calls.append((container, params['marker'], params['limit']))
+            in_flight[0] += 1
+            in_flight[1] = max(in_flight)
+            # let the other listings be requested
+            sleep(0.01)
+            in_flight[0] -= 1
+            names = [name for name in shard_names[container]
+                     if name > params['marker'] and (
+                         not params['end_marker'] or
+                         name < params['end_marker'])]
+            objs = [{'name': name, 'bytes': 1, 'hash': 'hash',
+                     'content_type': 'text/plain', 'deleted': 0,
+                     'last_modified': '1970-01-01T00:00:00.000000'}
+                    for name in names[:params['limit']]]
+            return objs, Response(
+                headers={'X-Backend-Sharding-State': 'unsharded'})
+
+        def do_listing(query_string):
+            del calls[:]
+            in_flight[1] = 0
+            req = Request.blank('/v1/a/c' + query_string)
+            with mocked_http_conn(200, body_iter=[json.dumps(
+                    [dict(sr) for sr in shard_ranges]).encode('ascii')],
+                    headers=root_resp_hdrs), \
+                    mock.patch.object(proxy_server.ContainerController,
+                                      '_get_container_listing',
+                                      side_effect=fake_get_container_listing):
+                resp = req.get_response(self.app)
+            self.assertEqual(200, resp.status_int)
+            return [obj['name'] for obj in json.loads(resp.body)]
+
+        # misplaced objects that are already listed are dropped
+        self.assertEqual(['a', 'b', 'd', 'e', 'g', 'h', 'j', 'k'],
+                         do_listing(''))
+        self.assertEqual(3, in_flight[1])
+        self.assertEqual([('c_c', '', 10000), ('c_f', '', 10000),
+                          ('c_i', '', 10000), ('c_', 'b', 10000 - 2)],
+                         calls)
+
+        # a prefetched listing that only has names that are already listed
+        # is fetched again
+        self.assertEqual(['a', 'b', 'd', 'e'], do_listing('?limit=4'))
+        self.assertEqual([('c_c', '', 4), ('c_f', '', 4), ('c_i', '', 4),
+                          ('c_f', 'b', 2), ('c_', 'b', 2)], calls)
+
+        # no more listings than needed are used
+        self.assertEqual(['a'], do_listing('?limit=1'))
+        self.assertEqual([('c_c', '', 1), ('c_f', '', 1), ('c_i', '', 1)],
+                         calls)
+
     def test_GET_sharded_container_with_delimiter(self):
         shard_bounds = (('', 'ham'), ('ham', 'pie'), ('pie', ''))
         shard_ranges = [
@@ -35,6 +35,7 @@ class TestInfoController(unittest.TestCase):
         disallowed_sections = disallowed_sections or []
 
         app = Mock(spec=ProxyApp)
+        app.sorts_by_latency = False
         return InfoController(app, None, expose_info,
                               disallowed_sections, admin_key)
 
@@ -162,6 +163,35 @@ class TestInfoController(unittest.TestCase):
         self.assertIn('quux', info['admin']['qux'])
         self.assertEqual(info['admin']['qux']['quux'], 'corge')
 
+    def test_get_admin_info_node_latency(self):
+        controller = self.get_controller(expose_info=True,
+                                         admin_key='secret-admin-key')
+        controller.app.sorts_by_latency = True
+        controller.app.get_node_latency_stats.return_value = {
+            '10.0.0.1:6200/sda': {'first_byte_latency': 0.25,
+                                  'in_flight': 2, 'updated': 12345.0}}
+        utils._swift_info = {'foo': {'bar': 'baz'}}
+
+        # not shown to everyone
+        req = Request.blank('/info', environ={'REQUEST_METHOD': 'GET'})
+        resp = controller.GET(req)
+        self.assertEqual('200 OK', str(resp))
+        info = json.loads(resp.body)
+        self.assertNotIn('admin', info)
+
+        expires = int(time.time() + 86400)
+        sig = utils.get_hmac('GET', '/info', expires, 'secret-admin-key')
+        path = '/info?swiftinfo_sig={sig}&swiftinfo_expires={expires}'.format(
+            sig=sig, expires=expires)
+        req = Request.blank(
+            path, environ={'REQUEST_METHOD': 'GET'})
+        resp = controller.GET(req)
+        self.assertEqual('200 OK', str(resp))
+        info = json.loads(resp.body)
+        self.assertEqual({'10.0.0.1:6200/sda': {
+            'first_byte_latency': 0.25, 'in_flight': 2, 'updated': 12345.0}},
+            info['admin']['node_latency'])
+
     def test_head_admin_info(self):
         controller = self.get_controller(expose_info=True,
                                          admin_key='secret-admin-key')
@@ -39,7 +39,8 @@ else:
 
 import swift
 from swift.common import utils, swob, exceptions
-from swift.common.exceptions import ChunkWriteTimeout
+from swift.common.exceptions import ChunkWriteTimeout, SegmentError, \
+    ShortReadError
 from swift.common.utils import Timestamp, list_from_csv, md5
 from swift.proxy import server as proxy_server
 from swift.proxy.controllers import obj
@@ -4118,6 +4119,78 @@ class TestECObjController(ECObjectControllerMixin, unittest.TestCase):
         ])
         self.assertEqual(resp.body, expected)
 
+    def test_GET_with_multirange_coalesced(self):
+        self.app.object_chunk_size = 256
+        test_body = b'test' * self.policy.ec_segment_size
+        ec_stub = make_ec_object_stub(test_body, self.policy, None)
+        frag_archives = ec_stub['frags']
+        self.assertEqual(len(frag_archives[0]), 1960)
+        boundary = b'81eb9c110b32ced5fe'
+
+        def make_mime_body(frag_archive):
+            return b'\r\n'.join([
+                b'--' + boundary,
+                b'Content-Type: application/octet-stream',
+                b'Content-Range: bytes 1470-1959/1960',
+                b'',
+                frag_archive[1470:],
+                b'--' + boundary,
+                b'Content-Type: application/octet-stream',
+                b'Content-Range: bytes 0-489/1960',
+                b'',
+                frag_archive[0:490],
+                b'--' + boundary + b'--',
+            ])
+
+        obj_resp_bodies = [make_mime_body(fa) for fa
+                           in ec_stub['frags'][:self.policy.ec_ndata]]
+
+        headers = {
+            'Content-Type': b'multipart/byteranges;boundary=' + boundary,
+            'Content-Length': len(obj_resp_bodies[0]),
+            'X-Object-Sysmeta-Ec-Content-Length': len(ec_stub['body']),
+            'X-Object-Sysmeta-Ec-Etag': ec_stub['etag'],
+            'X-Timestamp': Timestamp(self.ts()).normal,
+        }
+
+        responses = [
+            StubResponse(206, body, headers, i)
+            for i, body in enumerate(obj_resp_bodies)
+        ]
+
+        def get_response(req):
+            # the two ranges in the first segment are fetched once, after
+            # the last segment because that was asked for first
+            self.assertEqual(req['headers']['Range'], 'bytes=1470-1959,0-489')
+            return responses.pop(0) if responses else StubResponse(404)
+
+        req = swob.Request.blank('/v1/a/c/o', headers={
+            'Range': 'bytes=14000-15000,1000-2000,1500-1600'})
+        with capture_http_requests(get_response) as log:
+            resp = req.get_response(self.app)
+        self.assertEqual(resp.status_int, 206)
+        self.assertEqual(len(log), self.policy.ec_ndata)
+        resp_boundary = resp.headers['content-type'].rsplit('=', 1)[1].encode()
+        expected = b'\r\n'.join([
+            b'--' + resp_boundary,
+            b'Content-Type: application/octet-stream',
+            b'Content-Range: bytes 14000-15000/16384',
+            b'',
+            ec_stub['body'][14000:15001],
+            b'--' + resp_boundary,
+            b'Content-Type: application/octet-stream',
+            b'Content-Range: bytes 1000-2000/16384',
+            b'',
+            ec_stub['body'][1000:2001],
+            b'--' + resp_boundary,
+            b'Content-Type: application/octet-stream',
+            b'Content-Range: bytes 1500-1600/16384',
+            b'',
+            ec_stub['body'][1500:1601],
+            b'--' + resp_boundary + b'--',
+        ])
+        self.assertEqual(resp.body, expected)
+
     def test_GET_with_multirange_slow_body(self):
         self.app.object_chunk_size = 256
         self.app.recoverable_node_timeout = 0.01
@@ -5249,6 +5322,78 @@ class TestECFunctions(unittest.TestCase):
         self.assertEqual(actual, (100, None))
         self.assertEqual([type(x) for x in actual], [int, type(None)])
 
+    def test_coalesce_segment_ranges(self):
+        # overlapping and adjacent ranges are coalesced
+        self.assertEqual(
+            ([(0, 1535)], [0, 0]),
+            obj.coalesce_segment_ranges([(0, 1023), (512, 1535)], 512))
+        self.assertEqual(
+            ([(0, 1023)], [0, 0]),
+            obj.coalesce_segment_ranges([(512, 1023), (0, 511)], 512))
+        # gaps, prefixes and suffixes are not
+        self.assertEqual(
+            ([(0, 511), (1024, 1535)], [0, 1]),
+            obj.coalesce_segment_ranges([(0, 511), (1024, 1535)], 512))
+        self.assertEqual(
+            ([(0, 511), (512, None), (None, 1024)], [0, 1, 2]),
+            obj.coalesce_segment_ranges(
+                [(0, 511), (512, None), (None, 1024)], 512))
+        # fetches are in the order they were first asked for
+        self.assertEqual(
+            ([(0, 1535), (None, 1024), (5120, 5631)], [0, 1, 2, 0, 0]),
+            obj.coalesce_segment_ranges(
+                [(1024, 1535), (None, 1024), (5120, 5631), (0, 511),
+                 (512, 1023)], 512))
+        # too many shared segments are fetched again
+        self.assertEqual(
+            ([(0, 5119), (0, 5119)], [0, 0, 1]),
+            obj.coalesce_segment_ranges(
+                [(0, 5119), (0, 511), (0, 5119)], 512))
+        self.assertEqual(
+            ([(0, 5119)], [0, 0, 0]),
+            obj.coalesce_segment_ranges(
+                [(0, 5119), (0, 511), (0, 5119)], 512,
+                max_shared_segments=10))
+        self.assertEqual(([], []), obj.coalesce_segment_ranges([], 512))
+
+    def test_decoded_segments(self):
+        decoded = []
+
+        def segment_iter():
+            for i in range(4):
+                decoded.append(i)
+                yield (b'%d' % i) * 10
+
+        segments = obj.DecodedSegments(segment_iter(), 100, 10)
+        self.assertEqual(b'0000011', b''.join(
+            segments.iter_range(105, 111, keep_from=110)))
+        self.assertEqual({1: b'1' * 10}, segments.kept)
+        self.assertEqual(b'1111122', b''.join(
+            segments.iter_range(115, 121, keep_from=120)))
+        self.assertEqual({2: b'2' * 10}, segments.kept)
+        self.assertEqual(b'22', b''.join(segments.iter_range(120, 121)))
+        self.assertEqual({}, segments.kept)
+        self.assertEqual([0, 1, 2], decoded)
+        segments.drain()
+        self.assertEqual([0, 1, 2, 3], decoded)
+
+        # short segment iter
+        segments = obj.DecodedSegments(iter([b'a' * 10]), 0, 10)
+        range_iter = segments.iter_range(5, 15)
+        self.assertEqual(b'aaaaa', next(range_iter))
+        with self.assertRaises(ShortReadError) as cm:
+            next(range_iter)
+        self.assertEqual('Too few segments; got 1, expecting 2',
+                         str(cm.exception))
+
+        # ranges out of order
+        segments = obj.DecodedSegments(segment_iter(), 0, 10)
+        self.assertEqual(b'11', b''.join(segments.iter_range(12, 13)))
+        with self.assertRaises(SegmentError) as cm:
+            b''.join(segments.iter_range(5, 6))
+        self.assertEqual('Segment 0 was discarded before range 5-6 was '
+                         'served', str(cm.exception))
+
 
 @patch_policies([ECStoragePolicy(0, name='ec', is_default=True,
                                  ec_type=DEFAULT_TEST_EC_TYPE, ec_ndata=10,
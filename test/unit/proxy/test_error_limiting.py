@@ -0,0 +1,132 @@
+# Copyright (c) 2021 OpenStack Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from swift.proxy.error_limiting import SharedErrorLimitTable
+
+
+class TestSharedErrorLimitTable(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tempdir, 'error_limits')
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir, ignore_errors=True)
+
+    def test_init(self):
+        key = '10.0.0.1:6200/sda'
+        table = SharedErrorLimitTable(self.path, slots=10)
+        self.assertEqual(10, table.slots)
+        self.assertEqual(table.HEADER.size + 10 * table.SLOT.size,
+                         os.path.getsize(self.path))
+        table.setdefault(key, {})['errors'] = 1
+        # a table of the same size is shared
+        table2 = SharedErrorLimitTable(self.path, slots=10)
+        self.assertIn(key, table2)
+        # a table of another size replaces the file...
+        table3 = SharedErrorLimitTable(self.path, slots=5)
+        self.assertEqual(5, table3.slots)
+        self.assertEqual(table.HEADER.size + 5 * table.SLOT.size,
+                         os.path.getsize(self.path))
+        self.assertNotIn(key, table3)
+        self.assertEqual(['error_limits'], os.listdir(self.tempdir))
+        # ...without changing the old file under the tables that mapped it
+        self.assertIn(key, table)
+        table.setdefault(key, {})['errors'] = 2
+        self.assertEqual(2, table2[key]['errors'])
+        self.assertNotIn(key, table3)
+
+        # a file that isn't a table is replaced too
+        with open(self.path, 'wb') as fp:
+            fp.write(b'junk' * 100)
+        table = SharedErrorLimitTable(self.path, slots=5)
+        self.assertNotIn(key, table)
+        table.setdefault(key, {})['errors'] = 1
+        table.clear()
+        self.assertEqual(5, SharedErrorLimitTable(self.path, slots=5).slots)
+
+        with self.assertRaises(ValueError):
+            SharedErrorLimitTable(self.path, slots=0)
+
+    def test_dict_interface(self):
+        table = SharedErrorLimitTable(self.path, slots=10)
+        key = '10.0.0.1:6200/sda'
+        self.assertNotIn(key, table)
+        self.assertIsNone(table.get(key))
+        self.assertEqual({}, table.get(key, {}))
+        with self.assertRaises(KeyError):
+            table[key]
+        self.assertIsNone(table.pop(key, None))
+
+        stats = table.setdefault(key, {})
+        self.assertIn(key, table)
+        self.assertIn('errors', stats)
+        self.assertNotIn('other', stats)
+        self.assertEqual(0, stats.get('errors', 0))
+        stats['errors'] = stats.get('errors', 0) + 1
+        stats['last_error'] = 12345.5
+        self.assertEqual(1, table[key]['errors'])
+        self.assertEqual(12345.5, table.get(key)['last_error'])
+        with self.assertRaises(KeyError):
+            stats['other'] = 1
+        with self.assertRaises(KeyError):
+            stats['other']
+        self.assertIsNone(stats.get('other'))
+
+        self.assertEqual({'errors': 1, 'last_error': 12345.5},
+                         table.pop(key, None))
+        self.assertNotIn(key, table)
+        self.assertNotIn('errors', stats)
+        self.assertIsNone(stats.get('errors'))
+        # writing through a stale view allocates a new slot
+        stats['errors'] = 3
+        self.assertEqual(3, table[key]['errors'])
+
+        table.clear()
+        self.assertNotIn(key, table)
+
+    def test_shared_between_tables(self):
+        table1 = SharedErrorLimitTable(self.path, slots=10)
+        table2 = SharedErrorLimitTable(self.path, slots=10)
+        key = '10.0.0.1:6200/sda'
+        table1.setdefault(key, {})['errors'] = 11
+        self.assertEqual(11, table2[key]['errors'])
+        table2.pop(key, None)
+        self.assertNotIn(key, table1)
+
+    def test_eviction(self):
+        table = SharedErrorLimitTable(self.path, slots=4)
+        keys = ['10.0.0.%d:6200/sda' % i for i in range(5)]
+        for i, key in enumerate(keys[:4]):
+            stats = table.setdefault(key, {})
+            stats['errors'] = 1
+            stats['last_error'] = 100.0 + i
+        for key in keys[:4]:
+            self.assertIn(key, table)
+        # the table is full; the node with the oldest error gives way
+        table.setdefault(keys[4], {})['last_error'] = 200.0
+        self.assertIn(keys[4], table)
+        self.assertNotIn(keys[0], table)
+        for key in keys[1:4]:
+            self.assertIn(key, table)
+
+
+if __name__ == '__main__':
+    unittest.main()
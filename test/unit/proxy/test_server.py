@@ -51,7 +51,7 @@ import six
 from six.moves import range
 from six.moves.urllib.parse import quote, parse_qsl
 
-from test import listen_zero
+from test import listen_zero, annotate_failure
 from test.debug_logger import debug_logger
 from test.unit import (
     connect_tcp, readuntil2crlfs, fake_http_connect, FakeRing, FakeMemcache,
@@ -533,7 +533,7 @@ class TestController(unittest.TestCase):
 
     def test_get_container_info_returns_values_as_strings(self):
         app = mock.MagicMock()
-        memcache = mock.MagicMock()
+        memcache = mock.MagicMock(spec=['get', 'set'])
         memcache.get = mock.MagicMock()
         memcache.get.return_value = {
             u'foo': u'\u2603',
@@ -639,6 +639,24 @@ class TestProxyServerConfiguration(unittest.TestCase):
         self.assertEqual(app.recheck_updating_shard_ranges, 1800)
         self.assertEqual(app.recheck_listing_shard_ranges, 900)
 
+    def test_splice_options(self):
+        app = self._make_app({})
+        self.assertFalse(app.splice)
+        self.assertEqual(app.splice_min_object_size, 1048576)
+
+        with mock.patch('swift.proxy.server.splice',
+                        mock.Mock(available=True)):
+            app = self._make_app({'splice': 'yes',
+                                  'splice_min_object_size': '65536'})
+        self.assertTrue(app.splice)
+        self.assertEqual(app.splice_min_object_size, 65536)
+
+        with mock.patch('swift.proxy.server.splice',
+                        mock.Mock(available=False)):
+            app = self._make_app({'splice': 'yes'})
+        self.assertFalse(app.splice)
+        self.assertEqual(1, len(app.logger.get_lines_for_level('warning')))
+
 
 @patch_policies([StoragePolicy(0, 'zero', True, object_ring=FakeRing())])
 class TestProxyServer(unittest.TestCase):
@@ -875,6 +893,93 @@ class TestProxyServer(unittest.TestCase):
                        {'ip': '127.0.0.1'}]
         self.assertEqual(res, exp_sorting)
 
+    def test_node_latency(self):
+        baseapp = proxy_server.Application({'sorting_method': 'latency'},
+                                           container_ring=FakeRing(),
+                                           account_ring=FakeRing())
+        self.assertTrue(baseapp.sorts_by_latency)
+        self.assertFalse(baseapp.sorts_by_timing)
+        self.assertEqual(0.3, baseapp.latency_ewma_weight)
+        self.assertEqual({}, baseapp.node_latencies)
+
+        req = Request.blank('/v1/account', environ={'REQUEST_METHOD': 'HEAD'})
+        baseapp.update_request(req)
+        resp = baseapp.handle_request(req)
+        self.assertEqual(resp.status_int, 503)  # couldn't connect to anything
+        # failed requests are measured too...
+        stats = baseapp.get_node_latency_stats()
+        self.assertEqual(3, len(stats))
+        for node_stats in stats.values():
+            # ...and no request is left in flight
+            self.assertEqual(0, node_stats['in_flight'])
+
+        baseapp.node_latencies.clear()
+        nodes = [{'ip': '127.0.0.%d' % i, 'port': 6200, 'device': 'sda'}
+                 for i in range(4)]
+        now = time.time()
+        with mock.patch('swift.proxy.server.time', return_value=now):
+            for node, latency in zip(nodes, (0.1, 0.01, 0.5)):
+                baseapp.node_request_started(node)
+                baseapp.node_request_finished(node, latency)
+            node_stats = baseapp.get_node_latency_stats()
+        self.assertEqual({'127.0.0.0:6200/sda': {
+            'first_byte_latency': 0.1, 'in_flight': 0, 'updated': now},
+            '127.0.0.1:6200/sda': {
+            'first_byte_latency': 0.01, 'in_flight': 0, 'updated': now},
+            '127.0.0.2:6200/sda': {
+            'first_byte_latency': 0.5, 'in_flight': 0, 'updated': now}},
+            node_stats)
+
+        def do_sort():
+            with mock.patch('swift.proxy.server.shuffle', lambda l: l), \
+                    mock.patch('swift.proxy.server.time', return_value=now):
+                return baseapp.sort_nodes(list(nodes))
+
+        # unmeasured nodes first, then the fastest
+        self.assertEqual([nodes[3], nodes[1], nodes[0], nodes[2]], do_sort())
+
+        # the average moves towards new samples
+        with mock.patch('swift.proxy.server.time', return_value=now):
+            baseapp.node_request_started(nodes[1])
+            baseapp.node_request_finished(nodes[1], 0.41)
+        self.assertAlmostEqual(
+            0.01 + 0.3 * 0.4,
+            baseapp.node_latencies['127.0.0.1:6200/sda']['first_byte_latency'])
+        self.assertEqual([nodes[3], nodes[0], nodes[1], nodes[2]], do_sort())
+
+        # busy nodes are expected to be slower
+        for i in range(2):
+            baseapp.node_request_started(nodes[0])
+        self.assertEqual([nodes[3], nodes[1], nodes[0], nodes[2]], do_sort())
+        for i in range(2):
+            baseapp.node_request_finished(nodes[0], 0.1)
+
+        # old measurements are forgotten
+        later = now + baseapp.timing_expiry + 1
+        with mock.patch('swift.proxy.server.time', return_value=later):
+            self.assertEqual({}, baseapp.get_node_latency_stats())
+            baseapp.node_request_started(nodes[2])
+            baseapp.node_request_finished(nodes[2], 0.05)
+            self.assertEqual(
+                0.05,
+                baseapp.get_node_latency_stats()[
+                    '127.0.0.2:6200/sda']['first_byte_latency'])
+
+    def test_node_latency_not_collected(self):
+        baseapp = proxy_server.Application({'sorting_method': 'timing'},
+                                           container_ring=FakeRing(),
+                                           account_ring=FakeRing())
+        self.assertFalse(baseapp.sorts_by_latency)
+        node = {'ip': '127.0.0.1', 'port': 6200, 'device': 'sda'}
+        baseapp.node_request_started(node)
+        baseapp.node_request_finished(node, 0.1)
+        self.assertEqual({}, baseapp.node_latencies)
+
+        with self.assertRaises(ValueError):
+            proxy_server.Application({'latency_ewma_weight': '0'},
+                                     container_ring=FakeRing(),
+                                     account_ring=FakeRing())
+
     def _do_sort_nodes(self, conf, policy_conf, nodes, policy,
                        node_timings=None):
         # Note with shuffling mocked out, sort_nodes will by default return
@@ -1117,6 +1222,175 @@ class TestProxyServer(unittest.TestCase):
                 # Should get 127.0.0.2 as this has a wait of 1 seconds.
                 self.assertEqual(resp.body, b'Response from 127.0.0.2')
 
+    def test_hedged_gets(self):
+        nodes = [{'region': 1, 'zone': 1, 'ip': '127.0.0.1', 'port': 6010,
+                  'device': 'sda'},
+                 {'region': 2, 'zone': 2, 'ip': '127.0.0.2', 'port': 6010,
+                  'device': 'sda'},
+                 {'region': 3, 'zone': 3, 'ip': '127.0.0.3', 'port': 6010,
+                  'device': 'sda'}]
+        timings = {'127.0.0.1': 0.5, '127.0.0.2': 0, '127.0.0.3': 0}
+        statuses = {'127.0.0.1': 200, '127.0.0.2': 200, '127.0.0.3': 200}
+        req = Request.blank('/v1/account', environ={'REQUEST_METHOD': 'GET'})
+
+        def fake_iter_nodes(*arg, **karg):
+            class FakeNodeIter(object):
+                num_primary_nodes = 3
+
+                def __iter__(self):
+                    return iter(nodes)
+
+            return FakeNodeIter()
+
+        class FakeConn(object):
+            def __init__(self, ip, *args, **kargs):
+                self.ip = ip
+
+            def getresponse(self):
+                body = 'Response from %s' % self.ip
+
+                def mygetheader(header, *args, **kargs):
+                    if header == "Content-Type":
+                        return ""
+                    elif header == "Content-Length":
+                        return str(len(body))
+                    else:
+                        return 1
+
+                resp = mock.Mock()
+                resp.read.side_effect = [body.encode('ascii'), b'']
+                resp.getheader = mygetheader
+                resp.getheaders.return_value = {}
+                resp.reason = ''
+                resp.status = statuses[self.ip]
+                sleep(timings[self.ip])
+                return resp
+
+        def myfake_http_connect_raw(ip, *args, **kargs):
+            return FakeConn(ip)
+
+        def do_get(app):
+            app.logger.clear()
+            app.update_request(req)
+            resp = app.handle_request(req)
+            return resp.body, app.logger.get_increment_counts()
+
+        with mock.patch('swift.proxy.server.Application.iter_nodes',
+                        fake_iter_nodes), \
+                mock.patch('swift.common.bufferedhttp.http_connect_raw',
+                           myfake_http_connect_raw):
+            # without hedging the first node is waited for
+            baseapp = proxy_server.Application({'concurrency_timeout': 0.01},
+                                               logger=debug_logger(),
+                                               container_ring=FakeRing(),
+                                               account_ring=FakeRing())
+            self.assertFalse(baseapp.hedges_gets)
+            body, counts = do_get(baseapp)
+            self.assertEqual(b'Response from 127.0.0.1', body)
+            self.assertNotIn('hedge_sent', counts)
+            self.assertEqual({}, dict(baseapp.first_byte_latencies))
+
+            baseapp = proxy_server.Application({'hedged_gets': 'on',
+                                                'concurrency_timeout': 0.01},
+                                               logger=debug_logger(),
+                                               container_ring=FakeRing(),
+                                               account_ring=FakeRing())
+            self.assertTrue(baseapp.hedges_gets)
+            # with too few latency samples, concurrency_timeout is used
+            self.assertEqual(0.01, baseapp.get_hedge_delay('Account', None))
+            body, counts = do_get(baseapp)
+            self.assertEqual(b'Response from 127.0.0.2', body)
+            self.assertEqual(1, counts['hedge_sent'])
+            self.assertEqual(1, counts['hedge_won'])
+            self.assertNotIn('hedge_wasted', counts)
+
+            # a fast primary isn't hedged
+            timings['127.0.0.1'] = 0
+            body, counts = do_get(baseapp)
+            self.assertEqual(b'Response from 127.0.0.1', body)
+            self.assertNotIn('hedge_sent', counts)
+
+            # once enough latencies are known, the hedge delay adapts to them
+            for i in range(20):
+                baseapp.record_first_byte_latency('Account', None, 1.0)
+            self.assertEqual(1.0, baseapp.get_hedge_delay('Account', None))
+            timings['127.0.0.1'] = 0.1
+            body, counts = do_get(baseapp)
+            self.assertEqual(b'Response from 127.0.0.1', body)
+            self.assertNotIn('hedge_sent', counts)
+
+            # a hedge that loses the race is wasted
+            baseapp.first_byte_latencies.clear()
+            timings['127.0.0.1'] = 0.05
+            timings['127.0.0.2'] = 0.5
+            timings['127.0.0.3'] = 0.5
+            body, counts = do_get(baseapp)
+            self.assertEqual(b'Response from 127.0.0.1', body)
+            self.assertEqual(1, counts['hedge_sent'])
+            self.assertEqual(1, counts['hedge_wasted'])
+            self.assertNotIn('hedge_won', counts)
+
+            # a node that errors quickly is failed over, not hedged, even
+            # while a slow request is still in flight
+            baseapp.first_byte_latencies.clear()
+            timings['127.0.0.1'] = 0.5
+            timings['127.0.0.2'] = 0
+            timings['127.0.0.3'] = 0
+            statuses['127.0.0.2'] = 503
+            body, counts = do_get(baseapp)
+            self.assertEqual(b'Response from 127.0.0.3', body)
+            self.assertEqual(1, counts['hedge_sent'])
+            self.assertEqual(1, counts['hedge_wasted'])
+            self.assertNotIn('hedge_won', counts)
+
+            # nor is a node after a first node that errors quickly
+            timings['127.0.0.1'] = 0
+            statuses['127.0.0.1'] = 503
+            statuses['127.0.0.2'] = 200
+            body, counts = do_get(baseapp)
+            self.assertEqual(b'Response from 127.0.0.2', body)
+            self.assertNotIn('hedge_sent', counts)
+
+    def test_latency_window(self):
+        window = proxy_server.LatencyWindow(size=10, min_samples=5,
+                                            refresh_interval=5)
+        for latency in (0.5, 0.1, 0.4, 0.2):
+            window.add(latency)
+        self.assertIsNone(window.percentile(50))
+        window.add(0.3)
+        self.assertEqual(0.3, window.percentile(50))
+        self.assertEqual(0.5, window.percentile(100))
+        self.assertEqual(0.1, window.percentile(1))
+        # percentiles are only refreshed every refresh_interval samples
+        for i in range(4):
+            window.add(1.0)
+            self.assertEqual(0.5, window.percentile(100))
+        window.add(1.0)
+        self.assertEqual(1.0, window.percentile(100))
+        # only the most recent samples are kept
+        for i in range(10):
+            window.add(2.0)
+        self.assertEqual([2.0] * 10, list(window.samples))
+
+    def test_hedge_delay_percentile(self):
+        baseapp = proxy_server.Application(
+            {'hedged_gets': 'on', 'hedge_delay_percentile': '50'},
+            container_ring=FakeRing(), account_ring=FakeRing())
+        for i in range(100):
+            baseapp.record_first_byte_latency('Object', POLICIES[0], i / 100.0)
+        self.assertEqual(0.49, baseapp.get_hedge_delay('Object', POLICIES[0]))
+        # latencies are kept per server type and policy
+        self.assertEqual(baseapp.get_policy_options(None).concurrency_timeout,
+                         baseapp.get_hedge_delay('Object', None))
+        self.assertEqual(baseapp.get_policy_options(None).concurrency_timeout,
+                         baseapp.get_hedge_delay('Container', None))
+
+        for value in ('0', '-1', '101'):
+            with self.assertRaises(ValueError):
+                proxy_server.Application({'hedge_delay_percentile': value},
+                                         container_ring=FakeRing(),
+                                         account_ring=FakeRing())
+
     def test_info_defaults(self):
         app = proxy_server.Application({},
                                        account_ring=FakeRing(),
@@ -1271,6 +1545,45 @@ class TestProxyServer(unittest.TestCase):
         self.assertIs(log_kwargs['exc_info'][1], expected_err)
         self.assertEqual(4, node_error_count(app, node))
 
+    def test_shared_error_limiting(self):
+        tempdir = mkdtemp()
+        self.addCleanup(rmtree, tempdir)
+        conf = {'shared_error_limit_file': os.path.join(tempdir, 'errors'),
+                'shared_error_limit_slots': '16'}
+        logger = debug_logger('test')
+        # e.g. two workers of the same proxy server
+        app1 = proxy_server.Application(conf,
+                                        account_ring=FakeRing(),
+                                        container_ring=FakeRing(),
+                                        logger=logger)
+        app2 = proxy_server.Application(conf,
+                                        account_ring=FakeRing(),
+                                        container_ring=FakeRing(),
+                                        logger=logger)
+        self.assertEqual(16, app1._error_limiting.slots)
+        node = app1.container_ring.get_part_nodes(0)[0]
+        other_node = app1.container_ring.get_part_nodes(0)[1]
+
+        app1.error_occurred(node, 'test msg')
+        self.assertEqual(1, node_error_count(app1, node))
+        self.assertEqual(1, node_error_count(app2, node))
+        app2.error_occurred(node, 'test msg')
+        self.assertEqual(2, node_error_count(app1, node))
+        self.assertFalse(app1.error_limited(node))
+        self.assertFalse(app2.error_limited(node))
+
+        app1.error_limit(node, 'test msg')
+        self.assertTrue(app1.error_limited(node))
+        self.assertTrue(app2.error_limited(node))
+        self.assertFalse(app2.error_limited(other_node))
+
+        # once the suppression interval passes, either app clears it
+        with mock.patch('swift.proxy.server.time',
+                        return_value=time.time() + 61):
+            self.assertFalse(app2.error_limited(node))
+        self.assertEqual(0, node_error_count(app1, node))
+        self.assertFalse(app1.error_limited(node))
+
     def test_valid_api_version(self):
         app = proxy_server.Application({},
                                        account_ring=FakeRing(),
@@ -1606,7 +1919,8 @@ class TestProxyServerConfigLoading(unittest.TestCase):
             "'write_affinity_handoff_delete_count': None, "
             "'rebalance_missing_suppression_count': 1, "
             "'concurrent_gets': False, 'concurrency_timeout': 0.5, "
-            "'concurrent_ec_extra_requests': 0"
+            "'concurrent_ec_extra_requests': 0, 'hedged_gets': False, "
+            "'hedge_delay_percentile': 95.0"
             "}, app)",
             repr(default_options))
         self.assertEqual(default_options, eval(repr(default_options), {
@@ -1620,7 +1934,8 @@ class TestProxyServerConfigLoading(unittest.TestCase):
             "'write_affinity_handoff_delete_count': 4, "
             "'rebalance_missing_suppression_count': 2, "
             "'concurrent_gets': False, 'concurrency_timeout': 0.5, "
-            "'concurrent_ec_extra_requests': 0"
+            "'concurrent_ec_extra_requests': 0, 'hedged_gets': False, "
+            "'hedge_delay_percentile': 95.0"
             "}, app)",
             repr(policy_0_options))
         self.assertEqual(policy_0_options, eval(repr(policy_0_options), {
@@ -1943,7 +2258,7 @@ class TestProxyServerConfigLoading(unittest.TestCase):
                 self._write_conf_and_load_app(conf_sections)
             self.assertEqual(
                 'Invalid sorting_method value; must be one of shuffle, '
-                "timing, affinity, not 'broken' for %s" % scope,
+                "timing, affinity, latency, not 'broken' for %s" % scope,
                 cm.exception.args[0])
 
         conf_sections = """
@@ -4220,6 +4535,65 @@ class TestReplicatedObjectController(
         do_test('PUT', 'sharding')
         do_test('PUT', 'sharded')
 
+    @patch_policies([
+        StoragePolicy(0, 'zero', is_default=True, object_ring=FakeRing()),
+        StoragePolicy(1, 'one', object_ring=FakeRing()),
+    ])
+    def test_update_shard_cache_cleared_when_container_update_redirected(self):
+        # reset the router post patch_policies
+        self.app.obj_controller_router = proxy_server.ObjectControllerRouter()
+        self.app.sort_nodes = lambda nodes, *args, **kwargs: nodes
+        self.app.recheck_updating_shard_ranges = 3600
+        shard_range_cache = proxy_base.ShardRangeCache()
+        self.app.shard_range_cache = shard_range_cache
+        cache_key = 'shard-updating/a/c'
+
+        def do_test(method, redirected):
+            shard_ranges = [
+                utils.ShardRange(
+                    '.shards_a/c_lower', utils.Timestamp.now(), '', 'l'),
+                utils.ShardRange(
+                    '.shards_a/c_upper', utils.Timestamp.now(), 'l', ''),
+            ]
+            cache = FakeMemcache()
+            cache.set(cache_key, tuple(
+                dict(shard_range) for shard_range in shard_ranges))
+            shard_range_cache.clear()
+            req = Request.blank('/v1/a/c/o', {'swift.cache': cache},
+                                method=method, body='',
+                                headers={'Content-Type': 'text/plain'})
+            resp_headers = {'X-Backend-Storage-Policy-Index': 1,
+                            'x-backend-sharding-state': 'sharded'}
+            obj_resp_headers = dict(resp_headers)
+            if redirected:
+                obj_resp_headers[
+                    'X-Backend-Container-Update-Redirected'] = 'true'
+            # acc HEAD, cont HEAD, obj requests
+            with mocked_http_conn(200, 200, 202, 202, 202, headers=[
+                    resp_headers, resp_headers, resp_headers,
+                    obj_resp_headers, resp_headers]) as fake_conn:
+                resp = req.get_response(self.app)
+            self.assertEqual(202, resp.status_int)
+            # the update was directed with the cached shard ranges
+            self.assertEqual(
+                [shard_ranges[1].name] * 3,
+                [r['headers']['X-Backend-Quoted-Container-Path']
+                 for r in fake_conn.requests[2:]])
+            if redirected:
+                self.assertNotIn(cache_key, cache.store)
+                self.assertNotIn(cache_key, req.environ['swift.infocache'])
+                self.assertEqual([], list(shard_range_cache._entries))
+            else:
+                self.assertIn(cache_key, cache.store)
+                self.assertIn(cache_key, req.environ['swift.infocache'])
+                self.assertEqual([cache_key],
+                                 list(shard_range_cache._entries))
+
+        for method in ('POST', 'DELETE', 'PUT'):
+            with annotate_failure(method):
+                do_test(method, False)
+                do_test(method, True)
+
     def test_DELETE(self):
         with save_globals():
             def test_status_map(statuses, expected):
@@ -8721,6 +9095,35 @@ class TestObjectECRangedGET(unittest.TestCase):
                                                gotten_obj)
         self.assertEqual(len(got_byteranges), 5)
 
+    def test_multiple_ranges_coalesced(self):
+        # all of these are served from one fetch of the first two segments,
+        # in order of their first byte
+        status, headers, gotten_obj = self._get_obj(
+            "bytes=4096-5000,0-9,4000-4200,20-29,100-150")
+        self.assertEqual(status, 206)
+        got_byteranges = self._parse_multipart(headers['Content-Type'],
+                                               gotten_obj)
+        self.assertEqual(
+            ['bytes 0-9/14513', 'bytes 20-29/14513', 'bytes 100-150/14513',
+             'bytes 4000-4200/14513', 'bytes 4096-5000/14513'],
+            [byterange['Content-Range'] for byterange in got_byteranges])
+        self.assertEqual(
+            [self.obj[0:10], self.obj[20:30], self.obj[100:151],
+             self.obj[4000:4201], self.obj[4096:5001]],
+            [byterange.get_payload(decode=True)
+             for byterange in got_byteranges])
+
+    def test_multiple_ranges_nested(self):
+        status, headers, gotten_obj = self._get_obj(
+            "bytes=100-9000,200-300,8000-14512")
+        self.assertEqual(status, 206)
+        got_byteranges = self._parse_multipart(headers['Content-Type'],
+                                               gotten_obj)
+        self.assertEqual(
+            [self.obj[100:9001], self.obj[200:301], self.obj[8000:]],
+            [byterange.get_payload(decode=True)
+             for byterange in got_byteranges])
+
     def test_multiple_ranges_off_end(self):
         status, headers, gotten_obj = self._get_obj(
             "bytes=0-10,14500-14513")  # there is no byte 14513, only 0-14512